@@ -4,28 +4,58 @@ This script compiles, obfuscates, and packages a Minecraft Mod.
 """
 from __future__ import print_function, unicode_literals
 
-import distutils.version
+import collections
+import copy
+import functools
 import errno
+import hashlib
 import io
 import itertools
+import json
 import logging
 import os
 import os.path
+import re
 import subprocess
 import sys
+import time
 import traceback
 import zipfile
-from distutils.version import StrictVersion
+from multiprocessing.pool import ThreadPool
 try:
 	import configparser # pylint: disable=F0401
 except ImportError:
 	import ConfigParser as configparser
 
 import pathspec
-if StrictVersion(pathspec.__version__) < StrictVersion('0.3'):
+# - NOTE: distutils is not used to compare the versions because it imports
+#   pkg_resources which is slow to import.
+if tuple(int(part) for part in re.findall(r'\d+', pathspec.__version__)[:2]) < (0, 3):
 	raise ImportError("pathspec version {!r} is installed, version {!r} is required.".format(pathspec.__version__, '0.3'))
 
-from . import util
+from . import __version__, logqueue, util, watch
+from .checkpoint import Checkpoints, Fingerprint
+from .events import EventStream
+from .history import BuildHistory, HistoryRecorder, get_history_file
+from .jythoncache import JythonCache, get_cache_dir
+from .classfile import ClassIndex, find_dependents
+from .library import LIBRARY_CACHE_DIR, PackageWriter, Relocator, relocate_library, shrink_libraries
+from .procmon import ResourceMonitor
+
+#: The directory within the build directory to cache the indexes of the
+#: compiled mod classes in.
+CLASS_CACHE_DIR = os.path.join('cache', 'classes')
+
+#: The file within the build log directory to report the conflicting
+#: entries of the mod JAR in.
+CONFLICT_REPORT_FILE = 'conflicts.txt'
+
+#: The package index within the mod JAR.
+JAR_INDEX_FILE = 'META-INF/INDEX.LIST'
+
+#: The maximum number of python source files to compile with each Jython
+#: process so that its command line stays within the limits of the OS.
+JYTHON_BATCH_SIZE = 200
 
 #: The file to log to.
 LOG_FILE = 'mcpackage.log'
@@ -33,6 +63,46 @@ LOG_FILE = 'mcpackage.log'
 #: The name of the MCP configuration.
 MCP_CONFIG_FILE = 'mcp.cfg'
 
+#: The log written by MCP to its log directory which contains its errors
+#: and warnings.
+MCP_ERROR_LOG_FILE = 'mcperr.log'
+
+#: The pattern used to find the counts of classes in subprocess output
+#: (e.g., "Reobfuscating 25 classes").
+OUTPUT_CLASSES_PATTERN = re.compile(r'\b(\d+) class(?:es)?\b', re.I)
+
+#: The pattern used to find the lines MCP prints when it finishes (e.g.,
+#: "> Done in 12.34 seconds").
+OUTPUT_DONE_PATTERN = re.compile(r'^> Done in ([\d.]+) seconds')
+
+#: The pattern used to find errors in subprocess output (e.g.,
+#: "ExampleMod.java:12: error: ..." from javac).
+OUTPUT_ERROR_PATTERN = re.compile(r'\berror:|^\W*(?:ERROR|SEVERE)\b', re.I)
+
+#: The pattern used to find the lines MCP prints at the start of each
+#: phase (e.g., "> Recompiling client...").
+OUTPUT_PHASE_PATTERN = re.compile(r'^> (.+?)[.\s]*$')
+
+#: The pattern used to find warnings in subprocess output (e.g.,
+#: "ExampleMod.java:12: warning: [deprecation] ..." from javac, and
+#: "WARNING: ..." from SpecialSource).
+OUTPUT_WARNING_PATTERN = re.compile(r'\bwarning:|^\W*WARNING\b', re.I)
+
+#: The number of the last lines of output of a failed subprocess to log.
+OUTPUT_TAIL_LINES = 20
+
+#: The file within the build log directory to write the resource usage
+#: samples of the subprocesses of each stage to.
+RESOURCE_REPORT_FILE = 'resources.json'
+
+#: The map of the python modules to their compiled classes within the mod
+#: JAR. Each line is a module name and its class file separated by "=".
+MODULE_MAP_FILE = 'META-INF/MODULES.LIST'
+
+#: The file within the build log directory to report the timing of each
+#: stage and MCP phase in.
+TIMING_REPORT_FILE = 'timings.txt'
+
 #: Whether we are running Windows or another OS.
 IS_WINDOWS = util.get_system() == 'Windows'
 
@@ -44,6 +114,15 @@ DEFAULT_CONFIG = {
 	'build': {
 		# The directory to build the mod in.
 		'dir': 'build',
+		# Whether the mod JAR should be indexed. This adds a package index
+		# ("META-INF/INDEX.LIST") and a map of the python modules to their
+		# compiled classes ("META-INF/MODULES.LIST"), and orders the classes
+		# so that the hot classes come first and each class follows the
+		# classes which use it.
+		'index': False,
+		# Patterns used to match the hot class files (e.g., the main mod
+		# class) to package first when the mod JAR is indexed.
+		'hot': [],
 	},
 	# Settings for Minecraft Forge.
 	'forge': {
@@ -52,14 +131,92 @@ DEFAULT_CONFIG = {
 		# The Minecraft Coder Pack toolkit directory. This gets set to the
 		# MCP directory under the Forge directory.
 		'mcp_dir': None,
+		# Whether the MCP source and compiled classes should be hard linked
+		# into the build directory instead of copied. This saves the time
+		# and space of copying them for every mod built against the same
+		# Forge directory. The build directory must be on the same file
+		# system as the Forge directory, otherwise they are copied.
+		'link': False,
+	},
+	# Settings for installing the mod.
+	'install': {
+		# The Minecraft "mods" directories to install the mod JAR into. These
+		# can be glob patterns to match many directories (e.g., the instances
+		# of a test farm).
+		'mods_dirs': [],
+		# The maximum number of mods directories to install into
+		# concurrently. If this is null, all of them are installed into
+		# concurrently.
+		'jobs': None,
+		# Whether an installed JAR which cannot be linked (e.g., on a remote
+		# mount) should be updated by only writing the regions which changed
+		# instead of copying the whole JAR.
+		'delta': False,
+		# The block size in bytes used to find changed regions for delta
+		# installs. If this is null, the default is used.
+		'delta_block_size': None,
+	},
+	# Settings for running Minecraft.
+	'run': {
+		# The Java executable. If this is null, it is searched for on the
+		# PATH.
+		'java_exe': None,
+		# The arguments passed to the Java virtual machine.
+		'jvm_args': ['-Xmx1G'],
+		# The classpath used to run Minecraft. If this is null, every JAR in
+		# the MCP "jars" directory is used.
+		'classpath': None,
+		# The game directory Minecraft is run in. The client and server are
+		# run in the "client" and "server" directories under it. If this is
+		# null, the "run" directory under the build directory is used.
+		'game_dir': None,
+		# Settings for running the client.
+		'client': {
+			# The main class.
+			'main_class': 'net.minecraft.launchwrapper.Launch',
+			# The arguments passed to the main class.
+			'args': ['--version', 'mcpackage', '--tweakClass', 'cpw.mods.fml.common.launcher.FMLTweaker', '--accessToken', '0'],
+		},
+		# Settings for running the dedicated server.
+		'server': {
+			# The main class.
+			'main_class': 'net.minecraft.launchwrapper.Launch',
+			# The arguments passed to the main class.
+			'args': ['--tweakClass', 'cpw.mods.fml.common.launcher.FMLServerTweaker', 'nogui'],
+		},
+		# Whether a class data sharing (AppCDS) archive of the classes loaded
+		# while Minecraft is launched should be generated and reused to speed
+		# up later launches. This requires Java 13 or newer. The archive is
+		# regenerated when the classpath, mod JAR or command changes.
+		'class_data_sharing': False,
+		# The fraction a launch time can increase by over the previous launch
+		# before it is reported as a regression.
+		'regression_threshold': 0.2,
 	},
 	# Settings for additional libraries.
 	'library': {
 		# The directory containing additional libraries required by the mod.
 		'dir': 'lib',
 		# Patterns used to match libraries (JAR or ZIP) to package (merge)
-		# with the built mod JAR.
+		# with the built mod JAR. An entry can also be a mapping with the
+		# "pattern" and "relocate" which maps each package of the library
+		# to relocate (shade) to its new package (e.g., "com.google.gson:
+		# com.example.shaded.gson"). Relocated packages are renamed in every
+		# packaged class so that references to them are kept consistent.
 		'package': [],
+		# Whether the classes of the packaged libraries which cannot be
+		# reached from the compiled java classes of the mod should be left
+		# out of the mod JAR.
+		'shrink': False,
+		# Patterns used to match the packaged libraries in their order of
+		# precedence when they contain conflicting entries with the same
+		# name. The entries of the mod always have precedence, and libraries
+		# not matched come last in name order.
+		'precedence': [],
+		# Patterns used to match the class entries of the packaged libraries
+		# (e.g., "com/example/api/**") to always keep when shrinking. Classes
+		# only used by reflection or from python must be kept this way.
+		'keep': [],
 	},
 	# Settings pertaining to the mod source code.
 	'source': {
@@ -87,6 +244,62 @@ DEFAULT_CONFIG = {
 		# not be found, you must manually specify its location.
 		'java_exe': None,
 	},
+	# Settings for the cache of compiled python classes which is shared by
+	# every build of the same user (e.g., of other branches and workspaces,
+	# and clean builds). The classes are cached by the digest of their
+	# source and the version of Jython so that only changed python source is
+	# compiled.
+	'jython_cache': {
+		# Whether compiled python classes should be cached.
+		'enabled': True,
+		# The cache directory. If this is null, "mcpackage/jython" under the
+		# user cache directory (e.g., "~/.cache") is used.
+		'dir': None,
+		# The number of megabytes the cache can grow to before the least
+		# recently used classes are evicted.
+		'max_size': 256,
+	},
+	# Settings for monitoring the resource usage (CPU, memory, I/O and
+	# threads) of the Java toolchain (MCP and Jython) run by the build.
+	# This is only supported on Linux.
+	'monitor': {
+		# The number of seconds between samples. If this is null, the
+		# resource usage is not monitored.
+		'interval': 0.5,
+		# The number of megabytes of resident memory the Java toolchain
+		# should stay within. A warning is logged when it is exceeded. If
+		# this is null, there is no budget.
+		'memory_budget': None,
+	},
+	# Settings for the build history which records the stage timings,
+	# cache hit rates, JAR size and input counts of each build. These are
+	# shown by the "stats" command.
+	'history': {
+		# Whether the builds should be recorded.
+		'enabled': True,
+		# The SQLite database to record the builds in (e.g., a file in the
+		# home directory to keep the history when the build directory is
+		# cleaned). If this is null, "history.db" in the build directory is
+		# used.
+		'file': None,
+	},
+	# Settings for building the mod against several versions of Minecraft
+	# (Forge) at once.
+	'matrix': {
+		# The versions to build the mod against. Each entry is a mapping with
+		# the "version" label (e.g., "1.7.10", quoted so that it is not read
+		# as a number), and the "forge" and optionally "jython" settings
+		# which override those above for the version. Each version is built
+		# in its own directory under the build directory (e.g.,
+		# "build/1.7.10") into its own JAR named with the version (e.g.,
+		# "mod-1.7.10.jar"). The mod source is only scanned once and shared
+		# by the versions, which are built concurrently. If this is empty,
+		# the mod is only built against the Forge directory above.
+		'versions': [],
+		# The maximum number of versions to build concurrently. If this is
+		# null, all of them are built concurrently.
+		'jobs': None,
+	},
 }
 
 #: The keys in the configuration that are directory paths which need to
@@ -101,12 +314,44 @@ CONFIG_PATHS = [
 #: The keys in the configuration that are path-specs which need to be
 #: compiled.
 CONFIG_PATHSPECS = [
+	('build', 'hot'),
+	('library', 'keep'),
 	('library', 'package'),
 	('source', 'extra'),
 	('source', 'java'),
 	('source', 'python'),
 ]
 
+#: The stages of the build in the order they are run.
+STAGES = [
+	'prepare',
+	'scan',
+	'copy',
+	'compile',
+	'obfuscate',
+	'jython',
+	'package',
+]
+
+#: The stages which record checkpoints. The "scan" stage is always run
+#: because the other stages depend on its results.
+CHECKPOINT_STAGES = [stage for stage in STAGES if stage != 'scan']
+
+#: Maps each kind of changed file to the stages which need to be run
+#: again when watching for changes.
+WATCH_STAGES = {
+	'java': ['scan', 'copy', 'compile', 'obfuscate', 'package'],
+	'python': ['scan', 'copy', 'jython', 'package'],
+	'extra': ['scan', 'package'],
+	'library': ['scan', 'package'],
+}
+
+#: Caches the configurations loaded by ``load_config()``. This maps the
+#: digest of the configuration file and the mcpackage version (``tuple``)
+#: to the merged configuration values (``dict``) and compiled path-specs
+#: and relocation rules (``dict``).
+CONFIG_CACHE = {}
+
 def command(**args):
 	"""
 	Builds and packages the Minecraft Mod.
@@ -117,6 +362,78 @@ def command(**args):
 	"""
 	return BuildCommand(**args).run()
 
+def load_config(config_file):
+	"""
+	Loads the configuration, merges the defaults into it, expands its
+	paths and compiles its path-specs.
+
+	The merged configuration and compiled path-specs are cached by the
+	digest of the configuration file so that loading the same
+	configuration again (e.g., by the daemon, when watching, or in a
+	workspace) does not have to parse it and compile its path-specs
+	again.
+
+	*config_file* (``str``) is the mcpackage configuration file to load.
+
+	Returns a ``tuple`` containing: the configuration (``dict``), and the
+	configuration values (``dict``) before its path-specs were compiled.
+	"""
+	with io.open(config_file, mode='rb') as fh:
+		data = fh.read()
+	cache_key = (hashlib.sha1(data).hexdigest(), __version__)
+	cached = CONFIG_CACHE.get(cache_key)
+	if cached is None:
+		# Load config.
+		fh = io.StringIO(data.decode('UTF-8'))
+		fh.name = config_file
+		config = util.load_config(fh) or {}
+		del fh
+
+		# Merge defaults into loaded config.
+		# - NOTE: The defaults are copied because the merged configuration
+		#   shares any nested values not in the loaded configuration, and
+		#   those get modified below.
+		values = util.merge_config(copy.deepcopy(DEFAULT_CONFIG), config)
+		del config
+
+		# Compile path-specs and relocation rules.
+		specs = {}
+		specs[('library', 'relocate')] = Relocator.from_config(values['library']['package'])
+		pathspec_keys, lines = None, None
+		for pathspec_keys in CONFIG_PATHSPECS:
+			lines = util.get_nested_value(values, pathspec_keys)
+			if pathspec_keys == ('library', 'package'):
+				# Library entries can be mappings with relocation rules.
+				lines = [line['pattern'] if isinstance(line, dict) else line for line in lines]
+			specs[pathspec_keys] = pathspec.PathSpec.from_lines('gitignore', lines)
+		del pathspec_keys, lines
+
+		cached = CONFIG_CACHE[cache_key] = (values, specs)
+	del data, cache_key
+
+	# Expand paths. These are not cached because they depend on the
+	# working directory and environment.
+	values = copy.deepcopy(cached[0])
+	path_keys, path = None, None
+	for path_keys in CONFIG_PATHS:
+		path = util.get_nested_value(values, path_keys)
+		path = os.path.abspath(os.path.expandvars(path))
+		util.set_nested_value(values, path_keys, path)
+	del path_keys, path
+
+	# Set MCP directory.
+	values['forge']['mcp_dir'] = os.path.join(values['forge']['dir'], 'mcp')
+
+	# Set compiled path-specs and relocation rules. These are shared between
+	# the configurations because they are not modified.
+	config = copy.deepcopy(values)
+	pathspec_keys, spec = None, None
+	for pathspec_keys, spec in cached[1].items():
+		util.set_nested_value(config, pathspec_keys, spec)
+	del pathspec_keys, spec
+
+	return config, values
+
 
 class BuildCommand(object):
 	"""
@@ -124,13 +441,25 @@ class BuildCommand(object):
 	Mod.
 	"""
 
-	def __init__(self, config_file, verbose=None, **_):
+	def __init__(self, config_file, events=None, force=None, link=None, verbose=None, watch=None, **_):
 		"""
 		Initializes the ``BuildCommand`` instance.
 
 		*config_file* (``str``) is the mcpackage configuration file to
 		generate.
 
+		*events* (``str``) is the file to append the JSON build events to,
+		or `'fd:N'` to write them to the open file descriptor *N*. Default is
+		``None`` to not write events.
+
+		*force* (``bool``) is whether every stage should be run instead of
+		resuming from the checkpoints of a previous build. Default is
+		``None`` for ``False``.
+
+		*link* (``bool``) is whether the MCP source and compiled classes
+		should be hard linked into the build directory instead of copied.
+		Default is ``None`` to use *forge.link* from the configuration.
+
 		*verbose* (``int``) is the level of verbose debugging information to
 		be printed. Default is ``None`` for `0`.
 
@@ -139,6 +468,10 @@ class BuildCommand(object):
 		- `1`: print some debugging information.
 
 		- `2`: print lots of debugging information.
+
+		*watch* (``bool``) is whether the source and library directories
+		should be watched for changes to rebuild the mod continuously.
+		Default is ``None`` for ``False``.
 		"""
 
 		self.config = None
@@ -152,9 +485,60 @@ class BuildCommand(object):
 		generate.
 		"""
 
-		self.name = None
+		self.config_values = None
 		"""
-		*name* (``str``) is the name of the mod being built.
+		*config_values* (``dict``) is the loaded mcpackage configuration
+		before its path-specs are compiled. This is used to fingerprint the
+		inputs of each stage.
+		"""
+
+		self.events = EventStream()
+		"""
+		*events* (``EventStream``) is where the build events are written.
+		"""
+
+		self.events_target = events
+		"""
+		*events_target* (``str``) is the file or file descriptor to write
+		the build events to.
+		"""
+
+		self.force = force or False
+		"""
+		*force* (``bool``) is whether every stage should be run instead of
+		resuming from the checkpoints of a previous build.
+		"""
+
+		self.java_class_files = None
+		"""
+		*java_class_files* (``dict``) maps each java class file (``str``) to
+		its source information (``dict``). This is set by the "scan" stage.
+		"""
+
+		self.java_source_files = None
+		"""
+		*java_source_files* (``list`` of ``str``) contains the relative paths
+		of the java source files. This is set by the "scan" stage.
+		"""
+
+		self.jython_worker = None
+		"""
+		*jython_worker* (``JythonWorker``) is the persistent Jython process
+		used to compile python source when *keep_jython* is ``True``.
+		"""
+
+		self.keep_jython = False
+		"""
+		*keep_jython* (``bool``) is whether Jython should be kept running
+		between builds instead of being launched for each build. This is
+		used by the daemon.
+		"""
+
+		self.link = link
+		"""
+		*link* (``bool``) is whether the MCP source and compiled classes
+		should be hard linked into the build directory instead of copied, or
+		``None`` to use the configuration.
 		"""
 
 		self.log = None
@@ -162,50 +546,448 @@ class BuildCommand(object):
 		*log* (``logging.Logger``) is the logger for this script.
 		"""
 
+		self.log_handlers = []
+		"""
+		*log_handlers* (``list`` of ``logging.Handler``) contains the
+		handlers added by ``init_logging()``.
+		"""
+
+		self.log_listener = None
+		"""
+		*log_listener* (``logqueue.QueueListener``) writes the queued log
+		records on a background thread.
+		"""
+
+		self.log_sampled = None
+		"""
+		*log_sampled* (``logqueue.SampledLog``) is used to log the debug
+		messages for each entry packaged.
+		"""
+
+		self.matrix_builds = {}
+		"""
+		*matrix_builds* (``dict``) maps the label of each version in the
+		matrix (``str``) to its ``BuildCommand``. These are kept so that
+		their cached state is reused by the daemon.
+		"""
+
+		self.mcp_src_index = None
+		"""
+		*mcp_src_index* (``tuple``) caches the scan of the Forge and MCP
+		source tree as a ``tuple`` containing: the directory (``str``), its
+		modified time (``float``), and the relative file paths (``list`` of
+		``str``).
+		"""
+
+		self.name = None
+		"""
+		*name* (``str``) is the name of the mod being built.
+		"""
+
+		self.parent = None
+		"""
+		*parent* (``BuildCommand``) is the matrix build this version of the
+		mod is built for, or ``None``.
+		"""
+
+		self.python_class_files = None
+		"""
+		*python_class_files* (``dict``) maps each python class file (``str``)
+		to its source information (``dict``). This is set by the "scan"
+		stage.
+		"""
+
+		self.python_source_files = None
+		"""
+		*python_source_files* (``list`` of ``str``) contains the relative
+		paths of the python source files. This is set by the "scan" stage.
+		"""
+
+		self.timings = []
+		"""
+		*timings* (``list`` of ``dict``) contains the timing of each stage
+		run by ``run_work()`` with its `'stage'` (``str``), `'start'` time
+		(``float``), duration in `'seconds'` (``float``), and the `'phases'`
+		(``list`` of ``dict``) of its subprocesses from
+		``MCPMonitor.get_results()``, and the `'resources'` (``list`` of
+		``dict``) used by its subprocesses.
+		"""
+
 		self.verbose = verbose or 0
 		"""
 		*verbose* (``int``) is the level of verbose debugging information to
 		be printed.
 		"""
 
-	def init_config(self):
+		self.version = None
 		"""
-		Loads the configuration.
+		*version* (``dict``) is the entry of the version matrix to build this
+		version of the mod with, or ``None``. This is set by the matrix
+		build.
 		"""
-		# Load config.
-		if self.verbose >= 1:
-			print("Load {!r}.".format(self.config_file))
-		with io.open(self.config_file, mode='r', encoding='UTF-8') as fh:
-			config = util.load_config(fh)
 
-		# Merge defaults into loaded config.
-		self.config = util.merge_config(DEFAULT_CONFIG, config)
-		del config
+		self.watch = watch or False
+		"""
+		*watch* (``bool``) is whether the source and library directories
+		should be watched for changes to rebuild the mod continuously.
+		"""
 
-		# Expand paths.
-		path_keys, path = None, None
-		for path_keys in CONFIG_PATHS:
-			path = util.get_nested_value(self.config, path_keys)
-			path = os.path.abspath(os.path.expandvars(path))
-			util.set_nested_value(self.config, path_keys, path)
-		del path_keys, path
+	def apply_version(self):
+		"""
+		Applies the settings of the version from the matrix to the loaded
+		configuration so that it is built in its own build directory into
+		its own JAR.
+		"""
+		label = self.version['version']
+		for config in (self.config, self.config_values):
+			config['name'] = "{}-{}".format(config['name'], label)
+			config['build']['dir'] = os.path.join(config['build']['dir'], label)
+			for key in ('forge', 'jython'):
+				config[key].update(self.version.get(key) or {})
+			config['forge']['dir'] = os.path.abspath(os.path.expandvars(config['forge']['dir']))
+			config['forge']['mcp_dir'] = os.path.join(config['forge']['dir'], 'mcp')
+			config['matrix']['versions'] = []
+
+	def check_mcp_log(self):
+		"""
+		Reports the errors and warnings MCP wrote to its error log during the
+		current stage.
+		"""
+		build_dir = self.config['build']['dir']
+		log_file = os.path.join(build_dir, 'log', 'mcp', MCP_ERROR_LOG_FILE)
+		try:
+			stat = os.stat(log_file)
+		except OSError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			return
+		if not stat.st_size or not self.timings or stat.st_mtime < self.timings[-1]['start']:
+			return
 
-		# Compile path-specs.
-		pathspec_keys, lines, spec = None, None, None
-		for pathspec_keys in CONFIG_PATHSPECS:
-			lines = util.get_nested_value(self.config, pathspec_keys)
-			spec = pathspec.PathSpec.from_lines('gitignore', lines)
-			util.set_nested_value(self.config, pathspec_keys, spec)
-		del pathspec_keys, lines, spec
+		with io.open(log_file, mode='r', encoding='UTF-8', errors='replace') as fh:
+			lines = [line for line in fh if line.strip()]
+		self.timings[-1]['mcp_log_lines'] = len(lines)
+		self.log.info("MCP logged {} line(s) to {!r}.".format(len(lines), util.short_path(log_file, build_dir)))
 
-		# Set MCP directory.
-		self.config['forge']['mcp_dir'] = os.path.join(self.config['forge']['dir'], 'mcp')
+	def close(self):
+		"""
+		Stops the persistent Jython process (if running), including those of
+		the versions in the matrix.
+		"""
+		if self.jython_worker is not None:
+			self.jython_worker.close()
+			self.jython_worker = None
+		for build in self.matrix_builds.values():
+			build.close()
 
-		# Make sure forge and mcp directories exist.
-		forge_dir = self.config['forge']['dir']
+	def close_logging(self):
+		"""
+		Removes the handlers added by ``init_logging()`` so that the command
+		can be run again within the same process, and closes the event
+		stream.
+		"""
+		self.events.close()
+		self.events = EventStream()
+		if self.log_listener is not None:
+			self.log_sampled.summarize()
+			self.log_listener.stop()
+			self.log_listener = None
+		for handler in self.log_handlers:
+			self.log.removeHandler(handler)
+			handler.close()
+		self.log_handlers = []
+
+	def find_jython(self):
+		"""
+		Finds Jython.
+
+		Returns the command (``list`` of ``str``) used to execute Jython if
+		it could be found; otherwise, ``None`` after logging the errors.
+		"""
+		jython_exe = self.config['jython']['jython_exe'] or util.find_exe('jython')
+		if jython_exe:
+			if not os.path.isfile(jython_exe):
+				self.log.error("Jython executable could not be found at {!r}.".format(jython_exe))
+				self.log.error("You must set the Jython executable in the configuration {!r}.".format(self.config_file))
+				return None
+			self.log.debug("jython:{!r}".format(jython_exe))
+			return [jython_exe]
+
+		# Find java.
+		java_exe = self.config['jython']['java_exe'] or util.find_exe('java')
+		if not java_exe:
+			java_error = "Java executable could not be found."
+		elif not os.path.isfile(java_exe):
+			java_error = "Java executable could not be found at {!r}.".format(java_exe)
+		else:
+			java_error = None
+
+		jython_jar = self.config['jython']['jython_jar']
+		if not jython_jar:
+			jar_error = "Jython JAR could not be found."
+		elif not os.path.isfile(jython_jar):
+			jar_error = "Jython JAR could not be found at {!r}.".format(jython_jar)
+		else:
+			jar_error = None
+		jython_error = "Jython executable could not be found."
+
+		if java_error and jar_error:
+			# No java executable and no jython jar.
+			self.log.error(jython_error)
+			self.log.error(java_error)
+			self.log.error(jar_error)
+			self.log.error("You must set either the Jython executable or the Java executable with the Jython JAR in the configuration {!r}.".format(self.config_file))
+			return None
+		elif not java_error and jar_error:
+			# Found java executable but not jython jar.
+			self.log.error(jython_error)
+			self.log.error(jar_error)
+			self.log.error("You must set either the Jython executable or the Jython JAR in the configuration {!r}.".format(self.config_file))
+			return None
+		elif java_error and not jar_error:
+			# No java executable but we found jython jar.
+			self.log.error(java_error)
+			self.log.error("You must set the Java executable in the configuration {!r}.".format(self.config_file))
+			return None
+		self.log.debug("java:{!r}".format(java_exe))
+		self.log.debug("jar:{!r}".format(jython_jar))
+		return [java_exe, '-jar', jython_jar]
+
+	def flush_logging(self):
+		"""
+		Waits until the queued log records have been written so that they
+		are not out of order with the output of subprocesses.
+		"""
+		if self.log_listener is not None:
+			self.log_listener.flush()
+
+	def get_fingerprint(self, stage):
+		"""
+		Calculates the fingerprint of the inputs of the stage.
+
+		*stage* (``str``) is the stage.
+
+		Returns the fingerprint (``str``), or ``None`` if the stage does not
+		record checkpoints.
+		"""
+		config = self.config_values
 		mcp_dir = self.config['forge']['mcp_dir']
-		assert os.path.exists(forge_dir), "Forge directory {!r} does not exist.".format(forge_dir)
-		assert os.path.exists(mcp_dir), "MCP directory {!r} does not exist.".format(mcp_dir)
+		source_dir = self.config['source']['dir']
+		if stage == 'prepare':
+			fingerprint = Fingerprint(stage, config['build'], config['forge'], config['library']['dir'])
+			fingerprint.update_tree(os.path.join(mcp_dir, 'bin'))
+			fingerprint.update_tree(os.path.join(mcp_dir, 'temp'))
+		elif stage == 'copy':
+			mcp_src_dir, _, mcp_src_files = self.mcp_src_index
+			fingerprint = Fingerprint(stage, config['source'])
+			fingerprint.update_files(mcp_src_dir, mcp_src_files)
+			fingerprint.update_files(source_dir, self.java_source_files)
+			fingerprint.update_files(source_dir, self.python_source_files)
+		elif stage in ('compile', 'obfuscate'):
+			# These only depend on the previous stages.
+			fingerprint = Fingerprint(stage)
+		elif stage == 'jython':
+			fingerprint = Fingerprint(stage, config['jython'])
+			fingerprint.update_files(source_dir, self.python_source_files)
+		elif stage == 'package':
+			lib_dir = self.config['library']['dir']
+			fingerprint = Fingerprint(stage, config['name'], config['source'], config['library'])
+			fingerprint.update_files(source_dir, self.config['source']['extra'].match_tree(source_dir))
+			fingerprint.update_files(lib_dir, self.config['library']['package'].match_tree(lib_dir))
+		else:
+			return None
+		return fingerprint.hexdigest()
+
+	def get_stages(self, paths):
+		"""
+		Determines the stages which need to be run again because of changed
+		files.
+
+		*paths* (``Iterable`` of ``str``) contains the absolute paths of the
+		changed files.
+
+		Returns the stages to run (``list`` of ``str``) in order.
+		"""
+		if watch.RESCAN in paths:
+			# The changed files are unknown so everything must be rebuilt.
+			return list(STAGES)
+
+		source_dir = self.config['source']['dir']
+		lib_dir = self.config['library']['dir']
+		stages = set()
+		for path in paths:
+			if path.startswith(source_dir + os.sep):
+				file_path = os.path.relpath(path, source_dir)
+				if self.config['source']['java'].match_file(file_path):
+					stages.update(WATCH_STAGES['java'])
+				elif self.config['source']['python'].match_file(file_path):
+					stages.update(WATCH_STAGES['python'])
+				elif self.config['source']['extra'].match_file(file_path):
+					stages.update(WATCH_STAGES['extra'])
+			elif path.startswith(lib_dir + os.sep):
+				file_path = os.path.relpath(path, lib_dir)
+				if self.config['library']['package'].match_file(file_path):
+					stages.update(WATCH_STAGES['library'])
+		return [stage for stage in STAGES if stage in stages]
+
+	def get_hot_key(self, item):
+		"""
+		Gets the sort key which puts hot class files first when the mod JAR
+		is indexed.
+
+		*item* (``tuple``) contains the class file (``str``) and anything
+		else.
+
+		Returns the sort key (``tuple``).
+		"""
+		class_file = item[0]
+		if self.config['build']['index'] and self.config['build']['hot'].match_file(class_file):
+			return (0, class_file)
+		return (1, class_file)
+
+	def get_module_map(self):
+		"""
+		Gets the map of the python modules to their compiled classes.
+
+		Returns the module map (``bytes``).
+		"""
+		lines = []
+		for class_file in sorted(self.python_class_files):
+			entry = class_file.replace(os.sep, '/')
+			module = entry[:-len('$py.class')].replace('/', '.')
+			if module == '__init__':
+				continue
+			elif module.endswith('.__init__'):
+				module = module[:-len('.__init__')]
+			lines.append("{}={}".format(module, entry))
+		return ("\n".join(lines) + "\n").encode('UTF-8')
+
+	def get_outputs(self, stage):
+		"""
+		Calculates the fingerprint of the outputs of the stage so that a
+		stage whose outputs were changed or deleted is not skipped.
+
+		*stage* (``str``) is the stage.
+
+		Returns the fingerprint (``str``), or ``None`` if the stage does not
+		record checkpoints.
+		"""
+		build_dir = self.config['build']['dir']
+		dest_dir = os.path.join(build_dir, 'src', 'minecraft')
+		if stage == 'prepare':
+			# - NOTE: Only the existence of "bin" and "temp" is checked because
+			#   the later stages write into them. They are only created when
+			#   the MCP directories they are copied from contain files.
+			mcp_dir = self.config['forge']['mcp_dir']
+			fingerprint = Fingerprint(stage, [
+				os.path.isdir(os.path.join(build_dir, name)) or not any(files for _, _, files in os.walk(os.path.join(mcp_dir, name)))
+				for name in ('bin', 'temp')
+			])
+			fingerprint.update_files(build_dir, [MCP_CONFIG_FILE])
+		elif stage == 'copy':
+			fingerprint = Fingerprint(stage)
+			fingerprint.update_files(dest_dir, self.mcp_src_index[2])
+			fingerprint.update_files(dest_dir, self.java_source_files)
+			fingerprint.update_files(dest_dir, self.python_source_files)
+		elif stage == 'compile':
+			fingerprint = Fingerprint(stage)
+			fingerprint.update_tree(os.path.join(build_dir, 'bin', 'minecraft'))
+		elif stage == 'obfuscate':
+			fingerprint = Fingerprint(stage)
+			fingerprint.update_tree(os.path.join(build_dir, 'reobf', 'minecraft'))
+		elif stage == 'jython':
+			fingerprint = Fingerprint(stage)
+			fingerprint.update_files(dest_dir, self.python_class_files)
+		elif stage == 'package':
+			fingerprint = Fingerprint(stage)
+			fingerprint.update_files(build_dir, [self.config['name'] + '.jar'])
+		else:
+			return None
+		return fingerprint.hexdigest()
+
+	def index_classes(self, class_dir, index_name):
+		"""
+		Indexes the compiled classes of the mod. Only the class files in the
+		directories of the java source files are parsed, and each class is
+		matched to its source file using its *SourceFile* attribute so that
+		inner and secondary classes are found.
+
+		*class_dir* (``str``) is the directory containing the compiled
+		classes.
+
+		*index_name* (``str``) is the name of the index to persist the
+		parsed classes in.
+
+		Returns a ``tuple`` containing: the class index (``ClassIndex``), the
+		changed class files (``dict``) from ``ClassIndex.update()``, and a
+		``dict`` mapping each class file of the mod (``str``) to its java
+		source file (``str``).
+		"""
+		build_dir = self.config['build']['dir']
+		java_source_files = set(self.java_source_files)
+		class_files = []
+		for dir_path in sorted(set(os.path.dirname(file_path) for file_path in java_source_files)):
+			try:
+				names = os.listdir(os.path.join(class_dir, dir_path))
+			except OSError as e:
+				if e.errno != errno.ENOENT:
+					raise
+				continue
+			class_files.extend(os.path.join(dir_path, name) for name in names if name.endswith('.class'))
+
+		index = ClassIndex(os.path.join(build_dir, CLASS_CACHE_DIR, index_name + '.json'))
+		changed = index.update(class_dir, class_files)
+		if changed:
+			index.save()
+		parsed = sum(1 for class_file in changed if class_file in index.files)
+		self.events.emit('cache', name='class_index', index=index_name, hits=len(index.files) - parsed, misses=parsed)
+
+		sources = {}
+		for class_file, entry in index.files.items():
+			if entry['class'] is None:
+				self.log.warning("Failed to parse class file {!r}: {}".format(class_file, entry['error']))
+				continue
+			source_file = entry['class']['source_file']
+			if not source_file:
+				# Assume the source file of the outer class.
+				source_file = os.path.basename(class_file).split('$', 1)[0].rsplit('.', 1)[0] + '.java'
+			source_file = os.path.join(os.path.dirname(class_file), source_file)
+			if source_file in java_source_files:
+				sources[class_file] = source_file
+		return index, changed, sources
+
+	def init_config(self):
+		"""
+		Loads the configuration.
+		"""
+		# Load config.
+		if self.verbose >= 1:
+			print("Load {!r}.".format(self.config_file))
+		self.config, self.config_values = load_config(self.config_file)
+		if self.version is not None:
+			self.apply_version()
+		if self.link is not None:
+			self.config['forge']['link'] = self.link
+
+		versions = self.config['matrix']['versions']
+		if versions:
+			# Make sure each version in the matrix has a unique label. The
+			# Forge directory of each version is checked by its build.
+			assert not self.watch, "Watching for changes is not supported with a version matrix."
+			labels = set()
+			i, entry = None, None
+			for i, entry in enumerate(versions):
+				assert isinstance(entry, dict) and entry.get('version'), "Version {} of the matrix has no version label.".format(i + 1)
+				entry['version'] = "{}".format(entry['version'])
+				assert entry['version'] not in labels, "Version {!r} is in the matrix more than once.".format(entry['version'])
+				labels.add(entry['version'])
+			del i, entry, labels
+		else:
+			# Make sure forge and mcp directories exist.
+			forge_dir = self.config['forge']['dir']
+			mcp_dir = self.config['forge']['mcp_dir']
+			assert os.path.exists(forge_dir), "Forge directory {!r} does not exist.".format(forge_dir)
+			assert os.path.exists(mcp_dir), "MCP directory {!r} does not exist.".format(mcp_dir)
 
 		# Setup build directory.
 		build_dir = self.config['build']['dir']
@@ -230,7 +1012,13 @@ class BuildCommand(object):
 		else:
 			log_level = logging.WARNING
 
-		self.log = logging.getLogger()
+		if self.parent is not None:
+			# - NOTE: The log of each version in the matrix is named by its
+			#   version, and kept out of the log of the matrix build.
+			self.log = logging.getLogger(self.version['version'])
+			self.log.propagate = False
+		else:
+			self.log = logging.getLogger()
 		self.log.setLevel(logging.NOTSET)
 
 		build_dir = self.config['build']['dir']
@@ -246,14 +1034,97 @@ class BuildCommand(object):
 
 		if self.verbose >= 1:
 			print("Log to {!r}.".format(log_file))
-		stream_handler = logging.StreamHandler(stream=sys.stdout)
+		stream_handler = logqueue.BatchedStreamHandler(stream=sys.stdout)
 		stream_handler.setLevel(log_level)
 		stream_handler.setFormatter(logging.Formatter(fmt='[%(name)s] %(levelname)s: %(message)s'))
-		self.log.addHandler(stream_handler)
-		file_handler = logging.FileHandler(log_file)
+		file_handler = logqueue.BatchedFileHandler(log_file)
 		file_handler.setLevel(log_level)
 		file_handler.setFormatter(logging.Formatter(fmt='%(asctime)s [%(name)s] %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S%z'))
-		self.log.addHandler(file_handler)
+
+		# - NOTE: Records are queued and written by a background thread so
+		#   that formatting and writing them does not slow down the build.
+		self.log_listener = logqueue.QueueListener([stream_handler, file_handler])
+		self.log_listener.start()
+		queue_handler = logqueue.QueueHandler(self.log_listener.queue)
+		queue_handler.setLevel(log_level)
+		self.log.addHandler(queue_handler)
+
+		self.log_handlers = [queue_handler, stream_handler, file_handler]
+		self.log_sampled = logqueue.SampledLog(self.log, log_level <= logging.DEBUG)
+
+		# Open event stream. The events of each version in the matrix are
+		# written to the stream of the matrix build.
+		if self.parent is not None:
+			self.events = self.parent.events.derive(version=self.version['version'])
+		else:
+			self.events = EventStream.open(self.events_target)
+		if self.config['history']['enabled']:
+			history = BuildHistory(get_history_file(self.config))
+			self.events.listeners.append(HistoryRecorder(history, self.config['name'], self.config_file).handle)
+
+	def open_jython_cache(self, command):
+		"""
+		Opens the cache of compiled python classes.
+
+		*command* (``list`` of ``str``) is the command used to execute
+		Jython.
+
+		Returns a ``tuple`` containing: the cache (``JythonCache``), and the
+		version of Jython (``str``); or ``None`` if the cache is disabled or
+		the version of Jython could not be determined.
+		"""
+		if not self.config['jython_cache']['enabled']:
+			return None
+		cache = JythonCache(get_cache_dir(self.config), int(self.config['jython_cache']['max_size'] * 1024 * 1024))
+		try:
+			version = cache.get_version(command)
+		except (OSError, subprocess.CalledProcessError) as e:
+			self.log.warning("Not caching compiled python classes because the Jython version could not be determined: {}".format(e))
+			return None
+		self.log.debug("jython version:{!r}".format(version))
+		return cache, version
+
+	def order_classes(self, index, sources):
+		"""
+		Orders the compiled classes of the mod to package. When the mod JAR
+		is indexed, the hot classes come first, and the classes are then
+		ordered breadth first from the classes which are not used by other
+		classes (e.g., the main mod class) so that classes are near the
+		classes which load them. Otherwise they are ordered by name.
+
+		*index* (``ClassIndex``) is the index of the compiled classes.
+
+		*sources* (``dict``) maps each class file of the mod (``str``) to its
+		source file (``str``).
+
+		Returns the ordered class files (``list`` of ``str``).
+		"""
+		class_files = sorted(sources, key=lambda class_file: self.get_hot_key((class_file,)))
+		if not self.config['build']['index']:
+			return class_files
+
+		by_name = dict((index.files[class_file]['class']['name'], class_file) for class_file in class_files)
+		used = set()
+		for class_file in class_files:
+			used.update(index.files[class_file]['class']['references'])
+		hot = [class_file for class_file in class_files if self.get_hot_key((class_file,))[0] == 0]
+		roots = [class_file for class_file in class_files if index.files[class_file]['class']['name'] not in used]
+
+		order, seen = [], set()
+		for start in itertools.chain(hot, roots, class_files):
+			if start in seen:
+				continue
+			seen.add(start)
+			pending = collections.deque([start])
+			while pending:
+				class_file = pending.popleft()
+				order.append(class_file)
+				for ref in index.files[class_file]['class']['references']:
+					ref_file = by_name.get(ref)
+					if ref_file is not None and ref_file not in seen:
+						seen.add(ref_file)
+						pending.append(ref_file)
+		return order
 
 	def run(self):
 		"""
@@ -283,20 +1154,379 @@ class BuildCommand(object):
 
 		# Build mod.
 		try:
-			result = self.run_work()
-		except:
-			self.log.error("Failed to build mod.", exc_info=sys.exc_info())
-			result = 1
-		if result:
-			self.log.info("Exiting because of error.")
+			start = time.time()
+			self.events.emit('build_start', config_file=self.config_file, force=self.force)
+			try:
+				result = self.run_work()
+			except:
+				self.log.error("Failed to build mod.", exc_info=sys.exc_info())
+				result = 1
+			self.events.emit('build_end', result=result, seconds=round(time.time() - start, 3))
+			if result:
+				self.log.info("Exiting because of error.")
+			elif self.watch:
+				result = self.run_watch()
+		finally:
+			self.close_logging()
 		return result
 
-	def run_work(self):
+	def run_matrix(self):
+		"""
+		Builds the mod against each version in the matrix concurrently. The
+		mod source is scanned once and shared by the builds of the versions
+		which each run the other stages in their own build directory.
+
+		Returns the exit code (``int``).
+		"""
+		build_dir = self.config['build']['dir']
+		start = time.time()
+		self.timings = []
+		result = self.run_stages(Checkpoints(build_dir), ['scan'])
+		if result:
+			return result
+
+		builds = []
+		for entry in self.config['matrix']['versions']:
+			build = self.matrix_builds.get(entry['version'])
+			if build is None:
+				build = BuildCommand(self.config_file)
+				build.keep_jython = self.keep_jython
+				build.parent = self
+				self.matrix_builds[entry['version']] = build
+			build.force = self.force
+			build.link = self.link
+			build.verbose = self.verbose
+			build.version = entry
+			builds.append(build)
+		del entry
+
+		jobs = min(self.config['matrix']['jobs'] or len(builds), len(builds))
+		self.log.info("Build {} version(s) with {} job(s).".format(len(builds), jobs))
+		self.flush_logging()
+		pool = ThreadPool(jobs)
+		try:
+			results = pool.map(self.run_version, builds, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+
+		self.write_matrix_timings(builds, results, time.time() - start)
+		failed = [build.version['version'] for build, (result, _) in zip(builds, results) if result]
+		if failed:
+			self.log.error("Failed to build version(s): {}.".format(", ".join(failed)))
+			return 1
+		return 0
+
+	def run_process(self, command, cwd=None):
+		"""
+		Runs the subprocess, and waits for it to finish. Its output is
+		streamed into the build log as it is written, and parsed by
+		``MCPMonitor`` to time its phases for the timing report.
+
+		*command* (``list`` of ``str``) is the command to execute.
+
+		*cwd* (``str``) is the directory to execute the command in. Default
+		is ``None`` for the current working directory.
+
+		Raises ``subprocess.CalledProcessError`` if the subprocess fails.
+		"""
+		name = os.path.basename(command[0])
+		log = self.log.getChild(name)
+		output = MCPMonitor(name)
+		tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+		start = time.time()
+		try:
+			proc = subprocess.Popen(command, close_fds=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		except OSError as e:
+			# Add the executed file to the error.
+			e.args += (command[0],)
+			e.filename = command[0]
+			raise
+
+		monitor = self.start_monitor(proc.pid, name)
+		try:
+			# - NOTE: Lines are only queued for the log so reading the output
+			#   is not slowed down by writing it.
+			for line in iter(proc.stdout.readline, b''):
+				line = line.decode('UTF-8', 'replace').rstrip()
+				if not line:
+					continue
+				level = output.feed(line, time.time() - start)
+				log.log(level, line)
+				if level < logging.WARNING:
+					tail.append(line)
+			returncode = proc.wait()
+		finally:
+			if proc.poll() is None:
+				proc.kill()
+				proc.wait()
+			proc.stdout.close()
+			self.stop_monitor(monitor, name)
+
+		seconds = time.time() - start
+		output.finish(seconds)
+		phases = output.get_results()
+		if self.timings:
+			self.timings[-1]['phases'].extend(phases)
+		for phase in phases:
+			self.events.emit('phase', command=name, **phase)
+		self.events.emit('process', command=name, result=returncode, seconds=round(seconds, 3), mcp_seconds=output.mcp_seconds)
+		self.events.flush()
+
+		if returncode:
+			if self.verbose < 1 and tail:
+				# Show the output which was not logged at the default level.
+				log.error("Exited with {} after:\n{}".format(returncode, "\n".join(tail)))
+			raise subprocess.CalledProcessError(returncode, command)
+
+	def run_stage(self, stage):
+		"""
+		Runs the specified stage of the build.
+
+		*stage* (``str``) is the name of the stage to run. See ``STAGES``.
+
+		Returns the exit code (``int``).
+		"""
+		return getattr(self, 'stage_' + stage)() or 0
+
+	def run_stages(self, checkpoints, stages):
+		"""
+		Runs the stages of the build. See ``run_work()``.
+
+		*checkpoints* (``Checkpoints``) contains the checkpoints of the
+		stages.
+
+		*stages* (``Container`` of ``str``) optionally contains the stages to
+		run.
+
+		Returns the exit code (``int``).
+		"""
+		resume = stages is None
+		for stage in STAGES:
+			if stages is not None and stage not in stages:
+				continue
+
+			fingerprint = self.get_fingerprint(stage)
+			if fingerprint is not None and resume:
+				if fingerprint == checkpoints.get(stage):
+					if self.get_outputs(stage) == checkpoints.get_outputs(stage):
+						self.log.info("Skip {} stage because it is unchanged.".format(stage))
+						self.events.emit('stage_skip', stage=stage)
+						continue
+					self.log.info("Run {} stage because its outputs changed.".format(stage))
+
+				# Every following stage must be run because this one is, so
+				# their checkpoints are no longer valid.
+				resume = False
+				checkpoints.clear(STAGES[STAGES.index(stage):])
+
+			timing = {'stage': stage, 'start': time.time(), 'seconds': None, 'phases': [], 'resources': []}
+			self.timings.append(timing)
+			self.events.emit('stage_start', stage=stage)
+			try:
+				result = self.run_stage(stage)
+			except:
+				result = 1
+				raise
+			finally:
+				timing['seconds'] = round(time.time() - timing['start'], 3)
+				self.events.emit('stage_end', stage=stage, result=result, seconds=timing['seconds'])
+				self.events.flush()
+			if result:
+				return result
+
+			if fingerprint is not None:
+				checkpoints.set(stage, fingerprint, self.get_outputs(stage))
+		return 0
+
+	def run_version(self, build):
+		"""
+		Builds the version of the mod from the matrix. This is run on a
+		thread of the matrix build.
+
+		*build* (``BuildCommand``) is the build of the version.
+
+		Returns a ``tuple`` containing: the exit code (``int``), and the
+		number of seconds the build took (``float``).
+		"""
+		label = build.version['version']
+		start = time.time()
+		build.timings = []
+		try:
+			build.init_config()
+			build.init_logging()
+		except:
+			self.log.error("Failed to initialize the build of version {}.".format(label), exc_info=sys.exc_info())
+			return 1, time.time() - start
+
+		try:
+			build.events.emit('build_start', config_file=self.config_file, force=build.force)
+			try:
+				result = build.run_work()
+			except:
+				build.log.error("Failed to build mod.", exc_info=sys.exc_info())
+				result = 1
+			seconds = time.time() - start
+			build.events.emit('build_end', result=result, seconds=round(seconds, 3))
+		finally:
+			build.close_logging()
+		return result, seconds
+
+	def run_watch(self):
+		"""
+		Watches the source and library directories, and rebuilds the mod
+		whenever they change until interrupted. Only the stages affected by
+		the changed files are run again.
+
+		Returns the exit code (``int``).
+		"""
+		source_dir = self.config['source']['dir']
+		lib_dir = self.config['library']['dir']
+		watcher = watch.create_watcher([source_dir, lib_dir])
+		self.log.info("Watch {!r} for changes.".format([os.path.basename(path) for path in watcher.paths]))
+		try:
+			while True:
+				changed = watcher.wait()
+				stages = self.get_stages(changed)
+				if not stages:
+					continue
+
+				if watch.RESCAN in changed:
+					self.log.info("Rebuild everything because the changed files are unknown.")
+				else:
+					self.log.info("Rebuild {} for {} changed file(s).".format(', '.join(stages), len(changed)))
+				start = time.time()
+				self.events.emit('build_start', config_file=self.config_file, stages=stages)
+				try:
+					result = self.run_work(stages=stages)
+				except:
+					self.log.error("Failed to build mod.", exc_info=sys.exc_info())
+					result = 1
+				self.events.emit('build_end', result=result, seconds=round(time.time() - start, 3))
+				self.events.flush()
+				if result:
+					self.log.info("Waiting for changes because of error.")
+
+		except KeyboardInterrupt:
+			pass
+
+		finally:
+			watcher.close()
+
+		return 0
+
+	def run_work(self, stages=None):
 		"""
 		Perform the actual work of the "build" command.
 
+		*stages* (``Container`` of ``str``) optionally contains the stages to
+		run. Default is ``None`` to resume from the first stage whose inputs
+		or outputs changed since its checkpoint was recorded, or a previous
+		stage was run. See ``STAGES``.
+
 		Returns the exit code (``int``).
 		"""
+		if self.config['matrix']['versions']:
+			return self.run_matrix()
+
+		build_dir = self.config['build']['dir']
+		checkpoints = Checkpoints(build_dir)
+		if self.force and stages is None:
+			checkpoints.clear()
+
+		self.timings = []
+		try:
+			return self.run_stages(checkpoints, stages)
+		finally:
+			self.write_timings()
+
+	def scan_forge(self):
+		"""
+		Finds the Forge and MCP source files.
+		"""
+		# Find Forge and MCP source files.
+		# - NOTE: The scan is cached between builds run by the same process
+		#   (i.e., the daemon) until the modified time of the source
+		#   directory changes which happens when Forge is set up again.
+		forge_dir = self.config['forge']['dir']
+		mcp_dir = self.config['forge']['mcp_dir']
+		mcp_src_dir = os.path.join(mcp_dir, 'src', 'minecraft')
+		mcp_src_mtime = os.path.getmtime(mcp_src_dir)
+		if self.mcp_src_index is not None and self.mcp_src_index[:2] == (mcp_src_dir, mcp_src_mtime):
+			self.log.info("Reuse scan of {!r}.".format(util.short_path(mcp_src_dir, forge_dir)))
+			self.events.emit('cache', name='mcp_scan', hits=1, misses=0)
+		else:
+			self.log.info("Scan {!r}.".format(util.short_path(mcp_src_dir, forge_dir)))
+			self.mcp_src_index = (mcp_src_dir, mcp_src_mtime, list(pathspec.iter_tree(mcp_src_dir)))
+			self.events.emit('cache', name='mcp_scan', hits=0, misses=1)
+		del mcp_src_mtime
+
+	def scan_source(self):
+		"""
+		Finds the java and python source files of the mod.
+		"""
+		# Find java source files.
+		source_dir = self.config['source']['dir']
+		self.log.info("Scan {!r}.".format(os.path.basename(source_dir)))
+		java_spec = self.config['source']['java']
+		self.java_class_files = {}
+		self.java_source_files = []
+		file_path, class_file, src_file = None, None, None
+		for file_path in java_spec.match_tree(source_dir):
+			# Record java source file to be copied later.
+			self.java_source_files.append(file_path)
+
+			# Record source of java source file for java class file.
+			class_file = os.path.splitext(file_path)[0] + '.class'
+			src_file = os.path.join(source_dir, file_path)
+			self.java_class_files[class_file] = {
+				'path': file_path,
+				'src': src_file,
+			}
+		del file_path, class_file, src_file
+		del java_spec
+
+		# Find python source files.
+		python_spec = self.config['source']['python']
+		self.python_class_files = {}
+		self.python_source_files = []
+		file_path, class_file, src_file = None, None, None
+		for file_path in python_spec.match_tree(source_dir):
+			# Record python source file to be copied later.
+			self.python_source_files.append(file_path)
+
+			# Record source of python source file for python class file.
+			class_file = os.path.splitext(file_path)[0] + '$py.class'
+			src_file = os.path.join(source_dir, file_path)
+			self.python_class_files[class_file] = {
+				'path': file_path,
+				'src': src_file,
+			}
+		del file_path, class_file, src_file
+		del python_spec
+
+	def sort_libraries(self, paths):
+		"""
+		Sorts the libraries to package in their order of precedence.
+
+		*paths* (``Iterable`` of ``str``) contains the paths of the libraries
+		relative to the library directory.
+
+		Returns the sorted paths (``list`` of ``str``).
+		"""
+		specs = [pathspec.PathSpec.from_lines('gitignore', [pattern]) for pattern in self.config['library']['precedence']]
+		def rank(path):
+			for i, spec in enumerate(specs):
+				if spec.match_file(path):
+					return (i, path)
+			return (len(specs), path)
+		return sorted(paths, key=rank)
+
+	def stage_prepare(self):
+		"""
+		Generates the MCP configuration and copies the MCP directories to
+		the build directory.
+		"""
 		# Generate MCP configuration.
 		build_dir = self.config['build']['dir']
 		lib_dir = self.config['library']['dir']
@@ -318,94 +1548,91 @@ class BuildCommand(object):
 		config.set('DEFAULT', 'DirTempBin', os.path.join(build_dir, 'temp', 'bin'))
 		config.set('DEFAULT', 'DirTempCls', os.path.join(build_dir, 'temp', 'cls'))
 		config.set('DEFAULT', 'DirTempSrc', os.path.join(build_dir, 'temp', 'src'))
-		with open(mcp_file, mode='wb') as fh:
+		with open(mcp_file, mode='w') as fh:
 			config.write(fh)
 
-		mcp_dir = self.config['forge']['mcp_dir']
-		mcp_args = {'close_fds': True, 'cwd': mcp_dir}
-
 		# Copy MCP directories.
 		# - "bin" is where all of the java classes get compiled to,
 		#   including those belonging to the mod.
 		# - "temp" contains some miscellaneous files, and recompile and
 		#   reobfuscate generate a couple jars here.
 		forge_dir = self.config['forge']['dir']
-		src_dir, dest_dir = None, None
-		for src_dir, dest_dir in [
-			(os.path.join(mcp_dir, 'bin'), os.path.join(build_dir, 'bin')),
-			(os.path.join(mcp_dir, 'temp'), os.path.join(build_dir, 'temp')),
+		mcp_dir = self.config['forge']['mcp_dir']
+		# - NOTE: Only "bin" can be linked because MCP cleans it before
+		#   recompiling instead of writing over its files, while the jars in
+		#   "temp" are written over.
+		src_dir, dest_dir, link, counts = None, None, None, None
+		for src_dir, dest_dir, link in [
+			(os.path.join(mcp_dir, 'bin'), os.path.join(build_dir, 'bin'), self.config['forge']['link']),
+			(os.path.join(mcp_dir, 'temp'), os.path.join(build_dir, 'temp'), False),
 		]:
-			self.log.info("Copy from {!r} to {!r}.".format(util.short_path(src_dir, forge_dir), util.short_path(dest_dir, build_dir)))
-			util.sync_files(src_dir, dest_dir)
-		del src_dir, dest_dir
+			self.log.info("{} from {!r} to {!r}.".format("Link" if link else "Copy", util.short_path(src_dir, forge_dir), util.short_path(dest_dir, build_dir)))
+			counts = util.sync_files(src_dir, dest_dir, link=link)
+			self.events.emit('files', stage='prepare', dir=util.short_path(dest_dir, build_dir), **counts)
+		del src_dir, dest_dir, link, counts
 
-		# Find Forge and MCP source files.
-		mcp_src_dir = os.path.join(mcp_dir, 'src', 'minecraft')
-		self.log.info("Scan {!r}.".format(util.short_path(mcp_src_dir, forge_dir)))
-		mcp_src_files = list(pathspec.iter_tree(mcp_src_dir))
+	def stage_scan(self):
+		"""
+		Finds the Forge, MCP and mod source files.
+		"""
+		# - NOTE: The matrix build only scans the mod source which is shared
+		#   by the builds of its versions, and they each scan the Forge and
+		#   MCP source of their version.
+		if not self.config['matrix']['versions']:
+			self.scan_forge()
+		if self.parent is not None:
+			source_dir = self.config['source']['dir']
+			self.log.info("Reuse scan of {!r}.".format(os.path.basename(source_dir)))
+			self.java_class_files = self.parent.java_class_files
+			self.java_source_files = self.parent.java_source_files
+			self.python_class_files = self.parent.python_class_files
+			self.python_source_files = self.parent.python_source_files
+		else:
+			self.scan_source()
 
-		# Find java source files.
+		mcp_files = self.mcp_src_index[2] if self.mcp_src_index is not None else ()
+		self.events.emit('files', stage='scan', mcp=len(mcp_files), java=len(self.java_source_files), python=len(self.python_source_files))
+
+	def stage_copy(self):
+		"""
+		Copies source files to the "src" directory. This is the aggregation
+		of all java source code which includes the source for Forge, MCP,
+		and the project source code (including the python source code).
+		"""
+		build_dir = self.config['build']['dir']
+		forge_dir = self.config['forge']['dir']
 		source_dir = self.config['source']['dir']
-		self.log.info("Scan {!r}.".format(os.path.basename(source_dir)))
+		mcp_src_dir, _, mcp_src_files = self.mcp_src_index
 		dest_dir = os.path.join(build_dir, 'src', 'minecraft')
-		java_spec = self.config['source']['java']
-		java_class_files = {}
-		java_source_files = []
-		file_path, class_file, src_file, dest_file = None, None, None, None
-		for file_path in java_spec.match_tree(source_dir):
-			# Record java source file to be copied later.
-			java_source_files.append(file_path)
-
-			# Record source and destination of java source file for java class
-			# file.
-			class_file = os.path.splitext(file_path)[0] + '.class'
-			src_file = os.path.join(source_dir, file_path)
-			#dest_file = os.path.join(dest_dir, file_path)
-			java_class_files[class_file] = {
-				'src': src_file,
-				#'dest': dest_file,
-			}
-		del file_path, class_file, src_file, dest_file
-		del java_spec
-
-		# Find python source files.
-		python_spec = self.config['source']['python']
-		python_class_files = {}
-		python_source_files = []
-		file_path, class_file, src_file, dest_file = None, None, None, None
-		for file_path in python_spec.match_tree(source_dir):
-			# Record python source file to be copied later.
-			python_source_files.append(file_path)
-
-			# Record source and destination of python source file for python
-			# class file.
-			class_file = os.path.splitext(file_path)[0] + '$py.class'
-			src_file = os.path.join(source_dir, file_path)
-			#dest_file = os.path.join(dest_dir, file_path)
-			python_class_files[class_file] = {
-				'src': src_file,
-				#'dest': dest_file,
-			}
-		del file_path, class_file, src_file, dest_file
-		del python_spec
 
-		# Copy source files to the "src" directory. This is the aggregation
-		# of all java source code which includes the source for Forge, MCP,
-		# and the project source code (including the python source code).
 		dest_files = set()
 		dest_files.update(mcp_src_files)
-		dest_files.update(java_source_files)
-		dest_files.update(python_source_files)
+		dest_files.update(self.java_source_files)
+		dest_files.update(self.python_source_files)
 
-		# Copy Forge and MCP source.
-		self.log.info("Copy from {!r} to {!r}.".format(util.short_path(mcp_src_dir, forge_dir), util.short_path(dest_dir, build_dir)))
-		util.sync_files(mcp_src_dir, dest_dir, files=mcp_src_files, keep=dest_files)
+		# Keep compiled python class files so that they do not have to be
+		# recompiled when only java source changes.
+		dest_files.update(self.python_class_files)
+
+		# Copy Forge and MCP source. This is only read by MCP so it can be
+		# linked.
+		link = self.config['forge']['link']
+		self.log.info("{} from {!r} to {!r}.".format("Link" if link else "Copy", util.short_path(mcp_src_dir, forge_dir), util.short_path(dest_dir, build_dir)))
+		counts = util.sync_files(mcp_src_dir, dest_dir, files=mcp_src_files, keep=dest_files, link=link)
+		self.events.emit('files', stage='copy', dir=util.short_path(mcp_src_dir, forge_dir), **counts)
 
 		# Copy java and python source files to build directory.
 		self.log.info("Copy from {!r} to {!r}.".format(os.path.basename(source_dir), util.short_path(dest_dir, build_dir)))
-		util.sync_files(source_dir, dest_dir, files=itertools.chain(java_source_files, python_source_files), keep=dest_files)
+		counts = util.sync_files(source_dir, dest_dir, files=itertools.chain(self.java_source_files, self.python_source_files), keep=dest_files)
+		self.events.emit('files', stage='copy', dir=os.path.basename(source_dir), **counts)
 
-		# Compile mod.
+	def stage_compile(self):
+		"""
+		Compiles the mod using MCP.
+		"""
+		build_dir = self.config['build']['dir']
+		mcp_file = os.path.join(build_dir, MCP_CONFIG_FILE)
+		mcp_dir = self.config['forge']['mcp_dir']
 		self.log.info("Compile mod.")
 		if IS_WINDOWS:
 			command = ['recompile.bat']
@@ -413,17 +1640,61 @@ class BuildCommand(object):
 			command = ['./recompile.sh']
 		command += ['-c', mcp_file]
 		try:
-			subprocess.check_call(command, **mcp_args)
-		except OSError as e:
-			# Add the executed file to the error.
-			e.args += (command[0],)
-			e.filename = command[0]
-			raise
-
-		# Obfuscate mod.
+			self.run_process(command, cwd=mcp_dir)
+		finally:
+			self.check_mcp_log()
+
+		# Update the dependency graph of the mod classes, and report the
+		# classes affected by the changes.
+		# - NOTE: MCP always recompiles everything so this cannot limit the
+		#   classes which get compiled.
+		bin_dir = os.path.join(build_dir, 'bin', 'minecraft')
+		index, changed, sources = self.index_classes(bin_dir, 'bin')
+		if len(changed) == len(index.files) and all(entry is None for entry in changed.values()):
+			self.log.info("Index {} mod classes.".format(len(sources)))
+			return
+
+		changed_names, all_affected = set(), False
+		class_file, old_entry, new_entry, old_class, new_class = None, None, None, None, None
+		for class_file, old_entry in changed.items():
+			new_entry = index.files.get(class_file)
+			if class_file not in sources and (new_entry or not old_entry):
+				continue
+			old_class = old_entry['class'] if old_entry else None
+			new_class = new_entry['class'] if new_entry else None
+			if not (new_class or old_class):
+				continue
+			changed_names.add((new_class or old_class)['name'])
+			# Compile time constants are inlined by the compiler so the
+			# classes using them cannot be determined.
+			old_constants = old_class['constants'] if old_class else None
+			new_constants = new_class['constants'] if new_class else None
+			if old_constants != new_constants:
+				all_affected = True
+		del class_file, old_entry, new_entry, old_class, new_class
+
+		classes = [index.files[class_file]['class'] for class_file in sources]
+		if all_affected:
+			dependents = set(info['name'] for info in classes) - changed_names
+			self.log.info("Changed {} class(es) with compile time constants, assume all {} other class(es) are affected.".format(len(changed_names), len(dependents)))
+		else:
+			dependents = find_dependents(classes, changed_names)
+			self.log.info("Changed {} class(es) affecting {} dependent class(es).".format(len(changed_names), len(dependents)))
+		for name in sorted(changed_names):
+			self.log.debug("Changed {!r}.".format(name))
+		for name in sorted(dependents):
+			self.log.debug("Affected {!r}.".format(name))
+
+	def stage_obfuscate(self):
+		"""
+		Obfuscates the mod using MCP.
+		"""
 		# - NOTE: I do not have a particularly good reason to use the SRG
 		#   variation to obfuscate other than that is the one I got working
 		#   from an example.
+		build_dir = self.config['build']['dir']
+		mcp_file = os.path.join(build_dir, MCP_CONFIG_FILE)
+		mcp_dir = self.config['forge']['mcp_dir']
 		self.log.info("Obfuscate mod.")
 		if IS_WINDOWS:
 			command = ['reobfuscate_srg.bat']
@@ -431,84 +1702,124 @@ class BuildCommand(object):
 			command = ['./reobfuscate_srg.sh']
 		command += ['-c', mcp_file]
 		try:
-			subprocess.check_call(command, **mcp_args)
-		except OSError as e:
-			# Add the executed file to the error.
-			e.args += (command[0],)
-			e.filename = command[0]
-			raise
+			self.run_process(command, cwd=mcp_dir)
+		finally:
+			self.check_mcp_log()
 
-		# Compile python source files to class files.
-		if python_class_files:
-			# Find jython.
-			self.log.info("Find Jython.")
-			command = None
-			jython_exe = self.config['jython']['jython_exe'] or util.find_exe('jython')
-			if jython_exe:
-				if not os.path.isfile(jython_exe):
-					self.log.error("Jython executable could not be found at {!r}.".format(jython_exe))
-					self.log.error("You must set the Jython executable in the configuration {!r}.".format(self.config_file))
-					return 1
-				self.log.debug("jython:{!r}".format(jython_exe))
-				command = [jython_exe]
+	def stage_jython(self):
+		"""
+		Compiles python source files to class files.
 
-			else:
-				# Find java.
-				java_exe = self.config['jython']['java_exe'] or util.find_exe('java')
-				if not java_exe:
-					java_error = "Java executable could not be found."
-				elif not os.path.isfile(java_exe):
-					java_error = "Java executable could not be found at {!r}.".format(java_exe)
-				else:
-					java_error = None
+		Returns the exit code (``int``).
+		"""
+		if not self.python_class_files:
+			return 0
+
+		# Find jython.
+		self.log.info("Find Jython.")
+		command = self.find_jython()
+		if command is None:
+			return 1
 
-				jython_jar = self.config['jython']['jython_jar']
-				if not jython_jar:
-					jar_error = "Jython JAR could not be found."
-				elif not os.path.isfile(jython_jar):
-					jar_error = "Jython JAR could not be found at {!r}.".format(jython_jar)
+		# Restore the compiled classes of unchanged python source from the
+		# cache so that only the misses are compiled.
+		build_dir = self.config['build']['dir']
+		dest_dir = os.path.join(build_dir, 'src', 'minecraft')
+		cached = self.open_jython_cache(command)
+		misses = None
+		if cached is not None:
+			cache, version = cached
+			misses = {}
+			class_file, class_info, key, data = None, None, None, None
+			for class_file, class_info in sorted(self.python_class_files.items()):
+				with open(os.path.join(dest_dir, class_info['path']), 'rb') as fh:
+					key = cache.get_key(version, class_info['path'], fh.read())
+				data = cache.get(key)
+				if data is None:
+					misses[class_file] = key
+					continue
+				with open(os.path.join(dest_dir, class_file), 'wb') as fh:
+					fh.write(data)
+			del class_file, class_info, key, data
+			hits = len(self.python_class_files) - len(misses)
+			self.log.info("Restored {} of {} compiled python class(es) from {!r}.".format(hits, len(self.python_class_files), cache.cache_dir))
+			self.events.emit('cache', name='jython', hits=hits, misses=len(misses))
+			if not misses:
+				return 0
+
+		# Compile python source with jython.
+		self.log.info("Compile python source.")
+		if misses is not None:
+			source_files = sorted(self.python_class_files[class_file]['path'] for class_file in misses)
+		if self.keep_jython:
+			if self.jython_worker is None or self.jython_worker.command != command:
+				self.close()
+				self.jython_worker = JythonWorker(command)
+			else:
+				self.log.info("Reuse running Jython.")
+			self.flush_logging()
+			name = os.path.basename(command[0])
+			# - NOTE: Jython is started before it is monitored so that the
+			#   first compile, and those after a restart, are sampled too.
+			if not self.jython_worker.is_running():
+				self.jython_worker.start()
+			monitor = self.start_monitor(self.jython_worker.process.pid, name)
+			try:
+				# - NOTE: The source files are compiled relative to the
+				#   destination directory because the compiled classes record
+				#   their source file, and are cached by their relative path.
+				if misses is not None:
+					compiled = self.jython_worker.compile_paths(source_files, cwd=dest_dir)
 				else:
-					jar_error = None
-				jython_error = "Jython executable could not be found."
-
-				if java_error and jar_error:
-					# No java executable and no jython jar.
-					self.log.error(jython_error)
-					self.log.error(java_error)
-					self.log.error(jar_error)
-					self.log.error("You must set either the Jython executable or the Java executable with the Jython JAR in the configuration {!r}.".format(self.config_file))
-					return 1
-				elif not java_error and jar_error:
-					# Found java executable but not jython jar.
-					self.log.error(jython_error)
-					self.log.error(jar_error)
-					self.log.error("You must set either the Jython executable or the Jython JAR in the configuration {!r}.".format(self.config_file))
-					return 1
-				elif java_error and not jar_error:
-					# No java executable but we found jython jar.
-					self.log.error(java_error)
-					self.log.error("You must set the Java executable in the configuration {!r}.".format(self.config_file))
-					return 1
-				self.log.debug("java:{!r}".format(java_exe))
-				self.log.debug("jar:{!r}".format(jython_jar))
-				command = [java_exe, '-jar', jython_jar]
-
-			# Compile python source with jython.
-			self.log.info("Compile python source.")
+					compiled = self.jython_worker.compile_paths([dest_dir])
+			finally:
+				self.stop_monitor(monitor, name)
+			if not compiled:
+				raise subprocess.CalledProcessError(1, command)
+		elif misses is not None:
+			# - NOTE: The source files are compiled relative to the
+			#   destination directory to keep the command lines short.
+			for i in range(0, len(source_files), JYTHON_BATCH_SIZE):
+				self.run_process(command + ['-m', 'compileall'] + source_files[i:i + JYTHON_BATCH_SIZE], cwd=dest_dir)
+		else:
 			command += ['-m', 'compileall', dest_dir]
-			try:
-				subprocess.check_call(command, close_fds=True)
-			except OSError as e:
-				# Add the executable file to the error.
-				e.args += (command[0],)
-				e.filename = command[0]
-				raise
+			self.run_process(command)
+
+		# Cache the compiled classes of the misses.
+		if misses is not None:
+			class_file, key, class_path = None, None, None
+			for class_file, key in misses.items():
+				class_path = os.path.join(dest_dir, class_file)
+				if os.path.exists(class_path):
+					with open(class_path, 'rb') as fh:
+						cache.put(key, fh.read())
+			del class_file, key, class_path
+			evicted = cache.prune()
+			if evicted:
+				self.log.info("Evicted {} least recently used class(es) from the Jython cache.".format(evicted))
+		return 0
 
-		# Package mod in JAR.
+	def stage_package(self):
+		"""
+		Packages the mod in its JAR.
+		"""
+		build_dir = self.config['build']['dir']
+		lib_dir = self.config['library']['dir']
+		source_dir = self.config['source']['dir']
+		dest_dir = os.path.join(build_dir, 'src', 'minecraft')
 		name = self.config['name']
 		mod_jar_file = os.path.join(build_dir, name + '.jar')
 		self.log.info("Create mod jar at {!r}.".format(util.short_path(mod_jar_file, build_dir)))
-		with zipfile.ZipFile(mod_jar_file, 'w', zipfile.ZIP_DEFLATED) as mod_fh:
+
+		# - NOTE: The JAR is written to a temporary file which then replaces
+		#   the JAR instead of being written in place because installed
+		#   copies of the JAR may be hard links to it.
+		temp_jar_file = mod_jar_file + '.tmp'
+		with zipfile.ZipFile(temp_jar_file, 'w', zipfile.ZIP_DEFLATED) as mod_fh:
+			# - NOTE: Every entry is written through the package writer which
+			#   skips duplicate entries. The first entry written has
+			#   precedence.
+			writer = PackageWriter(mod_fh)
 
 			# Package compiled java code. Only copy compiled java classes
 			# originating from the source directory.
@@ -518,36 +1829,43 @@ class BuildCommand(object):
 			#   classes.
 			self.log.info("Package compiled java code.")
 			reobf_dir = os.path.join(build_dir, 'reobf', 'minecraft')
+			# - NOTE: The classes are matched to the source files they were
+			#   compiled from so that inner classes are packaged too.
 			self.log.info("Copy {!r} into {!r}.".format(util.short_path(reobf_dir, build_dir), util.short_path(mod_jar_file, build_dir)))
+			reobf_index, _, sources = self.index_classes(reobf_dir, 'reobf')
+			relocator = self.config['library']['relocate']
 			class_file, class_info, src_file = None, None, None
-			for class_file, class_info in java_class_files.items():
+			for class_file in self.order_classes(reobf_index, sources):
 				src_file = os.path.join(reobf_dir, class_file)
-				if os.path.exists(src_file):
-					self.log.debug("Copy {!r} to {!r}.".format(util.short_path(src_file, reobf_dir), class_file))
-					mod_fh.write(src_file, arcname=class_file)
+				self.log_sampled.debug("java class", "Package {!r}.", class_file)
+				if relocator:
+					# Relocate the references to relocated library packages.
+					with open(src_file, 'rb') as fh:
+						writer.writestr(relocator.relocate_name(class_file.replace(os.sep, '/')), relocator.relocate_class(fh.read()), "mod")
 				else:
-					self.log.warning("Source file {!r} was not compiled to class file {!r}.".format(util.short_path(class_info['src'], source_dir), util.short_path(src_file, reobf_dir)))
-			del class_file, class_info, src_file
-			del java_class_files
+					writer.write(src_file, class_file, "mod")
+			compiled = set(sources.values())
+			for class_file, class_info in self.java_class_files.items():
+				if class_info['path'] not in compiled:
+					self.log.warning("Source file {!r} was not compiled to class file {!r}.".format(util.short_path(class_info['src'], source_dir), util.short_path(os.path.join(reobf_dir, class_file), reobf_dir)))
+			del class_file, class_info, src_file, compiled
 
 			# Package compiled python code.
-			# - TODO: Copy source file as well.
-			if python_class_files:
+			if self.python_class_files:
 				self.log.info("Package compiled python code.")
 				class_file, class_info, src_file = None, None, None
-				for class_file, class_info in python_class_files.items():
+				for class_file, class_info in sorted(self.python_class_files.items(), key=self.get_hot_key):
 					# Copy python class file.
 					src_file = os.path.join(dest_dir, class_file)
 					if os.path.exists(src_file):
-						self.log.debug("Copy {!r} to {!r}.".format(util.short_path(src_file, dest_dir), class_file))
-						mod_fh.write(src_file, arcname=class_file)
+						self.log_sampled.debug("python class", "Package {!r}.", class_file)
+						writer.write(src_file, class_file, "mod")
 					else:
 						self.log.warning("Source file {!r} was not compiled to class file {!r}.".format(util.short_path(class_info['src'], source_dir), util.short_path(src_file, dest_dir)))
 					# Copy python source file.
-					# - TODO: class_info['src'] needs to be relative not absolute.
 					if os.path.exists(class_info['src']):
-						self.log.debug("Copy {!r} to {!r}.".format(util.short_path(class_info['src'], source_dir), ))
-						mod_fh.write() # TODO
+						self.log_sampled.debug("python source", "Package {!r}.", class_info['path'])
+						writer.write(class_info['src'], class_info['path'], "mod")
 				del class_file, class_info, src_file
 
 			# Copy assets/extra files.
@@ -558,8 +1876,8 @@ class BuildCommand(object):
 				for file_path in extra_spec.match_tree(source_dir):
 					src_file = os.path.join(source_dir, file_path)
 					dest_file = file_path
-					self.log.debug("Copy {!r} to {!r}.".format(util.short_path(src_file, source_dir), dest_file))
-					mod_fh.write(src_file, arcname=dest_file)
+					self.log_sampled.debug("extra file", "Package {!r}.", dest_file)
+					writer.write(src_file, dest_file, "mod")
 				del file_path, src_file, dest_file
 			del extra_spec
 
@@ -567,15 +1885,464 @@ class BuildCommand(object):
 			lib_spec = self.config['library']['package']
 			if lib_spec:
 				self.log.info("Package libraries.")
-				path, lib_file, info = None, None, None
-				for path in lib_spec.match_tree(lib_dir):
-					lib_file = os.path.join(lib_dir, path)
+				lib_files = [os.path.join(lib_dir, path) for path in self.sort_libraries(lib_spec.match_tree(lib_dir))]
+				lib_digests = {}
+				if self.config['library']['shrink'] or relocator:
+					lib_digests = dict((lib_file, util.file_digest(lib_file)) for lib_file in lib_files)
+
+				# Find the library classes which cannot be reached from the
+				# mod.
+				remove = {}
+				shrink_stats, relocate_stats = collections.Counter(), collections.Counter()
+				if self.config['library']['shrink']:
+					self.log.info("Shrink libraries.")
+					roots = set()
+					for class_file in sources:
+						roots.add(reobf_index.files[class_file]['class']['name'])
+						roots.update(reobf_index.files[class_file]['class']['references'])
+					remove = shrink_libraries(
+						[(lib_file, lib_digests[lib_file]) for lib_file in lib_files],
+						roots,
+						self.config['library']['keep'],
+						os.path.join(build_dir, LIBRARY_CACHE_DIR),
+						stats=shrink_stats,
+					)
+					self.events.emit('cache', name='shrink', hits=shrink_stats['hits'], misses=shrink_stats['misses'])
+					del roots
+
+				removed_classes, removed_bytes = 0, 0
+				lib_file, lib_remove, read_file, info = None, None, None, None
+				for lib_file in lib_files:
 					self.log.info("Copy {!r} into {!r}.".format(util.short_path(lib_file, lib_dir), util.short_path(mod_jar_file, build_dir)))
-					with zipfile.ZipFile(lib_file, 'r') as lib_fh:
+					lib_remove = remove.get(lib_file, ())
+					read_file = lib_file
+					if relocator:
+						read_file = relocate_library(lib_file, lib_digests[lib_file], relocator, os.path.join(build_dir, LIBRARY_CACHE_DIR), stats=relocate_stats)
+					with zipfile.ZipFile(read_file, 'r') as lib_fh:
 						for info in lib_fh.infolist():
-							if not info.filename.startswith('META-INF'):
-								mod_fh.writestr(info.filename, lib_fh.read(info.filename), compress_type=info.compress_type)
-				del path, lib_file, info
-			del lib_spec
+							if info.filename.startswith('META-INF'):
+								continue
+							if info.filename in lib_remove:
+								self.log_sampled.debug("unreachable class", "Remove unreachable {!r}.", info.filename)
+								removed_classes += 1
+								removed_bytes += info.file_size
+								continue
+							if writer.copy(lib_fh, info, relocator.relocate_name(info.filename), util.short_path(lib_file, lib_dir)):
+								self.log_sampled.debug("library entry", "Package {!r}.", info.filename)
+				del lib_file, lib_remove, read_file, info
+
+				if relocator:
+					self.events.emit('cache', name='relocate', hits=relocate_stats['hits'], misses=relocate_stats['misses'])
+				if self.config['library']['shrink']:
+					self.log.info("Removed {} unreachable class(es) totalling {} bytes from libraries.".format(removed_classes, removed_bytes))
+					self.events.emit('shrink', classes=removed_classes, bytes=removed_bytes)
+				del lib_files, lib_digests, remove, removed_classes, removed_bytes, shrink_stats, relocate_stats
+			del lib_spec, reobf_index, relocator, sources
+
+			# Index JAR.
+			if self.config['build']['index']:
+				self.log.info("Index mod jar.")
+				writer.writestr(JAR_INDEX_FILE, writer.get_jar_index(os.path.basename(mod_jar_file)), "index")
+				if self.python_class_files:
+					writer.writestr(MODULE_MAP_FILE, self.get_module_map(), "index")
+
+		util.replace_file(temp_jar_file, mod_jar_file)
+		self.events.emit('package', entries=len(writer.names), bytes=sum(writer.sizes), jar_bytes=os.path.getsize(mod_jar_file), duplicates=writer.duplicates, conflicts=len(writer.conflicts))
+
+		# Report duplicate and conflicting entries.
+		if writer.duplicates:
+			self.log.info("Skipped {} identical duplicate entries.".format(writer.duplicates))
+		report_file = os.path.join(build_dir, 'log', CONFLICT_REPORT_FILE)
+		writer.write_report(report_file)
+		if writer.conflicts:
+			self.log.warning("Skipped {} conflicting entries with different content, see {!r}.".format(len(writer.conflicts), util.short_path(report_file, build_dir)))
+			for name, kept, skipped in writer.conflicts:
+				self.log_sampled.debug("conflict", "Conflict {!r}: kept from {!r}, skipped from {!r}.", name, kept, skipped)
+		self.log_sampled.summarize()
+
+	def start_monitor(self, pid, name):
+		"""
+		Starts monitoring the resource usage of the subprocess.
 
-		return 0
+		*pid* (``int``) is the ID of the subprocess.
+
+		*name* (``str``) is the name of the subprocess.
+
+		Returns the started monitor (``ResourceMonitor``), or ``None`` if
+		monitoring is disabled.
+		"""
+		interval = self.config['monitor']['interval']
+		if not interval:
+			return None
+
+		budget = self.config['monitor']['memory_budget']
+		monitor = ResourceMonitor(
+			pid,
+			interval,
+			memory_budget=int(budget * 1024 * 1024) if budget else None,
+			on_budget=functools.partial(self.warn_budget, name),
+		)
+		monitor.start()
+		return monitor
+
+	def stop_monitor(self, monitor, name):
+		"""
+		Stops monitoring the resource usage of the subprocess, and records
+		its peaks and samples with the timing of the current stage.
+
+		*monitor* (``ResourceMonitor``) is the monitor from
+		``start_monitor()``, or ``None`` if monitoring is disabled.
+
+		*name* (``str``) is the name of the subprocess.
+		"""
+		if monitor is None:
+			return
+		monitor.stop()
+		if not monitor.samples:
+			return
+
+		peaks = monitor.get_peaks()
+		if self.timings:
+			self.timings[-1]['resources'].append({
+				'command': name,
+				'peaks': peaks,
+				'samples': monitor.samples,
+			})
+		self.events.emit('resources', command=name, **peaks)
+
+	def warn_budget(self, name, rss):
+		"""
+		Warns that the subprocess exceeded the memory budget. This is called
+		from the thread of its monitor.
+
+		*name* (``str``) is the name of the subprocess.
+
+		*rss* (``int``) is the resident memory in bytes.
+		"""
+		self.log.warning("{} exceeded the memory budget of {} MB with {:.0f} MB resident.".format(name, self.config['monitor']['memory_budget'], rss / 1048576.0))
+
+	def write_matrix_timings(self, builds, results, seconds):
+		"""
+		Writes the combined timing report of the versions built by the
+		matrix build. The report of each version is written to its own build
+		directory by its build.
+
+		*builds* (``list`` of ``BuildCommand``) contains the build of each
+		version.
+
+		*results* (``list`` of ``tuple``) contains the result of each build
+		from ``run_version()``.
+
+		*seconds* (``float``) is the number of seconds the matrix build
+		took.
+		"""
+		labels = [build.version['version'] for build in builds]
+		width = max([12] + [len(label) + 2 for label in labels])
+		def row(name, cells):
+			return ("{:<28}".format(name) + "".join("{:>{}}".format(cell, width) for cell in cells)).rstrip()
+
+		lines = [row("stage", labels)]
+		stage, build, times = None, None, None
+		for stage in STAGES:
+			cells = []
+			for build in builds:
+				times = [timing['seconds'] or 0.0 for timing in build.timings if timing['stage'] == stage]
+				cells.append("{:.3f}s".format(sum(times)) if times else "-")
+			lines.append(row(stage, cells))
+		del stage, build, times
+		lines.append(row("total", ["{:.3f}s".format(sum(timing['seconds'] or 0.0 for timing in build.timings)) for build in builds]))
+		lines.append(row("result", ["failed" if result else "ok" for result, _ in results]))
+		shared = sum(timing['seconds'] or 0.0 for timing in self.timings)
+		lines.append("{:<28}{:>{}}".format("shared scan", "{:.3f}s".format(shared), width))
+		lines.append("{:<28}{:>{}}".format("wall", "{:.3f}s".format(seconds), width))
+
+		build_dir = self.config['build']['dir']
+		report_file = os.path.join(build_dir, 'log', TIMING_REPORT_FILE)
+		with io.open(report_file, mode='w', encoding='UTF-8') as fh:
+			fh.write("\n".join(lines) + "\n")
+		for line in lines:
+			self.log.info("Timing: {}".format(line))
+
+	def write_timings(self):
+		"""
+		Writes the timing report of the stages run and the phases of their
+		subprocesses.
+		"""
+		if not self.timings:
+			return
+
+		lines = []
+		for timing in self.timings:
+			lines.append("{:<40} {:>9}".format(timing['stage'], "{:.3f}s".format(timing['seconds'] or 0.0)))
+			for phase in timing['phases']:
+				counts = ", ".join("{} {}".format(phase[key], label) for key, label in [
+					('classes', "class(es)"),
+					('warnings', "warning(s)"),
+					('errors', "error(s)"),
+				] if phase[key])
+				lines.append("  {:<38} {:>9}  {}".format(phase['name'][:38], "{:.3f}s".format(phase['seconds']), counts).rstrip())
+			if timing.get('mcp_log_lines'):
+				lines.append("  {} line(s) in MCP error log".format(timing['mcp_log_lines']))
+			for resources in timing['resources']:
+				peaks = resources['peaks']
+				lines.append("  {}: peak {:.0f} MB resident, {} thread(s), {:.0f}% CPU; {:.2f}s CPU, {:.1f} MB read, {:.1f} MB written".format(
+					resources['command'],
+					peaks['rss'] / 1048576.0,
+					peaks['threads'],
+					peaks['cpu_percent'],
+					peaks['cpu_seconds'],
+					peaks['read_bytes'] / 1048576.0,
+					peaks['write_bytes'] / 1048576.0,
+				))
+		total = sum(timing['seconds'] or 0.0 for timing in self.timings)
+		lines.append("{:<40} {:>9}".format("total", "{:.3f}s".format(total)))
+
+		build_dir = self.config['build']['dir']
+		report_file = os.path.join(build_dir, 'log', TIMING_REPORT_FILE)
+		with io.open(report_file, mode='w', encoding='UTF-8') as fh:
+			fh.write("\n".join(lines) + "\n")
+
+		# Write the resource usage time series of each stage.
+		series = dict((timing['stage'], timing['resources']) for timing in self.timings if timing['resources'])
+		if series:
+			with io.open(os.path.join(build_dir, 'log', RESOURCE_REPORT_FILE), mode='w', encoding='UTF-8') as fh:
+				fh.write(json.dumps(series, sort_keys=True))
+		for line in lines:
+			self.log.info("Timing: {}".format(line))
+
+
+class JythonWorker(object):
+	"""
+	The ``JythonWorker`` class is used to keep a Jython process running so
+	that python source can be compiled repeatedly without paying the
+	start-up cost of the JVM each time.
+	"""
+
+	#: The script run by Jython. Each line read from stdin is the directory
+	#: to compile in (empty for the starting directory) and the directory or
+	#: python source file to compile separated by a tab, and the result is
+	#: written to stdout as "1" for success or "0" for failure. Compiler
+	#: output is redirected to stderr so that it does not interfere with the
+	#: results.
+	SCRIPT = "\n".join([
+		"import compileall, os, sys",
+		"out = sys.stdout",
+		"sys.stdout = sys.stderr",
+		"start_dir = os.getcwd()",
+		"while True:",
+		"    line = sys.stdin.readline()",
+		"    if not line:",
+		"        break",
+		"    cwd, path = line.rstrip('\\n').split('\\t', 1)",
+		"    os.chdir(cwd or start_dir)",
+		"    if os.path.isdir(path):",
+		"        ok = compileall.compile_dir(path, quiet=1)",
+		"    else:",
+		"        ok = compileall.compile_file(path, quiet=1)",
+		"    out.write(ok and '1\\n' or '0\\n')",
+		"    out.flush()",
+	])
+
+	def __init__(self, command):
+		"""
+		Initializes the ``JythonWorker`` instance.
+
+		*command* (``list`` of ``str``) is the command used to execute
+		Jython.
+		"""
+
+		self.command = list(command)
+		"""
+		*command* (``list`` of ``str``) is the command used to execute
+		Jython.
+		"""
+
+		self.process = None
+		"""
+		*process* (``subprocess.Popen``) is the Jython process.
+		"""
+
+	def close(self):
+		"""
+		Stops the Jython process.
+		"""
+		if self.process is not None:
+			try:
+				self.process.stdin.close()
+				self.process.wait()
+			finally:
+				self.process = None
+
+	def compile_paths(self, paths, cwd=None):
+		"""
+		Compiles the python source files.
+
+		*paths* (``list`` of ``str``) contains the python source files and
+		directories of python source files to compile.
+
+		*cwd* (``str``) is the directory to compile in which relative *paths*
+		are resolved against, and recorded in the compiled classes. Default
+		is ``None`` for the directory Jython was started in.
+
+		Returns whether all files were compiled successfully (``bool``).
+		"""
+		if not self.is_running():
+			self.start()
+		# - NOTE: Every path is written before the results are read so that
+		#   Jython does not wait for each path.
+		self.process.stdin.write("".join("{}\t{}\n".format(cwd or '', path) for path in paths).encode('UTF-8'))
+		self.process.stdin.flush()
+		ok = True
+		for _ in paths:
+			result = self.process.stdout.readline()
+			if not result:
+				# Jython died, discard it so that it is restarted next time.
+				self.process = None
+				raise subprocess.CalledProcessError(1, self.command)
+			ok = ok and result.strip() == b'1'
+		return ok
+
+	def is_running(self):
+		"""
+		Returns whether the Jython process is running (``bool``).
+		"""
+		return self.process is not None and self.process.poll() is None
+
+	def start(self):
+		"""
+		Starts the Jython process.
+		"""
+		command = self.command + ['-c', self.SCRIPT]
+		try:
+			self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+		except OSError as e:
+			# Add the executable file to the error.
+			e.args += (command[0],)
+			e.filename = command[0]
+			raise
+
+
+class MCPMonitor(object):
+	"""
+	The ``MCPMonitor`` class parses the output of an MCP script (or other
+	subprocess) as it runs to time each phase, and to count the classes,
+	warnings and errors reported in each phase.
+
+	MCP prints a line starting with ">" at the start of each phase (e.g.,
+	"> Recompiling client..." followed by the output of javac, or
+	"> Reobfuscating client" followed by the output of RetroGuard or
+	SpecialSource). Output before the first phase is attributed to a phase
+	named after the command.
+	"""
+
+	def __init__(self, name):
+		"""
+		Initializes the ``MCPMonitor`` instance.
+
+		*name* (``str``) is the name of the command.
+		"""
+
+		self.mcp_seconds = None
+		"""
+		*mcp_seconds* (``float``) is the duration reported by MCP, or
+		``None`` if it was not reported.
+		"""
+
+		self.name = name
+		"""
+		*name* (``str``) is the name of the command.
+		"""
+
+		self.phases = []
+		"""
+		*phases* (``list`` of ``dict``) contains each phase that started
+		with its `'name'` (``str``), `'start'` and `'end'` times (``float``),
+		and the counts of `'classes'`, `'warnings'` and `'errors'`
+		(``int``).
+		"""
+
+	def feed(self, line, now):
+		"""
+		Parses the output line.
+
+		*line* (``str``) is the output line.
+
+		*now* (``float``) is the number of seconds since the command started
+		when the line was received.
+
+		Returns the level (``int``) to log the line at.
+		"""
+		match = OUTPUT_DONE_PATTERN.match(line)
+		if match:
+			self.mcp_seconds = float(match.group(1))
+			self.finish(now)
+			return logging.INFO
+
+		match = OUTPUT_PHASE_PATTERN.match(line)
+		if match:
+			self.finish(now)
+			self.start(match.group(1), now)
+			return logging.INFO
+
+		if not self.phases or self.phases[-1]['end'] is not None:
+			self.start(self.name, now)
+		phase = self.phases[-1]
+
+		match = OUTPUT_CLASSES_PATTERN.search(line)
+		if match:
+			phase['classes'] = max(phase['classes'], int(match.group(1)))
+
+		if OUTPUT_ERROR_PATTERN.search(line):
+			phase['errors'] += 1
+			return logging.ERROR
+		elif OUTPUT_WARNING_PATTERN.search(line):
+			phase['warnings'] += 1
+			return logging.WARNING
+		return logging.INFO
+
+	def finish(self, end):
+		"""
+		Ends the current phase.
+
+		*end* (``float``) is the number of seconds since the command started
+		when the phase ended.
+		"""
+		if self.phases and self.phases[-1]['end'] is None:
+			self.phases[-1]['end'] = end
+
+	def get_results(self):
+		"""
+		Gets the results of the phases.
+
+		Returns the phases (``list`` of ``dict``) with their `'name'`
+		(``str``), duration in `'seconds'` (``float``), and the counts of
+		`'classes'`, `'warnings'` and `'errors'` (``int``).
+		"""
+		results = []
+		for phase in self.phases:
+			results.append({
+				'name': phase['name'],
+				'seconds': round(phase['end'] - phase['start'], 3),
+				'classes': phase['classes'],
+				'warnings': phase['warnings'],
+				'errors': phase['errors'],
+			})
+		return results
+
+	def start(self, name, now):
+		"""
+		Starts a phase.
+
+		*name* (``str``) is the name of the phase.
+
+		*now* (``float``) is the number of seconds since the command started
+		when the phase started.
+		"""
+		self.phases.append({
+			'name': name,
+			'start': now,
+			'end': None,
+			'classes': 0,
+			'warnings': 0,
+			'errors': 0,
+		})
@@ -0,0 +1,293 @@
+# coding: utf-8
+"""
+This module implements the build checkpoints which allow a build to
+resume from the first stage whose inputs or outputs changed, and the
+"checkpoint" command which is used to show and clear them.
+"""
+from __future__ import print_function, unicode_literals
+
+import datetime
+import errno
+import hashlib
+import io
+import json
+import os
+import os.path
+import sys
+import traceback
+
+from . import __version__, util
+
+#: The file within the build directory to store the checkpoints in.
+CHECKPOINT_FILE = 'checkpoint.json'
+
+def command(**args):
+	"""
+	Shows or clears the build checkpoints.
+
+	`**args` is the keyword arguments to send to ``CheckpointCommand()``.
+
+	Returns the exit code (``int``).
+	"""
+	return CheckpointCommand(**args).run()
+
+
+class CheckpointCommand(object):
+	"""
+	The ``CheckpointCommand`` class is used to show and clear the build
+	checkpoints.
+	"""
+
+	def __init__(self, action, config_file, verbose=None, **_):
+		"""
+		Initializes the ``CheckpointCommand`` instance.
+
+		*action* (``str``) is the action to perform: `'show'` or `'clear'`.
+
+		*config_file* (``str``) is the mcpackage configuration file to use.
+
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed. Default is ``None`` for `0`.
+
+		- `0`: print no debugging information.
+
+		- `1`: print some debugging information.
+
+		- `2`: print lots of debugging information.
+		"""
+
+		self.action = action
+		"""
+		*action* (``str``) is the action to perform.
+		"""
+
+		self.config_file = config_file
+		"""
+		*config_file* (``str``) is the mcpackage configuration file to use.
+		"""
+
+		self.verbose = verbose or 0
+		"""
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed.
+		"""
+
+	def run(self):
+		"""
+		Runs the "checkpoint" command.
+
+		Returns the exit code (``int``).
+		"""
+		# - NOTE: This is imported here to avoid a circular import.
+		from .build import CHECKPOINT_STAGES, BuildCommand
+
+		# Load config.
+		build = BuildCommand(config_file=self.config_file, verbose=self.verbose)
+		try:
+			build.init_config()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to load configuration.", file=sys.stderr)
+			return 1
+
+		checkpoints = Checkpoints(build.config['build']['dir'])
+		if self.action == 'clear':
+			checkpoints.clear()
+			print("Cleared checkpoints in {!r}.".format(checkpoints.file))
+			return 0
+
+		for stage in CHECKPOINT_STAGES:
+			checkpoint = checkpoints.stages.get(stage)
+			if checkpoint:
+				print("{:<10} {} {}".format(stage, checkpoint['time'], checkpoint['fingerprint'][:12]))
+			else:
+				print("{:<10} -".format(stage))
+		return 0
+
+
+class Checkpoints(object):
+	"""
+	The ``Checkpoints`` class stores the fingerprints of the inputs and
+	outputs of each stage which completed successfully.
+	"""
+
+	def __init__(self, build_dir):
+		"""
+		Initializes the ``Checkpoints`` instance.
+
+		*build_dir* (``str``) is the build directory.
+		"""
+
+		self.file = os.path.join(build_dir, CHECKPOINT_FILE)
+		"""
+		*file* (``str``) is the path of the checkpoint file.
+		"""
+
+		self.stages = {}
+		"""
+		*stages* (``dict``) maps each stage (``str``) to its checkpoint
+		(``dict``) containing its ``"fingerprint"`` (``str``), the
+		fingerprint of its ``"outputs"`` (``str``), and the ``"time"``
+		(``str``) it completed.
+		"""
+
+		self.load()
+
+	def clear(self, stages=None):
+		"""
+		Clears the checkpoints.
+
+		*stages* (``Iterable`` of ``str``) optionally contains the stages to
+		clear. Default is ``None`` for all stages.
+		"""
+		if stages is None:
+			self.stages.clear()
+		else:
+			for stage in stages:
+				self.stages.pop(stage, None)
+		self.save()
+
+	def get(self, stage):
+		"""
+		Gets the fingerprint of the stage.
+
+		*stage* (``str``) is the stage.
+
+		Returns the fingerprint (``str``) if the stage has a checkpoint;
+		otherwise, ``None``.
+		"""
+		checkpoint = self.stages.get(stage)
+		return checkpoint['fingerprint'] if checkpoint else None
+
+	def get_outputs(self, stage):
+		"""
+		Gets the fingerprint of the outputs of the stage.
+
+		*stage* (``str``) is the stage.
+
+		Returns the fingerprint (``str``) if the stage has a checkpoint;
+		otherwise, ``None``.
+		"""
+		checkpoint = self.stages.get(stage)
+		return checkpoint.get('outputs') if checkpoint else None
+
+	def load(self):
+		"""
+		Loads the checkpoints from the checkpoint file. Checkpoints written
+		by a different version of mcpackage are discarded.
+		"""
+		try:
+			with io.open(self.file, mode='r', encoding='UTF-8') as fh:
+				data = json.load(fh)
+		except IOError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			data = None
+		except ValueError:
+			# Ignore corrupt checkpoint file.
+			data = None
+
+		if data and data.get('version') == __version__:
+			self.stages = data['stages']
+		else:
+			self.stages = {}
+
+	def save(self):
+		"""
+		Saves the checkpoints to the checkpoint file.
+		"""
+		data = {'version': __version__, 'stages': self.stages}
+		temp_file = self.file + '.tmp'
+		with io.open(temp_file, mode='w', encoding='UTF-8') as fh:
+			fh.write(json.dumps(data, indent=1, sort_keys=True))
+		util.replace_file(temp_file, self.file)
+
+	def set(self, stage, fingerprint, outputs=None):
+		"""
+		Records the checkpoint for the stage.
+
+		*stage* (``str``) is the stage.
+
+		*fingerprint* (``str``) is the fingerprint of the inputs of the
+		stage.
+
+		*outputs* (``str``) is the fingerprint of the outputs of the stage.
+		Default is ``None``.
+		"""
+		self.stages[stage] = {
+			'fingerprint': fingerprint,
+			'outputs': outputs,
+			'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+		}
+		self.save()
+
+
+class Fingerprint(object):
+	"""
+	The ``Fingerprint`` class is used to calculate the fingerprint of the
+	inputs or outputs of a stage. Files are fingerprinted by their paths,
+	sizes and modified times instead of their contents so that this is
+	cheap.
+	"""
+
+	def __init__(self, *values):
+		"""
+		Initializes the ``Fingerprint`` instance.
+
+		*values* contains any JSON serializable values to include.
+		"""
+
+		self.hash = hashlib.sha1()
+		"""
+		*hash* is the hash object.
+		"""
+
+		for value in values:
+			self.update_value(value)
+
+	def hexdigest(self):
+		"""
+		Returns the fingerprint (``str``).
+		"""
+		return self.hash.hexdigest()
+
+	def update_files(self, root, files):
+		"""
+		Includes the files.
+
+		*root* (``str``) is the directory containing the files.
+
+		*files* (``Iterable`` of ``str``) contains the relative paths of the
+		files.
+		"""
+		update = self.hash.update
+		for file_path in sorted(files):
+			try:
+				stat = os.stat(os.path.join(root, file_path))
+			except OSError as e:
+				if e.errno != errno.ENOENT:
+					raise
+				update("{}\0-\n".format(file_path).encode('UTF-8'))
+			else:
+				update("{}\0{}\0{!r}\n".format(file_path, stat.st_size, stat.st_mtime).encode('UTF-8'))
+
+	def update_tree(self, root):
+		"""
+		Includes all of the files under the directory.
+
+		*root* (``str``) is the directory.
+		"""
+		files = []
+		for parent, _, file_names in os.walk(root, followlinks=True):
+			parent = os.path.relpath(parent, root)
+			files.extend(os.path.join(parent, file_name) if parent != '.' else file_name for file_name in file_names)
+		self.update_files(root, files)
+
+	def update_value(self, value):
+		"""
+		Includes the value.
+
+		*value* is the JSON serializable value.
+		"""
+		self.hash.update(json.dumps(value, sort_keys=True).encode('UTF-8'))
+		self.hash.update(b'\n')
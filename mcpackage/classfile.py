@@ -0,0 +1,700 @@
+# coding: utf-8
+"""
+This module implements a minimal parser of Java class files which reads
+their constant pools to find the classes they depend on, and the class
+index which persists the parsed classes of a directory between builds.
+"""
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import io
+import json
+import os
+import os.path
+import struct
+
+from . import __version__, util
+
+#: The magic number at the start of every class file.
+CLASS_MAGIC = 0xCAFEBABE
+
+#: The sizes in bytes of the constant pool entries which are skipped
+#: instead of being parsed, by tag.
+_CONSTANT_SIZES = {
+	3: 4,  # Integer
+	4: 4,  # Float
+	5: 8,  # Long
+	6: 8,  # Double
+	9: 4,  # Fieldref
+	10: 4, # Methodref
+	11: 4, # InterfaceMethodref
+	15: 3, # MethodHandle
+	17: 4, # Dynamic
+	18: 4, # InvokeDynamic
+	19: 2, # Module
+	20: 2, # Package
+}
+
+#: The tags of the annotation element values which refer to a constant.
+_CONST_VALUE_TAGS = frozenset(ord(tag) for tag in 'BCDFIJSZs')
+
+#: The characters of the base types in descriptors and signatures
+#: (including void).
+_BASE_TYPES = frozenset('BCDFIJSZV')
+
+_u1 = struct.Struct('>B')
+_u2 = struct.Struct('>H')
+_u4 = struct.Struct('>I')
+
+class ClassFormatError(ValueError):
+	"""
+	The ``ClassFormatError`` exception is raised when a class file cannot
+	be parsed.
+	"""
+	pass
+
+
+def find_dependents(classes, names):
+	"""
+	Finds the classes which depend on the classes, directly or indirectly.
+
+	*classes* (``Iterable`` of ``dict``) contains the parsed classes from
+	``parse_class()``.
+
+	*names* (``Iterable`` of ``str``) contains the internal names of the
+	classes (e.g., `'com/example/ExampleMod'`).
+
+	Returns the internal names of the dependent classes (``set`` of
+	``str``), not including *names*.
+	"""
+	dependents = {}
+	for info in classes:
+		for ref in info['references']:
+			dependents.setdefault(ref, set()).add(info['name'])
+
+	names = set(names)
+	found = set()
+	pending = list(names)
+	while pending:
+		name = pending.pop()
+		for dependent in dependents.get(name, ()):
+			if dependent not in found and dependent not in names:
+				found.add(dependent)
+				pending.append(dependent)
+	return found
+
+def parse_class(data):
+	"""
+	Parses the class file.
+
+	*data* (``bytes``) is the content of the class file.
+
+	Returns the parsed class (``dict``) which is JSON serializable:
+
+	- `'name'` (``str``) is the internal name of the class.
+
+	- `'super'` (``str``) is the internal name of the super class, or
+	  ``None`` for `'java/lang/Object'`.
+
+	- `'source_file'` (``str``) is the name of the source file from the
+	  *SourceFile* attribute, or ``None`` if it was not compiled in.
+
+	- `'references'` (``list`` of ``str``) contains the sorted internal
+	  names of the other classes referenced by the class.
+
+	- `'constants'` (``str``) is the digest of the compile time constants
+	  declared by the class, or ``None`` if it declares none. Java
+	  compilers inline these into the classes using them without
+	  referencing the declaring class.
+
+	Raises ``ClassFormatError`` if the data is not a valid class file.
+	"""
+	try:
+		return _parse_class(data)
+	except (struct.error, IndexError, KeyError) as e:
+		raise ClassFormatError("Truncated or corrupt class file: {}".format(e))
+
+def _parse_class(data):
+	"""
+	Parses the class file. See ``parse_class()``.
+	"""
+	info = _read_class(data)
+	utf8s = info['utf8s']
+	texts = {}
+
+	def get_text(index):
+		text = texts.get(index)
+		if text is None:
+			start, end = utf8s[index]
+			text = texts[index] = data[start:end].decode('UTF-8', 'replace')
+		return text
+
+	# Collect referenced classes.
+	class_names = dict((class_index, get_text(name_index)) for class_index, name_index in info['classes'].items())
+	this_name = class_names[info['this_class']]
+	super_name = class_names.get(info['super_class']) if info['super_class'] else None
+
+	references = set()
+	for ref in class_names.values():
+		if ref.startswith('['):
+			# Array class.
+			references.update(name for _, _, name in parse_signature(ref))
+		else:
+			references.add(ref)
+	for desc_index in info['descriptors'] | info['signatures']:
+		references.update(name for _, _, name in parse_signature(get_text(desc_index)))
+	references.discard(this_name)
+
+	constants = []
+	strings = info['strings']
+	for name_index, value_index in info['constants']:
+		if value_index in strings:
+			start, end = utf8s[strings[value_index]]
+			constants.append((get_text(name_index), data[start:end]))
+		else:
+			constants.append((get_text(name_index), info['values'][value_index]))
+
+	if constants:
+		constants_hash = hashlib.sha1()
+		for const_name, const_value in sorted(constants):
+			constants_hash.update(const_name.encode('UTF-8') + b'\0' + const_value + b'\n')
+		constants_digest = constants_hash.hexdigest()
+	else:
+		constants_digest = None
+
+	return {
+		'name': this_name,
+		'super': super_name if super_name != 'java/lang/Object' else None,
+		'source_file': get_text(info['source_file']) if info['source_file'] else None,
+		'references': sorted(references),
+		'constants': constants_digest,
+	}
+
+def parse_signature(signature):
+	"""
+	Parses the descriptor or signature to find the classes it refers to.
+
+	*signature* (``str``) is a field or method descriptor (e.g.,
+	`'(Ljava/lang/String;)V'`), a class, field or method signature (e.g.,
+	`'<T:Ljava/lang/Object;>Ljava/util/List<TT;>;'`), or the name of an
+	array class (e.g., `'[Ljava/lang/String;'`).
+
+	Returns a ``list`` containing a ``tuple`` for each referenced class in
+	order: the start and end (``int``) of its internal name within
+	*signature*, and its internal name (``str``). Type variables (e.g., `'TT;'`) are not
+	classes. The inner class of a parameterized class (e.g.,
+	`'Lcom/example/Outer<TT;>.Inner;'`) is named by joining them (e.g.,
+	`'com/example/Outer$Inner'`), and its range only covers the outer
+	class.
+
+	Raises ``ClassFormatError`` if the signature is invalid.
+	"""
+	classes = []
+	try:
+		pos = 0
+		if signature.startswith('<'):
+			pos = _parse_type_parameters(signature, pos, classes)
+		if signature.startswith('(', pos):
+			# Method parameters, return type, and thrown exceptions.
+			pos += 1
+			while signature[pos] != ')':
+				pos = _parse_type(signature, pos, classes)
+			pos = _parse_type(signature, pos + 1, classes)
+			while signature.startswith('^', pos):
+				pos = _parse_type(signature, pos + 1, classes)
+		# Field type, or super class and interfaces.
+		while pos < len(signature):
+			pos = _parse_type(signature, pos, classes)
+	except IndexError:
+		raise ClassFormatError("Truncated signature {!r}.".format(signature))
+
+	# Outer classes are found after their type arguments.
+	classes.sort()
+	return classes
+
+def _parse_type(signature, pos, classes):
+	"""
+	Parses the type at the position in the signature. See
+	``parse_signature()``.
+
+	Returns the position after the type (``int``).
+	"""
+	char = signature[pos]
+	if char == 'L':
+		start = segment = pos = pos + 1
+		end = None
+		parts = []
+		while True:
+			char = signature[pos]
+			if char == ';' or char == '<' or char == '.':
+				if pos > segment:
+					parts.append(signature[segment:pos])
+				if end is None:
+					end = pos
+				if char == ';':
+					if not parts or end == start:
+						raise ClassFormatError("Empty class name in signature {!r} at {}.".format(signature, start))
+					classes.append((start, end, '$'.join(parts)))
+					return pos + 1
+				elif char == '<':
+					pos = _parse_type_arguments(signature, pos, classes)
+				else:
+					pos += 1
+				segment = pos
+			else:
+				pos += 1
+	elif char == 'T':
+		# Type variable.
+		end = signature.find(';', pos)
+		if end < 0:
+			raise IndexError(pos)
+		return end + 1
+	elif char == '[' or char == '+' or char == '-':
+		# Array, or bounded wildcard.
+		return _parse_type(signature, pos + 1, classes)
+	elif char == '*' or char in _BASE_TYPES:
+		return pos + 1
+	raise ClassFormatError("Invalid signature {!r} at {}.".format(signature, pos))
+
+def _parse_type_arguments(signature, pos, classes):
+	"""
+	Parses the type arguments (e.g., `'<TT;Ljava/lang/String;>'`) at the
+	position in the signature. See ``parse_signature()``.
+
+	Returns the position after the type arguments (``int``).
+	"""
+	pos += 1
+	while signature[pos] != '>':
+		pos = _parse_type(signature, pos, classes)
+	return pos + 1
+
+def _parse_type_parameters(signature, pos, classes):
+	"""
+	Parses the formal type parameters (e.g.,
+	`'<T:Ljava/lang/Object;U::Ljava/lang/Comparable<TU;>;>'`) at the
+	position in the signature. See ``parse_signature()``.
+
+	Returns the position after the type parameters (``int``).
+	"""
+	pos += 1
+	while signature[pos] != '>':
+		# - NOTE: The identifier can start with any letter (e.g., "LIST") so
+		#   it is skipped up to its class bound before parsing types.
+		colon = signature.find(':', pos)
+		if colon <= pos:
+			raise ClassFormatError("Invalid type parameter in signature {!r} at {}.".format(signature, pos))
+		pos = colon
+		while signature[pos] == ':':
+			# The class bound can be empty, and is followed by any interface
+			# bounds.
+			pos += 1
+			if signature[pos] != ':':
+				pos = _parse_type(signature, pos, classes)
+	return pos + 1
+
+def _read_annotation(data, pos, info):
+	"""
+	Reads the annotation at the position in the class file. See
+	``_read_class()``.
+
+	Returns the position after the annotation (``int``).
+	"""
+	type_index, pair_count = struct.unpack_from('>HH', data, pos)
+	info['descriptors'].add(type_index)
+	pos += 4
+	for _ in range(pair_count):
+		# Skip the element name.
+		pos = _read_element_value(data, pos + 2, info)
+	return pos
+
+def _read_attributes(data, pos, info, name_index=None):
+	"""
+	Reads the attributes at the position in the class file, and records
+	the constants they use. See ``_read_class()``.
+
+	*name_index* (``int``) is the index of the name of the field the
+	attributes belong to. Default is ``None``.
+
+	Returns the position after the attributes (``int``).
+	"""
+	utf8s = info['utf8s']
+	attr_count = _u2.unpack_from(data, pos)[0]
+	pos += 2
+	for _ in range(attr_count):
+		attr_name, attr_length = struct.unpack_from('>HI', data, pos)
+		pos += 6
+		end = pos + attr_length
+		start, stop = utf8s.get(attr_name, (0, 0))
+		attr = data[start:stop]
+		if attr == b'Signature':
+			info['signatures'].add(_u2.unpack_from(data, pos)[0])
+		elif attr == b'ConstantValue' and name_index is not None:
+			info['constants'].append((name_index, _u2.unpack_from(data, pos)[0]))
+		elif attr == b'SourceFile':
+			info['source_file'] = _u2.unpack_from(data, pos)[0]
+		elif attr == b'Code':
+			code_length = _u4.unpack_from(data, pos + 4)[0]
+			table_pos = pos + 8 + code_length
+			table_length = _u2.unpack_from(data, table_pos)[0]
+			_read_attributes(data, table_pos + 2 + 8 * table_length, info)
+		elif attr == b'LocalVariableTable' or attr == b'LocalVariableTypeTable':
+			kind = 'descriptors' if attr == b'LocalVariableTable' else 'signatures'
+			table_length = _u2.unpack_from(data, pos)[0]
+			for i in range(table_length):
+				info[kind].add(_u2.unpack_from(data, pos + 2 + 10 * i + 6)[0])
+		elif attr == b'RuntimeVisibleAnnotations' or attr == b'RuntimeInvisibleAnnotations':
+			count = _u2.unpack_from(data, pos)[0]
+			attr_pos = pos + 2
+			for _ in range(count):
+				attr_pos = _read_annotation(data, attr_pos, info)
+		elif attr == b'RuntimeVisibleParameterAnnotations' or attr == b'RuntimeInvisibleParameterAnnotations':
+			param_count = _u1.unpack_from(data, pos)[0]
+			attr_pos = pos + 1
+			for _ in range(param_count):
+				count = _u2.unpack_from(data, attr_pos)[0]
+				attr_pos += 2
+				for _ in range(count):
+					attr_pos = _read_annotation(data, attr_pos, info)
+		elif attr == b'RuntimeVisibleTypeAnnotations' or attr == b'RuntimeInvisibleTypeAnnotations':
+			count = _u2.unpack_from(data, pos)[0]
+			attr_pos = pos + 2
+			for _ in range(count):
+				attr_pos = _read_type_annotation(data, attr_pos, info)
+		elif attr == b'AnnotationDefault':
+			_read_element_value(data, pos, info)
+		elif attr == b'Record':
+			count = _u2.unpack_from(data, pos)[0]
+			attr_pos = pos + 2
+			for _ in range(count):
+				info['descriptors'].add(_u2.unpack_from(data, attr_pos + 2)[0])
+				attr_pos = _read_attributes(data, attr_pos + 4, info)
+		pos = end
+	return pos
+
+def _read_class(data):
+	"""
+	Reads the structure of the class file to find how its constants are
+	used.
+
+	*data* (``bytes``) is the content of the class file.
+
+	Returns the structure (``dict``):
+
+	- `'utf8s'` (``dict``) maps the index of each UTF-8 constant (``int``)
+	  to the start and end (``int``) of its encoded value in *data*.
+
+	- `'classes'` (``dict``) maps the index of each class constant
+	  (``int``) to the index of its name (``int``).
+
+	- `'strings'` (``dict``) maps the index of each string constant
+	  (``int``) to the index of its value (``int``).
+
+	- `'values'` (``dict``) maps the index of each other constant which is
+	  not parsed (``int``) to its raw value (``bytes``).
+
+	- `'descriptors'` (``set`` of ``int``) contains the indices of the
+	  UTF-8 constants used as descriptors.
+
+	- `'signatures'` (``set`` of ``int``) contains the indices of the
+	  UTF-8 constants used as signatures.
+
+	- `'constants'` (``list`` of ``tuple``) contains the index of the name
+	  and of the constant value (``int``) of each field with a constant
+	  value.
+
+	- `'this_class'` (``int``) and `'super_class'` (``int``) are the
+	  indices of the class and its super class.
+
+	- `'source_file'` (``int``) is the index of the source file name, or
+	  ``None``.
+
+	Raises ``ClassFormatError`` if the data is not a valid class file. A
+	truncated class file raises ``struct.error``, ``IndexError`` or
+	``KeyError``.
+	"""
+	if len(data) < 10 or _u4.unpack_from(data, 0)[0] != CLASS_MAGIC:
+		raise ClassFormatError("Not a class file.")
+
+	info = {
+		'utf8s': {},
+		'classes': {},
+		'strings': {},
+		'values': {},
+		'descriptors': set(),
+		'signatures': set(),
+		'constants': [],
+		'this_class': None,
+		'super_class': None,
+		'source_file': None,
+	}
+
+	# Read constant pool.
+	count = _u2.unpack_from(data, 8)[0]
+	pos = 10
+	index = 1
+	while index < count:
+		tag = _u1.unpack_from(data, pos)[0]
+		pos += 1
+		if tag == 1: # Utf8
+			length = _u2.unpack_from(data, pos)[0]
+			pos += 2
+			if pos + length > len(data):
+				raise IndexError(pos)
+			info['utf8s'][index] = (pos, pos + length)
+			pos += length
+		elif tag == 7: # Class
+			info['classes'][index] = _u2.unpack_from(data, pos)[0]
+			pos += 2
+		elif tag == 12: # NameAndType
+			info['descriptors'].add(_u2.unpack_from(data, pos + 2)[0])
+			pos += 4
+		elif tag == 8: # String
+			info['strings'][index] = _u2.unpack_from(data, pos)[0]
+			pos += 2
+		elif tag == 16: # MethodType
+			info['descriptors'].add(_u2.unpack_from(data, pos)[0])
+			pos += 2
+		elif tag in _CONSTANT_SIZES:
+			size = _CONSTANT_SIZES[tag]
+			info['values'][index] = data[pos:pos + size]
+			pos += size
+			if tag in (5, 6):
+				# Long and double take two entries.
+				index += 1
+		else:
+			raise ClassFormatError("Unknown constant pool tag {} at entry {}.".format(tag, index))
+		index += 1
+
+	# Read class.
+	info['this_class'], info['super_class'], interface_count = struct.unpack_from('>HHH', data, pos + 2)
+	pos += 8 + 2 * interface_count
+
+	# Read fields and methods.
+	for member in ('field', 'method'):
+		member_count = _u2.unpack_from(data, pos)[0]
+		pos += 2
+		for _ in range(member_count):
+			name_index, desc_index = struct.unpack_from('>HH', data, pos + 2)
+			info['descriptors'].add(desc_index)
+			pos = _read_attributes(data, pos + 6, info, name_index=name_index if member == 'field' else None)
+
+	# Read class attributes.
+	_read_attributes(data, pos, info)
+	return info
+
+def _read_element_value(data, pos, info):
+	"""
+	Reads the annotation element value at the position in the class file.
+	See ``_read_class()``.
+
+	Returns the position after the element value (``int``).
+	"""
+	tag = _u1.unpack_from(data, pos)[0]
+	pos += 1
+	if tag in _CONST_VALUE_TAGS:
+		return pos + 2
+	elif tag == ord('e'):
+		# Enum type descriptor, and constant name.
+		info['descriptors'].add(_u2.unpack_from(data, pos)[0])
+		return pos + 4
+	elif tag == ord('c'):
+		# Class as a return descriptor (e.g., "V" or "Ljava/lang/Object;").
+		info['descriptors'].add(_u2.unpack_from(data, pos)[0])
+		return pos + 2
+	elif tag == ord('@'):
+		return _read_annotation(data, pos, info)
+	elif tag == ord('['):
+		count = _u2.unpack_from(data, pos)[0]
+		pos += 2
+		for _ in range(count):
+			pos = _read_element_value(data, pos, info)
+		return pos
+	raise ClassFormatError("Unknown annotation element value tag {!r}.".format(tag))
+
+def _read_type_annotation(data, pos, info):
+	"""
+	Reads the type annotation at the position in the class file. See
+	``_read_class()``.
+
+	Returns the position after the type annotation (``int``).
+	"""
+	target_type = _u1.unpack_from(data, pos)[0]
+	pos += 1
+	if target_type in (0x00, 0x01, 0x16):
+		# Type parameter, or formal parameter.
+		pos += 1
+	elif target_type in (0x10, 0x11, 0x12, 0x17, 0x42, 0x43, 0x44, 0x45, 0x46):
+		# Super type, type parameter bound, throws, catch, or offset.
+		pos += 2
+	elif target_type in (0x40, 0x41):
+		# Local variable.
+		table_length = _u2.unpack_from(data, pos)[0]
+		pos += 2 + 6 * table_length
+	elif target_type in (0x47, 0x48, 0x49, 0x4A, 0x4B):
+		# Type argument.
+		pos += 3
+	elif target_type not in (0x13, 0x14, 0x15):
+		raise ClassFormatError("Unknown type annotation target {:#x}.".format(target_type))
+	path_length = _u1.unpack_from(data, pos)[0]
+	pos += 1 + 2 * path_length
+	return _read_annotation(data, pos, info)
+
+def rewrite_utf8(data, rewrite):
+	"""
+	Rewrites the UTF-8 constants in the constant pool of the class file
+	which are used as class names, descriptors, signatures or strings.
+	Everything else refers to constants by their index so the rest of the
+	class file is copied unchanged.
+
+	*data* (``bytes``) is the content of the class file.
+
+	*rewrite* (``callable``) is called with the encoded value (``bytes``)
+	of each UTF-8 constant and how it is used (``frozenset`` of ``str``):
+	`'class'` for the name of a class (or array class), `'descriptor'`,
+	`'signature'`, and `'string'` for the value of a string constant. It
+	returns the new encoded value (``bytes``).
+
+	Returns the rewritten class file (``bytes``).
+
+	Raises ``ClassFormatError`` if the data is not a valid class file.
+	"""
+	try:
+		info = _read_class(data)
+		uses = {}
+		for name_index in info['classes'].values():
+			uses.setdefault(name_index, set()).add('class')
+		for desc_index in info['descriptors']:
+			uses.setdefault(desc_index, set()).add('descriptor')
+		for sig_index in info['signatures']:
+			uses.setdefault(sig_index, set()).add('signature')
+		for value_index in info['strings'].values():
+			uses.setdefault(value_index, set()).add('string')
+
+		parts = []
+		start = 0
+		utf8s = info['utf8s']
+		for index in sorted(uses):
+			value_start, value_end = utf8s[index]
+			value = data[value_start:value_end]
+			new_value = rewrite(value, frozenset(uses[index]))
+			if new_value != value:
+				# Replace the length and value.
+				parts.append(data[start:value_start - 2])
+				parts.append(_u2.pack(len(new_value)) + new_value)
+				start = value_end
+	except (struct.error, IndexError, KeyError) as e:
+		raise ClassFormatError("Truncated or corrupt class file: {}".format(e))
+
+	parts.append(data[start:])
+	return b''.join(parts)
+
+
+class ClassIndex(object):
+	"""
+	The ``ClassIndex`` class is used to parse the class files within a
+	directory, and to persist the parsed classes between builds so that
+	only the class files which changed are parsed again.
+	"""
+
+	def __init__(self, cache_file):
+		"""
+		Initializes the ``ClassIndex`` instance.
+
+		*cache_file* (``str``) is the file to persist the index in.
+		"""
+
+		self.cache_file = cache_file
+		"""
+		*cache_file* (``str``) is the file to persist the index in.
+		"""
+
+		self.files = {}
+		"""
+		*files* (``dict``) maps each relative class file path (``str``) to
+		its entry (``dict``) containing its `'size'` (``int``), `'mtime'`
+		(``float``), `'digest'` (``str``) and parsed `'class'` (``dict``).
+		The parsed class is ``None`` if the class file is invalid in which
+		case the `'error'` (``str``) is recorded.
+		"""
+
+		self.load()
+
+	def load(self):
+		"""
+		Loads the index from the cache file. An index written by a different
+		version of mcpackage is discarded.
+		"""
+		try:
+			with io.open(self.cache_file, mode='r', encoding='UTF-8') as fh:
+				data = json.load(fh)
+		except IOError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			data = None
+		except ValueError:
+			# Ignore corrupt cache file.
+			data = None
+
+		if data and data.get('version') == __version__:
+			self.files = data['files']
+		else:
+			self.files = {}
+
+	def save(self):
+		"""
+		Saves the index to the cache file.
+		"""
+		cache_dir = os.path.dirname(self.cache_file)
+		try:
+			os.makedirs(cache_dir)
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+
+		data = {'version': __version__, 'files': self.files}
+		temp_file = self.cache_file + '.tmp'
+		with io.open(temp_file, mode='w', encoding='UTF-8') as fh:
+			fh.write(json.dumps(data, sort_keys=True))
+		util.replace_file(temp_file, self.cache_file)
+
+	def update(self, root, files):
+		"""
+		Updates the index with the class files.
+
+		*root* (``str``) is the directory containing the class files.
+
+		*files* (``Iterable`` of ``str``) contains the relative paths of the
+		class files. Class files in the index which are not in *files* are
+		removed from it.
+
+		Returns the class files whose content changed, were added or were
+		removed (``dict``). This maps each relative class file path (``str``)
+		to its previous entry (``dict``), or ``None`` if it was added.
+		"""
+		changed = {}
+		files = set(files)
+		for file_path in set(self.files) - files:
+			changed[file_path] = self.files.pop(file_path)
+
+		for file_path in files:
+			src_file = os.path.join(root, file_path)
+			stat = os.stat(src_file)
+			entry = self.files.get(file_path)
+			if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+				continue
+
+			with open(src_file, 'rb') as fh:
+				data = fh.read()
+			digest = hashlib.sha1(data).hexdigest()
+			if not entry or entry['digest'] != digest:
+				changed[file_path] = entry
+				try:
+					entry = {'digest': digest, 'class': parse_class(data)}
+				except ClassFormatError as e:
+					entry = {'digest': digest, 'class': None, 'error': str(e)}
+			entry['size'] = stat.st_size
+			entry['mtime'] = stat.st_mtime
+			self.files[file_path] = entry
+
+		return changed
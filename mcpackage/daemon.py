@@ -0,0 +1,329 @@
+# coding: utf-8
+"""
+This module implements the "daemon" command which is used to keep the
+build state of Minecraft Mods loaded between builds, and to send build
+requests to the running daemon.
+"""
+from __future__ import print_function, unicode_literals
+
+import errno
+import json
+import os
+import os.path
+import socket
+import sys
+import traceback
+
+def command(**args):
+	"""
+	Runs or communicates with the build daemon.
+
+	`**args` is the keyword arguments to send to ``DaemonCommand()``.
+
+	Returns the exit code (``int``).
+	"""
+	return DaemonCommand(**args).run()
+
+
+class DaemonCommand(object):
+	"""
+	The ``DaemonCommand`` class is used to run the build daemon, or to send
+	requests to it.
+
+	The daemon listens on a Unix socket. Each connection sends a single
+	request encoded as a line of JSON, and the daemon replies with lines of
+	JSON containing either the ``"output"`` (``str``) of the request or its
+	``"exit"`` code (``int``) which is always the last line.
+	"""
+
+	def __init__(self, action, config_file, socket_file, verbose=None, **_):
+		"""
+		Initializes the ``DaemonCommand`` instance.
+
+		*action* (``str``) is the action to perform:
+
+		- `'start'`: run the daemon in the foreground.
+
+		- `'build'`: have the daemon build the mod.
+
+		- `'status'`: print the status of the daemon.
+
+		- `'stop'`: stop the daemon.
+
+		*config_file* (``str``) is the mcpackage configuration file to use.
+
+		*socket_file* (``str``) is the socket file the daemon listens on.
+
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed. Default is ``None`` for `0`.
+
+		- `0`: print no debugging information.
+
+		- `1`: print some debugging information.
+
+		- `2`: print lots of debugging information.
+		"""
+
+		self.action = action
+		"""
+		*action* (``str``) is the action to perform.
+		"""
+
+		self.builds = {}
+		"""
+		*builds* (``dict``) maps each absolute configuration file path
+		(``str``) to its ``BuildCommand`` which holds its warm state.
+		"""
+
+		self.config_file = config_file
+		"""
+		*config_file* (``str``) is the mcpackage configuration file to use.
+		"""
+
+		self.socket_file = socket_file
+		"""
+		*socket_file* (``str``) is the socket file the daemon listens on.
+		"""
+
+		self.verbose = verbose or 0
+		"""
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed.
+		"""
+
+	def run(self):
+		"""
+		Runs the "daemon" command.
+
+		Returns the exit code (``int``).
+		"""
+		if not hasattr(socket, 'AF_UNIX'):
+			print("The daemon requires Unix sockets which are not supported on this system.", file=sys.stderr)
+			return 1
+
+		if self.action == 'start':
+			return self.run_server()
+
+		request = {'action': self.action}
+		if self.action == 'build':
+			request['config_file'] = os.path.abspath(self.config_file)
+			request['cwd'] = os.getcwd()
+			request['verbose'] = self.verbose
+		return self.run_client(request)
+
+	def run_client(self, request):
+		"""
+		Sends the request to the daemon and prints its output.
+
+		*request* (``dict``) is the request to send.
+
+		Returns the exit code (``int``) of the request.
+		"""
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			try:
+				sock.connect(self.socket_file)
+			except socket.error as e:
+				if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+					print("The daemon is not running at {!r}.".format(self.socket_file), file=sys.stderr)
+					return 1
+				raise
+
+			sock.sendall((json.dumps(request) + '\n').encode('UTF-8'))
+			with sock.makefile('rb') as fh:
+				for line in fh:
+					message = json.loads(line.decode('UTF-8'))
+					if 'output' in message:
+						sys.stdout.write(message['output'])
+						sys.stdout.flush()
+					if 'exit' in message:
+						return message['exit']
+
+		finally:
+			sock.close()
+
+		print("The daemon closed the connection unexpectedly.", file=sys.stderr)
+		return 1
+
+	def run_server(self):
+		"""
+		Runs the daemon until it is stopped.
+
+		Returns the exit code (``int``).
+		"""
+		# Remove socket file left behind by a daemon which is no longer
+		# running.
+		if os.path.exists(self.socket_file):
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				probe.connect(self.socket_file)
+			except socket.error as e:
+				if e.errno != errno.ECONNREFUSED:
+					raise
+				os.remove(self.socket_file)
+			else:
+				print("The daemon is already running at {!r}.".format(self.socket_file), file=sys.stderr)
+				return 1
+			finally:
+				probe.close()
+
+		server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			server.bind(self.socket_file)
+			server.listen(5)
+			if self.verbose >= 1:
+				print("Listen on {!r}.".format(self.socket_file))
+
+			# Serve requests one at a time because builds change the working
+			# directory and standard output of the process.
+			running = True
+			while running:
+				conn, _ = server.accept()
+				try:
+					running = self.serve(conn)
+				except:
+					traceback.print_exc(file=sys.stderr)
+				finally:
+					conn.close()
+
+		except KeyboardInterrupt:
+			pass
+
+		finally:
+			server.close()
+			try:
+				os.remove(self.socket_file)
+			except OSError as e:
+				if e.errno != errno.ENOENT:
+					raise
+			for build in self.builds.values():
+				build.close()
+
+		return 0
+
+	def serve(self, conn):
+		"""
+		Serves the request received on the connection.
+
+		*conn* (``socket.socket``) is the client connection.
+
+		Returns whether the daemon should keep running (``bool``).
+		"""
+		with conn.makefile('rb') as fh:
+			line = fh.readline()
+		if not line:
+			return True
+		request = json.loads(line.decode('UTF-8'))
+		writer = _SocketWriter(conn)
+		action = request.get('action')
+		if self.verbose >= 1:
+			print("Request {!r}.".format(action))
+
+		if action == 'build':
+			result = self.serve_build(request, writer)
+		elif action == 'status':
+			writer.write("Daemon (pid {pid}) is running with {count} loaded configuration(s).\n".format(
+				pid=os.getpid(),
+				count=len(self.builds),
+			))
+			for config_file in sorted(self.builds):
+				writer.write("- {}\n".format(config_file))
+			result = 0
+		elif action == 'stop':
+			writer.write("Daemon stopped.\n")
+			writer.send({'exit': 0})
+			return False
+		else:
+			writer.write("Unknown action {!r}.\n".format(action))
+			result = 1
+
+		writer.send({'exit': result})
+		return True
+
+	def serve_build(self, request, writer):
+		"""
+		Builds the mod for the request.
+
+		*request* (``dict``) is the build request.
+
+		*writer* (``_SocketWriter``) is used to send the output of the build
+		to the client.
+
+		Returns the exit code (``int``) of the build.
+		"""
+		# - NOTE: This is imported here so that the client does not have to
+		#   load the build dependencies.
+		from .build import BuildCommand
+
+		config_file = request['config_file']
+		build = self.builds.get(config_file)
+		if build is None:
+			build = BuildCommand(config_file=config_file)
+			build.keep_jython = True
+			self.builds[config_file] = build
+		build.verbose = request.get('verbose') or 0
+
+		cwd = os.getcwd()
+		stdout, stderr = sys.stdout, sys.stderr
+		os.chdir(request['cwd'])
+		sys.stdout = sys.stderr = writer
+		try:
+			return build.run()
+		finally:
+			sys.stdout, sys.stderr = stdout, stderr
+			os.chdir(cwd)
+
+
+class _SocketWriter(object):
+	"""
+	The ``_SocketWriter`` class is a file-like object which sends the text
+	written to it to a client of the daemon.
+	"""
+
+	def __init__(self, conn):
+		"""
+		Initializes the ``_SocketWriter`` instance.
+
+		*conn* (``socket.socket``) is the client connection.
+		"""
+
+		self.conn = conn
+		"""
+		*conn* (``socket.socket``) is the client connection.
+		"""
+
+		self.closed = False
+		"""
+		*closed* (``bool``) is whether the client has disconnected.
+		"""
+
+	def flush(self):
+		"""
+		Does nothing because every write is sent immediately.
+		"""
+		pass
+
+	def send(self, message):
+		"""
+		Sends the message to the client.
+
+		*message* (``dict``) is the message to send.
+		"""
+		if self.closed:
+			return
+		try:
+			self.conn.sendall((json.dumps(message) + '\n').encode('UTF-8'))
+		except socket.error:
+			# The client disconnected, let the build continue.
+			self.closed = True
+
+	def write(self, text):
+		"""
+		Writes the text to the client.
+
+		*text* (``str``) is the text to write.
+		"""
+		if isinstance(text, bytes):
+			text = text.decode('UTF-8', 'replace')
+		if text:
+			self.send({'output': text})
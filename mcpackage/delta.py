@@ -0,0 +1,217 @@
+# coding: utf-8
+"""
+This module implements rsync style delta transfers which are used to
+update a large installed JAR by only writing the regions which changed.
+
+The existing file is split into blocks, and the signature of each block
+is its weak (rolling) checksum and strong hash. The new file is then
+scanned for blocks matching the signature using the rolling checksum so
+that matches are found at any offset, and the delta between the files is
+the matched blocks to copy from the existing file along with the
+literal data which changed.
+
+The new file is always written to a separate file which then replaces
+the existing file so that a running client never sees a partially
+written file. The matched blocks are copied within the file system when
+it supports it, and are otherwise read from the existing file.
+"""
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import os
+import zlib
+
+#: The default block size in bytes.
+DEFAULT_BLOCK_SIZE = 8192
+
+#: The default number of bytes of the new file which can be scanned one
+#: byte at a time without finding a match before the delta is abandoned.
+#: Rolling the checksum runs at roughly a megabyte per second, so a
+#: mostly changed file is copied whole instead.
+DEFAULT_MAX_MISSES = 1024 * 1024
+
+#: The size in bytes of the chunks to read the ranges of the existing file
+#: in when they cannot be copied within the file system.
+READ_SIZE = 1024 * 1024
+
+#: The modulus of the adler32 checksum.
+_ADLER_MOD = 65521
+
+def apply_delta(old_fh, new_fh, delta):
+	"""
+	Writes the new file from the existing file and the delta. The ranges of
+	the existing file are copied within the file system when it supports it
+	(see ``copy_range()``), and are otherwise read from the existing file
+	and written.
+
+	*old_fh* (``file``) is the existing file opened for binary reading.
+
+	*new_fh* (``file``) is the new file opened for unbuffered binary
+	writing.
+
+	*delta* (``list`` of ``tuple``) is the delta from ``compute_delta()``.
+
+	Returns the number of bytes copied within the file system (``int``)
+	and the number of bytes written (``int``) as a ``tuple``.
+	"""
+	copied, written = 0, 0
+	can_copy = True
+	for op in delta:
+		if op[0] == 'copy':
+			offset, length = op[1], op[2]
+			if can_copy:
+				count = copy_range(old_fh, new_fh, offset, length)
+				copied += count
+				offset += count
+				length -= count
+				# Once a range cannot be copied, none of them can.
+				can_copy = length == 0
+			if length:
+				old_fh.seek(offset)
+				while length > 0:
+					chunk = old_fh.read(min(length, READ_SIZE))
+					if not chunk:
+						raise IOError(errno.EIO, "Unexpected end of file while reading range.")
+					new_fh.write(chunk)
+					written += len(chunk)
+					length -= len(chunk)
+		else:
+			new_fh.write(op[1])
+			written += len(op[1])
+	return copied, written
+
+def compute_delta(data, signature, max_misses=None):
+	"""
+	Computes the delta between the existing file and the new file.
+
+	*data* (``bytes``) is the content of the new file.
+
+	*signature* (``dict``) is the signature of the existing file from
+	``compute_signature()``.
+
+	*max_misses* (``int``) is the number of bytes which can be scanned
+	without finding a match. Default is ``None`` for
+	``DEFAULT_MAX_MISSES``.
+
+	Returns the delta (``list`` of ``tuple``). Each operation is either
+	``('copy', offset, length)`` to copy a range of the existing file, or
+	``('data', bytes)`` to write literal data. Returns ``None`` if too much
+	of the file changed in which case it should be copied whole.
+	"""
+	if max_misses is None:
+		max_misses = DEFAULT_MAX_MISSES
+	block_size = signature['block_size']
+	strongs = signature['strong']
+	lookup = {}
+	for index, weak in enumerate(signature['weak']):
+		lookup.setdefault(weak, []).append(index)
+
+	buf = bytearray(data)
+	size = len(buf)
+	delta = []
+	literal_start = 0
+	pos = 0
+	misses = 0
+	weak = None
+	a, b = 0, 0
+	while pos + block_size <= size:
+		if weak is None:
+			weak = zlib.adler32(bytes(buf[pos:pos + block_size])) & 0xffffffff
+			a, b = weak & 0xffff, weak >> 16
+
+		indices = lookup.get(weak)
+		if indices:
+			strong = hashlib.md5(buf[pos:pos + block_size]).hexdigest()
+			match = None
+			for index in indices:
+				if strongs[index] == strong:
+					match = index
+					break
+
+			if match is not None:
+				if literal_start < pos:
+					delta.append(('data', bytes(buf[literal_start:pos])))
+				offset = match * block_size
+				last = delta[-1] if delta else None
+				if last and last[0] == 'copy' and last[1] + last[2] == offset:
+					# Extend the previous range.
+					delta[-1] = ('copy', last[1], last[2] + block_size)
+				else:
+					delta.append(('copy', offset, block_size))
+				pos += block_size
+				literal_start = pos
+				weak = None
+				continue
+
+		# Roll the checksum forward by one byte.
+		misses += 1
+		if misses > max_misses:
+			return None
+		if pos + block_size < size:
+			out_byte, in_byte = buf[pos], buf[pos + block_size]
+			a = (a - out_byte + in_byte) % _ADLER_MOD
+			b = (b - block_size * out_byte + a - 1) % _ADLER_MOD
+			weak = (b << 16) | a
+		pos += 1
+
+	if literal_start < size:
+		delta.append(('data', bytes(buf[literal_start:])))
+	return delta
+
+def compute_signature(fh, block_size=None):
+	"""
+	Computes the signature of the existing file.
+
+	*fh* (``file``) is the existing file opened for binary reading.
+
+	*block_size* (``int``) is the block size in bytes. Default is ``None``
+	for ``DEFAULT_BLOCK_SIZE``.
+
+	Returns the signature (``dict``) which is JSON serializable.
+	"""
+	block_size = block_size or DEFAULT_BLOCK_SIZE
+	weaks, strongs = [], []
+	while True:
+		block = fh.read(block_size)
+		if len(block) < block_size:
+			# A partial block at the end is never matched.
+			break
+		weaks.append(zlib.adler32(block) & 0xffffffff)
+		strongs.append(hashlib.md5(block).hexdigest())
+	return {'block_size': block_size, 'weak': weaks, 'strong': strongs}
+
+def copy_range(src_fh, dest_fh, offset, length):
+	"""
+	Copies the range of the source file to the end of the destination
+	file within the file system using ``os.copy_file_range()`` (e.g.,
+	server-side copies on NFS 4.2 or reflinks).
+
+	*src_fh* (``file``) is the source file opened for binary reading.
+
+	*dest_fh* (``file``) is the destination file opened for unbuffered
+	binary writing.
+
+	*offset* (``int``) is the offset of the range in the source file.
+
+	*length* (``int``) is the length of the range.
+
+	Returns the number of bytes copied (``int``) which is less than
+	*length* when the file system cannot copy the rest of the range.
+	"""
+	copy_file_range = getattr(os, 'copy_file_range', None)
+	if copy_file_range is None:
+		return 0
+
+	src_fd, dest_fd = src_fh.fileno(), dest_fh.fileno()
+	copied = 0
+	try:
+		while copied < length:
+			count = copy_file_range(src_fd, dest_fd, length - copied, offset + copied)
+			if not count:
+				raise IOError(errno.EIO, "Unexpected end of file while copying range.")
+			copied += count
+	except OSError as e:
+		if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+			raise
+	return copied
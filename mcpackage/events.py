@@ -0,0 +1,148 @@
+# coding: utf-8
+"""
+This module implements the structured event stream which reports the
+progress and metrics of a build as lines of JSON.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import threading
+import time
+
+class EventStream(object):
+	"""
+	The ``EventStream`` class writes events as lines of JSON to a file or
+	file descriptor. Each event has its `"event"` type, the `"time"` it
+	happened as seconds since the epoch, and its fields.
+
+	Events are buffered and only flushed at the end of each stage, after
+	each subprocess, and when closed so that the stream is cheap enough to
+	leave on. Events are also passed to the listeners (e.g., the build
+	history) even when they are not written.
+	"""
+
+	def __init__(self, fh=None, owned=False):
+		"""
+		Initializes the ``EventStream`` instance.
+
+		*fh* (``file``) is the text file to write events to. Default is
+		``None`` to discard events.
+
+		*owned* (``bool``) is whether the file should be closed with the
+		stream.
+		"""
+
+		self.context = {}
+		"""
+		*context* (``dict``) contains the fields added to every event (e.g.,
+		the version of a matrix build).
+		"""
+
+		self.fh = fh
+		"""
+		*fh* (``file``) is the text file to write events to, or ``None`` to
+		discard events.
+		"""
+
+		self.listeners = []
+		"""
+		*listeners* (``list`` of ``callable``) contains the functions called
+		with each event (``dict``).
+		"""
+
+		self.lock = threading.Lock()
+		"""
+		*lock* (``threading.Lock``) is used to write whole events when they
+		are emitted from multiple threads.
+		"""
+
+		self.owned = owned
+		"""
+		*owned* (``bool``) is whether the file should be closed with the
+		stream.
+		"""
+
+	def __bool__(self):
+		"""
+		Returns whether events are being written (``bool``).
+		"""
+		return self.fh is not None
+
+	__nonzero__ = __bool__
+
+	def close(self):
+		"""
+		Flushes the stream, and closes its file if it is owned.
+		"""
+		if self.fh is None:
+			return
+		if self.owned:
+			self.fh.close()
+		else:
+			with self.lock:
+				self.fh.flush()
+		self.fh = None
+
+	def derive(self, **context):
+		"""
+		Creates a stream which writes its events to the same file as this
+		stream with the additional fields.
+
+		*context* are the JSON serializable fields to add to every event of
+		the derived stream.
+
+		Returns the derived stream (``EventStream``).
+		"""
+		stream = EventStream(self.fh)
+		stream.context = dict(self.context, **context)
+		stream.lock = self.lock
+		return stream
+
+	def emit(self, event, **fields):
+		"""
+		Writes the event.
+
+		*event* (``str``) is the type of event.
+
+		*fields* are the JSON serializable fields of the event.
+		"""
+		if self.fh is None and not self.listeners:
+			return
+		for key, value in self.context.items():
+			fields.setdefault(key, value)
+		fields['event'] = event
+		fields['time'] = round(time.time(), 3)
+		for listener in self.listeners:
+			listener(fields)
+		if self.fh is not None:
+			line = json.dumps(fields, sort_keys=True) + '\n'
+			with self.lock:
+				self.fh.write(line)
+
+	def flush(self):
+		"""
+		Flushes the buffered events.
+		"""
+		if self.fh is not None:
+			with self.lock:
+				self.fh.flush()
+
+	@classmethod
+	def open(cls, target):
+		"""
+		Opens the event stream.
+
+		*target* (``str``) is either the file to append events to, or
+		`'fd:N'` to write them to the open file descriptor *N* (e.g.,
+		`'fd:3'`). Default is ``None`` to discard events.
+
+		Returns the event stream (``EventStream``).
+		"""
+		if not target:
+			return cls()
+		if target.startswith('fd:'):
+			fd = int(target[3:])
+			return cls(io.open(os.dup(fd), mode='a', encoding='UTF-8'), owned=True)
+		return cls(io.open(target, mode='a', encoding='UTF-8'), owned=True)
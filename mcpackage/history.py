@@ -0,0 +1,584 @@
+# coding: utf-8
+"""
+This module implements the build history which records the timings and
+metrics of each build in a SQLite database, and the "stats" command which
+is used to show trends and compare builds.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import datetime
+import errno
+import os
+import os.path
+import sqlite3
+import sys
+import traceback
+
+from . import __version__
+
+#: The file within the build directory to store the build history in.
+HISTORY_FILE = 'history.db'
+
+#: The version of the database schema.
+SCHEMA_VERSION = 1
+
+#: The statements used to create the database schema.
+SCHEMA = [
+	"""
+	CREATE TABLE IF NOT EXISTS builds (
+		id INTEGER PRIMARY KEY AUTOINCREMENT,
+		started REAL NOT NULL,
+		version TEXT NOT NULL,
+		name TEXT,
+		config_file TEXT,
+		forced INTEGER NOT NULL,
+		result INTEGER,
+		seconds REAL,
+		jar_bytes INTEGER,
+		entries INTEGER,
+		mcp_files INTEGER,
+		java_files INTEGER,
+		python_files INTEGER
+	)
+	""",
+	"""
+	CREATE TABLE IF NOT EXISTS stages (
+		build_id INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+		stage TEXT NOT NULL,
+		skipped INTEGER NOT NULL,
+		result INTEGER,
+		seconds REAL
+	)
+	""",
+	"""
+	CREATE TABLE IF NOT EXISTS caches (
+		build_id INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+		name TEXT NOT NULL,
+		hits INTEGER NOT NULL,
+		misses INTEGER NOT NULL
+	)
+	""",
+	"CREATE INDEX IF NOT EXISTS stages_build_id ON stages (build_id)",
+	"CREATE INDEX IF NOT EXISTS caches_build_id ON caches (build_id)",
+]
+
+def _hit_rate(counts):
+	"""
+	Calculates the cache hit rate.
+
+	*counts* (``tuple``) contains the hits (``int``) and misses (``int``),
+	or is ``None``.
+
+	Returns the hit rate (``float``), or ``None`` if the cache was not
+	used.
+	"""
+	if not counts or not sum(counts):
+		return None
+	return counts[0] / sum(counts)
+
+def _is_skipped(build):
+	"""
+	Determines whether the build skipped every stage which records
+	checkpoints because nothing changed.
+
+	*build* (``dict``) is the build.
+
+	Returns whether the build was skipped (``bool``).
+	"""
+	# - NOTE: This is imported here to avoid a circular import.
+	from .build import CHECKPOINT_STAGES
+	return not any(stage in build['stages'] for stage in CHECKPOINT_STAGES)
+
+def _stage_order(builds):
+	"""
+	Orders the stages run by the builds.
+
+	*builds* (``list`` of ``dict``) contains the builds.
+
+	Returns the stages (``list`` of ``str``) in build order.
+	"""
+	# - NOTE: This is imported here to avoid a circular import.
+	from .build import STAGES
+	stages = set()
+	for build in builds:
+		stages.update(build['stages'])
+	return [stage for stage in STAGES if stage in stages]
+
+def command(**args):
+	"""
+	Shows the statistics of the build history.
+
+	`**args` is the keyword arguments to send to ``StatsCommand()``.
+
+	Returns the exit code (``int``).
+	"""
+	return StatsCommand(**args).run()
+
+def format_bytes(size):
+	"""
+	Formats the number of bytes for display.
+
+	*size* (``int``) is the number of bytes, or ``None``.
+
+	Returns the formatted size (``str``).
+	"""
+	if size is None:
+		return "-"
+	elif size < 1024:
+		return "{} B".format(size)
+	elif size < 1024 * 1024:
+		return "{:.1f} KB".format(size / 1024)
+	return "{:.1f} MB".format(size / (1024 * 1024))
+
+def get_history_file(config):
+	"""
+	Gets the path of the build history database.
+
+	*config* (``dict``) is the loaded mcpackage configuration.
+
+	Returns the path (``str``).
+	"""
+	db_file = config['history']['file']
+	if db_file:
+		return os.path.abspath(os.path.expanduser(os.path.expandvars(db_file)))
+	return os.path.join(config['build']['dir'], HISTORY_FILE)
+
+def percentile(values, fraction):
+	"""
+	Calculates the percentile of the values using the nearest rank.
+
+	*values* (``list`` of ``float``) contains the sorted values.
+
+	*fraction* (``float``) is the percentile as a fraction (e.g., `0.9`
+	for the 90th percentile).
+
+	Returns the percentile (``float``), or ``None`` if there are no
+	values.
+	"""
+	if not values:
+		return None
+	rank = max(1, int(-(-fraction * len(values) // 1)))
+	return values[min(rank, len(values)) - 1]
+
+
+class BuildHistory(object):
+	"""
+	The ``BuildHistory`` class stores the record of each build in a SQLite
+	database.
+	"""
+
+	def __init__(self, db_file):
+		"""
+		Initializes the ``BuildHistory`` instance.
+
+		*db_file* (``str``) is the path of the database.
+		"""
+
+		self.db_file = db_file
+		"""
+		*db_file* (``str``) is the path of the database.
+		"""
+
+	def add(self, record):
+		"""
+		Adds the build to the history.
+
+		*record* (``dict``) is the build record from ``HistoryRecorder``.
+
+		Returns the ID of the build (``int``).
+		"""
+		conn = self.connect()
+		try:
+			with conn:
+				cursor = conn.execute("""
+					INSERT INTO builds (started, version, name, config_file, forced, result, seconds, jar_bytes, entries, mcp_files, java_files, python_files)
+					VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+				""", (
+					record['started'],
+					__version__,
+					record['name'],
+					record['config_file'],
+					int(bool(record['forced'])),
+					record['result'],
+					record['seconds'],
+					record['jar_bytes'],
+					record['entries'],
+					record['files'].get('mcp'),
+					record['files'].get('java'),
+					record['files'].get('python'),
+				))
+				build_id = cursor.lastrowid
+				conn.executemany("INSERT INTO stages (build_id, stage, skipped, result, seconds) VALUES (?, ?, ?, ?, ?)", [
+					(build_id, stage['stage'], int(stage['skipped']), stage['result'], stage['seconds']) for stage in record['stages']
+				])
+				conn.executemany("INSERT INTO caches (build_id, name, hits, misses) VALUES (?, ?, ?, ?)", [
+					(build_id, name, hits, misses) for name, (hits, misses) in sorted(record['caches'].items())
+				])
+		finally:
+			conn.close()
+		return build_id
+
+	def connect(self):
+		"""
+		Connects to the database, and creates its schema if needed.
+
+		Returns the connection (``sqlite3.Connection``).
+		"""
+		try:
+			os.makedirs(os.path.dirname(os.path.abspath(self.db_file)))
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+
+		conn = sqlite3.connect(self.db_file, timeout=30)
+		conn.row_factory = sqlite3.Row
+		conn.execute("PRAGMA foreign_keys = ON")
+		if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+			with conn:
+				for statement in SCHEMA:
+					conn.execute(statement)
+				conn.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+		return conn
+
+	def get_build(self, build_id):
+		"""
+		Gets the build.
+
+		*build_id* (``int``) is the ID of the build.
+
+		Returns the build (``dict``) with the columns of the build, its
+		`'stages'` (``dict``) mapping each stage run (``str``) to its
+		seconds (``float``), and its `'caches'` (``dict``) mapping each cache
+		(``str``) to its hits and misses (``tuple``). Returns ``None`` if the
+		build does not exist.
+		"""
+		builds = self.get_builds(build_ids=[build_id])
+		return builds[0] if builds else None
+
+	def get_builds(self, limit=None, build_ids=None):
+		"""
+		Gets the most recent builds.
+
+		*limit* (``int``) is the maximum number of builds to get. Default is
+		``None`` for all builds.
+
+		*build_ids* (``Iterable`` of ``int``) optionally contains the IDs of
+		the builds to get. Default is ``None`` for any build.
+
+		Returns the builds (``list`` of ``dict``) from oldest to newest. See
+		``get_build()``.
+		"""
+		if not os.path.exists(self.db_file):
+			return []
+
+		conn = self.connect()
+		try:
+			query = "SELECT * FROM builds"
+			params = []
+			if build_ids is not None:
+				build_ids = list(build_ids)
+				query += " WHERE id IN ({})".format(", ".join("?" for _ in build_ids))
+				params.extend(build_ids)
+			query += " ORDER BY id DESC"
+			if limit:
+				query += " LIMIT ?"
+				params.append(limit)
+			builds = [dict(row) for row in conn.execute(query, params)]
+			builds.reverse()
+
+			by_id = dict((build['id'], build) for build in builds)
+			for build in builds:
+				build['stages'] = {}
+				build['caches'] = {}
+			if by_id:
+				marks = ", ".join("?" for _ in by_id)
+				for row in conn.execute("SELECT * FROM stages WHERE build_id IN ({}) AND skipped = 0".format(marks), list(by_id)):
+					by_id[row['build_id']]['stages'][row['stage']] = row['seconds']
+				for row in conn.execute("SELECT * FROM caches WHERE build_id IN ({})".format(marks), list(by_id)):
+					by_id[row['build_id']]['caches'][row['name']] = (row['hits'], row['misses'])
+			return builds
+		finally:
+			conn.close()
+
+
+class HistoryRecorder(object):
+	"""
+	The ``HistoryRecorder`` class collects the metrics of each build from
+	its events (see ``EventStream``), and adds the build to the history
+	when it ends.
+	"""
+
+	def __init__(self, history, name, config_file):
+		"""
+		Initializes the ``HistoryRecorder`` instance.
+
+		*history* (``BuildHistory``) is the build history.
+
+		*name* (``str``) is the name of the mod.
+
+		*config_file* (``str``) is the mcpackage configuration file.
+		"""
+
+		self.config_file = config_file
+		"""
+		*config_file* (``str``) is the mcpackage configuration file.
+		"""
+
+		self.history = history
+		"""
+		*history* (``BuildHistory``) is the build history.
+		"""
+
+		self.name = name
+		"""
+		*name* (``str``) is the name of the mod.
+		"""
+
+		self.record = None
+		"""
+		*record* (``dict``) is the record of the current build, or ``None``
+		if no build is running.
+		"""
+
+	def handle(self, event):
+		"""
+		Collects the metrics from the build event.
+
+		*event* (``dict``) is the event.
+		"""
+		kind = event['event']
+		if kind == 'build_start':
+			self.record = {
+				'started': event['time'],
+				'name': self.name,
+				'config_file': self.config_file,
+				'forced': event.get('force'),
+				'result': None,
+				'seconds': None,
+				'jar_bytes': None,
+				'entries': None,
+				'files': {},
+				'stages': [],
+				'caches': {},
+			}
+			return
+
+		record = self.record
+		if record is None:
+			return
+		elif kind == 'stage_end':
+			record['stages'].append({'stage': event['stage'], 'skipped': False, 'result': event['result'], 'seconds': event['seconds']})
+		elif kind == 'stage_skip':
+			record['stages'].append({'stage': event['stage'], 'skipped': True, 'result': None, 'seconds': None})
+		elif kind == 'cache':
+			hits, misses = record['caches'].get(event['name'], (0, 0))
+			record['caches'][event['name']] = (hits + event['hits'], misses + event['misses'])
+		elif kind == 'files' and event['stage'] == 'scan':
+			for key in ('mcp', 'java', 'python'):
+				record['files'][key] = event[key]
+		elif kind == 'package':
+			record['jar_bytes'] = event['jar_bytes']
+			record['entries'] = event['entries']
+		elif kind == 'build_end':
+			record['result'] = event['result']
+			record['seconds'] = event['seconds']
+			self.record = None
+			self.history.add(record)
+
+
+class StatsCommand(object):
+	"""
+	The ``StatsCommand`` class is used to show the trends of the build
+	history, and to compare builds.
+	"""
+
+	def __init__(self, config_file, compare=None, include_skipped=None, limit=None, verbose=None, **_):
+		"""
+		Initializes the ``StatsCommand`` instance.
+
+		*config_file* (``str``) is the mcpackage configuration file to use.
+
+		*compare* (``list`` of ``int``) optionally contains the IDs of the
+		two builds to compare. Default is ``None`` to show the trends.
+
+		*include_skipped* (``bool``) is whether the builds which skipped
+		every stage because nothing changed should be included in the
+		statistics. Default is ``None`` for ``False``.
+
+		*limit* (``int``) is the number of recent builds to show the trends
+		of. Default is ``None`` for `20`.
+
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed. Default is ``None`` for `0`.
+		"""
+
+		self.compare = compare
+		"""
+		*compare* (``list`` of ``int``) contains the IDs of the two builds
+		to compare, or ``None`` to show the trends.
+		"""
+
+		self.config_file = config_file
+		"""
+		*config_file* (``str``) is the mcpackage configuration file to use.
+		"""
+
+		self.include_skipped = include_skipped or False
+		"""
+		*include_skipped* (``bool``) is whether the builds which skipped
+		every stage because nothing changed should be included in the
+		statistics.
+		"""
+
+		self.limit = limit or 20
+		"""
+		*limit* (``int``) is the number of recent builds to show the trends
+		of.
+		"""
+
+		self.verbose = verbose or 0
+		"""
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed.
+		"""
+
+	def print_compare(self, history):
+		"""
+		Prints the comparison of the two builds.
+
+		*history* (``BuildHistory``) is the build history.
+
+		Returns the exit code (``int``).
+		"""
+		builds = []
+		for build_id in self.compare:
+			build = history.get_build(build_id)
+			if build is None:
+				print("Build {} does not exist in {!r}.".format(build_id, history.db_file), file=sys.stderr)
+				return 1
+			builds.append(build)
+		old, new = builds
+
+		def row(label, old_value, new_value, fmt):
+			if old_value is None or new_value is None:
+				change = ""
+			elif old_value:
+				change = "{:+.0%}".format((new_value - old_value) / old_value)
+			else:
+				change = ""
+			print("{:<16} {:>12} {:>12}  {}".format(label, fmt(old_value), fmt(new_value), change).rstrip())
+
+		seconds = lambda value: "-" if value is None else "{:.3f}s".format(value)
+		print("{:<16} {:>12} {:>12}".format("", "#{}".format(old['id']), "#{}".format(new['id'])))
+		row("total", old['seconds'], new['seconds'], seconds)
+		for stage in _stage_order([old, new]):
+			row("  " + stage, old['stages'].get(stage), new['stages'].get(stage), seconds)
+		row("jar size", old['jar_bytes'], new['jar_bytes'], format_bytes)
+		row("jar entries", old['entries'], new['entries'], lambda value: "-" if value is None else str(value))
+		for key in ('mcp', 'java', 'python'):
+			row("{} files".format(key), old[key + '_files'], new[key + '_files'], lambda value: "-" if value is None else str(value))
+		for name in sorted(set(old['caches']) | set(new['caches'])):
+			row("{} hits".format(name), _hit_rate(old['caches'].get(name)), _hit_rate(new['caches'].get(name)), lambda value: "-" if value is None else "{:.0%}".format(value))
+		return 0
+
+	def print_trends(self, history):
+		"""
+		Prints the recent builds, the percentiles and trends of the stage
+		timings, and the slowest stages.
+
+		*history* (``BuildHistory``) is the build history.
+
+		Returns the exit code (``int``).
+		"""
+		builds = history.get_builds(limit=self.limit)
+		if not builds:
+			print("No builds recorded in {!r}.".format(history.db_file))
+			return 0
+
+		print("Recent builds:")
+		print("{:>6}  {:<19}  {:<6} {:>10} {:>10} {:>8}".format("ID", "Started", "Result", "Seconds", "JAR", "Cache"))
+		for build in builds:
+			hits = sum(hits for hits, _ in build['caches'].values())
+			total = sum(hits + misses for hits, misses in build['caches'].values())
+			print("{:>6}  {:<19}  {:<6} {:>10} {:>10} {:>8}".format(
+				build['id'],
+				datetime.datetime.fromtimestamp(build['started']).strftime('%Y-%m-%d %H:%M:%S'),
+				"ok" if build['result'] == 0 else "failed",
+				"{:.3f}".format(build['seconds']) if build['seconds'] is not None else "-",
+				format_bytes(build['jar_bytes']),
+				"{:.0%}".format(hits / total) if total else "-",
+			))
+
+		# - NOTE: Only successful builds are used for the statistics because
+		#   failed builds stop early. Builds which skipped every stage are
+		#   also left out by default because their near-zero times would
+		#   skew the percentiles and trends.
+		builds = [build for build in builds if build['result'] == 0]
+		skipped = 0
+		if not self.include_skipped:
+			skipped = sum(1 for build in builds if _is_skipped(build))
+			builds = [build for build in builds if not _is_skipped(build)]
+		if not builds:
+			return 0
+
+		rows = []
+		for stage in ['total'] + _stage_order(builds):
+			if stage == 'total':
+				values = [build['seconds'] for build in builds if build['seconds'] is not None]
+			else:
+				# Only the runs of the stage are used so that the builds which
+				# skipped it do not skew its trend.
+				values = [build['stages'][stage] for build in builds if build['stages'].get(stage) is not None]
+			if not values:
+				continue
+			# The trend compares the newer half of the runs to the older half.
+			half = len(values) // 2
+			trend = None
+			if half:
+				older = sum(values[:half]) / half
+				newer = sum(values[-half:]) / half
+				if older:
+					trend = (newer - older) / older
+			sorted_values = sorted(values)
+			rows.append((stage, len(values), percentile(sorted_values, 0.5), percentile(sorted_values, 0.9), sorted_values[-1], sum(values) / len(values), trend))
+
+		print("")
+		if skipped:
+			print("Stage timings of the last {} successful build(s), excluding {} skipped build(s):".format(len(builds), skipped))
+		else:
+			print("Stage timings of the last {} successful build(s):".format(len(builds)))
+		print("{:<12} {:>5} {:>10} {:>10} {:>10} {:>10} {:>8}".format("Stage", "Runs", "p50", "p90", "Max", "Mean", "Trend"))
+		for stage, runs, p50, p90, high, mean, trend in rows:
+			print("{:<12} {:>5} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>8}".format(stage, runs, p50, p90, high, mean, "{:+.0%}".format(trend) if trend is not None else "-"))
+
+		print("")
+		print("Slowest stages:")
+		for stage, runs, _, _, _, mean, _ in sorted((row for row in rows if row[0] != 'total'), key=lambda row: -row[5])[:3]:
+			print("  {:<12} {:.3f}s mean over {} run(s)".format(stage, mean, runs))
+		return 0
+
+	def run(self):
+		"""
+		Runs the "stats" command.
+
+		Returns the exit code (``int``).
+		"""
+		# - NOTE: This is imported here to avoid a circular import.
+		from .build import BuildCommand
+
+		# Load config.
+		build = BuildCommand(config_file=self.config_file, verbose=self.verbose)
+		try:
+			build.init_config()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to load configuration.", file=sys.stderr)
+			return 1
+
+		history = BuildHistory(get_history_file(build.config))
+		if self.verbose >= 1:
+			print("Read {!r}.".format(history.db_file))
+		if self.compare:
+			return self.print_compare(history)
+		return self.print_trends(history)
+
@@ -5,19 +5,22 @@ scaffolding for a new Minecraft Mod.
 """
 from __future__ import print_function, unicode_literals
 
+import copy
 import errno
 import io
 import json
 import logging
+import multiprocessing
 import os
 import re
 import string # pylint: disable=W0402
 import sys
+import time
 import traceback
+from multiprocessing.pool import ThreadPool
 
-import pkg_resources
-
-from . import __name__ as MCPACKAGE
+from . import util
+from .resources import resource_string
 
 #: The template mcmod info file.
 MCMOD_TEMPLATE_FILE = {
@@ -47,16 +50,101 @@ PYTHON_MOD_TEMPLATE_FILE = {
 	'python': 'data/templates/python/mod.py'
 }
 
-def command(**args):
+#: The default manifest of the mods to create.
+DEFAULT_MANIFEST = {
+	# The arguments of ``InitCommand()`` used for every mod (e.g.,
+	# "mod_type" and "forge_dir"). These override the command-line
+	# arguments.
+	'defaults': {},
+	# The arguments of ``InitCommand()`` for each mod to create (e.g.,
+	# "mod_name", "mod_namespace" and "mod_dir"). The mod directories are
+	# relative to the manifest.
+	'mods': [],
+	# The maximum number of mods to create concurrently. If this is null,
+	# the number of CPUs is used.
+	'jobs': None,
+}
+
+#: Caches the MCP mod information loaded by ``load_mcp_mod_info()``. This
+#: maps the Forge directory (``str``) to a ``tuple`` containing: the MCP
+#: mod information (``dict``) or ``None``, and the warning (``str``) or
+#: ``None``.
+MCP_INFO_CACHE = {}
+
+#: Caches the templates loaded by ``load_template()``. This maps the path
+#: of each template (``str``) to its contents (``str``).
+TEMPLATE_CACHE = {}
+
+def command(manifest=None, **args):
 	"""
-	Creates the scaffolding for a new Minecraft Mod.
+	Creates the scaffolding for a new Minecraft Mod, or for each mod in the
+	manifest.
+
+	*manifest* (``str``) is the manifest of the mods to create. Default is
+	``None`` to create the one mod from the arguments.
 
 	`**args` is the keyword arguments to send to ``InitCommand()``.
 
 	Returns the exit code (``int``).
 	"""
+	if manifest:
+		return ManifestCommand(manifest, **args).run()
 	return InitCommand(**args).run()
 
+def load_mcp_mod_info(forge_dir):
+	"""
+	Loads the MCP mod information from the Forge directory. This is cached
+	so that it is only read once when many mods are created.
+
+	*forge_dir* (``str``) is the Minecraft Forge source directory.
+
+	Returns a ``tuple`` containing: the MCP mod information (``dict``), or
+	``None`` if it could not be found; and the warning (``str``) to report
+	if it could not be found, or ``None``.
+	"""
+	cached = MCP_INFO_CACHE.get(forge_dir)
+	if cached is not None:
+		return cached
+
+	mcp_mod_info, warning = None, None
+	if os.path.isdir(forge_dir):
+		# Load MCP mod info file.
+		mcp_info_file = os.path.join(forge_dir, 'mcpmod.info')
+		try:
+			with io.open(mcp_info_file, 'r', encoding='UTF-8') as fh:
+				config = json.load(fh)
+		except IOError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			warning = "The Minecraft Forge file {!r} does not exist.".format(mcp_info_file)
+		else:
+			for row in config:
+				if row['modid'] == 'mcp':
+					mcp_mod_info = row
+					break
+			if mcp_mod_info is None:
+				warning = "The Minecraft Forge file {!r} does not contain the 'mcp' mod information.".format(mcp_info_file)
+	else:
+		warning = "The Minecraft Forge directory {!r} does not exist. Ensure it gets created before building.".format(forge_dir)
+
+	cached = MCP_INFO_CACHE[forge_dir] = (mcp_mod_info, warning)
+	return cached
+
+def load_template(path):
+	"""
+	Loads the template. This is cached so that each template is only read
+	once when many mods are created.
+
+	*path* (``str``) is the path of the template relative to the
+	*mcpackage* package.
+
+	Returns the template (``str``).
+	"""
+	template = TEMPLATE_CACHE.get(path)
+	if template is None:
+		template = TEMPLATE_CACHE[path] = resource_string(path).decode('UTF-8')
+	return template
+
 
 class InitCommand(object):
 	"""
@@ -273,36 +361,16 @@ class InitCommand(object):
 		if not self.force:
 			# If mod directory is not empty, report error and stop. This is so
 			# we do not accidently overwrite files belonging an existing mod.
-			for _ in os.walk(self.mod_dir):
+			if os.listdir(self.mod_dir):
 				self.log.error("Mod directory {!r} is not empty.".format(self.mod_dir))
 				return 1
 
 		# Display warning if forge directory does not exist.
 		forge_dir = os.path.normpath(os.path.join(self.mod_dir, self.forge_dir))
-		mcp_mod_info = None
-		if os.path.isdir(forge_dir):
-			# Load MCP mod info file.
-			mcp_info_file = os.path.join(forge_dir, 'mcpmod.info')
-			try:
-				with io.open(mcp_info_file, 'r', encoding='UTF-8') as fh:
-					config = json.load(fh)
-			except IOError as e:
-				if e.errno == errno.ENOENT:
-					self.log.warning("The Minecraft Forge file {!r} does not exist.".format(mcp_info_file))
-				else:
-					raise
-			else:
-				for row in config:
-					if row['modid'] == 'mcp':
-						mcp_mod_info = row
-						break
-				if mcp_mod_info is None:
-					self.log.warning("The Minecraft Forge file {!r} does not contain the 'mcp' mod information.".format(mcp_info_file))
-			del mcp_info_file, config
-
-		else:
-			self.log.warning("The Minecraft Forge directory {!r} does not exist. Ensure it gets created before building.".format(forge_dir))
-		del forge_dir
+		mcp_mod_info, warning = load_mcp_mod_info(forge_dir)
+		if warning:
+			self.log.warning(warning)
+		del forge_dir, warning
 
 		# Create library directory.
 		library_dir = os.path.normpath(os.path.join(self.mod_dir, self.library_dir))
@@ -338,8 +406,7 @@ class InitCommand(object):
 		# Load mcpackage configuration template.
 		config_file = MCPACKAGE_TEMPLATE_FILE[self.mod_type]
 		self.log.info("Load {!r}.".format(config_file))
-		config_tpl = pkg_resources.resource_string(MCPACKAGE, config_file)
-		config_tpl = config_tpl.decode('UTF-8')
+		config_tpl = load_template(config_file)
 		del config_file
 
 		# Generate mcpackage configuration.
@@ -364,8 +431,7 @@ class InitCommand(object):
 		# Load mcmod info template.
 		info_file = MCMOD_TEMPLATE_FILE[self.mod_type]
 		self.log.info("Load {!r}.".format(info_file))
-		info_tpl = pkg_resources.resource_string(MCPACKAGE, info_file)
-		info_tpl = info_tpl.decode('UTF-8')
+		info_tpl = load_template(info_file)
 		del info_file
 
 		# Generate mcmod info.
@@ -394,8 +460,7 @@ class InitCommand(object):
 		# Load java mod template.
 		mod_file = JAVA_MOD_TEMPLATE_FILE[self.mod_type]
 		self.log.info("Load {!r}.".format(mod_file))
-		mod_tpl = pkg_resources.resource_string(MCPACKAGE, mod_file)
-		mod_tpl = mod_tpl.decode('UTF-8')
+		mod_tpl = load_template(mod_file)
 		del mod_file
 
 		# Generate java mod file.
@@ -429,8 +494,7 @@ class InitCommand(object):
 			# Load python init template.
 			init_file = PYTHON_INIT_TEMPLATE_FILE[self.mod_type]
 			self.log.info("Load {!r}.".format(init_file))
-			init_tpl = pkg_resources.resource_string(MCPACKAGE, init_file)
-			init_tpl = init_tpl.decode('UTF-8')
+			init_tpl = load_template(init_file)
 			del init_file
 
 			# Generate python init file.
@@ -452,8 +516,7 @@ class InitCommand(object):
 			# Load python mod template.
 			mod_file = PYTHON_MOD_TEMPLATE_FILE[self.mod_type]
 			self.log.info("Load {!r}.".format(mod_file))
-			mod_tpl = pkg_resources.resource_string(MCPACKAGE, mod_file)
-			mod_tpl = mod_tpl.decode('UTF-8')
+			mod_tpl = load_template(mod_file)
 			del mod_file
 
 			# Generate python mod file.
@@ -474,3 +537,204 @@ class InitCommand(object):
 
 		self.log.info("Done.")
 		return 0
+
+
+class ManifestCommand(object):
+	"""
+	The ``ManifestCommand`` class is used to create the scaffolding for
+	each Minecraft Mod in a manifest concurrently. The templates and Forge
+	mod information are only loaded once and shared by every mod which
+	makes it cheap to create many mods (e.g., for testing the build at
+	scale).
+	"""
+
+	def __init__(self, manifest, force=None, verbose=None, **args):
+		"""
+		Initializes the ``ManifestCommand`` instance.
+
+		*manifest* (``str``) is the manifest of the mods to create.
+
+		*force* (``bool``) forces the initialization of each mod even if its
+		directory is not empty. Default is ``None`` for ``False``.
+
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed. Default is ``None`` for `0`.
+
+		`**args` are the keyword arguments of ``InitCommand()`` used for
+		every mod unless set by the manifest.
+		"""
+
+		self.args = args
+		"""
+		*args* (``dict``) contains the keyword arguments of ``InitCommand()``
+		used for every mod unless set by the manifest.
+		"""
+
+		self.config = None
+		"""
+		*config* (``dict``) is the loaded manifest.
+		"""
+
+		self.force = force or False
+		"""
+		*force* (``bool``) forces the initialization of each mod.
+		"""
+
+		self.log = None
+		"""
+		*log* (``logging.Logger``) is the main logger.
+		"""
+
+		self.log_handlers = []
+		"""
+		*log_handlers* (``list`` of ``logging.Handler``) contains the
+		handlers added by ``init_logging()``.
+		"""
+
+		self.manifest_file = manifest
+		"""
+		*manifest_file* (``str``) is the manifest of the mods to create.
+		"""
+
+		self.mods = None
+		"""
+		*mods* (``list`` of ``InitCommand``) contains the command used to
+		create each mod.
+		"""
+
+		self.verbose = verbose or 0
+		"""
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed.
+		"""
+
+	def close_logging(self):
+		"""
+		Removes the handlers added by ``init_logging()`` so that the command
+		can be run again within the same process.
+		"""
+		for handler in self.log_handlers:
+			self.log.removeHandler(handler)
+			handler.close()
+		self.log_handlers = []
+
+	def create_mod(self, init):
+		"""
+		Creates the mod. This is run on a thread of the pool.
+
+		*init* (``InitCommand``) is the command used to create the mod.
+
+		Returns the exit code (``int``).
+		"""
+		try:
+			result = init.run_work()
+		except:
+			init.log.error("Failed to create mod.", exc_info=sys.exc_info())
+			result = 1
+		return result
+
+	def init_config(self):
+		"""
+		Loads the manifest.
+		"""
+		if self.verbose >= 1:
+			print("Load {!r}.".format(self.manifest_file))
+		config = util.load_config(self.manifest_file) or {}
+		self.config = util.merge_config(copy.deepcopy(DEFAULT_MANIFEST), config)
+
+		# Create the command for each mod.
+		manifest_dir = os.path.dirname(os.path.abspath(self.manifest_file))
+		self.mods = []
+		mod_dirs = set()
+		i, entry, args, init = None, None, None, None
+		for i, entry in enumerate(self.config['mods']):
+			assert isinstance(entry, dict), "Mod {} of the manifest {!r} is not a mapping.".format(i + 1, self.manifest_file)
+			args = dict(self.args, force=self.force, verbose=self.verbose)
+			args.update(self.config['defaults'])
+			args.update(entry)
+			assert args.get('mod_name') and args.get('mod_namespace'), "Mod {} of the manifest {!r} must have a mod_name and mod_namespace.".format(i + 1, self.manifest_file)
+			args['mod_dir'] = os.path.normpath(os.path.join(manifest_dir, os.path.expanduser(os.path.expandvars(args['mod_dir']))))
+			assert args['mod_dir'] not in mod_dirs, "Mod directory {!r} is in the manifest {!r} more than once.".format(args['mod_dir'], self.manifest_file)
+			mod_dirs.add(args['mod_dir'])
+			init = InitCommand(**args)
+			init.log = logging.getLogger(os.path.relpath(args['mod_dir'], manifest_dir))
+			self.mods.append(init)
+		del i, entry, args, init
+
+	def init_logging(self):
+		"""
+		Initialize logging.
+		"""
+		if self.verbose >= 2:
+			log_level = logging.DEBUG
+		elif self.verbose >= 1:
+			log_level = logging.INFO
+		else:
+			log_level = logging.WARNING
+
+		self.log = logging.getLogger()
+		self.log.setLevel(logging.NOTSET)
+
+		if self.verbose >= 1:
+			print("Log to stdout.")
+		stream_handler = logging.StreamHandler(stream=sys.stdout)
+		stream_handler.setLevel(log_level)
+		stream_handler.setFormatter(logging.Formatter(fmt='[%(name)s] %(levelname)s: %(message)s'))
+		self.log.addHandler(stream_handler)
+		self.log_handlers.append(stream_handler)
+
+	def run(self):
+		"""
+		Runs the "init" command with a manifest.
+
+		Returns the exit code (``int``).
+		"""
+		# Initialze logging.
+		try:
+			self.init_logging()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to initialize logging.", file=sys.stderr)
+			return 1
+
+		# Create mods.
+		try:
+			result = self.run_work()
+		except:
+			self.log.error("Failed to create mods.", exc_info=sys.exc_info())
+			result = 1
+		finally:
+			self.close_logging()
+		return result
+
+	def run_work(self):
+		"""
+		Perform the actual work of the "init" command with a manifest.
+
+		Returns the exit code (``int``).
+		"""
+		# Load manifest.
+		try:
+			self.init_config()
+		except:
+			self.log.error("Failed to load manifest.", exc_info=sys.exc_info())
+			return 1
+
+		if not self.mods:
+			self.log.error("No mods in manifest {!r}.".format(self.manifest_file))
+			return 1
+
+		# Create mods concurrently.
+		jobs = max(1, min(self.config['jobs'] or multiprocessing.cpu_count(), len(self.mods)))
+		self.log.info("Create {} mod(s) with {} job(s).".format(len(self.mods), jobs))
+		start = time.time()
+		pool = ThreadPool(jobs)
+		try:
+			results = pool.map(self.create_mod, self.mods, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+
+		failed = sum(1 for result in results if result)
+		print("Created {} of {} mod(s) in {:.3f}s.".format(len(results) - failed, len(results), time.time() - start))
+		return 1 if failed else 0
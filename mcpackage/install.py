@@ -3,6 +3,32 @@
 This module implements the "install" command which is used  to install
 the Minecraft Mod.
 """
+from __future__ import print_function, unicode_literals
+
+import errno
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import os.path
+import shutil
+import sys
+import time
+import traceback
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+from . import delta, util
+from .build import load_config
+
+#: The directory within the build directory to cache the signatures of
+#: installed JARs in for delta installs.
+DELTA_CACHE_DIR = os.path.join('cache', 'delta')
+
+#: The mod information file within a mod JAR.
+MCMOD_INFO_FILE = 'mcmod.info'
 
 def command(**args):
 	"""
@@ -14,19 +40,81 @@ def command(**args):
 	"""
 	return InstallCommand(**args).run()
 
+def get_key(obj, key):
+	"""
+	Gets the value of the key from the JSON object ignoring the case of
+	the key.
+
+	*obj* (``dict``) is the JSON object.
+
+	*key* (``str``) is the lower case key.
+
+	Returns the value, or ``None`` if the key is not found.
+	"""
+	if key in obj:
+		return obj[key]
+	for obj_key, value in obj.items():
+		if obj_key.lower() == key:
+			return value
+	return None
+
+def get_mod_ids(jar_file):
+	"""
+	Gets the IDs of the mods contained in the JAR from its mod information
+	file.
+
+	*jar_file* (``str``) is the path of the JAR.
+
+	Returns the mod IDs (``set`` of ``str``). This is empty if the JAR does
+	not have a valid mod information file.
+	"""
+	try:
+		with zipfile.ZipFile(jar_file, 'r') as jar_fh:
+			data = jar_fh.read(MCMOD_INFO_FILE)
+		info = json.loads(data.decode('UTF-8'))
+	except (KeyError, IOError, ValueError, zipfile.BadZipfile):
+		return set()
+
+	# The mod information file is either a list of mods, or an object with
+	# the list of mods under "modlist" for version 2.
+	# - NOTE: The keys are matched case-insensitively because both "modlist"
+	#   (as in the mcmod.info template) and "modList" are found in the wild.
+	if isinstance(info, dict):
+		info = get_key(info, 'modlist')
+	if not isinstance(info, list):
+		return set()
+	mod_ids = set()
+	for row in info:
+		mod_id = get_key(row, 'modid') if isinstance(row, dict) else None
+		if mod_id:
+			mod_ids.add(mod_id)
+	return mod_ids
+
 
 class InstallCommand(object):
 	"""
 	The ``InstallCommand`` class is used to install the Minecraft Mod.
 	"""
 
-	def __init__(self, config_file, verbose=None):
+	def __init__(self, config_file, delta=None, jobs=None, mods_dir=None, verbose=None, **_):
 		"""
 		Initializes the ``InstallCommand`` instance.
 
 		*config_file* (``str``) is the **mcpackage** configuration file to
 		use.
 
+		*delta* (``bool``) is whether JARs which cannot be linked should be
+		updated by only writing the changed regions. Default is ``None`` to
+		use *install.delta* from the configuration.
+
+		*jobs* (``int``) is the maximum number of mods directories to install
+		into concurrently. Default is ``None`` to use *install.jobs* from the
+		configuration.
+
+		*mods_dir* (``list`` of ``str``) optionally contains the Minecraft
+		mods directories to install the mod into. These can be glob patterns.
+		Default is ``None`` to use the directories from the configuration.
+
 		*verbose* (``int``) is the level of verbose debugging information to
 		be printed. Default is ``None`` for `0`.
 
@@ -37,26 +125,387 @@ class InstallCommand(object):
 		- `2`: print lots of debugging information.
 		"""
 
+		self.config = None
+		"""
+		*config* (``dict``) is the loaded mcpackage configuration.
+		"""
+
 		self.config_file = config_file
 		"""
 		*config_file* (``str``) is the mcpackage configuration file to use.
 		"""
 
+		self.delta = delta
+		"""
+		*delta* (``bool``) is whether JARs which cannot be linked should be
+		updated by only writing the changed regions.
+		"""
+
+		self.jobs = jobs
+		"""
+		*jobs* (``int``) is the maximum number of mods directories to install
+		into concurrently.
+		"""
+
 		self.log = None
 		"""
 		*log* (``logging.Logger``) is the main logger.
 		"""
 
+		self.mods_dirs = mods_dir
+		"""
+		*mods_dirs* (``list`` of ``str``) contains the Minecraft mods
+		directories to install the mod into.
+		"""
+
 		self.verbose = verbose or 0
 		"""
 		*verbose* (``int``) is the level of verbose debugging information to
 		be printed.
 		"""
 
+	def init_config(self):
+		"""
+		Loads the configuration.
+		"""
+		if self.verbose >= 1:
+			print("Load {!r}.".format(self.config_file))
+		self.config, _ = load_config(self.config_file)
+
+		if not self.jobs:
+			self.jobs = self.config['install']['jobs']
+		if not self.delta:
+			self.delta = self.config['install']['delta']
+
+		# Expand mods directories. Patterns are expanded to the existing
+		# directories they match, while plain paths are kept so that they
+		# can be created.
+		if not self.mods_dirs:
+			self.mods_dirs = self.config['install']['mods_dirs']
+		mods_dirs = []
+		pattern, path = None, None
+		for pattern in self.mods_dirs:
+			pattern = os.path.abspath(os.path.expanduser(os.path.expandvars(pattern)))
+			if glob.has_magic(pattern):
+				for path in sorted(glob.glob(pattern)):
+					if os.path.isdir(path) and path not in mods_dirs:
+						mods_dirs.append(path)
+			elif pattern not in mods_dirs:
+				mods_dirs.append(pattern)
+		del pattern, path
+		self.mods_dirs = mods_dirs
+
+	def init_logging(self):
+		"""
+		Initialize logging.
+		"""
+		if self.verbose >= 2:
+			log_level = logging.DEBUG
+		elif self.verbose >= 1:
+			log_level = logging.INFO
+		else:
+			log_level = logging.WARNING
+
+		self.log = logging.getLogger()
+		self.log.setLevel(logging.NOTSET)
+
+		if self.verbose >= 1:
+			print("Log to stdout.")
+		stream_handler = logging.StreamHandler(stream=sys.stdout)
+		stream_handler.setLevel(log_level)
+		stream_handler.setFormatter(logging.Formatter(fmt='[%(name)s] %(levelname)s: %(message)s'))
+		self.log.addHandler(stream_handler)
+
+	def install_jar(self, jar_file, jar_data, digest, mod_ids, mods_dir):
+		"""
+		Installs the mod JAR into the mods directory.
+
+		The JAR is not copied if the installed JAR has the same digest.
+		Otherwise, a hard link to the JAR is created as a temporary file when
+		the file system allows it, or the JAR is written to the temporary
+		file. The temporary file then replaces the installed JAR so that a
+		running Minecraft never sees a partially written JAR. Older versions
+		of the mod are removed.
+
+		*jar_file* (``str``) is the path of the mod JAR.
+
+		*jar_data* (``bytes``) is the content of the mod JAR.
+
+		*digest* (``str``) is the digest of the mod JAR.
+
+		*mod_ids* (``set`` of ``str``) contains the IDs of the mods in the
+		JAR.
+
+		*mods_dir* (``str``) is the mods directory.
+
+		Returns how the JAR was installed (``str``): `'linked'`, `'copied'`,
+		`'delta ...'` or `'unchanged'`.
+		"""
+		try:
+			os.makedirs(mods_dir)
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+
+		jar_name = os.path.basename(jar_file)
+		dest_file = os.path.join(mods_dir, jar_name)
+		if os.path.isfile(dest_file) and (util.is_same_file(dest_file, jar_file) or (os.path.getsize(dest_file) == len(jar_data) and util.file_digest(dest_file) == digest)):
+			self.log.info("Skip {!r} because it is up to date.".format(dest_file))
+			status = 'unchanged'
+
+		else:
+			temp_file = os.path.join(mods_dir, '.{}.{}.tmp'.format(jar_name, os.getpid()))
+			if os.path.lexists(temp_file):
+				# Remove temporary file left behind by an interrupted install.
+				os.remove(temp_file)
+			try:
+				try:
+					os.link(jar_file, temp_file)
+				except (AttributeError, OSError):
+					# Either hard links are not supported, or the mods directory
+					# is on a different file system.
+					status = None
+				else:
+					self.log.info("Link {!r} to {!r}.".format(jar_name, dest_file))
+					status = 'linked'
+
+				if status is None and self.delta and os.path.isfile(dest_file):
+					status = self.install_delta(jar_file, jar_data, digest, dest_file, temp_file)
+
+				if status is None:
+					self.log.info("Copy {!r} to {!r}.".format(jar_name, dest_file))
+					with open(temp_file, 'wb') as fh:
+						fh.write(jar_data)
+						fh.flush()
+						os.fsync(fh.fileno())
+					shutil.copystat(jar_file, temp_file)
+					status = 'copied'
+
+				util.replace_file(temp_file, dest_file)
+				if self.delta and status != 'linked':
+					self.save_signature(dest_file, jar_data)
+			except:
+				if os.path.lexists(temp_file):
+					os.remove(temp_file)
+				raise
+
+		# Remove older versions of the mod. These are JARs containing the
+		# same mods.
+		if mod_ids:
+			for file_name in os.listdir(mods_dir):
+				path = os.path.join(mods_dir, file_name)
+				if file_name != jar_name and os.path.splitext(file_name)[1].lower() in ('.jar', '.zip') and os.path.isfile(path):
+					if get_mod_ids(path) & mod_ids:
+						self.log.info("Remove older version {!r}.".format(path))
+						os.remove(path)
+
+		return status
+
+	def install_delta(self, jar_file, jar_data, digest, dest_file, temp_file):
+		"""
+		Writes the mod JAR to the temporary file by copying the unchanged
+		regions from the installed JAR within the file system and writing
+		only the changed regions. When the file system cannot copy regions
+		(e.g., SSHFS), the unchanged regions are read from the installed JAR
+		instead.
+
+		*jar_file* (``str``) is the path of the mod JAR.
+
+		*jar_data* (``bytes``) is the content of the mod JAR.
+
+		*digest* (``str``) is the digest of the mod JAR.
+
+		*dest_file* (``str``) is the path of the installed JAR.
+
+		*temp_file* (``str``) is the path of the temporary file to write.
+
+		Returns the status (``str``) if the temporary file was written
+		(`'delta ...'`) and its digest verified; otherwise, ``None`` to copy
+		the whole JAR.
+		"""
+		signature = self.load_signature(dest_file)
+		ops = delta.compute_delta(jar_data, signature)
+		if ops is None:
+			self.log.info("Copy {!r} because most of it changed.".format(dest_file))
+			return None
+
+		with open(dest_file, 'rb') as old_fh, open(temp_file, 'wb', 0) as new_fh:
+			_, written = delta.apply_delta(old_fh, new_fh, ops)
+			os.fsync(new_fh.fileno())
+		shutil.copystat(jar_file, temp_file)
+
+		if util.file_digest(temp_file) != digest:
+			self.log.warning("Delta of {!r} did not match, copy instead.".format(dest_file))
+			os.remove(temp_file)
+			return None
+
+		self.log.info("Update {!r} writing {} of {} bytes.".format(dest_file, written, len(jar_data)))
+		return 'delta {:.1%}'.format(float(written) / max(len(jar_data), 1))
+
+	def install_target(self, args):
+		"""
+		Installs the mod JAR into the mods directory, and records how long it
+		took. This is run by the worker pool.
+
+		*args* (``tuple``) contains the arguments for ``install_jar()``.
+
+		Returns a ``tuple`` containing: the mods directory (``str``), the
+		status (``str``), and the number of seconds it took (``float``).
+		"""
+		mods_dir = args[-1]
+		start = time.time()
+		try:
+			status = self.install_jar(*args)
+		except Exception as e:
+			self.log.debug("Failed to install into {!r}.".format(mods_dir), exc_info=sys.exc_info())
+			status = 'failed: {}'.format(e)
+		return mods_dir, status, time.time() - start
+
+	def get_signature_file(self, dest_file):
+		"""
+		Gets the file caching the signature of the installed JAR.
+
+		*dest_file* (``str``) is the path of the installed JAR.
+
+		Returns the path of the signature file (``str``).
+		"""
+		name = hashlib.sha1(dest_file.encode('UTF-8')).hexdigest()
+		return os.path.join(self.config['build']['dir'], DELTA_CACHE_DIR, name + '.json')
+
+	def load_signature(self, dest_file):
+		"""
+		Loads the signature of the installed JAR. The cached signature is used
+		if the installed JAR has not changed since it was cached so that the
+		installed JAR does not have to be read. Otherwise, it is computed from
+		the installed JAR.
+
+		*dest_file* (``str``) is the path of the installed JAR.
+
+		Returns the signature (``dict``).
+		"""
+		block_size = self.config['install']['delta_block_size'] or delta.DEFAULT_BLOCK_SIZE
+		stat = os.stat(dest_file)
+		try:
+			with open(self.get_signature_file(dest_file), 'rb') as fh:
+				cached = json.loads(fh.read().decode('UTF-8'))
+		except (IOError, ValueError):
+			cached = None
+		if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime and cached['signature']['block_size'] == block_size:
+			return cached['signature']
+
+		with open(dest_file, 'rb') as fh:
+			return delta.compute_signature(fh, block_size)
+
 	def run(self):
 		"""
 		Runs the "install" command.
 
 		Returns the exit code (``int``).
 		"""
-		raise NotImplementedError("TODO")
+		# Load config.
+		try:
+			self.init_config()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to load configuration.", file=sys.stderr)
+			if self.verbose >= 1:
+				print("Exiting because of error.")
+			return 1
+
+		# Initialize logging.
+		try:
+			self.init_logging()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to initialize logging.", file=sys.stderr)
+			if self.verbose >= 1:
+				print("Exiting because of error.")
+			return 1
+
+		# Install mod.
+		try:
+			result = self.run_work()
+		except:
+			self.log.error("Failed to install mod.", exc_info=sys.exc_info())
+			result = 1
+		if result:
+			self.log.info("Exiting because of error.")
+		return result
+
+	def save_signature(self, dest_file, jar_data):
+		"""
+		Caches the signature of the installed JAR so that the next delta
+		install does not have to read it.
+
+		*dest_file* (``str``) is the path of the installed JAR.
+
+		*jar_data* (``bytes``) is the content of the installed JAR.
+		"""
+		block_size = self.config['install']['delta_block_size'] or delta.DEFAULT_BLOCK_SIZE
+		stat = os.stat(dest_file)
+		signature_file = self.get_signature_file(dest_file)
+		try:
+			os.makedirs(os.path.dirname(signature_file))
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+		data = {
+			'path': dest_file,
+			'size': stat.st_size,
+			'mtime': stat.st_mtime,
+			'signature': delta.compute_signature(io.BytesIO(jar_data), block_size),
+		}
+		temp_file = signature_file + '.tmp'
+		with open(temp_file, 'wb') as fh:
+			fh.write(json.dumps(data).encode('UTF-8'))
+		util.replace_file(temp_file, signature_file)
+
+	def run_work(self):
+		"""
+		Perform the actual work of the "install" command.
+
+		Returns the exit code (``int``).
+		"""
+		if not self.mods_dirs:
+			self.log.error("No mods directory to install into. Set 'install.mods_dirs' in the configuration {!r}.".format(self.config_file))
+			return 1
+
+		build_dir = self.config['build']['dir']
+		jar_file = os.path.join(build_dir, self.config['name'] + '.jar')
+		if not os.path.isfile(jar_file):
+			self.log.error("Mod jar {!r} does not exist. Build the mod first.".format(jar_file))
+			return 1
+
+		# Read the JAR once to share it between every mods directory.
+		with open(jar_file, 'rb') as fh:
+			jar_data = fh.read()
+		digest = hashlib.sha1(jar_data).hexdigest()
+		mod_ids = get_mod_ids(jar_file)
+		self.log.debug("digest:{!r} mod_ids:{!r}".format(digest, sorted(mod_ids)))
+
+		# Install into mods directories concurrently.
+		jobs = max(1, min(self.jobs or len(self.mods_dirs), len(self.mods_dirs)))
+		self.log.info("Install into {} mods director{} with {} job(s).".format(len(self.mods_dirs), 'y' if len(self.mods_dirs) == 1 else 'ies', jobs))
+		start = time.time()
+		pool = ThreadPool(jobs)
+		try:
+			results = pool.map(self.install_target, [(jar_file, jar_data, digest, mod_ids, mods_dir) for mods_dir in self.mods_dirs], chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+		elapsed = time.time() - start
+
+		# Print summary.
+		failed = 0
+		for mods_dir, status, seconds in results:
+			if status.startswith('failed'):
+				failed += 1
+			print("{:>8.3f}s  {:<10} {}".format(seconds, status, mods_dir))
+		print("Installed into {} of {} mods directories in {:.3f}s.".format(len(results) - failed, len(results), elapsed))
+
+		if failed:
+			self.log.error("Failed to install into {} mods director{}.".format(failed, 'y' if failed == 1 else 'ies'))
+			return 1
+
+		self.log.info("Done.")
+		return 0
@@ -0,0 +1,251 @@
+# coding: utf-8
+"""
+This module implements the content-addressed cache of the python classes
+compiled by Jython which is shared by every build of the same user (e.g.,
+of other branches, workspaces and clean builds).
+"""
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import io
+import json
+import os
+import os.path
+import subprocess
+import tempfile
+
+from . import util
+
+#: The file within the cache directory which records the version of each
+#: Jython installation.
+VERSIONS_FILE = 'versions.json'
+
+def get_cache_dir(config):
+	"""
+	Gets the directory of the Jython cache.
+
+	*config* (``dict``) is the loaded mcpackage configuration.
+
+	Returns the path (``str``).
+	"""
+	cache_dir = config['jython_cache']['dir']
+	if cache_dir:
+		return os.path.abspath(os.path.expanduser(os.path.expandvars(cache_dir)))
+	if util.get_system() == 'Windows' and os.environ.get('LOCALAPPDATA'):
+		root_dir = os.environ['LOCALAPPDATA']
+	else:
+		root_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	return os.path.join(root_dir, 'mcpackage', 'jython')
+
+
+class JythonCache(object):
+	"""
+	The ``JythonCache`` class caches the compiled python classes (i.e.,
+	"$py.class" files) by the digest of their python source, their path
+	relative to the source directory, and the version of Jython which
+	compiled them.
+
+	Each class is stored in its own file named by its digest which is
+	written to a temporary file and renamed into place so that concurrent
+	builds never see partial classes, and do not need to lock the cache.
+	The modified time of a class is updated when it is used, and the least
+	recently used classes are evicted when the cache exceeds its maximum
+	size.
+	"""
+
+	def __init__(self, cache_dir, max_size):
+		"""
+		Initializes the ``JythonCache`` instance.
+
+		*cache_dir* (``str``) is the directory to cache the classes in.
+
+		*max_size* (``int``) is the number of bytes the cache can grow to
+		before classes are evicted.
+		"""
+
+		self.cache_dir = cache_dir
+		"""
+		*cache_dir* (``str``) is the directory to cache the classes in.
+		"""
+
+		self.max_size = max_size
+		"""
+		*max_size* (``int``) is the number of bytes the cache can grow to
+		before classes are evicted.
+		"""
+
+	def get(self, key):
+		"""
+		Gets the cached class, and marks it as recently used.
+
+		*key* (``str``) is the key of the class from ``get_key()``.
+
+		Returns the class (``bytes``), or ``None`` if it is not cached.
+		"""
+		path = self.get_path(key)
+		try:
+			with io.open(path, mode='rb') as fh:
+				data = fh.read()
+			os.utime(path, None)
+		except (IOError, OSError) as e:
+			# - NOTE: The class may have just been evicted by another build.
+			if e.errno != errno.ENOENT:
+				raise
+			return None
+		return data
+
+	def get_key(self, version, path, source):
+		"""
+		Gets the key of the compiled class.
+
+		*version* (``str``) is the version of Jython.
+
+		*path* (``str``) is the path of the python source file relative to
+		the source directory. This is included because the compiled class
+		records its source file.
+
+		*source* (``bytes``) is the python source.
+
+		Returns the key (``str``).
+		"""
+		digest = hashlib.sha1()
+		digest.update(version.encode('UTF-8') + b'\0')
+		digest.update(path.replace(os.sep, '/').encode('UTF-8') + b'\0')
+		digest.update(source)
+		return digest.hexdigest()
+
+	def get_path(self, key):
+		"""
+		Gets the path of the cached class.
+
+		*key* (``str``) is the key of the class.
+
+		Returns the path (``str``).
+		"""
+		return os.path.join(self.cache_dir, key[:2], key + '.class')
+
+	def get_version(self, command):
+		"""
+		Gets the version of Jython. This is only run once for each Jython
+		installation, after which it is read from the cache.
+
+		*command* (``list`` of ``str``) is the command used to execute
+		Jython.
+
+		Returns the version (``str``).
+
+		Raises ``subprocess.CalledProcessError`` if Jython fails.
+		"""
+		# - NOTE: Jython is identified by its JAR when it is run with java,
+		#   and otherwise by its executable.
+		jython_file = os.path.realpath(command[-1] if '-jar' in command else command[0])
+		stat = os.stat(jython_file)
+		ident = "{}:{}:{}".format(jython_file, stat.st_size, int(stat.st_mtime))
+
+		versions_file = os.path.join(self.cache_dir, VERSIONS_FILE)
+		try:
+			with io.open(versions_file, mode='r', encoding='UTF-8') as fh:
+				versions = json.load(fh)
+		except IOError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			versions = {}
+		except ValueError:
+			# Ignore corrupt versions file.
+			versions = {}
+
+		version = versions.get(ident)
+		if version is None:
+			output = subprocess.check_output(command + ['--version'], stderr=subprocess.STDOUT)
+			version = output.decode('UTF-8', 'replace').strip()
+			versions[ident] = version
+			self.write_file(versions_file, json.dumps(versions, sort_keys=True).encode('UTF-8'))
+		return version
+
+	def prune(self):
+		"""
+		Evicts the least recently used classes until the cache is within its
+		maximum size.
+
+		Returns the number of classes evicted (``int``).
+		"""
+		entries = []
+		total = 0
+		try:
+			names = os.listdir(self.cache_dir)
+		except OSError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			return 0
+		for name in names:
+			dir_path = os.path.join(self.cache_dir, name)
+			if len(name) != 2 or not os.path.isdir(dir_path):
+				continue
+			for file_name in os.listdir(dir_path):
+				if not file_name.endswith('.class'):
+					# Skip the temporary files of classes being written.
+					continue
+				path = os.path.join(dir_path, file_name)
+				try:
+					stat = os.stat(path)
+				except OSError as e:
+					if e.errno != errno.ENOENT:
+						raise
+					continue
+				entries.append((stat.st_mtime, stat.st_size, path))
+				total += stat.st_size
+		if total <= self.max_size:
+			return 0
+
+		evicted = 0
+		entries.sort()
+		for _, size, path in entries:
+			if total <= self.max_size:
+				break
+			try:
+				os.remove(path)
+			except OSError as e:
+				# - NOTE: The class may have been evicted by another build, or
+				#   be open on Windows.
+				if e.errno not in (errno.ENOENT, errno.EACCES):
+					raise
+				continue
+			total -= size
+			evicted += 1
+		return evicted
+
+	def put(self, key, data):
+		"""
+		Caches the class.
+
+		*key* (``str``) is the key of the class from ``get_key()``.
+
+		*data* (``bytes``) is the class.
+		"""
+		self.write_file(self.get_path(key), data)
+
+	def write_file(self, path, data):
+		"""
+		Writes the file atomically. The file is written to a unique temporary
+		file which then replaces it so that concurrent builds can write the
+		same file.
+
+		*path* (``str``) is the path of the file.
+
+		*data* (``bytes``) is the content of the file.
+		"""
+		dir_path = os.path.dirname(path)
+		try:
+			os.makedirs(dir_path)
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+		fd, temp_file = tempfile.mkstemp(dir=dir_path, suffix='.tmp')
+		try:
+			with io.open(fd, mode='wb') as fh:
+				fh.write(data)
+			util.replace_file(temp_file, path)
+		except:
+			os.remove(temp_file)
+			raise
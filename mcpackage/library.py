@@ -0,0 +1,670 @@
+# coding: utf-8
+"""
+This module implements the processing of the additional libraries which
+are packaged (merged) with the mod JAR.
+"""
+from __future__ import unicode_literals
+
+import array
+import errno
+import hashlib
+import io
+import json
+import os
+import os.path
+import re
+import zipfile
+import zlib
+
+from . import __version__, util
+from .classfile import ClassFormatError, parse_class, parse_signature, rewrite_utf8
+
+#: The modified time of the entries written to the mod JAR from the build
+#: (i.e., not copied from libraries). This is fixed so that building the
+#: same content produces the same JAR which keeps delta installs small.
+ENTRY_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+#: The permissions of the entries written to the mod JAR from the build
+#: (a regular file with mode 644).
+ENTRY_EXTERNAL_ATTR = 0o100644 << 16
+
+#: The directory within the build directory to cache the results of
+#: processing libraries in.
+LIBRARY_CACHE_DIR = os.path.join('cache', 'library')
+
+#: The version of how classes are relocated. This is part of the digest
+#: of a relocator so that libraries relocated by an older version are not
+#: reused from the cache.
+RELOCATOR_VERSION = 2
+
+#: The pattern of string constants which are class names (e.g.,
+#: `'com/example/Example'` or `'com.example.Example'`).
+_CLASS_NAME = re.compile(br'[\w$]+(?:[/.][\w$]+)+\Z')
+
+def _count(stats, key):
+	"""
+	Increments the count.
+
+	*stats* (``collections.Counter``) contains the counts, or is ``None``
+	when they are not being counted.
+
+	*key* (``str``) is the count to increment.
+	"""
+	if stats is not None:
+		stats[key] += 1
+
+def _load_json(path):
+	"""
+	Loads the cached JSON file.
+
+	*path* (``str``) is the path of the file.
+
+	Returns the cached data (``dict``), or ``None`` if the file does not
+	exist, is corrupt, or was written by a different version of
+	mcpackage.
+	"""
+	try:
+		with io.open(path, mode='r', encoding='UTF-8') as fh:
+			data = json.load(fh)
+	except IOError as e:
+		if e.errno != errno.ENOENT:
+			raise
+		return None
+	except ValueError:
+		# Ignore corrupt cache file.
+		return None
+	if data and data.get('version') == __version__:
+		return data
+	return None
+
+def _replace_prefix(name, prefixes):
+	"""
+	Replaces the prefix of the name.
+
+	*name* (``bytes``) is the name.
+
+	*prefixes* (``list`` of ``tuple``) contains each prefix to replace
+	(``bytes``) with its replacement (``bytes``), longest first.
+
+	Returns the name with the first matching prefix replaced (``bytes``),
+	or *name* itself if none match.
+	"""
+	for old, new in prefixes:
+		if name.startswith(old):
+			return new + name[len(old):]
+	return name
+
+def _save_json(path, data):
+	"""
+	Saves the cached JSON file.
+
+	*path* (``str``) is the path of the file.
+
+	*data* (``dict``) is the data to save.
+	"""
+	try:
+		os.makedirs(os.path.dirname(path))
+	except OSError as e:
+		if e.errno != errno.EEXIST:
+			raise
+	data = dict(data, version=__version__)
+	temp_file = path + '.tmp'
+	with io.open(temp_file, mode='w', encoding='UTF-8') as fh:
+		fh.write(json.dumps(data, sort_keys=True))
+	util.replace_file(temp_file, path)
+
+def find_reachable(classes, roots):
+	"""
+	Finds the classes reachable from the root classes by following their
+	references.
+
+	*classes* (``dict``) maps the internal name of each class (``str``) to
+	the internal names of the classes it references (``list`` of ``str``).
+
+	*roots* (``Iterable`` of ``str``) contains the internal names of the
+	root classes.
+
+	Returns the internal names of the reachable classes in *classes*
+	(``set`` of ``str``).
+	"""
+	reachable = set()
+	pending = [name for name in roots if name in classes]
+	while pending:
+		name = pending.pop()
+		if name in reachable:
+			continue
+		reachable.add(name)
+		pending.extend(ref for ref in classes[name] if ref in classes and ref not in reachable)
+	return reachable
+
+def load_library_classes(lib_file, digest, cache_dir, stats=None):
+	"""
+	Gets the classes contained in the library. The parsed classes are
+	cached by the digest of the library.
+
+	*lib_file* (``str``) is the path of the library.
+
+	*digest* (``str``) is the digest of the library.
+
+	*cache_dir* (``str``) is the directory to cache the parsed classes in.
+
+	*stats* (``collections.Counter``) optionally counts the cache `'hits'`
+	and `'misses'`.
+
+	Returns a ``dict`` mapping the name of each class entry (``str``) to a
+	``tuple`` containing: the internal name of the class (``str``), and the
+	internal names of the classes it references (``list`` of ``str``).
+	Entries which are not valid class files are left out.
+	"""
+	cache_file = os.path.join(cache_dir, 'classes-{}.json'.format(digest))
+	data = _load_json(cache_file)
+	if data is not None:
+		_count(stats, 'hits')
+		return dict((entry, tuple(info)) for entry, info in data['classes'].items())
+	_count(stats, 'misses')
+
+	classes = {}
+	with zipfile.ZipFile(lib_file, 'r') as lib_fh:
+		for info in lib_fh.infolist():
+			if not info.filename.endswith('.class') or info.filename.startswith('META-INF'):
+				continue
+			try:
+				parsed = parse_class(lib_fh.read(info.filename))
+			except ClassFormatError:
+				continue
+			classes[info.filename] = (parsed['name'], parsed['references'])
+
+	_save_json(cache_file, {'classes': classes})
+	return classes
+
+def relocate_library(lib_file, digest, relocator, cache_dir, stats=None):
+	"""
+	Relocates the classes of the library. The relocated library is cached
+	by the digest of the library and the relocation rules.
+
+	*lib_file* (``str``) is the path of the library.
+
+	*digest* (``str``) is the digest of the library.
+
+	*relocator* (``Relocator``) is used to relocate the classes.
+
+	*cache_dir* (``str``) is the directory to cache the relocated library
+	in.
+
+	*stats* (``collections.Counter``) optionally counts the cache `'hits'`
+	and `'misses'`.
+
+	Returns the path of the relocated library (``str``). Its entries keep
+	their original names so that they can be matched to the library, and
+	only the content of its class files is relocated.
+	"""
+	cache_file = os.path.join(cache_dir, 'relocated-{}-{}.jar'.format(digest, relocator.digest))
+	if os.path.exists(cache_file):
+		_count(stats, 'hits')
+		return cache_file
+	_count(stats, 'misses')
+
+	try:
+		os.makedirs(cache_dir)
+	except OSError as e:
+		if e.errno != errno.EEXIST:
+			raise
+
+	# Stream the entries of the library into the relocated library one at
+	# a time.
+	temp_file = cache_file + '.tmp'
+	with zipfile.ZipFile(lib_file, 'r') as lib_fh, zipfile.ZipFile(temp_file, 'w', zipfile.ZIP_DEFLATED) as out_fh:
+		for info in lib_fh.infolist():
+			data = lib_fh.read(info.filename)
+			if info.filename.endswith('.class'):
+				data = relocator.relocate_class(data)
+			out_fh.writestr(info, data)
+	util.replace_file(temp_file, cache_file)
+
+	# Remove the relocated versions of the library for other rules.
+	prefix = 'relocated-{}-'.format(digest)
+	for name in os.listdir(cache_dir):
+		if name.startswith(prefix) and name != os.path.basename(cache_file):
+			os.remove(os.path.join(cache_dir, name))
+
+	return cache_file
+
+def shrink_libraries(libraries, roots, keep_spec, cache_dir, stats=None):
+	"""
+	Determines the classes of the libraries which can be reached from the
+	mod.
+
+	*libraries* (``list`` of ``tuple``) contains the path (``str``) and
+	digest (``str``) of each library.
+
+	*roots* (``Iterable`` of ``str``) contains the internal names of the
+	classes referenced by the mod.
+
+	*keep_spec* (``pathspec.PathSpec``) matches the class entries of the
+	libraries which must always be kept (e.g., those which are only
+	loaded by reflection or from Python).
+
+	*cache_dir* (``str``) is the directory to cache the results in.
+
+	*stats* (``collections.Counter``) optionally counts the cache `'hits'`
+	and `'misses'` of the result and of the parsed classes of each
+	library.
+
+	Returns a ``dict`` mapping the path of each library (``str``) to the
+	names of the class entries to remove from it (``set`` of ``str``).
+	"""
+	roots = set(roots)
+	key = hashlib.sha1(json.dumps([
+		sorted(digest for _, digest in libraries),
+		sorted(roots),
+		[(pattern.regex.pattern, pattern.include) for pattern in keep_spec.patterns if getattr(pattern, 'regex', None) is not None],
+	]).encode('UTF-8')).hexdigest()
+
+	# Reuse the result when neither the libraries nor the classes they are
+	# reached from changed.
+	cache_file = os.path.join(cache_dir, 'shrink.json')
+	data = _load_json(cache_file)
+	if data is not None and data['key'] == key:
+		_count(stats, 'hits')
+		return dict((lib_file, set(entries)) for lib_file, entries in data['remove'].items())
+	_count(stats, 'misses')
+
+	lib_classes = {}
+	graph = {}
+	for lib_file, digest in libraries:
+		lib_classes[lib_file] = load_library_classes(lib_file, digest, cache_dir, stats=stats)
+		for entry, (name, references) in lib_classes[lib_file].items():
+			graph.setdefault(name, []).extend(references)
+			if keep_spec.match_file(entry):
+				roots.add(name)
+
+	# Remove the cached classes of libraries which are no longer packaged.
+	current = set('classes-{}.json'.format(digest) for _, digest in libraries)
+	try:
+		names = os.listdir(cache_dir)
+	except OSError as e:
+		if e.errno != errno.ENOENT:
+			raise
+		names = []
+	for name in names:
+		if name.startswith('classes-') and name.endswith('.json') and name not in current:
+			os.remove(os.path.join(cache_dir, name))
+
+	reachable = find_reachable(graph, roots)
+	remove = {}
+	for lib_file, classes in lib_classes.items():
+		remove[lib_file] = set(entry for entry, (name, _) in classes.items() if name not in reachable)
+
+	_save_json(cache_file, {
+		'key': key,
+		'remove': dict((lib_file, sorted(entries)) for lib_file, entries in remove.items()),
+	})
+	return remove
+
+
+class PackageWriter(object):
+	"""
+	The ``PackageWriter`` class is used to write the entries of the mod JAR
+	while indexing them so that the same entry is only written once. The
+	first entry written with a name has precedence: later entries with the
+	same content are skipped as duplicates, and later entries with
+	different content are skipped as conflicts.
+
+	The index is kept compact for libraries with many entries by storing
+	the CRC, size and source of each entry in arrays, and only the name to
+	position mapping in a ``dict``.
+	"""
+
+	def __init__(self, zip_fh):
+		"""
+		Initializes the ``PackageWriter`` instance.
+
+		*zip_fh* (``zipfile.ZipFile``) is the mod JAR opened for writing.
+		"""
+
+		self.conflicts = []
+		"""
+		*conflicts* (``list`` of ``tuple``) contains each entry name
+		(``str``) which conflicted, with the source it was kept from
+		(``str``) and the source it was skipped from (``str``).
+		"""
+
+		self.crcs = array.array(str('L'))
+		"""
+		*crcs* (``array.array``) contains the CRC of each entry.
+		"""
+
+		self.duplicates = 0
+		"""
+		*duplicates* (``int``) is the number of identical duplicate entries
+		which were skipped.
+		"""
+
+		self.names = {}
+		"""
+		*names* (``dict``) maps the name of each entry (``str``) to its
+		position in the arrays (``int``).
+		"""
+
+		self.sizes = array.array(str('L'))
+		"""
+		*sizes* (``array.array``) contains the size of each entry.
+		"""
+
+		self.source_ids = array.array(str('H'))
+		"""
+		*source_ids* (``array.array``) contains the position of the source
+		of each entry in *sources*.
+		"""
+
+		self.source_map = {}
+		"""
+		*source_map* (``dict``) maps each source (``str``) to its position
+		in *sources*.
+		"""
+
+		self.sources = []
+		"""
+		*sources* (``list`` of ``str``) contains each source of entries.
+		"""
+
+		self.zip_fh = zip_fh
+		"""
+		*zip_fh* (``zipfile.ZipFile``) is the mod JAR.
+		"""
+
+	def add(self, name, crc, size, source):
+		"""
+		Adds the entry to the index.
+
+		*name* (``str``) is the name of the entry.
+
+		*crc* (``int``) is the CRC-32 of the entry.
+
+		*size* (``int``) is the uncompressed size of the entry.
+
+		*source* (``str``) is where the entry came from.
+
+		Returns whether the entry should be written (``bool``).
+		"""
+		pos = self.names.get(name)
+		if pos is not None:
+			if self.crcs[pos] == crc and self.sizes[pos] == size:
+				self.duplicates += 1
+			else:
+				self.conflicts.append((name, self.sources[self.source_ids[pos]], source))
+			return False
+
+		source_id = self.source_map.get(source)
+		if source_id is None:
+			source_id = self.source_map[source] = len(self.sources)
+			self.sources.append(source)
+		self.names[name] = len(self.crcs)
+		self.crcs.append(crc)
+		self.sizes.append(size)
+		self.source_ids.append(source_id)
+		return True
+
+	def copy(self, zip_fh, info, name, source):
+		"""
+		Copies the entry from another ZIP file to the mod JAR. The entry is
+		only read when it will be written.
+
+		*zip_fh* (``zipfile.ZipFile``) is the ZIP file opened for reading.
+
+		*info* (``zipfile.ZipInfo``) is the entry to copy.
+
+		*name* (``str``) is the name of the entry in the mod JAR.
+
+		*source* (``str``) is where the entry came from.
+
+		Returns whether the entry was written (``bool``).
+		"""
+		if not self.add(name, info.CRC, info.file_size, source):
+			return False
+		# - NOTE: The entry keeps its modified time and attributes from the
+		#   library so that it is the same in every build.
+		dest_info = zipfile.ZipInfo(name, date_time=info.date_time)
+		dest_info.compress_type = info.compress_type
+		dest_info.external_attr = info.external_attr
+		self.zip_fh.writestr(dest_info, zip_fh.read(info.filename))
+		return True
+
+	def get_info(self, name):
+		"""
+		Creates the information of an entry written from the build. The entry
+		has a fixed modified time (see ``ENTRY_DATE_TIME``) so that building
+		the same content produces the same JAR.
+
+		*name* (``str``) is the name of the entry.
+
+		Returns the entry information (``zipfile.ZipInfo``).
+		"""
+		info = zipfile.ZipInfo(name.replace(os.sep, '/'), date_time=ENTRY_DATE_TIME)
+		info.compress_type = self.zip_fh.compression
+		info.external_attr = ENTRY_EXTERNAL_ATTR
+		return info
+
+	def get_jar_index(self, jar_name):
+		"""
+		Gets the JAR index of the entries written so far. This lists the
+		directories containing entries, and the entries at the root of the
+		JAR in the format of "META-INF/INDEX.LIST" so that class loaders can
+		find the JAR containing a package without searching it.
+
+		*jar_name* (``str``) is the file name of the mod JAR.
+
+		Returns the JAR index (``bytes``).
+		"""
+		dirs = set()
+		for name in self.names:
+			if name.startswith('META-INF/') or name.endswith('/'):
+				continue
+			dirs.add(name.rsplit('/', 1)[0] if '/' in name else name)
+		lines = ["JarIndex-Version: 1.0", "", jar_name]
+		lines.extend(sorted(dirs))
+		return ("\n".join(lines) + "\n\n").encode('UTF-8')
+
+	def write(self, path, name, source):
+		"""
+		Writes the file to the mod JAR.
+
+		*path* (``str``) is the path of the file.
+
+		*name* (``str``) is the name of the entry.
+
+		*source* (``str``) is where the entry came from.
+
+		Returns whether the entry was written (``bool``).
+		"""
+		with open(path, 'rb') as fh:
+			data = fh.read()
+		if not self.add(name.replace(os.sep, '/'), zlib.crc32(data) & 0xffffffff, len(data), source):
+			return False
+		self.zip_fh.writestr(self.get_info(name), data)
+		return True
+
+	def writestr(self, name, data, source):
+		"""
+		Writes the data to the mod JAR.
+
+		*name* (``str``) is the name of the entry.
+
+		*data* (``bytes``) is the content of the entry.
+
+		*source* (``str``) is where the entry came from.
+
+		Returns whether the entry was written (``bool``).
+		"""
+		if not self.add(name.replace(os.sep, '/'), zlib.crc32(data) & 0xffffffff, len(data), source):
+			return False
+		self.zip_fh.writestr(self.get_info(name), data)
+		return True
+
+	def write_report(self, report_file):
+		"""
+		Writes the report of the conflicting entries. The report is removed
+		when there are no conflicts.
+
+		*report_file* (``str``) is the path of the report.
+		"""
+		if not self.conflicts:
+			try:
+				os.remove(report_file)
+			except OSError as e:
+				if e.errno != errno.ENOENT:
+					raise
+			return
+
+		with io.open(report_file, mode='w', encoding='UTF-8') as fh:
+			for name, kept, skipped in self.conflicts:
+				fh.write("{}\n  kept: {}\n  skipped: {}\n".format(name, kept, skipped))
+
+
+class Relocator(object):
+	"""
+	The ``Relocator`` class is used to relocate (shade) packages by
+	rewriting the names of class file entries and the class names in the
+	constant pools of classes.
+	"""
+
+	def __init__(self, rules):
+		"""
+		Initializes the ``Relocator`` instance.
+
+		*rules* (``Iterable`` of ``tuple``) contains each package prefix to
+		relocate (``str``) with the package prefix to relocate it to
+		(``str``). These can be either internal names (e.g., `'com/example'`)
+		or package names (e.g., `'com.example'`).
+		"""
+
+		self.rules = []
+		"""
+		*rules* (``list`` of ``tuple``) contains each internal package
+		prefix to relocate (``str``) with its relocated prefix (``str``),
+		longest first. Each prefix ends with `'/'`.
+		"""
+
+		for old, new in rules:
+			old = old.replace('.', '/').strip('/') + '/'
+			new = new.replace('.', '/').strip('/') + '/'
+			self.rules.append((old, new))
+		self.rules.sort(key=lambda rule: (-len(rule[0]), rule[0]))
+
+		self.digest = hashlib.sha1(json.dumps([RELOCATOR_VERSION, self.rules]).encode('UTF-8')).hexdigest()
+		"""
+		*digest* (``str``) is the digest of the rules.
+		"""
+
+		self.names = [(old.encode('UTF-8'), new.encode('UTF-8')) for old, new in self.rules]
+		"""
+		*names* (``list`` of ``tuple``) contains each internal package
+		prefix to relocate (``bytes``) with its relocated prefix
+		(``bytes``), longest first.
+		"""
+
+		self.package_names = [(old.replace(b'/', b'.'), new.replace(b'/', b'.')) for old, new in self.names]
+		"""
+		*package_names* (``list`` of ``tuple``) contains each package name
+		prefix to relocate (``bytes``) with its relocated prefix
+		(``bytes``), longest first. These are used for class names in string
+		constants.
+		"""
+
+	def __bool__(self):
+		"""
+		Returns whether there are any rules (``bool``).
+		"""
+		return bool(self.rules)
+
+	__nonzero__ = __bool__
+
+	@classmethod
+	def from_config(cls, package):
+		"""
+		Creates the relocator from the library package entries of the
+		configuration.
+
+		*package* (``list``) contains the library package entries. Each
+		entry is either a pattern (``str``), or a ``dict`` with the
+		`'pattern'` (``str``) and optionally `'relocate'` (``dict``) which
+		maps each package to relocate to its new package.
+
+		Returns the relocator (``Relocator``).
+		"""
+		rules = []
+		for entry in package:
+			if isinstance(entry, dict):
+				assert entry.get('pattern'), "library.package entry:{!r} must have a pattern.".format(entry)
+				rules.extend((entry.get('relocate') or {}).items())
+		return cls(rules)
+
+	def relocate_class(self, data):
+		"""
+		Relocates the class file.
+
+		*data* (``bytes``) is the content of the class file.
+
+		Returns the relocated class file (``bytes``). Invalid class files are
+		returned unchanged.
+		"""
+		if not self.rules:
+			return data
+		try:
+			return rewrite_utf8(data, self.relocate_constant)
+		except ClassFormatError:
+			return data
+
+	def relocate_constant(self, value, uses):
+		"""
+		Relocates the class names in a UTF-8 constant of a class file.
+
+		*value* (``bytes``) is the encoded value of the constant.
+
+		*uses* (``frozenset`` of ``str``) is how the constant is used. See
+		``classfile.rewrite_utf8()``.
+
+		Returns the relocated value (``bytes``).
+		"""
+		if 'class' in uses and not value.startswith(b'['):
+			return _replace_prefix(value, self.names)
+
+		elif 'class' in uses or 'descriptor' in uses or 'signature' in uses:
+			# - NOTE: Decode as Latin-1 so that the positions of the class
+			#   names match the encoded value.
+			try:
+				classes = parse_signature(value.decode('latin-1'))
+			except ClassFormatError:
+				return value
+			parts = []
+			pos = 0
+			for start, end, _ in classes:
+				parts.append(value[pos:start])
+				parts.append(_replace_prefix(value[start:end], self.names))
+				pos = end
+			parts.append(value[pos:])
+			return b''.join(parts)
+
+		elif _CLASS_NAME.match(value):
+			# - NOTE: A string constant is only relocated when all of it is a
+			#   class name (e.g., for "Class.forName()") so that unrelated
+			#   text is not changed.
+			new_value = _replace_prefix(value, self.names)
+			if new_value is value:
+				new_value = _replace_prefix(value, self.package_names)
+			return new_value
+
+		return value
+
+	def relocate_name(self, name):
+		"""
+		Relocates the name of an entry.
+
+		*name* (``str``) is the name of the entry.
+
+		Returns the relocated name (``str``).
+		"""
+		for old, new in self.rules:
+			if name.startswith(old):
+				return new + name[len(old):]
+		return name
@@ -0,0 +1,298 @@
+# coding: utf-8
+"""
+This module implements queued logging which moves the formatting and
+writing of log records off of the thread doing the work, and sampled
+logging for messages logged for each of many entries.
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+try:
+	import queue
+except ImportError:
+	import Queue as queue # pylint: disable=F0401
+
+#: The maximum number of records written between flushes.
+BATCH_SIZE = 256
+
+#: The number of messages of each kind logged by ``SampledLog`` before the
+#: rest are only counted.
+SAMPLE_THRESHOLD = 100
+
+#: The record put on the queue to stop the listener.
+_STOP = object()
+
+
+class _BatchFlushMixin(object):
+	"""
+	The ``_BatchFlushMixin`` class makes a stream handler only flush after
+	each batch of records instead of after each record.
+	"""
+
+	def flush(self):
+		"""
+		Does nothing because the stream is flushed by ``flush_batch()``.
+		"""
+		pass
+
+	def flush_batch(self):
+		"""
+		Flushes the stream.
+		"""
+		logging.StreamHandler.flush(self)
+
+
+class BatchedFileHandler(_BatchFlushMixin, logging.FileHandler):
+	"""
+	The ``BatchedFileHandler`` class is a file handler which is flushed
+	after each batch of records.
+	"""
+	pass
+
+
+class BatchedStreamHandler(_BatchFlushMixin, logging.StreamHandler):
+	"""
+	The ``BatchedStreamHandler`` class is a stream handler which is flushed
+	after each batch of records.
+	"""
+	pass
+
+
+class QueueHandler(logging.Handler):
+	"""
+	The ``QueueHandler`` class puts the log records on a queue to be
+	handled by a ``QueueListener``.
+
+	Unlike ``logging.handlers.QueueHandler`` (which is not available on
+	Python 2) the records are not formatted before being queued so that
+	formatting happens on the listener thread.
+	"""
+
+	def __init__(self, queue):
+		"""
+		Initializes the ``QueueHandler`` instance.
+
+		*queue* (``queue.Queue``) is the queue to put records on.
+		"""
+		logging.Handler.__init__(self)
+
+		self.queue = queue
+		"""
+		*queue* (``queue.Queue``) is the queue to put records on.
+		"""
+
+	def emit(self, record):
+		"""
+		Puts the record on the queue.
+
+		*record* (``logging.LogRecord``) is the record.
+		"""
+		self.queue.put(record)
+
+
+class QueueListener(object):
+	"""
+	The ``QueueListener`` class writes the log records from its queue to
+	its handlers on a background thread. Records are written in batches,
+	and the handlers are flushed once for each batch.
+	"""
+
+	def __init__(self, handlers, batch_size=None):
+		"""
+		Initializes the ``QueueListener`` instance.
+
+		*handlers* (``list`` of ``logging.Handler``) contains the handlers
+		which write the records.
+
+		*batch_size* (``int``) is the maximum number of records written
+		between flushes. Default is ``None`` for ``BATCH_SIZE``.
+		"""
+
+		self.batch_size = batch_size or BATCH_SIZE
+		"""
+		*batch_size* (``int``) is the maximum number of records written
+		between flushes.
+		"""
+
+		self.handlers = handlers
+		"""
+		*handlers* (``list`` of ``logging.Handler``) contains the handlers
+		which write the records.
+		"""
+
+		self.queue = queue.Queue()
+		"""
+		*queue* (``queue.Queue``) is the queue of records.
+		"""
+
+		self.thread = None
+		"""
+		*thread* (``threading.Thread``) is the background thread.
+		"""
+
+	def flush(self):
+		"""
+		Waits until every queued record has been written. This is used
+		before output is written directly (e.g., by a subprocess) so that it
+		is not out of order with the log.
+		"""
+		if self.thread is not None:
+			self.queue.join()
+
+	def handle_batch(self, batch):
+		"""
+		Writes the batch of records to the handlers, and flushes them.
+
+		*batch* (``list`` of ``logging.LogRecord``) contains the records.
+		"""
+		for record in batch:
+			for handler in self.handlers:
+				if record.levelno >= handler.level:
+					handler.handle(record)
+		for handler in self.handlers:
+			getattr(handler, 'flush_batch', handler.flush)()
+
+	def run(self):
+		"""
+		Writes the queued records until stopped.
+		"""
+		get, get_nowait, task_done = self.queue.get, self.queue.get_nowait, self.queue.task_done
+		running = True
+		while running:
+			batch = [get()]
+			try:
+				while len(batch) < self.batch_size:
+					batch.append(get_nowait())
+			except queue.Empty:
+				pass
+
+			if _STOP in batch:
+				running = False
+				records = [record for record in batch if record is not _STOP]
+			else:
+				records = batch
+			try:
+				self.handle_batch(records)
+			finally:
+				for _ in batch:
+					task_done()
+
+	def start(self):
+		"""
+		Starts the background thread.
+		"""
+		self.thread = threading.Thread(target=self.run, name='mcpackage-log')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		"""
+		Writes the remaining records, and stops the background thread.
+		"""
+		if self.thread is not None:
+			self.queue.put(_STOP)
+			self.thread.join()
+			self.thread = None
+
+
+class SampledLog(object):
+	"""
+	The ``SampledLog`` class is used to log a debug message for each of
+	many entries (e.g., the files packaged into the mod JAR). Messages are
+	only formatted when they are written, and after ``SAMPLE_THRESHOLD``
+	messages of a kind the rest are only counted and summarized.
+	"""
+
+	def __init__(self, log, enabled, threshold=None):
+		"""
+		Initializes the ``SampledLog`` instance.
+
+		*log* (``logging.Logger``) is the logger.
+
+		*enabled* (``bool``) is whether debug messages are being logged.
+
+		*threshold* (``int``) is the number of messages of each kind to log.
+		Default is ``None`` for ``SAMPLE_THRESHOLD``.
+		"""
+
+		self.counts = {}
+		"""
+		*counts* (``dict``) maps each kind of message (``str``) to the
+		number logged (``int``).
+		"""
+
+		self.enabled = enabled
+		"""
+		*enabled* (``bool``) is whether debug messages are being logged.
+		"""
+
+		self.log = log
+		"""
+		*log* (``logging.Logger``) is the logger.
+		"""
+
+		self.threshold = threshold or SAMPLE_THRESHOLD
+		"""
+		*threshold* (``int``) is the number of messages of each kind to log.
+		"""
+
+	def debug(self, kind, message, *args):
+		"""
+		Logs the debug message.
+
+		*kind* (``str``) is the kind of message which is counted.
+
+		*message* (``str``) is the message to format with ``str.format()``.
+
+		*args* are the arguments to format the message with.
+		"""
+		if not self.enabled:
+			return
+		count = self.counts.get(kind, 0) + 1
+		self.counts[kind] = count
+		if count <= self.threshold:
+			self.log.debug(_LazyMessage(message, args))
+
+	def summarize(self):
+		"""
+		Logs the number of messages of each kind which were not logged, and
+		resets the counts.
+		"""
+		for kind, count in sorted(self.counts.items()):
+			if count > self.threshold:
+				self.log.debug("{} more {} message(s) not shown.".format(count - self.threshold, kind))
+		self.counts = {}
+
+
+class _LazyMessage(object):
+	"""
+	The ``_LazyMessage`` class is a log message which is formatted when it
+	is written.
+	"""
+
+	def __init__(self, message, args):
+		"""
+		Initializes the ``_LazyMessage`` instance.
+
+		*message* (``str``) is the message to format with ``str.format()``.
+
+		*args* (``tuple``) contains the arguments to format the message
+		with.
+		"""
+
+		self.args = args
+		"""
+		*args* (``tuple``) contains the arguments.
+		"""
+
+		self.message = message
+		"""
+		*message* (``str``) is the message.
+		"""
+
+	def __str__(self):
+		"""
+		Returns the formatted message (``str``).
+		"""
+		return self.message.format(*self.args)
@@ -6,17 +6,13 @@ from __future__ import unicode_literals
 
 import argparse
 import gettext
-
-import pkg_resources
+import importlib
 
 from . import __name__ as MCPACKAGE, __project__, __version__
-from .build import command as build_command
-from .init import command as init_command
-from .install import command as install_command
-from .run import command as run_command
+from .resources import resource_filename
 
 # Override argparse messages.
-LOCALE_DIR = pkg_resources.resource_filename(MCPACKAGE, 'data/locale')
+LOCALE_DIR = resource_filename('data/locale')
 gettext.bindtextdomain('messages', LOCALE_DIR)
 
 #: The default build configuration file.
@@ -28,6 +24,12 @@ DEFAULT_MOD_DIR = '.'
 #: The default path to the Minecraft Forge directory.
 DEFAULT_FORGE_DIR = 'forge'
 
+#: The default workspace configuration file.
+DEFAULT_WORKSPACE_FILE = 'mcpackage-workspace.yaml'
+
+#: The default socket file for the daemon to listen on.
+DEFAULT_SOCKET_FILE = '.mcpackage.sock'
+
 #: THe default directory to build the mod in.
 DEFAULT_BUILD_DIR = 'build'
 
@@ -37,6 +39,23 @@ DEFAULT_LIBRARY_DIR = 'lib'
 #: The default directory to create the mod source in.
 DEFAULT_SOURCE_DIR = 'src'
 
+def lazy_command(name):
+	"""
+	Creates the function used to run the command. The command module is
+	only imported when the command is run so that the modules and
+	dependencies of other commands do not have to be loaded.
+
+	*name* (``str``) is the name of the command module.
+
+	Returns the function (``callable``) which runs the command with the
+	parsed arguments (``argparse.Namespace``), and returns the exit code
+	(``int``).
+	"""
+	def run_command(args):
+		module = importlib.import_module('.' + name, MCPACKAGE)
+		return module.command(**vars(args))
+	return run_command
+
 def run(argv):
 	"""
 	Runs the *mcpackage* command-line interface.
@@ -56,18 +75,20 @@ def run(argv):
 
 	# Init command.
 	parser_init = subparsers.add_parser('init', help="Creates the scaffolding for a new Minecraft Mod.")
-	parser_init.set_defaults(func=lambda args: init_command(**vars(args)))
+	parser_init.set_defaults(func=lazy_command('init'))
 
-	group = parser_init.add_argument_group(title="Required Arguments")
-	group.add_argument('--mod-name', required=True, metavar="NAME", help="""
+	group = parser_init.add_argument_group(title="Required Arguments", description="""
+		These are required unless *manifest* is set.
+	""")
+	group.add_argument('--mod-name', metavar="NAME", help="""
 		The name of the Minecraft Mod. This can contain letters, numbers,
 		and symbols. E.g., 'My Awesome Mod'.
 	""")
-	group.add_argument('--mod-namespace', required=True, metavar="NS", help="""
+	group.add_argument('--mod-namespace', metavar="NS", help="""
 		The Java package namespace for the Minecraft Mod. This should only
 		contain lowercase letters and periods. E.g., 'myname.myawesomemod'.
 	""")
-	group.add_argument('--mod-type', choices=['java', 'python'], required=True, metavar="TYPE", help="""
+	group.add_argument('--mod-type', choices=['java', 'python'], metavar="TYPE", help="""
 		The type of Minecraft Mod scaffolding to create. *java* is for a
 		normal mod written in Java. *python* is for a mod written primarily
 		in Python with Java bootstrapping (requires PyMod).
@@ -117,6 +138,15 @@ def run(argv):
 	""")
 
 	group = parser_init.add_argument_group(title="Optional Arguments")
+	parser_init.add_argument('--manifest', metavar="FILE", help="""
+		Create each Minecraft Mod listed in the manifest file concurrently
+		instead of only one. The manifest lists the arguments of each mod
+		under "mods" (e.g., "mod_name", "mod_namespace" and "mod_dir"
+		relative to the manifest), the arguments to use for every mod under
+		"defaults", and the maximum number of mods to create concurrently
+		as "jobs". The other command-line arguments are used for every mod
+		unless set by the manifest.
+	""")
 	parser_init.add_argument('-v', '--verbose', action='count', help="""
 		Print verbose debugging information.
 	""")
@@ -128,7 +158,7 @@ def run(argv):
 
 	# Build command.
 	parser_build = subparsers.add_parser('build', help="Build and package the Minecraft Mod.")
-	parser_build.set_defaults(func=lambda args: build_command(**vars(args)))
+	parser_build.set_defaults(func=lazy_command('build'))
 
 	group = parser_build.add_argument_group(title="Default Arguments")
 	group.add_argument('--config-file', default=DEFAULT_CONFIG_FILE, metavar="FILE", help="""
@@ -137,29 +167,245 @@ def run(argv):
 	group.add_argument('-v', '--verbose', action='count', help="""
 		Print verbose debugging information.
 	""")
+	group.add_argument('--force', action='store_true', default=False, help="""
+		Run every stage of the build instead of resuming from the first
+		stage whose inputs or outputs changed since the previous build.
+	""")
+	group.add_argument('--watch', action='store_true', default=False, help="""
+		After building, watch the source and library directories for changes
+		and rebuild the mod until interrupted. Only the affected stages are
+		run again.
+	""")
+	group.add_argument('--link', action='store_true', default=None, help="""
+		Hard link the MCP source and compiled classes into the build
+		directory instead of copying them. This overrides *forge.link* in
+		the configuration.
+	""")
+	group.add_argument('--events', metavar="FILE", help="""
+		Append a stream of build events (stage timings, file counts, bytes
+		packaged, cache hits and subprocess results) to *FILE* as lines of
+		JSON. Use "fd:N" to write them to the open file descriptor *N*.
+	""")
+
+	# Checkpoint command.
+	parser_checkpoint = subparsers.add_parser('checkpoint', help="Show or clear the build checkpoints.")
+	parser_checkpoint.set_defaults(func=lazy_command('checkpoint'))
+	parser_checkpoint.add_argument('action', choices=['show', 'clear'], help="""
+		The action to perform. *show* lists the stages which completed
+		successfully and will be skipped by the next build if their inputs
+		do not change. *clear* removes the checkpoints so that the next
+		build runs every stage.
+	""")
+	parser_checkpoint.add_argument('-c', '--config-file', default=DEFAULT_CONFIG_FILE, metavar="FILE", help="""
+		The mcpackage configuration file to use. Default is %(default)r.
+	""")
+	parser_checkpoint.add_argument('-v', '--verbose', action='count', help="""
+		Print verbose debugging information.
+	""")
+
+	# Workspace command.
+	parser_workspace = subparsers.add_parser('workspace', help="Build the Minecraft Mods of a workspace concurrently.")
+	parser_workspace.set_defaults(func=lazy_command('workspace'))
+	parser_workspace.add_argument('-w', '--workspace-file', default=DEFAULT_WORKSPACE_FILE, metavar="FILE", help="""
+		The workspace configuration file listing the mcpackage configuration
+		files of the mods to build. Default is %(default)r.
+	""")
+	parser_workspace.add_argument('-j', '--jobs', type=int, metavar="N", help="""
+		The maximum number of mods to build concurrently. Default is to use
+		*jobs* from the workspace configuration.
+	""")
+	parser_workspace.add_argument('--force', action='store_true', default=False, help="""
+		Run every stage of each build instead of resuming from the first
+		stage whose inputs or outputs changed since the previous build.
+	""")
+	parser_workspace.add_argument('-v', '--verbose', action='count', help="""
+		Print verbose debugging information.
+	""")
+
+	# Stats command.
+	parser_stats = subparsers.add_parser('stats', help="Show the trends of the build history, or compare builds.")
+	parser_stats.set_defaults(func=lazy_command('history'))
+	parser_stats.add_argument('-c', '--config-file', default=DEFAULT_CONFIG_FILE, metavar="FILE", help="""
+		The mcpackage configuration file to use. Default is %(default)r.
+	""")
+	parser_stats.add_argument('-n', '--limit', type=int, metavar="N", help="""
+		Show the trends of the last *N* builds. Default is 20.
+	""")
+	parser_stats.add_argument('--include-skipped', action='store_true', help="""
+		Include the builds which skipped every stage because nothing changed
+		in the stage timings. These are excluded by default.
+	""")
+	parser_stats.add_argument('--compare', type=int, nargs=2, metavar="ID", help="""
+		Compare the stage timings and metrics of two builds by their IDs.
+	""")
+	parser_stats.add_argument('-v', '--verbose', action='count', help="""
+		Print verbose debugging information.
+	""")
+
+	# Synth command.
+	parser_synth = subparsers.add_parser('synth', help="Generate a synthetic Minecraft Mod for stress-testing builds.")
+	parser_synth.set_defaults(func=lazy_command('synthetic'))
+	parser_synth.add_argument('--mod-dir', required=True, metavar="DIR", help="""
+		The directory to generate the mod in.
+	""")
+	parser_synth.add_argument('--forge-dir', default=DEFAULT_FORGE_DIR, metavar="DIR", help="""
+		The Minecraft Forge source directory. Default is %(default)r.
+	""")
+	parser_synth.add_argument('--java', type=int, metavar="N", help="""
+		The number of java classes to generate. Default is 0.
+	""")
+	parser_synth.add_argument('--python', type=int, metavar="N", help="""
+		The number of python modules to generate. The mod is a python mod
+		if this is not 0. Default is 0.
+	""")
+	parser_synth.add_argument('--assets', type=int, metavar="N", help="""
+		The number of assets to generate. Default is 0.
+	""")
+	parser_synth.add_argument('--asset-size', type=int, metavar="BYTES", help="""
+		The size of each asset. Default is 4096.
+	""")
+	parser_synth.add_argument('--libraries', type=int, metavar="N", help="""
+		The number of library JARs to generate. Default is 0.
+	""")
+	parser_synth.add_argument('--library-classes', type=int, metavar="N", help="""
+		The number of classes in each library. Default is 100.
+	""")
+	parser_synth.add_argument('--duplication', type=float, metavar="FRACTION", help="""
+		The fraction of the classes of each library which are duplicated in
+		every library. Default is 0.0.
+	""")
+	parser_synth.add_argument('--seed', type=int, metavar="N", help="""
+		The seed of the generated references so that the same mod is
+		generated each time. Default is 0.
+	""")
+	parser_synth.add_argument('--settings-file', metavar="FILE", help="""
+		A YAML file containing settings to merge into the generated
+		mcpackage configuration (e.g., *jython.jython_exe*).
+	""")
+	parser_synth.add_argument('--force', action='store_true', help="""
+		Generate the mod even if the mod directory is not empty.
+	""")
+	parser_synth.add_argument('-v', '--verbose', action='count', help="""
+		Print verbose debugging information.
+	""")
+
+	# Scale command.
+	parser_scale = subparsers.add_parser('scale', help="Measure how the build scales with the size of synthetic mods.")
+	parser_scale.set_defaults(func=lazy_command('scale'))
+	parser_scale.add_argument('--forge-dir', default=DEFAULT_FORGE_DIR, metavar="DIR", help="""
+		The Minecraft Forge source directory to build the mods against.
+		Default is %(default)r.
+	""")
+	parser_scale.add_argument('--work-dir', default='scale', metavar="DIR", help="""
+		The directory to generate and build the mods in. Default is
+		%(default)r.
+	""")
+	parser_scale.add_argument('--java', default='100', metavar="N[,N...]", help="""
+		The comma separated numbers of java classes. Default is %(default)r.
+	""")
+	parser_scale.add_argument('--python', default='0', metavar="N[,N...]", help="""
+		The comma separated numbers of python modules. Default is
+		%(default)r.
+	""")
+	parser_scale.add_argument('--assets', default='0', metavar="N[,N...]", help="""
+		The comma separated numbers of assets. Default is %(default)r.
+	""")
+	parser_scale.add_argument('--libraries', default='0', metavar="N[,N...]", help="""
+		The comma separated numbers of library JARs. Default is %(default)r.
+	""")
+	parser_scale.add_argument('--library-classes', type=int, metavar="N", help="""
+		The number of classes in each library. Default is 100.
+	""")
+	parser_scale.add_argument('--duplication', type=float, metavar="FRACTION", help="""
+		The fraction of the classes of each library which are duplicated in
+		every library. Default is 0.0.
+	""")
+	parser_scale.add_argument('--asset-size', type=int, metavar="BYTES", help="""
+		The size of each asset. Default is 4096.
+	""")
+	parser_scale.add_argument('--settings-file', metavar="FILE", help="""
+		A YAML file containing settings to merge into the configuration of
+		each mod (e.g., *jython.jython_exe*).
+	""")
+	parser_scale.add_argument('-v', '--verbose', action='count', help="""
+		Print verbose debugging information.
+	""")
+
+	# Daemon command.
+	parser_daemon = subparsers.add_parser('daemon', help="Run the build daemon, or send it a request.")
+	parser_daemon.set_defaults(func=lazy_command('daemon'))
+	parser_daemon.add_argument('action', choices=['start', 'build', 'status', 'stop'], help="""
+		The action to perform. *start* runs the daemon in the foreground
+		which keeps the configuration, scanned source trees and Jython
+		loaded between builds. *build* has the running daemon build the
+		mod. *status* shows the running daemon. *stop* stops the running
+		daemon.
+	""")
+	parser_daemon.add_argument('-c', '--config-file', default=DEFAULT_CONFIG_FILE, metavar="FILE", help="""
+		The mcpackage configuration file to use. Default is %(default)r.
+	""")
+	parser_daemon.add_argument('--socket-file', default=DEFAULT_SOCKET_FILE, metavar="FILE", help="""
+		The socket file the daemon listens on. Default is %(default)r.
+	""")
+	parser_daemon.add_argument('-v', '--verbose', action='count', help="""
+		Print verbose debugging information.
+	""")
 
 	# Install command.
-	# - TODO: Determine proper arguments.
 	parser_install = subparsers.add_parser('install', help="Install the Minecraft Mod.")
-	parser_install.set_defaults(func=lambda args: install_command(**vars(args)))
+	parser_install.set_defaults(func=lazy_command('install'))
 	parser_install.add_argument('-c', '--config-file', default=DEFAULT_CONFIG_FILE, metavar="FILE", help="""
 		The mcpackage configuration file to use. Default is %(default)r.
 	""")
+	parser_install.add_argument('--mods-dir', action='append', metavar="DIR", help="""
+		The Minecraft mods directory to install the mod into. This can be a
+		glob pattern, and can be specified multiple times. Default is to use
+		*install.mods_dirs* from the configuration.
+	""")
+	parser_install.add_argument('--delta', action='store_true', default=None, help="""
+		Update installed JARs which cannot be linked (e.g., on remote mounts)
+		by only writing the regions which changed. Default is to use
+		*install.delta* from the configuration.
+	""")
+	parser_install.add_argument('-j', '--jobs', type=int, metavar="N", help="""
+		The maximum number of mods directories to install into concurrently.
+		Default is to use *install.jobs* from the configuration.
+	""")
 	parser_install.add_argument('-v', '--verbose', action='count', help="""
 		Print verbose debugging information.
 	""")
 
 	# Run command.
-	# - TODO: Determine proper arguments.
 	parser_run = subparsers.add_parser('run', help="Run Minecraft.")
-	parser_run.set_defaults(func=lambda args: run_command(**vars(args)))
+	parser_run.set_defaults(func=lazy_command('run'))
+	parser_run.add_argument('side', nargs='?', choices=['client', 'server'], default='client', help="""
+		The side to run. *client* runs the Minecraft client. *server* runs
+		the dedicated server. Default is %(default)r.
+	""")
 	parser_run.add_argument('-c', '--config-file', default=DEFAULT_CONFIG_FILE, metavar="FILE", help="""
 		The mcpackage configuration file to use. Default is %(default)r.
 	""")
+	parser_run.add_argument('--cds', dest='class_data_sharing', action='store_true', default=None, help="""
+		Generate a class data sharing (AppCDS) archive on the first launch
+		and reuse it on later launches. Default is to use
+		*run.class_data_sharing* from the configuration.
+	""")
+	parser_run.add_argument('--measure', action='store_true', help="""
+		Stop Minecraft once it has finished loading so that only the launch
+		time is measured.
+	""")
 	parser_run.add_argument('-v', '--verbose', action='count', help="""
 		Print verbose debugging information.
 	""")
 
 	# Parse command-line arguments.
 	args = parser.parse_args(argv[1:])
+	if args.func is parser_init.get_default('func') and not args.manifest:
+		missing = [option for option, value in [
+			('--mod-name', args.mod_name),
+			('--mod-namespace', args.mod_namespace),
+			('--mod-type', args.mod_type),
+		] if not value]
+		if missing:
+			parser_init.error("the following arguments are required: {}".format(", ".join(missing)))
 	return args.func(args)
@@ -0,0 +1,269 @@
+# coding: utf-8
+"""
+This module implements the monitor which samples the resource usage of a
+subprocess and its descendants from "/proc" while it runs.
+"""
+from __future__ import unicode_literals
+
+import errno
+import io
+import os
+import os.path
+import threading
+import time
+
+#: The directory the process information is read from.
+PROC_DIR = '/proc'
+
+def is_supported():
+	"""
+	Returns whether the resource usage of processes can be read from
+	"/proc" (``bool``).
+	"""
+	return os.path.exists(os.path.join(PROC_DIR, 'self', 'stat'))
+
+
+class ResourceMonitor(object):
+	"""
+	The ``ResourceMonitor`` class samples the CPU time, resident memory
+	(RSS), I/O bytes and thread count of a process and its descendants on a
+	background thread. This is only supported on systems with "/proc"
+	(i.e., Linux). Elsewhere no samples are taken.
+
+	The CPU time of each process includes the time of its children which
+	exited so that short-lived children (e.g., the javac launched by a
+	script) are counted. The I/O bytes of exited children are not kept by
+	the kernel so they are only counted while the children run.
+	"""
+
+	def __init__(self, pid, interval, memory_budget=None, on_budget=None):
+		"""
+		Initializes the ``ResourceMonitor`` instance.
+
+		*pid* (``int``) is the ID of the process to monitor.
+
+		*interval* (``float``) is the number of seconds between samples.
+
+		*memory_budget* (``int``) is the number of bytes the resident memory
+		of the process tree should stay within. Default is ``None`` for no
+		budget.
+
+		*on_budget* (``callable``) is called with the resident memory in
+		bytes (``int``) the first time the memory budget is exceeded.
+		Default is ``None``.
+		"""
+
+		self.clock_ticks = os.sysconf(str('SC_CLK_TCK')) if hasattr(os, 'sysconf') else 100
+		"""
+		*clock_ticks* (``int``) is the number of clock ticks per second used
+		by the CPU times in "/proc".
+		"""
+
+		self.interval = interval
+		"""
+		*interval* (``float``) is the number of seconds between samples.
+		"""
+
+		self.memory_budget = memory_budget
+		"""
+		*memory_budget* (``int``) is the number of bytes the resident memory
+		should stay within, or ``None`` for no budget.
+		"""
+
+		self.on_budget = on_budget
+		"""
+		*on_budget* (``callable``) is called when the memory budget is first
+		exceeded.
+		"""
+
+		self.over_budget = False
+		"""
+		*over_budget* (``bool``) is whether the memory budget was exceeded.
+		"""
+
+		self.page_size = os.sysconf(str('SC_PAGE_SIZE')) if hasattr(os, 'sysconf') else 4096
+		"""
+		*page_size* (``int``) is the number of bytes per page used by the
+		resident memory in "/proc".
+		"""
+
+		self.pid = pid
+		"""
+		*pid* (``int``) is the ID of the process to monitor.
+		"""
+
+		self.samples = []
+		"""
+		*samples* (``list`` of ``dict``) contains each sample with the
+		`'time'` in seconds since monitoring started (``float``), the total
+		`'cpu_seconds'` (``float``), the `'cpu_percent'` since the previous
+		sample (``float``), the resident memory in bytes `'rss'` (``int``),
+		the `'read_bytes'` and `'write_bytes'` (``int``), the number of
+		`'threads'` (``int``), and the number of `'processes'` (``int``).
+		"""
+
+		self.start_time = None
+		"""
+		*start_time* (``float``) is when monitoring started.
+		"""
+
+		self.stopped = threading.Event()
+		"""
+		*stopped* (``threading.Event``) is set to stop the background
+		thread.
+		"""
+
+		self.thread = None
+		"""
+		*thread* (``threading.Thread``) is the background thread.
+		"""
+
+	def get_peaks(self):
+		"""
+		Gets the peak resource usage.
+
+		Returns the peaks (``dict``) with the peak `'rss'` (``int``),
+		`'threads'` (``int``), `'processes'` (``int``) and `'cpu_percent'`
+		(``float``), and the total `'cpu_seconds'` (``float``),
+		`'read_bytes'` (``int``) and `'write_bytes'` (``int``), and the
+		number of `'samples'` (``int``).
+		"""
+		peaks = {'samples': len(self.samples)}
+		for key in ('rss', 'threads', 'processes', 'cpu_percent', 'cpu_seconds', 'read_bytes', 'write_bytes'):
+			peaks[key] = max(sample[key] for sample in self.samples) if self.samples else 0
+		return peaks
+
+	def read_process(self, pid):
+		"""
+		Reads the resource usage of the process.
+
+		*pid* (``int``) is the ID of the process.
+
+		Returns the resource usage (``dict``), or ``None`` if the process no
+		longer exists.
+		"""
+		proc_dir = os.path.join(PROC_DIR, str(pid))
+		try:
+			with io.open(os.path.join(proc_dir, 'stat'), mode='rb') as fh:
+				stat = fh.read()
+		except (IOError, OSError) as e:
+			if e.errno not in (errno.ENOENT, errno.ESRCH):
+				raise
+			return None
+
+		# - NOTE: The command name is in parentheses and can contain spaces so
+		#   the fields are split after its closing parenthesis.
+		fields = stat[stat.rindex(b')') + 2:].split()
+		usage = {
+			'ppid': int(fields[1]),
+			'cpu_ticks': int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14]),
+			'threads': int(fields[17]),
+			'rss': int(fields[21]) * self.page_size,
+			'read_bytes': 0,
+			'write_bytes': 0,
+		}
+
+		# - NOTE: The I/O counters can only be read for processes owned by the
+		#   same user.
+		try:
+			with io.open(os.path.join(proc_dir, 'io'), mode='rb') as fh:
+				for line in fh:
+					key, _, value = line.partition(b':')
+					if key == b'read_bytes':
+						usage['read_bytes'] = int(value)
+					elif key == b'write_bytes':
+						usage['write_bytes'] = int(value)
+		except (IOError, OSError) as e:
+			if e.errno not in (errno.ENOENT, errno.ESRCH, errno.EACCES, errno.EPERM):
+				raise
+		return usage
+
+	def read_tree(self):
+		"""
+		Reads the resource usage of the process and its descendants.
+
+		Returns the resource usage (``list`` of ``dict``) of each process.
+		"""
+		processes = {}
+		for name in os.listdir(PROC_DIR):
+			if name.isdigit():
+				usage = self.read_process(int(name))
+				if usage is not None:
+					processes[int(name)] = usage
+
+		children = {}
+		for pid, usage in processes.items():
+			children.setdefault(usage['ppid'], []).append(pid)
+
+		tree = []
+		pending = [self.pid]
+		while pending:
+			pid = pending.pop()
+			if pid in processes:
+				tree.append(processes[pid])
+				pending.extend(children.get(pid, ()))
+		return tree
+
+	def run(self):
+		"""
+		Samples the resource usage until stopped.
+		"""
+		while True:
+			self.sample()
+			if self.stopped.wait(self.interval):
+				break
+
+	def sample(self):
+		"""
+		Samples the resource usage of the process and its descendants.
+		"""
+		tree = self.read_tree()
+		if not tree:
+			return
+
+		now = time.time() - self.start_time
+		cpu_seconds = float(sum(usage['cpu_ticks'] for usage in tree)) / self.clock_ticks
+		cpu_percent = 0.0
+		if self.samples:
+			last = self.samples[-1]
+			if now > last['time']:
+				cpu_percent = max(0.0, 100.0 * (cpu_seconds - last['cpu_seconds']) / (now - last['time']))
+
+		sample = {
+			'time': round(now, 3),
+			'cpu_seconds': round(cpu_seconds, 3),
+			'cpu_percent': round(cpu_percent, 1),
+			'rss': sum(usage['rss'] for usage in tree),
+			'read_bytes': sum(usage['read_bytes'] for usage in tree),
+			'write_bytes': sum(usage['write_bytes'] for usage in tree),
+			'threads': sum(usage['threads'] for usage in tree),
+			'processes': len(tree),
+		}
+		self.samples.append(sample)
+
+		if self.memory_budget and not self.over_budget and sample['rss'] > self.memory_budget:
+			self.over_budget = True
+			if self.on_budget is not None:
+				self.on_budget(sample['rss'])
+
+	def start(self):
+		"""
+		Starts sampling on the background thread. Nothing is sampled if
+		"/proc" is not supported.
+		"""
+		self.start_time = time.time()
+		if not is_supported():
+			return
+		self.thread = threading.Thread(target=self.run, name='mcpackage-procmon')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		"""
+		Stops sampling, and waits for the background thread to finish.
+		"""
+		if self.thread is not None:
+			self.stopped.set()
+			self.thread.join()
+			self.thread = None
+
@@ -0,0 +1,45 @@
+# coding: utf-8
+"""
+This module provides access to the data files packaged with *mcpackage*.
+
+``importlib.resources`` is used when it is available because importing
+``pkg_resources`` is notoriously slow.
+"""
+from __future__ import unicode_literals
+
+try:
+	from importlib.resources import files as _files
+except ImportError:
+	_files = None
+
+from . import __name__ as MCPACKAGE
+
+def resource_filename(path):
+	"""
+	Gets the file path of the packaged data file.
+
+	*path* (``str``) is the path of the data file relative to the
+	*mcpackage* package (e.g., ``'data/locale'``).
+
+	Returns the file path (``str``).
+	"""
+	if _files is not None:
+		return str(_files(MCPACKAGE).joinpath(path))
+
+	import pkg_resources
+	return pkg_resources.resource_filename(MCPACKAGE, path)
+
+def resource_string(path):
+	"""
+	Reads the packaged data file.
+
+	*path* (``str``) is the path of the data file relative to the
+	*mcpackage* package (e.g., ``'data/templates/mcmod.info'``).
+
+	Returns the contents of the data file (``bytes``).
+	"""
+	if _files is not None:
+		return _files(MCPACKAGE).joinpath(path).read_bytes()
+
+	import pkg_resources
+	return pkg_resources.resource_string(MCPACKAGE, path)
@@ -2,6 +2,46 @@
 """
 This module implements the "run" command which is used to run Minecraft.
 """
+from __future__ import print_function, unicode_literals
+
+import datetime
+import errno
+import io
+import json
+import logging
+import os
+import os.path
+import re
+import subprocess
+import sys
+import time
+import traceback
+
+from . import util
+from .build import load_config
+from .checkpoint import Fingerprint
+from .install import InstallCommand, get_mod_ids
+
+#: The directory within the build directory to store class data sharing
+#: archives in.
+CDS_CACHE_DIR = os.path.join('cache', 'cds')
+
+#: The file within the build log directory to record launch times in.
+LAUNCH_TIMES_FILE = 'launch-times.jsonl'
+
+#: The loading phases in the order they occur, and the patterns matching
+#: the log lines which start them.
+PHASE_PATTERNS = [
+	('construction', re.compile(r'Constructing mods|identified \d+ mods? to load|Loading state: CONSTRUCTING|Bar Step: Construction', re.I)),
+	('preinit', re.compile(r'FMLPreInitializationEvent|Bar Step: PreInitialization|Loading state: PREINITIALIZATION', re.I)),
+	('init', re.compile(r'FMLInitializationEvent|Bar Step: Initialization|Loading state: INITIALIZATION', re.I)),
+	('postinit', re.compile(r'FMLPostInitializationEvent|Bar Step: PostInitialization|Loading state: POSTINITIALIZATION', re.I)),
+	('world', re.compile(r'Starting integrated minecraft server|Preparing start region|Preparing level', re.I)),
+]
+
+#: The pattern matching the log line when loading is complete (the world
+#: has been loaded).
+READY_PATTERN = re.compile(r'Done \(\d+(?:[.,]\d+)?s\)!|joined the game', re.I)
 
 def command(**args):
 	"""
@@ -14,18 +54,136 @@ def command(**args):
 	return RunCommand(**args).run()
 
 
+class LaunchMonitor(object):
+	"""
+	The ``LaunchMonitor`` class parses the log output of Minecraft as it is
+	launched to time each loading phase, and the share of the time spent by
+	the mod.
+
+	The time of the mod is estimated from the log: the time between a log
+	line mentioning the mod and the next log line is attributed to the mod
+	because FML logs the events it sends to each mod before the mod handles
+	them.
+	"""
+
+	def __init__(self, mod_ids):
+		"""
+		Initializes the ``LaunchMonitor`` instance.
+
+		*mod_ids* (``Iterable`` of ``str``) contains the IDs of the mods to
+		time.
+		"""
+
+		self.last_time = None
+		"""
+		*last_time* (``float``) is the time of the last log line.
+		"""
+
+		self.mod_pattern = re.compile(r'\b(?:{})\b'.format('|'.join(re.escape(mod_id) for mod_id in mod_ids)), re.I) if mod_ids else None
+		"""
+		*mod_pattern* (``re.RegexObject``) matches log lines mentioning the
+		mod.
+		"""
+
+		self.mod_seconds = 0.0
+		"""
+		*mod_seconds* (``float``) is the number of seconds attributed to the
+		mod.
+		"""
+
+		self.mod_active = False
+		"""
+		*mod_active* (``bool``) is whether the last log line mentioned the
+		mod.
+		"""
+
+		self.phases = []
+		"""
+		*phases* (``list``) contains each phase (``str``) that started with
+		its start time (``float``) as a ``tuple``.
+		"""
+
+		self.ready = None
+		"""
+		*ready* (``float``) is the time loading completed, or ``None`` if it
+		has not.
+		"""
+
+	def feed(self, line, now):
+		"""
+		Parses the log line.
+
+		*line* (``str``) is the log line.
+
+		*now* (``float``) is the number of seconds since launch when the line
+		was received.
+
+		Returns whether loading just completed (``bool``).
+		"""
+		if self.mod_active and self.last_time is not None:
+			self.mod_seconds += now - self.last_time
+		self.last_time = now
+		self.mod_active = bool(self.mod_pattern and self.mod_pattern.search(line))
+
+		if self.ready is not None:
+			return False
+
+		started = set(phase for phase, _ in self.phases)
+		for phase, pattern in PHASE_PATTERNS:
+			if phase not in started and pattern.search(line):
+				self.phases.append((phase, now))
+				break
+
+		if READY_PATTERN.search(line):
+			self.ready = now
+			return True
+		return False
+
+	def get_results(self, end):
+		"""
+		Gets the results.
+
+		*end* (``float``) is the number of seconds since launch when
+		Minecraft exited.
+
+		Returns the results (``dict``).
+		"""
+		total = self.ready if self.ready is not None else end
+		phases = {}
+		for i, (phase, start) in enumerate(self.phases):
+			stop = self.phases[i + 1][1] if i + 1 < len(self.phases) else total
+			phases[phase] = round(stop - start, 3)
+		return {
+			'phases': phases,
+			'ready': self.ready is not None,
+			'total': round(total, 3),
+			'mod': round(self.mod_seconds, 3),
+		}
+
+
 class RunCommand(object):
 	"""
 	The ``RunCommand`` class is used to run Minecraft.
 	"""
 
-	def __init__(self, config_file, verbose=None):
+	def __init__(self, config_file, class_data_sharing=None, measure=None, side=None, verbose=None, **_):
 		"""
 		Initializes the ``RunCommand`` instance.
 
 		*config_file* (``str``) is the **mcpackage** configuration file to
 		use.
 
+		*class_data_sharing* (``bool``) is whether a class data sharing
+		archive should be generated and reused. Default is ``None`` to use
+		*run.class_data_sharing* from the configuration.
+
+		*measure* (``bool``) is whether Minecraft should be stopped once it
+		has finished loading so that only the launch time is measured.
+		Default is ``None`` for ``False``.
+
+		*side* (``str``) is the side to run: `'client'` or `'server'`.
+		Default is ``None`` for `'client'`.
+
 		*verbose* (``int``) is the level of verbose debugging information to
 		be printed. Default is ``None`` for `0`.
 
@@ -36,6 +194,17 @@ class RunCommand(object):
 		- `2`: print lots of debugging information.
 		"""
 
+		self.class_data_sharing = class_data_sharing
+		"""
+		*class_data_sharing* (``bool``) is whether a class data sharing
+		archive should be generated and reused.
+		"""
+
+		self.config = None
+		"""
+		*config* (``dict``) is the loaded mcpackage configuration.
+		"""
+
 		self.config_file = config_file
 		"""
 		*config_file* (``str``) is the mcpackage configuration file to use.
@@ -46,16 +215,373 @@ class RunCommand(object):
 		*log* (``logging.Logger``) is the main logger.
 		"""
 
+		self.measure = measure or False
+		"""
+		*measure* (``bool``) is whether Minecraft should be stopped once it
+		has finished loading.
+		"""
+
+		self.side = side or 'client'
+		"""
+		*side* (``str``) is the side to run: `'client'` or `'server'`.
+		"""
+
 		self.verbose = verbose or 0
 		"""
 		*verbose* (``int``) is the level of verbose debugging information to
 		be printed.
 		"""
 
+	def get_cds_archive(self, command, classpath, jar_file):
+		"""
+		Gets the class data sharing archive to launch Minecraft with.
+
+		*command* (``list`` of ``str``) is the command used to run Minecraft.
+
+		*classpath* (``list`` of ``str``) is the classpath.
+
+		*jar_file* (``str``) is the mod JAR.
+
+		Returns the path of the archive (``str``). The archive is keyed on
+		the classpath, mod JAR and command so that it is regenerated when
+		any of them change.
+		"""
+		fingerprint = Fingerprint(command)
+		for path in [command[0]] + classpath:
+			if os.path.isdir(path):
+				fingerprint.update_value(path)
+				fingerprint.update_tree(path)
+			else:
+				fingerprint.update_files('', [path])
+		fingerprint.update_value(util.file_digest(jar_file))
+		cds_dir = os.path.join(self.config['build']['dir'], CDS_CACHE_DIR)
+		return os.path.join(cds_dir, '{}-{}.jsa'.format(self.side, fingerprint.hexdigest()))
+
+	def get_classpath(self):
+		"""
+		Gets the classpath to run Minecraft with.
+
+		Returns the classpath (``list`` of ``str``).
+		"""
+		classpath = self.config['run']['classpath']
+		if classpath is not None:
+			return [os.path.abspath(os.path.expanduser(os.path.expandvars(path))) for path in classpath]
+
+		# Default to every JAR in the MCP "jars" directory except for mods.
+		jars_dir = os.path.join(self.config['forge']['mcp_dir'], 'jars')
+		classpath = []
+		for parent, dirs, files in os.walk(jars_dir):
+			if 'mods' in dirs:
+				dirs.remove('mods')
+			dirs.sort()
+			classpath.extend(os.path.join(parent, name) for name in sorted(files) if name.lower().endswith('.jar'))
+		return classpath
+
+	def get_command(self, classpath):
+		"""
+		Gets the command used to run Minecraft.
+
+		*classpath* (``list`` of ``str``) is the classpath.
+
+		Returns the command (``list`` of ``str``), or ``None`` if Java could
+		not be found.
+		"""
+		java_exe = self.config['run']['java_exe'] or util.find_exe('java')
+		if not java_exe or not os.path.isfile(java_exe):
+			self.log.error("Java executable could not be found{}.".format(" at {!r}".format(java_exe) if java_exe else ""))
+			self.log.error("You must set the Java executable in the configuration {!r}.".format(self.config_file))
+			return None
+
+		side = self.config['run'][self.side]
+		command = [java_exe]
+		command += self.config['run']['jvm_args']
+		command += ['-cp', os.pathsep.join(classpath), side['main_class']]
+		command += side['args']
+		return command
+
+	def init_cds(self, cds_archive):
+		"""
+		Prepares the class data sharing archive, and removes the stale
+		archives of the side.
+
+		*cds_archive* (``str``) is the path of the archive.
+
+		Returns whether the launch is `'cold'` (the archive will be dumped
+		when Minecraft exits) or `'warm'` (the archive is used) (``str``).
+		"""
+		cds_dir = os.path.dirname(cds_archive)
+		try:
+			os.makedirs(cds_dir)
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+
+		prefix = self.side + '-'
+		for name in os.listdir(cds_dir):
+			path = os.path.join(cds_dir, name)
+			if name.startswith(prefix) and path != cds_archive:
+				self.log.info("Remove stale class data sharing archive {!r}.".format(name))
+				os.remove(path)
+
+		if os.path.isfile(cds_archive):
+			self.log.info("Use class data sharing archive {!r}.".format(os.path.basename(cds_archive)))
+			return 'warm'
+		self.log.info("Generate class data sharing archive {!r}.".format(os.path.basename(cds_archive)))
+		return 'cold'
+
+	def init_config(self):
+		"""
+		Loads the configuration.
+		"""
+		if self.verbose >= 1:
+			print("Load {!r}.".format(self.config_file))
+		self.config, _ = load_config(self.config_file)
+		if self.class_data_sharing is None:
+			self.class_data_sharing = self.config['run']['class_data_sharing']
+		assert self.side in ('client', 'server'), "side:{!r} must be:{!r}.".format(self.side, ['client', 'server'])
+
+	def init_logging(self):
+		"""
+		Initialize logging.
+		"""
+		if self.verbose >= 2:
+			log_level = logging.DEBUG
+		elif self.verbose >= 1:
+			log_level = logging.INFO
+		else:
+			log_level = logging.WARNING
+
+		self.log = logging.getLogger()
+		self.log.setLevel(logging.NOTSET)
+
+		if self.verbose >= 1:
+			print("Log to stdout.")
+		stream_handler = logging.StreamHandler(stream=sys.stdout)
+		stream_handler.setLevel(log_level)
+		stream_handler.setFormatter(logging.Formatter(fmt='[%(name)s] %(levelname)s: %(message)s'))
+		self.log.addHandler(stream_handler)
+
+	def launch(self, command, game_dir, monitor):
+		"""
+		Launches Minecraft, and passes its output to the monitor until it
+		exits.
+
+		*command* (``list`` of ``str``) is the command used to run Minecraft.
+
+		*game_dir* (``str``) is the game directory to run Minecraft in.
+
+		*monitor* (``LaunchMonitor``) is the monitor.
+
+		Returns a ``tuple`` containing: the exit code of Minecraft (``int``),
+		and the number of seconds it ran (``float``).
+		"""
+		self.log.debug("command:{!r}".format(command))
+		start = time.time()
+		try:
+			proc = subprocess.Popen(command, cwd=game_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=True)
+		except OSError as e:
+			# Add the executed file to the error.
+			e.args += (command[0],)
+			e.filename = command[0]
+			raise
+
+		try:
+			for line in iter(proc.stdout.readline, b''):
+				line = line.decode('UTF-8', 'replace')
+				sys.stdout.write(line)
+				sys.stdout.flush()
+				if monitor.feed(line, time.time() - start) and self.measure:
+					self.log.info("Stop Minecraft because it finished loading.")
+					self.stop(proc)
+		except KeyboardInterrupt:
+			self.stop(proc)
+		finally:
+			proc.stdout.close()
+			code = proc.wait()
+		return code, time.time() - start
+
+	def record(self, results):
+		"""
+		Records the launch results, and reports any regression since the
+		previous launch of the same side.
+
+		*results* (``dict``) contains the launch results.
+		"""
+		log_dir = os.path.join(self.config['build']['dir'], 'log')
+		try:
+			os.makedirs(log_dir)
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+		times_file = os.path.join(log_dir, LAUNCH_TIMES_FILE)
+
+		# Find the previous launch of the same side.
+		# - NOTE: Cold and warm class data sharing launches are only compared
+		#   with launches of the same kind.
+		previous, cold = None, None
+		try:
+			with io.open(times_file, mode='r', encoding='UTF-8') as fh:
+				for line in fh:
+					try:
+						row = json.loads(line)
+					except ValueError:
+						continue
+					if row.get('side') != results['side'] or not row.get('ready'):
+						continue
+					if row.get('cds') == results.get('cds'):
+						previous = row
+					if row.get('cds') == 'cold' and row.get('cds_archive') == results.get('cds_archive'):
+						cold = row
+		except IOError as e:
+			if e.errno != errno.ENOENT:
+				raise
+
+		with io.open(times_file, mode='a', encoding='UTF-8') as fh:
+			fh.write(json.dumps(results, sort_keys=True) + '\n')
+
+		# Report results.
+		print("Launch time of {side}{cds}: {total:.3f}s ({mod:.3f}s or {share:.1%} in mod).".format(
+			side=results['side'],
+			cds=" ({} class data sharing)".format(results['cds']) if results.get('cds') else "",
+			total=results['total'],
+			mod=results['mod'],
+			share=results['mod'] / results['total'] if results['total'] else 0.0,
+		))
+		for phase, _ in PHASE_PATTERNS:
+			if phase in results['phases']:
+				print("  {:<13} {:>8.3f}s".format(phase, results['phases'][phase]))
+
+		if cold and results.get('cds') == 'warm' and results['ready']:
+			print("Class data sharing: cold {:.3f}s, warm {:.3f}s ({:+.3f}s).".format(cold['total'], results['total'], results['total'] - cold['total']))
+
+		if previous and results['ready']:
+			threshold = self.config['run']['regression_threshold']
+			for key in ('total', 'mod'):
+				if previous[key] and results[key] > previous[key] * (1.0 + threshold):
+					self.log.warning("Launch time regression: {key} time increased from {old:.3f}s to {new:.3f}s since {time}.".format(
+						key=key,
+						old=previous[key],
+						new=results[key],
+						time=previous['time'],
+					))
+
 	def run(self):
 		"""
 		Runs the "run" command.
 
 		Returns the exit code (``int``).
 		"""
-		raise NotImplementedError("TODO")
+		# Load config.
+		try:
+			self.init_config()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to load configuration.", file=sys.stderr)
+			if self.verbose >= 1:
+				print("Exiting because of error.")
+			return 1
+
+		# Initialize logging.
+		try:
+			self.init_logging()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to initialize logging.", file=sys.stderr)
+			if self.verbose >= 1:
+				print("Exiting because of error.")
+			return 1
+
+		# Run minecraft.
+		try:
+			result = self.run_work()
+		except:
+			self.log.error("Failed to run Minecraft.", exc_info=sys.exc_info())
+			result = 1
+		if result:
+			self.log.info("Exiting because of error.")
+		return result
+
+	def run_work(self):
+		"""
+		Perform the actual work of the "run" command.
+
+		Returns the exit code (``int``).
+		"""
+		build_dir = self.config['build']['dir']
+		jar_file = os.path.join(build_dir, self.config['name'] + '.jar')
+		if not os.path.isfile(jar_file):
+			self.log.error("Mod jar {!r} does not exist. Build the mod first.".format(jar_file))
+			return 1
+
+		# Install mod into game directory.
+		game_dir = self.config['run']['game_dir']
+		if game_dir:
+			game_dir = os.path.abspath(os.path.expanduser(os.path.expandvars(game_dir)))
+		else:
+			game_dir = os.path.join(build_dir, 'run')
+		game_dir = os.path.join(game_dir, self.side)
+		installer = InstallCommand(config_file=self.config_file, mods_dir=[os.path.join(game_dir, 'mods')], verbose=self.verbose)
+		installer.init_config()
+		installer.log = self.log
+		result = installer.run_work()
+		if result:
+			return result
+
+		# Run minecraft.
+		classpath = self.get_classpath()
+		command = self.get_command(classpath)
+		if command is None:
+			return 1
+		cds_archive, cds_mode = None, None
+		if self.class_data_sharing:
+			cds_archive = self.get_cds_archive(command, classpath, jar_file)
+			cds_mode = self.init_cds(cds_archive)
+			if cds_mode == 'warm':
+				cds_flag = '-XX:SharedArchiveFile=' + cds_archive
+			else:
+				cds_flag = '-XX:ArchiveClassesAtExit=' + cds_archive
+			command[1:1] = ['-Xshare:auto', cds_flag]
+		self.log.info("Run Minecraft {} in {!r}.".format(self.side, game_dir))
+		monitor = LaunchMonitor(get_mod_ids(jar_file) or [self.config['name']])
+		code, seconds = self.launch(command, game_dir, monitor)
+
+		if cds_mode == 'cold' and monitor.ready is None:
+			# Do not keep an archive of an incomplete launch.
+			try:
+				os.remove(cds_archive)
+			except OSError as e:
+				if e.errno != errno.ENOENT:
+					raise
+
+		# Record launch times.
+		results = monitor.get_results(seconds)
+		results['side'] = self.side
+		if cds_mode:
+			results['cds'] = cds_mode
+			results['cds_archive'] = os.path.basename(cds_archive)
+		results['time'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+		results['jar_digest'] = util.file_digest(jar_file)
+		self.record(results)
+
+		if code and not (self.measure and monitor.ready is not None):
+			self.log.error("Minecraft exited with code {}.".format(code))
+			return 1
+		return 0
+
+	def stop(self, proc):
+		"""
+		Stops Minecraft.
+
+		*proc* (``subprocess.Popen``) is the Minecraft process.
+		"""
+		if proc.poll() is not None:
+			return
+		if self.side == 'server':
+			# Let the server save and stop cleanly.
+			try:
+				proc.stdin.write(b'stop\n')
+				proc.stdin.flush()
+				return
+			except (IOError, OSError):
+				pass
+		proc.terminate()
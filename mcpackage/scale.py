@@ -0,0 +1,403 @@
+# coding: utf-8
+"""
+This module implements the "scale" command which builds synthetic
+Minecraft Mods of increasing size, and reports how the time and memory of
+the build scale with each dimension of the mod.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import collections
+import io
+import json
+import logging
+import math
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+
+from . import __name__ as MCPACKAGE, util
+from .procmon import ResourceMonitor
+from .synthetic import SyntheticCommand
+
+#: The dimensions of the synthetic mods which can be scaled.
+DIMENSIONS = ['java', 'python', 'assets', 'libraries']
+
+#: The file within the work directory to write the report to.
+SCALE_REPORT_FILE = 'scale.json'
+
+#: The number of seconds between the samples of the memory used by each
+#: build.
+SAMPLE_INTERVAL = 0.1
+
+def command(**args):
+	"""
+	Builds synthetic Minecraft Mods of increasing size.
+
+	`**args` is the keyword arguments to send to ``ScaleCommand()``.
+
+	Returns the exit code (``int``).
+	"""
+	return ScaleCommand(**args).run()
+
+def parse_sizes(value):
+	"""
+	Parses the sizes of a dimension.
+
+	*value* (``str``) is the comma separated sizes (e.g., `'100,1000'`).
+
+	Returns the sizes (``list`` of ``int``).
+	"""
+	return [int(size) for size in value.split(',') if size.strip()]
+
+def scaling_exponent(size1, seconds1, size2, seconds2):
+	"""
+	Estimates the exponent *k* of the build time growing as *size* ^ *k*
+	between two sizes (e.g., `1.0` for linear and `2.0` for quadratic).
+
+	*size1* (``int``) and *seconds1* (``float``) are the smaller size and
+	its build time.
+
+	*size2* (``int``) and *seconds2* (``float``) are the larger size and its
+	build time.
+
+	Returns the exponent (``float``), or ``None`` if it cannot be
+	estimated.
+	"""
+	if size1 <= 0 or size2 <= size1 or seconds1 <= 0 or seconds2 <= 0:
+		return None
+	return math.log(seconds2 / seconds1) / math.log(size2 / size1)
+
+
+class ScaleCommand(object):
+	"""
+	The ``ScaleCommand`` class is used to build synthetic Minecraft Mods of
+	increasing size to report how the build scales.
+
+	The first size of each dimension is its base size. Each dimension with
+	more sizes is scaled in turn while the others are kept at their base
+	sizes. Every mod is generated from scratch, and built with every stage
+	in its own mcpackage process whose time, CPU time and peak resident
+	memory (including MCP and Jython) are measured.
+	"""
+
+	def __init__(self, forge_dir, work_dir, java, python, assets, libraries, library_classes=None, duplication=None, asset_size=None, settings_file=None, verbose=None, **_):
+		"""
+		Initializes the ``ScaleCommand`` instance.
+
+		*forge_dir* (``str``) is the Minecraft Forge source directory to
+		build the mods against.
+
+		*work_dir* (``str``) is the directory to generate and build the mods
+		in.
+
+		*java* (``str``) is the comma separated numbers of java classes.
+
+		*python* (``str``) is the comma separated numbers of python modules.
+
+		*assets* (``str``) is the comma separated numbers of assets.
+
+		*libraries* (``str``) is the comma separated numbers of libraries.
+
+		*library_classes* (``int``) is the number of classes in each
+		library. Default is ``None`` for `100`.
+
+		*duplication* (``float``) is the fraction of the classes of each
+		library which are duplicated in every library. Default is ``None``
+		for `0.0`.
+
+		*asset_size* (``int``) is the number of bytes of each asset. Default
+		is ``None`` for `4096`.
+
+		*settings_file* (``str``) is the file containing the settings to
+		merge into the configuration of each mod (e.g., the Jython
+		executable). Default is ``None``.
+
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed. Default is ``None`` for `0`.
+		"""
+
+		self.asset_size = asset_size
+		"""
+		*asset_size* (``int``) is the number of bytes of each asset.
+		"""
+
+		self.duplication = duplication
+		"""
+		*duplication* (``float``) is the fraction of the classes of each
+		library which are duplicated in every library.
+		"""
+
+		self.forge_dir = forge_dir
+		"""
+		*forge_dir* (``str``) is the Minecraft Forge source directory.
+		"""
+
+		self.library_classes = library_classes
+		"""
+		*library_classes* (``int``) is the number of classes in each library.
+		"""
+
+		self.log = None
+		"""
+		*log* (``logging.Logger``) is the main logger.
+		"""
+
+		self.log_handlers = []
+		"""
+		*log_handlers* (``list`` of ``logging.Handler``) contains the
+		handlers added by ``init_logging()``.
+		"""
+
+		self.settings_file = settings_file
+		"""
+		*settings_file* (``str``) is the file containing the settings to
+		merge into the configuration of each mod.
+		"""
+
+		self.sizes = collections.OrderedDict([
+			('java', parse_sizes(java)),
+			('python', parse_sizes(python)),
+			('assets', parse_sizes(assets)),
+			('libraries', parse_sizes(libraries)),
+		])
+		"""
+		*sizes* (``collections.OrderedDict``) maps each dimension (``str``)
+		to its sizes (``list`` of ``int``).
+		"""
+
+		self.verbose = verbose or 0
+		"""
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed.
+		"""
+
+		self.work_dir = work_dir
+		"""
+		*work_dir* (``str``) is the directory to generate and build the mods
+		in.
+		"""
+
+		for dimension, sizes in self.sizes.items():
+			assert sizes and all(size >= 0 for size in sizes), "{} sizes:{!r} must be non-negative.".format(dimension, sizes)
+
+	def build_mod(self, sizes, settings):
+		"""
+		Generates and builds the mod.
+
+		*sizes* (``dict``) maps each dimension (``str``) to its size
+		(``int``).
+
+		*settings* (``dict``) contains the settings to merge into the
+		configuration of the mod.
+
+		Returns the measurements (``dict``) with the `'sizes'` (``dict``),
+		the `'result'` of the build (``int``), its `'seconds'`
+		(``float``), `'cpu_seconds'` (``float``) and `'peak_rss'` in bytes
+		(``int``), the `'jar_bytes'` (``int``), and the `'stages'`
+		(``dict``) mapping each stage (``str``) to its seconds (``float``).
+		"""
+		name = "-".join("{}{}".format(dimension, sizes[dimension]) for dimension in DIMENSIONS)
+		mod_dir = os.path.join(os.path.abspath(self.work_dir), name)
+		if os.path.exists(mod_dir):
+			shutil.rmtree(mod_dir)
+
+		# Generate mod.
+		self.log.info("Generate {!r}.".format(name))
+		synth = SyntheticCommand(
+			mod_dir=mod_dir,
+			forge_dir=os.path.abspath(self.forge_dir),
+			java=sizes['java'],
+			python=sizes['python'],
+			assets=sizes['assets'],
+			asset_size=self.asset_size,
+			libraries=sizes['libraries'],
+			library_classes=self.library_classes,
+			duplication=self.duplication,
+			settings=settings,
+			verbose=self.verbose,
+		)
+		synth.log = logging.getLogger(name)
+		result = synth.run_work()
+		if result:
+			raise RuntimeError("Failed to generate {!r}.".format(name))
+
+		# Build mod.
+		self.log.info("Build {!r}.".format(name))
+		events_file = os.path.join(mod_dir, 'events.jsonl')
+		command = [sys.executable, '-m', MCPACKAGE, 'build', '--force', '--events', events_file]
+		start = time.time()
+		proc = subprocess.Popen(command, close_fds=True, cwd=mod_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		monitor = ResourceMonitor(proc.pid, SAMPLE_INTERVAL)
+		monitor.start()
+		try:
+			output = proc.communicate()[0]
+		finally:
+			monitor.stop()
+		seconds = time.time() - start
+		output = output.decode('UTF-8', 'replace').rstrip()
+		if proc.returncode:
+			self.log.error("Failed to build {!r}:\n{}".format(name, output))
+		elif output:
+			self.log.debug(output)
+
+		stages, jar_bytes = {}, None
+		if os.path.exists(events_file):
+			with io.open(events_file, mode='r', encoding='UTF-8') as fh:
+				for line in fh:
+					event = json.loads(line)
+					if event['event'] == 'stage_end':
+						stages[event['stage']] = event['seconds']
+					elif event['event'] == 'package':
+						jar_bytes = event['jar_bytes']
+
+		peaks = monitor.get_peaks()
+		return {
+			'sizes': sizes,
+			'result': proc.returncode,
+			'seconds': round(seconds, 3),
+			'cpu_seconds': peaks['cpu_seconds'],
+			'peak_rss': peaks['rss'],
+			'jar_bytes': jar_bytes,
+			'stages': stages,
+		}
+
+	def close_logging(self):
+		"""
+		Removes the handlers added by ``init_logging()`` so that the command
+		can be run again within the same process.
+		"""
+		for handler in self.log_handlers:
+			self.log.removeHandler(handler)
+			handler.close()
+		self.log_handlers = []
+
+	def get_runs(self):
+		"""
+		Determines the mods to build.
+
+		Returns the runs (``list`` of ``tuple``) to build where each
+		contains: the dimension being scaled (``str``), or ``None`` for the
+		base mod; and the sizes (``dict``).
+		"""
+		base = dict((dimension, sizes[0]) for dimension, sizes in self.sizes.items())
+		runs = [(None, base)]
+		for dimension, sizes in self.sizes.items():
+			for size in sizes[1:]:
+				runs.append((dimension, dict(base, **{dimension: size})))
+		return runs
+
+	def init_logging(self):
+		"""
+		Initialize logging.
+		"""
+		if self.verbose >= 2:
+			log_level = logging.DEBUG
+		elif self.verbose >= 1:
+			log_level = logging.INFO
+		else:
+			log_level = logging.WARNING
+
+		self.log = logging.getLogger()
+		self.log.setLevel(logging.NOTSET)
+
+		if self.verbose >= 1:
+			print("Log to stdout.")
+		stream_handler = logging.StreamHandler(stream=sys.stdout)
+		stream_handler.setLevel(log_level)
+		stream_handler.setFormatter(logging.Formatter(fmt='[%(name)s] %(levelname)s: %(message)s'))
+		self.log.addHandler(stream_handler)
+		self.log_handlers.append(stream_handler)
+
+	def print_report(self, measurements):
+		"""
+		Prints how the build scales with each dimension.
+
+		*measurements* (``list`` of ``tuple``) contains the dimension
+		(``str``) or ``None``, and the measurements (``dict``) from
+		``build_mod()`` of each run.
+		"""
+		# - NOTE: This is imported here so that the build dependencies are
+		#   only loaded when the report is printed.
+		from .build import STAGES
+		base = measurements[0][1]
+		header = "{:>8} {:>7} {:>9} {:>9} {:>10} {:>10} {:>6}".format("size", "result", "wall", "CPU", "peak RSS", "JAR", "exp")
+		header += "".join(" {:>9}".format(stage[:9]) for stage in STAGES)
+		sections = []
+		for dimension in DIMENSIONS:
+			runs = [base] + [run for run_dimension, run in measurements if run_dimension == dimension]
+			if len(runs) > 1:
+				sections.append((dimension, runs))
+		if not sections:
+			# Only the base mod was built.
+			sections.append((DIMENSIONS[0], [base]))
+
+		for dimension, runs in sections:
+			print("{}:".format(dimension))
+			print(header)
+			previous = None
+			for run in sorted(runs, key=lambda run: run['sizes'][dimension]):
+				exponent = None
+				if previous is not None:
+					exponent = scaling_exponent(previous['sizes'][dimension], previous['seconds'], run['sizes'][dimension], run['seconds'])
+				line = "{:>8} {:>7} {:>9} {:>9} {:>10} {:>10} {:>6}".format(
+					run['sizes'][dimension],
+					"failed" if run['result'] else "ok",
+					"{:.3f}s".format(run['seconds']),
+					"{:.3f}s".format(run['cpu_seconds']),
+					"{:.1f} MB".format(run['peak_rss'] / 1048576) if run['peak_rss'] else "-",
+					"{:.1f} KB".format(run['jar_bytes'] / 1024) if run['jar_bytes'] is not None else "-",
+					"{:.2f}".format(exponent) if exponent is not None else "-",
+				)
+				line += "".join(" {:>9}".format("{:.3f}s".format(run['stages'][stage]) if stage in run['stages'] else "-") for stage in STAGES)
+				print(line)
+				previous = run
+			print("")
+
+	def run(self):
+		"""
+		Runs the "scale" command.
+
+		Returns the exit code (``int``).
+		"""
+		# Initialze logging.
+		try:
+			self.init_logging()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to initialize logging.", file=sys.stderr)
+			return 1
+
+		# Build mods.
+		try:
+			result = self.run_work()
+		except:
+			self.log.error("Failed to scale mods.", exc_info=sys.exc_info())
+			result = 1
+		finally:
+			self.close_logging()
+		return result
+
+	def run_work(self):
+		"""
+		Perform the actual work of the "scale" command.
+
+		Returns the exit code (``int``).
+		"""
+		settings = util.load_config(self.settings_file) if self.settings_file else {}
+		runs = self.get_runs()
+		print("Build {} synthetic mod(s) in {!r}.".format(len(runs), self.work_dir))
+		measurements = []
+		for dimension, sizes in runs:
+			measurements.append((dimension, self.build_mod(sizes, settings)))
+
+		# Write and print report.
+		report_file = os.path.join(self.work_dir, SCALE_REPORT_FILE)
+		with io.open(report_file, mode='w', encoding='UTF-8') as fh:
+			fh.write(json.dumps([dict(run, dimension=dimension) for dimension, run in measurements], indent=1, sort_keys=True))
+		self.print_report(measurements)
+		print("Wrote report to {!r}.".format(report_file))
+		return 1 if any(run['result'] for _, run in measurements) else 0
@@ -0,0 +1,441 @@
+# coding: utf-8
+"""
+This module implements the "synth" command which is used to generate a
+synthetic Minecraft Mod of parametric size for stress-testing the build.
+"""
+from __future__ import print_function, unicode_literals
+
+import binascii
+import copy
+import errno
+import io
+import logging
+import os
+import os.path
+import random
+import struct
+import sys
+import traceback
+import zipfile
+
+from . import util
+from .init import InitCommand
+
+#: The settings merged into the configuration of every synthetic mod. The
+#: caches which would hide the cost of building the mod from scratch are
+#: disabled, and the builds are not recorded in the history.
+DEFAULT_SETTINGS = {
+	'jython_cache': {
+		'enabled': False,
+	},
+	'history': {
+		'enabled': False,
+	},
+}
+
+#: The name of the shared package of the classes duplicated between the
+#: synthetic libraries.
+SHARED_PACKAGE = 'synthetic/shared'
+
+def command(**args):
+	"""
+	Generates a synthetic Minecraft Mod.
+
+	`**args` is the keyword arguments to send to ``SyntheticCommand()``.
+
+	Returns the exit code (``int``).
+	"""
+	return SyntheticCommand(**args).run()
+
+def make_class(name, references=()):
+	"""
+	Creates a minimal class file which extends ``java.lang.Object`` and
+	refers to the other classes.
+
+	*name* (``str``) is the internal name of the class (e.g.,
+	`'com/example/Foo'`).
+
+	*references* (``Iterable`` of ``str``) contains the internal names of
+	the classes it refers to.
+
+	Returns the class file (``bytes``).
+	"""
+	pool = []
+	indexes = {}
+	def add(key, entry):
+		if key not in indexes:
+			pool.append(entry)
+			indexes[key] = len(pool)
+		return indexes[key]
+	def add_class(class_name):
+		data = class_name.encode('UTF-8')
+		utf8 = add(('utf8', class_name), b'\x01' + struct.pack('>H', len(data)) + data)
+		return add(('class', class_name), b'\x07' + struct.pack('>H', utf8))
+
+	this_index = add_class(name)
+	super_index = add_class('java/lang/Object')
+	for reference in references:
+		add_class(reference)
+
+	# Magic, version 50 (Java 6), constant pool, access flags (public super),
+	# this and super classes, and no interfaces, fields, methods or
+	# attributes.
+	return b''.join([
+		struct.pack('>IHHH', 0xCAFEBABE, 0, 50, len(pool) + 1),
+		b''.join(pool),
+		struct.pack('>HHHHHHH', 0x0021, this_index, super_index, 0, 0, 0, 0),
+	])
+
+
+class SyntheticCommand(object):
+	"""
+	The ``SyntheticCommand`` class is used to generate a synthetic
+	Minecraft Mod from the "init" templates with a parametric number of
+	java classes, python modules, assets and libraries.
+
+	The java classes and python modules each refer to a few of the ones
+	generated before them so that the dependency graph is realistic and
+	acyclic. A fraction of the classes of each library are duplicated in
+	every library to exercise the handling of duplicate entries.
+	"""
+
+	def __init__(self, mod_dir, forge_dir, java=None, python=None, assets=None, asset_size=None, libraries=None, library_classes=None, duplication=None, settings=None, settings_file=None, seed=None, force=None, verbose=None, **_):
+		"""
+		Initializes the ``SyntheticCommand`` instance.
+
+		*mod_dir* (``str``) is the directory to generate the mod in.
+
+		*forge_dir* (``str``) is the Minecraft Forge source directory.
+
+		*java* (``int``) is the number of java classes to generate. Default
+		is ``None`` for `0`.
+
+		*python* (``int``) is the number of python modules to generate.
+		Default is ``None`` for `0`. The mod is a python mod if this is not
+		`0`.
+
+		*assets* (``int``) is the number of assets to generate. Default is
+		``None`` for `0`.
+
+		*asset_size* (``int``) is the number of bytes of each asset. Default
+		is ``None`` for `4096`.
+
+		*libraries* (``int``) is the number of libraries to generate.
+		Default is ``None`` for `0`.
+
+		*library_classes* (``int``) is the number of classes in each
+		library. Default is ``None`` for `100`.
+
+		*duplication* (``float``) is the fraction of the classes of each
+		library which are duplicated in every library. Default is ``None``
+		for `0.0`.
+
+		*settings* (``dict``) contains the settings to merge into the
+		generated mcpackage configuration (e.g., the Jython executable).
+		Default is ``None``.
+
+		*settings_file* (``str``) is the file containing more settings to
+		merge into the generated mcpackage configuration. Default is
+		``None``.
+
+		*seed* (``int``) is the seed of the random references so that the
+		same mod is generated each time. Default is ``None`` for `0`.
+
+		*force* (``bool``) is whether the mod should be generated even if
+		*mod_dir* is not empty. Default is ``None`` for ``False``.
+
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed. Default is ``None`` for `0`.
+		"""
+
+		self.asset_size = 4096 if asset_size is None else asset_size
+		"""
+		*asset_size* (``int``) is the number of bytes of each asset.
+		"""
+
+		self.assets = assets or 0
+		"""
+		*assets* (``int``) is the number of assets to generate.
+		"""
+
+		self.duplication = duplication or 0.0
+		"""
+		*duplication* (``float``) is the fraction of the classes of each
+		library which are duplicated in every library.
+		"""
+
+		self.force = force or False
+		"""
+		*force* (``bool``) is whether the mod should be generated even if
+		*mod_dir* is not empty.
+		"""
+
+		self.forge_dir = forge_dir
+		"""
+		*forge_dir* (``str``) is the Minecraft Forge source directory.
+		"""
+
+		self.java = java or 0
+		"""
+		*java* (``int``) is the number of java classes to generate.
+		"""
+
+		self.libraries = libraries or 0
+		"""
+		*libraries* (``int``) is the number of libraries to generate.
+		"""
+
+		self.library_classes = 100 if library_classes is None else library_classes
+		"""
+		*library_classes* (``int``) is the number of classes in each library.
+		"""
+
+		self.log = None
+		"""
+		*log* (``logging.Logger``) is the main logger.
+		"""
+
+		self.log_handlers = []
+		"""
+		*log_handlers* (``list`` of ``logging.Handler``) contains the
+		handlers added by ``init_logging()``.
+		"""
+
+		self.mod_dir = mod_dir
+		"""
+		*mod_dir* (``str``) is the directory to generate the mod in.
+		"""
+
+		self.python = python or 0
+		"""
+		*python* (``int``) is the number of python modules to generate.
+		"""
+
+		self.seed = seed or 0
+		"""
+		*seed* (``int``) is the seed of the random references.
+		"""
+
+		self.settings = settings or {}
+		"""
+		*settings* (``dict``) contains the settings to merge into the
+		generated mcpackage configuration.
+		"""
+
+		self.settings_file = settings_file
+		"""
+		*settings_file* (``str``) is the file containing more settings to
+		merge into the generated mcpackage configuration.
+		"""
+
+		self.verbose = verbose or 0
+		"""
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed.
+		"""
+
+		assert 0.0 <= self.duplication <= 1.0, "duplication:{!r} must be between 0 and 1.".format(self.duplication)
+
+	def close_logging(self):
+		"""
+		Removes the handlers added by ``init_logging()`` so that the command
+		can be run again within the same process.
+		"""
+		for handler in self.log_handlers:
+			self.log.removeHandler(handler)
+			handler.close()
+		self.log_handlers = []
+
+	def generate_assets(self, asset_dir):
+		"""
+		Generates the assets.
+
+		*asset_dir* (``str``) is the directory to generate the assets in.
+		"""
+		self.log.info("Generate {} asset(s) in {!r}.".format(self.assets, asset_dir))
+		rand = random.Random(self.seed)
+		for i in range(self.assets):
+			# - NOTE: Assets are random so that they do not compress, like
+			#   textures and sounds.
+			data = binascii.unhexlify('{:0{}x}'.format(rand.getrandbits(self.asset_size * 8), self.asset_size * 2)) if self.asset_size else b''
+			with io.open(os.path.join(asset_dir, 'asset{}.bin'.format(i)), mode='wb') as fh:
+				fh.write(data)
+
+	def generate_java(self, java_dir, package):
+		"""
+		Generates the java classes.
+
+		*java_dir* (``str``) is the directory to generate the java source
+		files in.
+
+		*package* (``str``) is the java package of the classes.
+		"""
+		self.log.info("Generate {} java class(es) in {!r}.".format(self.java, java_dir))
+		rand = random.Random(self.seed)
+		for i in range(self.java):
+			refs = sorted(set(rand.randrange(i) for _ in range(min(i, 3))))
+			value = " + ".join(["Gen{}.value()".format(ref) for ref in refs] + [str(i)])
+			with io.open(os.path.join(java_dir, 'Gen{}.java'.format(i)), mode='w', encoding='UTF-8') as fh:
+				fh.write("package {};\n\npublic class Gen{} {{\n\tpublic static int value() {{\n\t\treturn {};\n\t}}\n}}\n".format(package, i, value))
+
+	def generate_libraries(self, lib_dir):
+		"""
+		Generates the libraries.
+
+		*lib_dir* (``str``) is the directory to generate the libraries in.
+		"""
+		shared = int(round(self.library_classes * self.duplication))
+		self.log.info("Generate {} libraries with {} class(es) each ({} shared) in {!r}.".format(self.libraries, self.library_classes, shared, lib_dir))
+		rand = random.Random(self.seed)
+		for i in range(self.libraries):
+			package = 'synthetic/lib{}'.format(i)
+			with zipfile.ZipFile(os.path.join(lib_dir, 'synthetic-lib{}.jar'.format(i)), 'w', zipfile.ZIP_DEFLATED) as fh:
+				fh.writestr('META-INF/MANIFEST.MF', "Manifest-Version: 1.0\r\n\r\n")
+				for j in range(shared):
+					fh.writestr('{}/Shared{}.class'.format(SHARED_PACKAGE, j), make_class('{}/Shared{}'.format(SHARED_PACKAGE, j)))
+				for j in range(self.library_classes - shared):
+					refs = ['{}/Class{}'.format(package, rand.randrange(j))] if j else []
+					if shared:
+						refs.append('{}/Shared{}'.format(SHARED_PACKAGE, rand.randrange(shared)))
+					fh.writestr('{}/Class{}.class'.format(package, j), make_class('{}/Class{}'.format(package, j), refs))
+
+	def generate_python(self, python_dir, package):
+		"""
+		Generates the python modules.
+
+		*python_dir* (``str``) is the directory to generate the python
+		modules in.
+
+		*package* (``str``) is the python package of the modules.
+		"""
+		self.log.info("Generate {} python module(s) in {!r}.".format(self.python, python_dir))
+		with io.open(os.path.join(python_dir, '__init__.py'), mode='w', encoding='UTF-8') as fh:
+			fh.write("")
+		rand = random.Random(self.seed)
+		for i in range(self.python):
+			refs = sorted(set(rand.randrange(i) for _ in range(min(i, 3))))
+			lines = ["from {} import {}".format(package, ", ".join("mod{}".format(ref) for ref in refs))] if refs else []
+			lines.append("")
+			lines.append("def value():")
+			lines.append("\treturn {}".format(" + ".join(["mod{}.value()".format(ref) for ref in refs] + [str(i)])))
+			with io.open(os.path.join(python_dir, 'mod{}.py'.format(i)), mode='w', encoding='UTF-8') as fh:
+				fh.write("\n".join(lines) + "\n")
+
+	def init_logging(self):
+		"""
+		Initialize logging.
+		"""
+		if self.verbose >= 2:
+			log_level = logging.DEBUG
+		elif self.verbose >= 1:
+			log_level = logging.INFO
+		else:
+			log_level = logging.WARNING
+
+		self.log = logging.getLogger()
+		self.log.setLevel(logging.NOTSET)
+
+		if self.verbose >= 1:
+			print("Log to stdout.")
+		stream_handler = logging.StreamHandler(stream=sys.stdout)
+		stream_handler.setLevel(log_level)
+		stream_handler.setFormatter(logging.Formatter(fmt='[%(name)s] %(levelname)s: %(message)s'))
+		self.log.addHandler(stream_handler)
+		self.log_handlers.append(stream_handler)
+
+	def run(self):
+		"""
+		Runs the "synth" command.
+
+		Returns the exit code (``int``).
+		"""
+		# Initialze logging.
+		try:
+			self.init_logging()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to initialize logging.", file=sys.stderr)
+			return 1
+
+		# Generate mod.
+		try:
+			result = self.run_work()
+		except:
+			self.log.error("Failed to generate mod.", exc_info=sys.exc_info())
+			result = 1
+		finally:
+			self.close_logging()
+		return result
+
+	def run_work(self):
+		"""
+		Perform the actual work of the "synth" command.
+
+		Returns the exit code (``int``).
+		"""
+		# Create the scaffolding of the mod from the init templates.
+		init = InitCommand(
+			mod_name="Synthetic",
+			mod_namespace='synthetic.mod',
+			mod_type='python' if self.python else 'java',
+			mod_dir=self.mod_dir,
+			config_file='mcpackage.yaml',
+			forge_dir=os.path.abspath(self.forge_dir),
+			build_dir='build',
+			library_dir='lib',
+			source_dir='src',
+			force=self.force,
+			verbose=self.verbose,
+		)
+		init.log = self.log
+		result = init.run_work()
+		if result:
+			return result
+
+		# Generate the source, assets and libraries.
+		source_dir = os.path.join(self.mod_dir, 'src')
+		lib_dir = os.path.join(self.mod_dir, 'lib')
+		dirs = [
+			(self.java, os.path.join(source_dir, 'synthetic', 'mod', 'gen')),
+			(self.python, os.path.join(source_dir, 'synthetic', 'mod', 'py', 'gen')),
+			(self.assets, os.path.join(source_dir, 'assets', init.mod_id, 'gen')),
+		]
+		count, dir_path = None, None
+		for count, dir_path in dirs:
+			if count:
+				try:
+					os.makedirs(dir_path)
+				except OSError as e:
+					if e.errno != errno.EEXIST:
+						raise
+		del count, dir_path
+		if self.java:
+			self.generate_java(dirs[0][1], 'synthetic.mod.gen')
+		if self.python:
+			self.generate_python(dirs[1][1], 'synthetic.mod.py.gen')
+		if self.assets:
+			self.generate_assets(dirs[2][1])
+		if self.libraries:
+			self.generate_libraries(lib_dir)
+
+		# Package the assets and libraries, and merge in the settings.
+		# - NOTE: Only the changed settings are rewritten so that the comments
+		#   of the generated configuration are kept.
+		config_file = os.path.join(self.mod_dir, 'mcpackage.yaml')
+		with io.open(config_file, mode='r', encoding='UTF-8') as fh:
+			text = fh.read()
+		old_config = util.load_config(io.StringIO(text))
+		config = copy.deepcopy(old_config)
+		config['name'] = init.mod_id
+		config['library']['package'] = ['synthetic-*.jar']
+		config['source']['extra'] = ['/mcmod.info', '/assets/']
+		settings = util.merge_config(copy.deepcopy(DEFAULT_SETTINGS), self.settings)
+		if self.settings_file:
+			settings = util.merge_config(settings, util.load_config(self.settings_file) or {})
+		config = util.merge_config(config, settings)
+		self.log.info("Update {!r}.".format(config_file))
+		with io.open(config_file, mode='w', encoding='UTF-8') as fh:
+			fh.write(util.update_config_text(text, old_config, config))
+
+		self.log.info("Done.")
+		return 0
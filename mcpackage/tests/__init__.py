@@ -0,0 +1,4 @@
+# coding: utf-8
+"""
+This package contains the unit tests of mcpackage.
+"""
@@ -0,0 +1,76 @@
+# coding: utf-8
+"""
+This script tests the build checkpoints.
+"""
+from __future__ import unicode_literals
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from mcpackage.checkpoint import Checkpoints, Fingerprint
+
+
+class CheckpointsTest(unittest.TestCase):
+	"""
+	The ``CheckpointsTest`` class tests the ``Checkpoints`` and
+	``Fingerprint`` classes.
+	"""
+
+	def setUp(self):
+		"""
+		Creates the build directory.
+		"""
+		self.build_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		"""
+		Removes the build directory.
+		"""
+		shutil.rmtree(self.build_dir)
+
+	def get_outputs(self):
+		"""
+		Returns the fingerprint of the mod JAR (``str``).
+		"""
+		fingerprint = Fingerprint('package')
+		fingerprint.update_files(self.build_dir, ['mod.jar'])
+		return fingerprint.hexdigest()
+
+	def test_01_save(self):
+		"""
+		Tests that the fingerprints of the inputs and outputs are saved.
+		"""
+		checkpoints = Checkpoints(self.build_dir)
+		checkpoints.set('package', 'inputs', 'outputs')
+
+		checkpoints = Checkpoints(self.build_dir)
+		self.assertEqual(checkpoints.get('package'), 'inputs')
+		self.assertEqual(checkpoints.get_outputs('package'), 'outputs')
+		self.assertIsNone(checkpoints.get('compile'))
+		self.assertIsNone(checkpoints.get_outputs('compile'))
+
+	def test_02_deleted_output(self):
+		"""
+		Tests that deleting an output changes its fingerprint.
+		"""
+		with open(os.path.join(self.build_dir, 'mod.jar'), 'wb') as fh:
+			fh.write(b'PK')
+		outputs = self.get_outputs()
+		self.assertEqual(self.get_outputs(), outputs)
+
+		os.remove(os.path.join(self.build_dir, 'mod.jar'))
+		self.assertNotEqual(self.get_outputs(), outputs)
+
+	def test_03_clear(self):
+		"""
+		Tests clearing the checkpoints of the following stages.
+		"""
+		checkpoints = Checkpoints(self.build_dir)
+		checkpoints.set('compile', 'a', 'b')
+		checkpoints.set('package', 'c', 'd')
+		checkpoints.clear(['package'])
+		self.assertEqual(checkpoints.get_outputs('compile'), 'b')
+		self.assertIsNone(checkpoints.get_outputs('package'))
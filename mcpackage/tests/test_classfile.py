@@ -0,0 +1,197 @@
+# coding: utf-8
+"""
+This script tests parsing and rewriting class files.
+"""
+from __future__ import unicode_literals
+
+import struct
+import unittest
+
+from mcpackage.classfile import ClassFormatError, parse_class, parse_signature, rewrite_utf8
+from mcpackage.tests.util import ClassBuilder
+
+
+def build_example():
+	"""
+	Assembles the example class with long, double and string constants,
+	generic signatures, local variables and an annotation.
+
+	Returns the class file (``bytes``).
+	"""
+	builder = ClassBuilder()
+	# - NOTE: Add the long and double constants first so that every entry
+	#   after them is shifted by the unusable entries.
+	long_index = builder.long(1 << 40)
+	double_index = builder.double(2.5)
+	string_index = builder.string("Lcom/example/NotAClass;")
+	annotation = struct.pack('>HHH', 1, builder.utf8('Lcom/example/Marker;'), 0)
+	return builder.build(
+		'com/example/Example',
+		super_name='com/example/Base',
+		fields=[
+			('LONG', 'J', [builder.attribute('ConstantValue', struct.pack('>H', long_index))]),
+			('DOUBLE', 'D', [builder.attribute('ConstantValue', struct.pack('>H', double_index))]),
+			('TEXT', 'Ljava/lang/String;', [builder.attribute('ConstantValue', struct.pack('>H', string_index))]),
+			('items', 'Ljava/util/List;', [builder.attribute('Signature', struct.pack('>H', builder.utf8('Ljava/util/List<Lcom/example/Item;>;')))]),
+		],
+		methods=[
+			('get', '(Ljava/lang/Object;)Ljava/lang/Object;', [
+				builder.code(
+					local_vars=[('value', 'Lcom/example/Local;')],
+					local_types=[('value', 'TLIST;')],
+				),
+				builder.attribute('Signature', struct.pack('>H', builder.utf8('<LIST:Lcom/example/Bound;>(TLIST;)TLIST;'))),
+			]),
+		],
+		attributes=[
+			builder.attribute('SourceFile', struct.pack('>H', builder.utf8('Example.java'))),
+			builder.attribute('RuntimeVisibleAnnotations', annotation),
+		],
+	)
+
+
+class ParseClassTest(unittest.TestCase):
+	"""
+	The ``ParseClassTest`` class tests parsing class files.
+	"""
+
+	def test_01_constants(self):
+		"""
+		Test parsing a constant pool with long and double entries.
+		"""
+		info = parse_class(build_example())
+		self.assertEqual(info['name'], 'com/example/Example')
+		self.assertEqual(info['super'], 'com/example/Base')
+		self.assertEqual(info['source_file'], 'Example.java')
+		self.assertIsNotNone(info['constants'])
+
+	def test_02_references(self):
+		"""
+		Test finding the classes referenced by descriptors, signatures,
+		local variables and annotations, but not type variables or strings.
+		"""
+		info = parse_class(build_example())
+		self.assertEqual(info['references'], [
+			'com/example/Base',
+			'com/example/Bound',
+			'com/example/Item',
+			'com/example/Local',
+			'com/example/Marker',
+			'java/lang/Object',
+			'java/lang/String',
+			'java/util/List',
+		])
+
+	def test_03_constants_changed(self):
+		"""
+		Test the constants digest changes when a constant value changes.
+		"""
+		data = build_example()
+		changed = data.replace(struct.pack('>d', 2.5), struct.pack('>d', 3.5))
+		self.assertNotEqual(changed, data)
+		self.assertNotEqual(parse_class(changed)['constants'], parse_class(data)['constants'])
+
+	def test_04_invalid(self):
+		"""
+		Test invalid and truncated class files are rejected.
+		"""
+		data = build_example()
+		with self.assertRaises(ClassFormatError):
+			parse_class(b'PK\x03\x04' + data[4:])
+		for size in (12, len(data) // 2, len(data) - 1):
+			with self.assertRaises(ClassFormatError):
+				parse_class(data[:size])
+
+
+class ParseSignatureTest(unittest.TestCase):
+	"""
+	The ``ParseSignatureTest`` class tests parsing descriptors and
+	signatures.
+	"""
+
+	def test_01_descriptor(self):
+		"""
+		Test parsing a method descriptor.
+		"""
+		desc = '(I[Ljava/lang/String;[[J)Lcom/example/Result;'
+		self.assertEqual(parse_signature(desc), [
+			(4, 20, 'java/lang/String'),
+			(26, 44, 'com/example/Result'),
+		])
+
+	def test_02_type_variables(self):
+		"""
+		Test type variables are not parsed as classes.
+		"""
+		sig = '<LIST:Ljava/lang/Object;T::Ljava/lang/Comparable<TT;>;>(TLIST;[TT;)TLIST;^TE;'
+		self.assertEqual([name for _, _, name in parse_signature(sig)], [
+			'java/lang/Object',
+			'java/lang/Comparable',
+		])
+
+	def test_03_class_signature(self):
+		"""
+		Test parsing a class signature with wildcards and inner classes.
+		"""
+		sig = 'Lcom/example/Outer<+Lcom/example/A;>.Inner<-Lcom/example/B;*>;Ljava/lang/Runnable;'
+		classes = parse_signature(sig)
+		self.assertEqual([name for _, _, name in classes], [
+			'com/example/Outer$Inner',
+			'com/example/A',
+			'com/example/B',
+			'java/lang/Runnable',
+		])
+		for start, end, name in classes:
+			self.assertTrue(name.startswith(sig[start:end]), name)
+
+	def test_04_invalid(self):
+		"""
+		Test invalid signatures are rejected.
+		"""
+		for sig in ('Ljava/lang/String', '(I', 'L;', '<:Ljava/lang/Object;>V', 'Q'):
+			with self.assertRaises(ClassFormatError, msg=sig):
+				parse_signature(sig)
+
+
+class RewriteUtf8Test(unittest.TestCase):
+	"""
+	The ``RewriteUtf8Test`` class tests rewriting the UTF-8 constants of
+	class files.
+	"""
+
+	def test_01_unchanged(self):
+		"""
+		Test rewriting nothing returns the same class file.
+		"""
+		data = build_example()
+		uses = {}
+
+		def rewrite(value, kinds):
+			uses[value] = kinds
+			return value
+
+		self.assertEqual(rewrite_utf8(data, rewrite), data)
+		self.assertEqual(uses[b'com/example/Example'], {'class'})
+		self.assertEqual(uses[b'Ljava/lang/String;'], {'descriptor'})
+		self.assertEqual(uses[b'TLIST;'], {'signature'})
+		self.assertEqual(uses[b'Lcom/example/Marker;'], {'descriptor'})
+		self.assertEqual(uses[b'Lcom/example/NotAClass;'], {'string'})
+		self.assertNotIn(b'Example.java', uses)
+		self.assertNotIn(b'LONG', uses)
+
+	def test_02_changed(self):
+		"""
+		Test rewriting constants to different lengths.
+		"""
+		data = build_example()
+		rewritten = rewrite_utf8(data, lambda value, kinds: value.replace(b'com/example/', b'org/example/shaded/'))
+		info = parse_class(rewritten)
+		self.assertEqual(info['name'], 'org/example/shaded/Example')
+		self.assertEqual(info['super'], 'org/example/shaded/Base')
+		self.assertEqual(info['source_file'], 'Example.java')
+		self.assertIn('org/example/shaded/Item', info['references'])
+		self.assertNotIn('com/example/Item', info['references'])
+
+		# Rewriting back restores the original class file.
+		restored = rewrite_utf8(rewritten, lambda value, kinds: value.replace(b'org/example/shaded/', b'com/example/'))
+		self.assertEqual(restored, data)
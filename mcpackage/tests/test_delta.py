@@ -0,0 +1,250 @@
+# coding: utf-8
+"""
+This script tests the delta transfers used by delta installs.
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+import os.path
+import random
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+
+from mcpackage import delta
+from mcpackage.library import PackageWriter
+
+#: The block size to use for the tests.
+BLOCK_SIZE = 512
+
+
+def get_literal_bytes(ops):
+	"""
+	Counts the literal bytes of the delta.
+
+	*ops* (``list`` of ``tuple``) is the delta.
+
+	Returns the number of literal bytes (``int``).
+	"""
+	return sum(len(op[1]) for op in ops if op[0] == 'data')
+
+
+class DeltaTest(unittest.TestCase):
+	"""
+	The ``DeltaTest`` class tests computing and applying deltas.
+	"""
+
+	def setUp(self):
+		"""
+		Creates the test data.
+		"""
+		self.temp_dir = tempfile.mkdtemp()
+		rand = random.Random(0)
+		self.old_data = bytes(bytearray(rand.randrange(256) for _ in range(BLOCK_SIZE * 40)))
+
+		# Change a block in place, and insert data which shifts the rest.
+		new_data = bytearray(self.old_data)
+		new_data[BLOCK_SIZE * 5:BLOCK_SIZE * 5 + 10] = b'x' * 10
+		new_data[BLOCK_SIZE * 20:BLOCK_SIZE * 20] = b'inserted'
+		self.new_data = bytes(new_data)
+
+	def tearDown(self):
+		"""
+		Removes the temporary directory.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def get_delta(self):
+		"""
+		Computes the delta from the old data to the new data.
+
+		Returns the delta (``list`` of ``tuple``).
+		"""
+		signature = delta.compute_signature(io.BytesIO(self.old_data), BLOCK_SIZE)
+		return delta.compute_delta(self.new_data, signature)
+
+	def test_01_unchanged(self):
+		"""
+		Tests that unchanged data is copied entirely.
+		"""
+		signature = delta.compute_signature(io.BytesIO(self.old_data), BLOCK_SIZE)
+		ops = delta.compute_delta(self.old_data, signature)
+		self.assertEqual(ops, [('copy', 0, len(self.old_data))])
+
+	def test_02_changed(self):
+		"""
+		Tests that only the changed regions are literal.
+		"""
+		ops = self.get_delta()
+		self.assertLessEqual(get_literal_bytes(ops), BLOCK_SIZE * 3)
+
+	def apply(self):
+		"""
+		Writes the new file from the old file and the delta.
+
+		Returns the content of the new file (``bytes``), and the number of
+		bytes copied within the file system (``int``) and written (``int``)
+		as a ``tuple``.
+		"""
+		old_file = os.path.join(self.temp_dir, 'old')
+		new_file = os.path.join(self.temp_dir, 'new')
+		with open(old_file, 'wb') as fh:
+			fh.write(self.old_data)
+		with open(old_file, 'rb') as old_fh, open(new_file, 'wb', 0) as new_fh:
+			copied, written = delta.apply_delta(old_fh, new_fh, self.get_delta())
+		with open(new_file, 'rb') as fh:
+			return fh.read(), copied, written
+
+	def test_03_apply(self):
+		"""
+		Tests writing the new file by copying ranges within the file system
+		when it supports it.
+		"""
+		data, copied, written = self.apply()
+		self.assertEqual(data, self.new_data)
+		self.assertEqual(copied + written, len(self.new_data))
+
+	def test_04_apply_read(self):
+		"""
+		Tests writing the new file by reading the ranges of the old file when
+		the file system cannot copy them, or only copies part of a range.
+		"""
+		copy_range = delta.copy_range
+		for limit in (0, BLOCK_SIZE // 2):
+			delta.copy_range = lambda src_fh, dest_fh, offset, length: copy_range(src_fh, dest_fh, offset, min(length, limit))
+			try:
+				data, copied, written = self.apply()
+			finally:
+				delta.copy_range = copy_range
+			self.assertEqual(data, self.new_data)
+			self.assertLessEqual(copied, limit)
+			self.assertEqual(copied + written, len(self.new_data))
+
+	def test_05_apply_shorter(self):
+		"""
+		Tests writing a new file which is shorter than the old file.
+		"""
+		self.new_data = self.old_data[:BLOCK_SIZE * 10] + self.old_data[BLOCK_SIZE * 11:]
+		data, _, _ = self.apply()
+		self.assertEqual(data, self.new_data)
+
+
+class DeltaBenchmarkTest(unittest.TestCase):
+	"""
+	The ``DeltaBenchmarkTest`` class benchmarks computing the delta of a
+	mostly changed file.
+	"""
+
+	def test_01_bounded(self):
+		"""
+		Benchmark that the delta of a mostly changed file is abandoned after
+		scanning a bounded number of bytes instead of the whole file.
+		"""
+		max_misses = 256 * 1024
+		rand = random.Random(0)
+		old_data = bytes(bytearray(rand.randrange(256) for _ in range(BLOCK_SIZE * 64)))
+		new_data = os.urandom(max_misses * 8)
+		signature = delta.compute_signature(io.BytesIO(old_data), BLOCK_SIZE)
+
+		start = time.time()
+		self.assertIsNone(delta.compute_delta(new_data, signature, max_misses=max_misses))
+		bounded = time.time() - start
+
+		# Scanning the whole file is what the bound avoids.
+		start = time.time()
+		self.assertIsNotNone(delta.compute_delta(new_data[:max_misses * 2], signature, max_misses=len(new_data)))
+		unbounded = time.time() - start
+
+		self.assertLess(bounded, unbounded, "Bounded delta took {:.3f}s, scanning a quarter of the file {:.3f}s.".format(bounded, unbounded))
+
+	def test_02_small_change(self):
+		"""
+		Tests a small change within the bound still produces a delta.
+		"""
+		rand = random.Random(0)
+		old_data = bytes(bytearray(rand.randrange(256) for _ in range(BLOCK_SIZE * 64)))
+		new_data = old_data[:BLOCK_SIZE * 10] + b'x' * BLOCK_SIZE * 2 + old_data[BLOCK_SIZE * 10:]
+		signature = delta.compute_signature(io.BytesIO(old_data), BLOCK_SIZE)
+		ops = delta.compute_delta(new_data, signature, max_misses=BLOCK_SIZE * 4)
+		self.assertIsNotNone(ops)
+		self.assertLessEqual(get_literal_bytes(ops), BLOCK_SIZE * 3)
+
+
+class RebuildDeltaTest(unittest.TestCase):
+	"""
+	The ``RebuildDeltaTest`` class tests that building the same content
+	produces the same JAR so that delta installs stay small.
+	"""
+
+	def setUp(self):
+		"""
+		Creates the mod classes and library.
+		"""
+		self.temp_dir = tempfile.mkdtemp()
+		rand = random.Random(0)
+		self.class_files = []
+		for i in range(20):
+			path = os.path.join(self.temp_dir, 'Class{}.class'.format(i))
+			with open(path, 'wb') as fh:
+				fh.write(bytes(bytearray(rand.randrange(256) for _ in range(2000))))
+			self.class_files.append(path)
+
+		self.lib_file = os.path.join(self.temp_dir, 'lib.jar')
+		with zipfile.ZipFile(self.lib_file, 'w', zipfile.ZIP_DEFLATED) as lib_fh:
+			for i in range(20):
+				info = zipfile.ZipInfo('lib/Lib{}.class'.format(i), date_time=(2013, 7, 23, 12, 0, 0))
+				lib_fh.writestr(info, bytes(bytearray(rand.randrange(256) for _ in range(2000))))
+
+	def tearDown(self):
+		"""
+		Removes the temporary directory.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def build_jar(self, jar_name, mtime):
+		"""
+		Packages the mod JAR.
+
+		*jar_name* (``str``) is the file name of the JAR.
+
+		*mtime* (``float``) is the modified time to give the compiled mod
+		classes as if they were compiled again.
+
+		Returns the content of the JAR (``bytes``).
+		"""
+		jar_file = os.path.join(self.temp_dir, jar_name)
+		with zipfile.ZipFile(jar_file, 'w', zipfile.ZIP_DEFLATED) as mod_fh:
+			writer = PackageWriter(mod_fh)
+			for path in self.class_files:
+				os.utime(path, (mtime, mtime))
+				writer.write(path, 'mod/' + os.path.basename(path), "mod")
+			with zipfile.ZipFile(self.lib_file, 'r') as lib_fh:
+				for info in lib_fh.infolist():
+					writer.copy(lib_fh, info, info.filename, "lib")
+			writer.writestr('META-INF/INDEX.LIST', writer.get_jar_index(jar_name), "index")
+		with open(jar_file, 'rb') as fh:
+			return fh.read()
+
+	def test_01_rebuild(self):
+		"""
+		Tests that rebuilding unchanged content produces a near-zero delta.
+		"""
+		now = time.time()
+		old_data = self.build_jar('mod.jar', now - 3600)
+		new_data = self.build_jar('mod.jar', now)
+		signature = delta.compute_signature(io.BytesIO(old_data), BLOCK_SIZE)
+		ops = delta.compute_delta(new_data, signature)
+		self.assertLess(get_literal_bytes(ops), BLOCK_SIZE)
+
+	def test_02_entry_times(self):
+		"""
+		Tests that mod entries have a fixed modified time, and library
+		entries keep theirs.
+		"""
+		self.build_jar('mod.jar', time.time())
+		with zipfile.ZipFile(os.path.join(self.temp_dir, 'mod.jar'), 'r') as jar_fh:
+			self.assertEqual(jar_fh.getinfo('mod/Class0.class').date_time, (1980, 1, 1, 0, 0, 0))
+			self.assertEqual(jar_fh.getinfo('lib/Lib0.class').date_time, (2013, 7, 23, 12, 0, 0))
@@ -0,0 +1,121 @@
+# coding: utf-8
+"""
+This script tests the build history statistics.
+"""
+from __future__ import unicode_literals
+
+import io
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mcpackage.build import CHECKPOINT_STAGES
+from mcpackage.history import BuildHistory, StatsCommand
+
+
+class StatsTest(unittest.TestCase):
+	"""
+	The ``StatsTest`` class tests the statistics of the build history.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.temp_dir = tempfile.mkdtemp(prefix='mcpackage-test-')
+		self.history = BuildHistory(os.path.join(self.temp_dir, 'history.db'))
+
+	def tearDown(self):
+		"""
+		Called after each test.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def add_build(self, seconds, stages):
+		"""
+		Adds a successful build to the history.
+
+		*seconds* (``float``) is the total seconds of the build.
+
+		*stages* (``dict``) maps each stage which ran (``str``) to its
+		seconds (``float``). The other stages are recorded as skipped.
+		"""
+		self.history.add({
+			'started': 1388534400.0,
+			'name': 'example',
+			'config_file': 'mcpackage.yaml',
+			'forced': False,
+			'result': 0,
+			'seconds': seconds,
+			'jar_bytes': 1024,
+			'entries': 10,
+			'files': {},
+			'stages': [{'stage': 'scan', 'skipped': False, 'result': 0, 'seconds': 0.01}] + [
+				{'stage': stage, 'skipped': stage not in stages, 'result': 0 if stage in stages else None, 'seconds': stages.get(stage)}
+				for stage in CHECKPOINT_STAGES
+			],
+			'caches': {},
+		})
+
+	def get_rows(self, **args):
+		"""
+		Prints the trends, and parses the stage timings.
+
+		`**args` is the keyword arguments to send to ``StatsCommand()``.
+
+		Returns a ``tuple`` containing: the heading of the stage timings
+		(``str``), and a ``dict`` mapping each stage (``str``) to its row
+		(``list`` of ``str``).
+		"""
+		output = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+		old_stdout, sys.stdout = sys.stdout, output
+		try:
+			StatsCommand(config_file='mcpackage.yaml', **args).print_trends(self.history)
+		finally:
+			sys.stdout = old_stdout
+
+		lines = output.getvalue().splitlines()
+		start = next(i for i, line in enumerate(lines) if line.startswith("Stage timings"))
+		rows = {}
+		for line in lines[start + 2:]:
+			if not line:
+				break
+			cells = line.split()
+			rows[cells[0]] = cells
+		return lines[start], rows
+
+	def test_01_exclude_skipped(self):
+		"""
+		Test builds which skipped every stage are excluded by default.
+		"""
+		self.add_build(10.0, {'compile': 8.0, 'package': 1.0})
+		self.add_build(0.1, {})
+		self.add_build(0.1, {})
+		self.add_build(12.0, {'compile': 10.0, 'package': 1.0})
+
+		heading, rows = self.get_rows()
+		self.assertIn("last 2 successful build(s), excluding 2 skipped", heading)
+		self.assertEqual(rows['total'][1:4], ['2', '10.000', '12.000'])
+		self.assertEqual(rows['total'][-1], '+20%')
+
+		heading, rows = self.get_rows(include_skipped=True)
+		self.assertNotIn("skipped", heading)
+		self.assertEqual(rows['total'][1:3], ['4', '0.100'])
+
+	def test_02_stage_runs(self):
+		"""
+		Test the trend of each stage only uses the builds which ran it.
+		"""
+		self.add_build(10.0, {'compile': 8.0, 'package': 1.0})
+		self.add_build(2.0, {'package': 1.0})
+		self.add_build(2.0, {'package': 1.5})
+		self.add_build(10.0, {'compile': 4.0, 'package': 1.5})
+
+		_, rows = self.get_rows()
+		self.assertEqual(rows['compile'][1], '2')
+		self.assertEqual(rows['compile'][-1], '-50%')
+		self.assertEqual(rows['package'][1], '4')
+		self.assertEqual(rows['package'][-1], '+50%')
+		self.assertNotIn('copy', rows)
@@ -0,0 +1,206 @@
+# coding: utf-8
+"""
+This script tests and benchmarks indexing the mod JAR.
+"""
+from __future__ import unicode_literals
+
+import os
+import os.path
+import posixpath
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+
+from mcpackage.build import BuildCommand, JAR_INDEX_FILE, MODULE_MAP_FILE
+from mcpackage.library import PackageWriter
+
+#: The number of times to resolve the names with each loader. The fastest
+#: run is used to ignore noise from other processes.
+REPEAT = 5
+
+#: The number of packages of library classes in the example mod JAR.
+LIBRARY_PACKAGES = 40
+
+#: The number of classes in each library package.
+LIBRARY_CLASSES = 50
+
+
+class StubLoader(object):
+	"""
+	The ``StubLoader`` class resolves classes and python modules from a mod
+	JAR like a class loader and PyMod would. Without an index, it has to
+	search the entries of the JAR. With an index, it only looks up the
+	package and module maps.
+	"""
+
+	def __init__(self, zip_fh, indexed):
+		"""
+		Initializes the ``StubLoader`` instance.
+
+		*zip_fh* (``zipfile.ZipFile``) is the mod JAR.
+
+		*indexed* (``bool``) is whether to use the index of the mod JAR.
+		"""
+
+		self.modules = None
+		"""
+		*modules* (``dict``) maps each python module (``str``) to its class
+		entry (``str``), or is ``None`` without an index.
+		"""
+
+		self.packages = None
+		"""
+		*packages* (``set`` of ``str``) contains the indexed package
+		directories, or is ``None`` without an index.
+		"""
+
+		self.zip_fh = zip_fh
+		"""
+		*zip_fh* (``zipfile.ZipFile``) is the mod JAR.
+		"""
+
+		if indexed:
+			lines = zip_fh.read(JAR_INDEX_FILE).decode('UTF-8').splitlines()
+			self.packages = set(line for line in lines[3:] if line)
+			self.modules = dict(line.split('=', 1) for line in zip_fh.read(MODULE_MAP_FILE).decode('UTF-8').splitlines() if line)
+
+	def find_class(self, name):
+		"""
+		Finds the class.
+
+		*name* (``str``) is the internal name of the class.
+
+		Returns the entry of the class (``str``), or ``None`` if it is not in
+		the mod JAR.
+		"""
+		entry = name + '.class'
+		if self.packages is not None:
+			if posixpath.dirname(entry) not in self.packages:
+				return None
+			return entry if entry in self.zip_fh.NameToInfo else None
+		for info in self.zip_fh.infolist():
+			if info.filename == entry:
+				return entry
+		return None
+
+	def find_module(self, module):
+		"""
+		Finds the python module.
+
+		*module* (``str``) is the name of the module.
+
+		Returns the entry of the compiled module (``str``), or ``None`` if it
+		is not in the mod JAR.
+		"""
+		if self.modules is not None:
+			return self.modules.get(module)
+		path = module.replace('.', '/')
+		for entry in (path + '$py.class', path + '/__init__$py.class'):
+			for info in self.zip_fh.infolist():
+				if info.filename == entry:
+					return entry
+		return None
+
+
+class JarIndexTest(unittest.TestCase):
+	"""
+	The ``JarIndexTest`` class tests and benchmarks the index of the mod
+	JAR.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.temp_dir = tempfile.mkdtemp(prefix='mcpackage-test-')
+
+	def tearDown(self):
+		"""
+		Called after each test.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def write_jar(self, indexed):
+		"""
+		Writes the example mod JAR.
+
+		*indexed* (``bool``) is whether the mod JAR should be indexed.
+
+		Returns the path of the mod JAR (``str``).
+		"""
+		jar_file = os.path.join(self.temp_dir, 'indexed.jar' if indexed else 'plain.jar')
+		command = BuildCommand(os.path.join(self.temp_dir, 'mcpackage.yaml'))
+		command.python_class_files = {}
+		with zipfile.ZipFile(jar_file, 'w', zipfile.ZIP_STORED) as zip_fh:
+			writer = PackageWriter(zip_fh)
+			writer.writestr('mcmod.info', b'[]', 'build')
+			writer.writestr('META-INF/MANIFEST.MF', b'Manifest-Version: 1.0\n', 'build')
+			writer.writestr('assets/example/lang/en_US.lang', b'', 'build')
+			writer.writestr('com/example/ExampleMod.class', b'mod', 'build')
+			for name in ('__init__', 'example/__init__', 'example/blocks', 'example/items'):
+				class_file = name + '$py.class'
+				command.python_class_files[class_file.replace('/', os.sep)] = None
+				writer.writestr(class_file, b'python', 'build')
+			for i in range(LIBRARY_PACKAGES):
+				for j in range(LIBRARY_CLASSES):
+					writer.writestr('com/lib/p{}/C{}.class'.format(i, j), b'lib', 'lib.jar')
+			if indexed:
+				writer.writestr(JAR_INDEX_FILE, writer.get_jar_index(os.path.basename(jar_file)), 'index')
+				writer.writestr(MODULE_MAP_FILE, command.get_module_map(), 'index')
+		return jar_file
+
+	def test_01_packages(self):
+		"""
+		Test the JAR index lists every directory containing entries, and the
+		entries at the root.
+		"""
+		with zipfile.ZipFile(self.write_jar(True), 'r') as zip_fh:
+			lines = zip_fh.read(JAR_INDEX_FILE).decode('UTF-8').splitlines()
+			names = zip_fh.namelist()
+
+		self.assertEqual(lines[:3], ["JarIndex-Version: 1.0", "", 'indexed.jar'])
+		expected = set(posixpath.dirname(name) or name for name in names if not name.startswith('META-INF/'))
+		self.assertEqual(set(lines[3:]) - {''}, expected)
+		self.assertIn('com/lib/p0', expected)
+		self.assertIn('assets/example/lang', expected)
+		self.assertIn('mcmod.info', expected)
+
+	def test_02_modules(self):
+		"""
+		Test the module map lists every python module.
+		"""
+		with zipfile.ZipFile(self.write_jar(True), 'r') as zip_fh:
+			loader = StubLoader(zip_fh, True)
+		self.assertEqual(loader.modules, {
+			'example': 'example/__init__$py.class',
+			'example.blocks': 'example/blocks$py.class',
+			'example.items': 'example/items$py.class',
+		})
+
+	def test_03_resolve_benchmark(self):
+		"""
+		Benchmark resolving classes and modules from the indexed mod JAR
+		against the unindexed mod JAR.
+		"""
+		classes = ['com/example/ExampleMod', 'net/minecraft/block/Block', 'java/lang/String', 'com/lib/p0/Missing']
+		classes.extend('com/lib/p{}/C{}'.format(i, i % LIBRARY_CLASSES) for i in range(0, LIBRARY_PACKAGES, 3))
+		modules = ['example', 'example.blocks', 'example.items', 'example.missing', 'os']
+
+		times, results = {}, {}
+		for indexed in (False, True):
+			with zipfile.ZipFile(self.write_jar(indexed), 'r') as zip_fh:
+				best = None
+				for _ in range(REPEAT):
+					start = time.time()
+					loader = StubLoader(zip_fh, indexed)
+					found = [loader.find_class(name) for name in classes] + [loader.find_module(name) for name in modules]
+					seconds = time.time() - start
+					if best is None or seconds < best:
+						best = seconds
+			times[indexed], results[indexed] = best, found
+
+		self.assertEqual(results[True], results[False])
+		self.assertEqual(results[True][:4], ['com/example/ExampleMod.class', None, None, None])
+		self.assertLess(times[True], times[False], "Indexed resolving took {:.6f}s, unindexed {:.6f}s.".format(times[True], times[False]))
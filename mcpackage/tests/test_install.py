@@ -0,0 +1,164 @@
+# coding: utf-8
+"""
+This script tests the install command.
+"""
+from __future__ import unicode_literals
+
+import errno
+import json
+import logging
+import os
+import os.path
+import random
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from mcpackage import delta, util
+from mcpackage.install import MCMOD_INFO_FILE, InstallCommand, get_mod_ids
+
+
+class GetModIdsTest(unittest.TestCase):
+	"""
+	The ``GetModIdsTest`` class tests the ``get_mod_ids()`` function.
+	"""
+
+	def setUp(self):
+		"""
+		Creates the temporary directory.
+		"""
+		self.temp_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		"""
+		Removes the temporary directory.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def write_jar(self, info):
+		"""
+		Writes a mod JAR.
+
+		*info* is the JSON value of its mod information file.
+
+		Returns the path of the JAR (``str``).
+		"""
+		jar_file = os.path.join(self.temp_dir, 'mod.jar')
+		with zipfile.ZipFile(jar_file, 'w') as jar_fh:
+			jar_fh.writestr(MCMOD_INFO_FILE, json.dumps(info))
+		return jar_file
+
+	def test_01_list(self):
+		"""
+		Tests the version 1 list of mods.
+		"""
+		jar_file = self.write_jar([{'modid': 'a'}, {'modid': 'b'}])
+		self.assertEqual(get_mod_ids(jar_file), {'a', 'b'})
+
+	def test_02_template(self):
+		"""
+		Tests the version 2 spelling of the mcmod.info template.
+		"""
+		jar_file = self.write_jar({'modinfoversion': 2, 'modlist': [{'modid': 'a'}]})
+		self.assertEqual(get_mod_ids(jar_file), {'a'})
+
+	def test_03_camel_case(self):
+		"""
+		Tests the camel case spelling of version 2.
+		"""
+		jar_file = self.write_jar({'modInfoVersion': 2, 'modList': [{'modId': 'a'}]})
+		self.assertEqual(get_mod_ids(jar_file), {'a'})
+
+	def test_04_invalid(self):
+		"""
+		Tests JARs without valid mod information.
+		"""
+		self.assertEqual(get_mod_ids(self.write_jar({'modlist': None})), set())
+		self.assertEqual(get_mod_ids(self.write_jar(['a', {}])), set())
+		self.assertEqual(get_mod_ids(os.path.join(self.temp_dir, 'missing.jar')), set())
+
+
+class InstallDeltaTest(unittest.TestCase):
+	"""
+	The ``InstallDeltaTest`` class tests delta installs on a file system
+	which cannot link or copy ranges (e.g., SSHFS).
+	"""
+
+	def setUp(self):
+		"""
+		Creates the installed JAR and the new mod JAR.
+		"""
+		self.temp_dir = tempfile.mkdtemp()
+		self.mods_dir = os.path.join(self.temp_dir, 'mods')
+		os.mkdir(self.mods_dir)
+
+		rand = random.Random(0)
+		self.old_data = bytes(bytearray(rand.randrange(256) for _ in range(64 * 1024)))
+		self.new_data = self.old_data[:1000] + b'changed' + self.old_data[1000:]
+		self.jar_file = os.path.join(self.temp_dir, 'mod.jar')
+		with open(self.jar_file, 'wb') as fh:
+			fh.write(self.new_data)
+		self.dest_file = os.path.join(self.mods_dir, 'mod.jar')
+		with open(self.dest_file, 'wb') as fh:
+			fh.write(self.old_data)
+
+		self.command = InstallCommand(os.path.join(self.temp_dir, 'mcpackage.yaml'), delta=True)
+		self.command.config = {'build': {'dir': self.temp_dir}, 'install': {'delta_block_size': 1024}}
+		self.command.log = logging.getLogger('test')
+
+		# Emulate a remote mount.
+		self.link, self.copy_range = os.link, delta.copy_range
+		os.link = self.fail_link
+		delta.copy_range = lambda src_fh, dest_fh, offset, length: 0
+
+	def tearDown(self):
+		"""
+		Restores the emulated functions, and removes the temporary directory.
+		"""
+		os.link, delta.copy_range = self.link, self.copy_range
+		shutil.rmtree(self.temp_dir)
+
+	def fail_link(self, src, dest):
+		"""
+		Fails to create a hard link as on a different file system.
+		"""
+		raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+	def test_01_replace(self):
+		"""
+		Tests the installed JAR is replaced instead of written in place so
+		that a client which has it open never sees torn content.
+		"""
+		with open(self.dest_file, 'rb') as open_fh:
+			status = self.command.install_jar(self.jar_file, self.new_data, util.file_digest(self.jar_file), set(), self.mods_dir)
+			self.assertEqual(open_fh.read(), self.old_data)
+
+		self.assertTrue(status.startswith('delta'), status)
+		with open(self.dest_file, 'rb') as fh:
+			self.assertEqual(fh.read(), self.new_data)
+		self.assertEqual(os.listdir(self.mods_dir), ['mod.jar'])
+
+	def test_02_mismatch(self):
+		"""
+		Tests the installed JAR is untouched until the delta is verified, and
+		a mismatched delta falls back to a copy.
+		"""
+		apply_delta = delta.apply_delta
+
+		def corrupt_delta(old_fh, new_fh, ops):
+			with open(self.dest_file, 'rb') as fh:
+				self.assertEqual(fh.read(), self.old_data)
+			result = apply_delta(old_fh, new_fh, ops)
+			new_fh.write(b'corrupt')
+			return result
+
+		delta.apply_delta = corrupt_delta
+		try:
+			status = self.command.install_jar(self.jar_file, self.new_data, util.file_digest(self.jar_file), set(), self.mods_dir)
+		finally:
+			delta.apply_delta = apply_delta
+
+		self.assertEqual(status, 'copied')
+		with open(self.dest_file, 'rb') as fh:
+			self.assertEqual(fh.read(), self.new_data)
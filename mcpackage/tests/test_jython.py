@@ -0,0 +1,131 @@
+# coding: utf-8
+"""
+This script tests compiling python source with a running Jython.
+"""
+from __future__ import unicode_literals
+
+import copy
+import importlib.util
+import io
+import logging
+import marshal
+import os
+import os.path
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from mcpackage.build import BuildCommand, DEFAULT_CONFIG, JythonWorker
+
+#: The fake Jython executable. It runs the script given with "-c" using
+#: the python running the tests.
+FAKE_JYTHON = "\n".join([
+	"#!{python}",
+	"import sys",
+	"if sys.argv[1:2] == ['--version']:",
+	"    print('Jython 2.7.0')",
+	"    sys.exit(0)",
+	"script = sys.argv[2]",
+	"sys.argv = ['-c'] + sys.argv[3:]",
+	"exec(script)",
+	"",
+])
+
+
+class JythonWorkerTest(unittest.TestCase):
+	"""
+	The ``JythonWorkerTest`` class tests compiling python source with a
+	running Jython.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.temp_dir = tempfile.mkdtemp(prefix='mcpackage-test-')
+		self.jython_exe = os.path.join(self.temp_dir, 'jython')
+		with io.open(self.jython_exe, 'w', encoding='UTF-8') as fh:
+			fh.write(FAKE_JYTHON.format(python=sys.executable))
+		os.chmod(self.jython_exe, os.stat(self.jython_exe).st_mode | stat.S_IXUSR)
+
+		self.build_dir = os.path.join(self.temp_dir, 'build')
+		self.dest_dir = os.path.join(self.build_dir, 'src', 'minecraft')
+		os.makedirs(self.dest_dir)
+		with io.open(os.path.join(self.dest_dir, 'example.py'), 'w', encoding='UTF-8') as fh:
+			fh.write("VALUE = 1\n")
+
+		self.command = BuildCommand(os.path.join(self.temp_dir, 'mcpackage.yaml'))
+		self.command.config = copy.deepcopy(DEFAULT_CONFIG)
+		self.command.config['build']['dir'] = self.build_dir
+		self.command.config['jython']['jython_exe'] = self.jython_exe
+		self.command.config['jython_cache']['enabled'] = False
+		self.command.keep_jython = True
+		self.command.log = logging.getLogger('mcpackage-test')
+		self.command.python_class_files = {'example$py.class': {'path': 'example.py'}}
+
+	def tearDown(self):
+		"""
+		Called after each test.
+		"""
+		self.command.close()
+		shutil.rmtree(self.temp_dir)
+
+	def test_01_monitor_first_compile(self):
+		"""
+		Test Jython is monitored on the first compile, and after it exits.
+		"""
+		pids = []
+
+		def start_monitor(pid, name):
+			self.assertTrue(self.command.jython_worker.is_running())
+			pids.append(pid)
+			return None
+
+		self.command.start_monitor = start_monitor
+		self.assertEqual(self.command.stage_jython(), 0)
+		self.assertEqual(len(pids), 1)
+
+		# Reuse the running Jython.
+		self.assertEqual(self.command.stage_jython(), 0)
+		self.assertEqual(pids[1:], pids[:1])
+
+		# Restart Jython after it exits.
+		process = self.command.jython_worker.process
+		process.stdin.close()
+		process.wait()
+		self.assertFalse(self.command.jython_worker.is_running())
+		self.assertEqual(self.command.stage_jython(), 0)
+		self.assertEqual(len(pids), 3)
+		self.assertNotEqual(pids[2], pids[0])
+
+	def test_02_is_running(self):
+		"""
+		Test the worker is only running once it has been started, and until
+		it is closed.
+		"""
+		worker = JythonWorker([self.jython_exe])
+		self.assertFalse(worker.is_running())
+		worker.start()
+		try:
+			self.assertTrue(worker.is_running())
+		finally:
+			worker.close()
+		self.assertFalse(worker.is_running())
+
+	def test_03_relative_paths(self):
+		"""
+		Test the cache misses are compiled relative to the destination
+		directory so that the compiled classes do not record the workspace.
+		"""
+		self.command.config['jython_cache']['enabled'] = True
+		self.command.config['jython_cache']['dir'] = os.path.join(self.temp_dir, 'cache')
+		self.assertEqual(self.command.stage_jython(), 0)
+
+		# - NOTE: The fake Jython compiles with python, so the source file is
+		#   recorded in its byte-code instead of a "$py.class" file.
+		source_file = os.path.join(self.dest_dir, 'example.py')
+		with open(importlib.util.cache_from_source(source_file), 'rb') as fh:
+			code = marshal.loads(fh.read()[16:])
+		self.assertEqual(code.co_filename, 'example.py')
@@ -0,0 +1,156 @@
+# coding: utf-8
+"""
+This script tests the cache of compiled python classes.
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+import os.path
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+
+from mcpackage.jythoncache import JythonCache, VERSIONS_FILE
+
+#: The fake Jython executable. It prints its version, and counts how many
+#: times it was run in the file next to it.
+FAKE_JYTHON = "\n".join([
+	"#!{python}",
+	"import os, sys",
+	"count_file = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), 'count')",
+	"count = int(open(count_file).read()) if os.path.exists(count_file) else 0",
+	"open(count_file, 'w').write(str(count + 1))",
+	"print('Jython 2.7.0')",
+	"",
+])
+
+
+class JythonCacheTest(unittest.TestCase):
+	"""
+	The ``JythonCacheTest`` class tests the cache of compiled python
+	classes.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.temp_dir = tempfile.mkdtemp(prefix='mcpackage-test-')
+		self.cache_dir = os.path.join(self.temp_dir, 'cache')
+		self.cache = JythonCache(self.cache_dir, 1500)
+
+	def tearDown(self):
+		"""
+		Called after each test.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def get_files(self):
+		"""
+		Lists the files in the cache.
+
+		Returns the file names (``list`` of ``str``).
+		"""
+		names = []
+		for _, _, file_names in os.walk(self.cache_dir):
+			names.extend(file_names)
+		return sorted(names)
+
+	def test_01_prune(self):
+		"""
+		Test the least recently used classes are evicted until the cache is
+		within its maximum size.
+		"""
+		keys = [self.cache.get_key('2.7.0', 'mod{}.py'.format(i), b'') for i in range(5)]
+		for i, key in enumerate(keys):
+			self.cache.put(key, b'x' * 300)
+			os.utime(self.cache.get_path(key), (1000 + i, 1000 + i))
+		self.assertEqual(self.cache.prune(), 0)
+
+		# Using the oldest class makes it the most recently used.
+		self.cache.max_size = 700
+		self.assertEqual(self.cache.get(keys[0]), b'x' * 300)
+		self.assertEqual(self.cache.prune(), 3)
+		self.assertEqual(self.get_files(), sorted([keys[0] + '.class', keys[4] + '.class']))
+		self.assertIsNone(self.cache.get(keys[1]))
+
+	def test_02_get_evicted(self):
+		"""
+		Test getting a class which is evicted by another build while it is
+		being read returns nothing.
+		"""
+		key = self.cache.get_key('2.7.0', 'mod.py', b'')
+		self.assertIsNone(self.cache.get(key))
+		self.cache.put(key, b'class')
+
+		path = self.cache.get_path(key)
+		old_utime = os.utime
+
+		def utime(utime_path, times):
+			os.remove(utime_path)
+			old_utime(utime_path, times)
+
+		os.utime = utime
+		try:
+			self.assertIsNone(self.cache.get(key))
+		finally:
+			os.utime = old_utime
+		self.assertFalse(os.path.exists(path))
+
+	def test_03_concurrent_writes(self):
+		"""
+		Test concurrent builds writing the same class never leave a partial
+		class or temporary files behind.
+		"""
+		key = self.cache.get_key('2.7.0', 'mod.py', b'')
+		values = [bytes(bytearray([i])) * 4096 for i in range(8)]
+		errors = []
+
+		def write(value):
+			try:
+				for _ in range(20):
+					self.cache.put(key, value)
+					data = self.cache.get(key)
+					if data not in values:
+						errors.append(data)
+			except Exception as e:
+				errors.append(e)
+
+		threads = [threading.Thread(target=write, args=(value,)) for value in values]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		del thread
+
+		self.assertEqual(errors, [])
+		self.assertIn(self.cache.get(key), values)
+		self.assertEqual(self.get_files(), [key + '.class'])
+
+	def test_04_get_version(self):
+		"""
+		Test the version of Jython is only determined once for each Jython
+		installation.
+		"""
+		jython_exe = os.path.join(self.temp_dir, 'jython')
+		count_file = os.path.join(self.temp_dir, 'count')
+		with io.open(jython_exe, 'w', encoding='UTF-8') as fh:
+			fh.write(FAKE_JYTHON.format(python=sys.executable))
+		os.chmod(jython_exe, os.stat(jython_exe).st_mode | stat.S_IXUSR)
+
+		for _ in range(2):
+			self.assertEqual(self.cache.get_version([jython_exe]), 'Jython 2.7.0')
+			with io.open(count_file, 'r', encoding='UTF-8') as fh:
+				self.assertEqual(fh.read(), '1')
+		self.assertTrue(os.path.exists(os.path.join(self.cache_dir, VERSIONS_FILE)))
+
+		# A changed Jython installation is run again.
+		with io.open(jython_exe, 'a', encoding='UTF-8') as fh:
+			fh.write("# changed\n")
+		self.assertEqual(self.cache.get_version([jython_exe]), 'Jython 2.7.0')
+		with io.open(count_file, 'r', encoding='UTF-8') as fh:
+			self.assertEqual(fh.read(), '2')
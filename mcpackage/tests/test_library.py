@@ -0,0 +1,246 @@
+# coding: utf-8
+"""
+This script tests processing the libraries packaged with the mod JAR.
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+import os.path
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+
+import pathspec
+
+from mcpackage.classfile import parse_class
+from mcpackage.library import PackageWriter, Relocator, shrink_libraries
+from mcpackage.tests.util import ClassBuilder
+
+
+class PackageWriterTest(unittest.TestCase):
+	"""
+	The ``PackageWriterTest`` class tests writing the entries of the mod
+	JAR.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.temp_dir = tempfile.mkdtemp(prefix='mcpackage-test-')
+		self.jar_file = os.path.join(self.temp_dir, 'example.jar')
+		self.lib_file = os.path.join(self.temp_dir, 'lib.jar')
+		self.report_file = os.path.join(self.temp_dir, 'conflicts.txt')
+
+		with zipfile.ZipFile(self.lib_file, 'w', zipfile.ZIP_DEFLATED) as zip_fh:
+			zip_fh.writestr('com/lib/Lib.class', b'lib')
+			zip_fh.writestr('com/example/Same.class', b'same')
+			zip_fh.writestr('com/example/Other.class', b'lib other')
+
+	def tearDown(self):
+		"""
+		Called after each test.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def test_01_duplicates_and_conflicts(self):
+		"""
+		Test identical entries are skipped as duplicates, and different
+		entries are skipped as conflicts while keeping the first.
+		"""
+		with zipfile.ZipFile(self.jar_file, 'w', zipfile.ZIP_DEFLATED) as zip_fh:
+			writer = PackageWriter(zip_fh)
+			self.assertTrue(writer.writestr('com/example/Same.class', b'same', 'build'))
+			self.assertTrue(writer.writestr('com/example/Other.class', b'build other', 'build'))
+			with zipfile.ZipFile(self.lib_file, 'r') as lib_fh:
+				written = [writer.copy(lib_fh, info, info.filename, 'lib.jar') for info in lib_fh.infolist()]
+			self.assertFalse(writer.writestr('com/example/Same.class', b'same', 'other.jar'))
+			self.assertFalse(writer.writestr('com/example/Other.class', b'other', 'other.jar'))
+			writer.write_report(self.report_file)
+
+		self.assertEqual(written, [True, False, False])
+		self.assertEqual(writer.duplicates, 2)
+		self.assertEqual(writer.conflicts, [
+			('com/example/Other.class', 'build', 'lib.jar'),
+			('com/example/Other.class', 'build', 'other.jar'),
+		])
+
+		with zipfile.ZipFile(self.jar_file, 'r') as zip_fh:
+			self.assertEqual(sorted(zip_fh.namelist()), [
+				'com/example/Other.class',
+				'com/example/Same.class',
+				'com/lib/Lib.class',
+			])
+			self.assertEqual(zip_fh.read('com/example/Other.class'), b'build other')
+
+		with io.open(self.report_file, 'r', encoding='UTF-8') as fh:
+			report = fh.read()
+		self.assertEqual(report, (
+			"com/example/Other.class\n  kept: build\n  skipped: lib.jar\n"
+			"com/example/Other.class\n  kept: build\n  skipped: other.jar\n"
+		))
+
+	def test_02_no_conflicts(self):
+		"""
+		Test the report is removed when there are no conflicts.
+		"""
+		with io.open(self.report_file, 'w', encoding='UTF-8') as fh:
+			fh.write("stale\n")
+
+		with zipfile.ZipFile(self.jar_file, 'w', zipfile.ZIP_DEFLATED) as zip_fh:
+			writer = PackageWriter(zip_fh)
+			writer.writestr('com/example/Same.class', b'same', 'build')
+			writer.writestr('com/example/Same.class', b'same', 'lib.jar')
+			writer.write_report(self.report_file)
+
+		self.assertEqual(writer.duplicates, 1)
+		self.assertEqual(writer.conflicts, [])
+		self.assertFalse(os.path.exists(self.report_file))
+
+
+class RelocatorTest(unittest.TestCase):
+	"""
+	The ``RelocatorTest`` class tests relocating (shading) classes.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.relocator = Relocator([('com.lib', 'shaded.lib')])
+
+	def build_class(self, strings=()):
+		"""
+		Assembles a library class.
+
+		*strings* (``Iterable`` of ``str``) contains the string constants
+		to add.
+
+		Returns the class file (``bytes``).
+		"""
+		builder = ClassBuilder()
+		for value in strings:
+			builder.string(value)
+		builder.class_('[Lcom/lib/Array;')
+		builder.class_('com/library/Other')
+		return builder.build(
+			'com/lib/Foo',
+			super_name='com/lib/Base',
+			fields=[
+				('bar', 'Lcom/lib/Bar;', []),
+				('items', 'Ljava/util/List;', [builder.attribute('Signature', struct.pack('>H', builder.utf8('Ljava/util/List<+Lcom/lib/Item;>;')))]),
+			],
+			methods=[
+				('get', '(Ljava/lang/Object;)Ljava/lang/Object;', [
+					builder.attribute('Signature', struct.pack('>H', builder.utf8('<LIST:Lcom/lib/Bound;>(TLIST;)Lcom/lib/Outer<TLIST;>.Inner;'))),
+				]),
+			],
+		)
+
+	def test_01_classes(self):
+		"""
+		Test relocating class names, descriptors and signatures.
+		"""
+		info = parse_class(self.relocator.relocate_class(self.build_class()))
+		self.assertEqual(info['name'], 'shaded/lib/Foo')
+		self.assertEqual(info['super'], 'shaded/lib/Base')
+		self.assertEqual(info['references'], [
+			'com/library/Other',
+			'java/lang/Object',
+			'java/util/List',
+			'shaded/lib/Array',
+			'shaded/lib/Bar',
+			'shaded/lib/Base',
+			'shaded/lib/Bound',
+			'shaded/lib/Item',
+			'shaded/lib/Outer$Inner',
+		])
+
+	def test_02_strings(self):
+		"""
+		Test only relocating string constants which are class names.
+		"""
+		data = self.relocator.relocate_class(self.build_class(strings=[
+			"com.lib.Plugin",
+			"com/lib/resource",
+			"Lcom/lib/Bar; is not a class name",
+			"com.library.Plugin",
+			"com.lib",
+		]))
+		self.assertIn(b'shaded.lib.Plugin', data)
+		self.assertIn(b'shaded/lib/resource', data)
+		self.assertIn(b'Lcom/lib/Bar; is not a class name', data)
+		self.assertIn(b'com.library.Plugin', data)
+		self.assertIn(b'\x00\x07com.lib', data)
+
+	def test_03_unchanged(self):
+		"""
+		Test classes are unchanged without rules, or when they are invalid.
+		"""
+		data = self.build_class()
+		self.assertEqual(Relocator([]).relocate_class(data), data)
+		self.assertEqual(self.relocator.relocate_class(data[:-1]), data[:-1])
+
+	def test_04_names(self):
+		"""
+		Test relocating the names of entries.
+		"""
+		self.assertEqual(self.relocator.relocate_name('com/lib/Foo.class'), 'shaded/lib/Foo.class')
+		self.assertEqual(self.relocator.relocate_name('com/library/Foo.class'), 'com/library/Foo.class')
+		self.assertEqual(self.relocator.relocate_name('assets/com/lib/foo.png'), 'assets/com/lib/foo.png')
+
+
+class ShrinkLibrariesTest(unittest.TestCase):
+	"""
+	The ``ShrinkLibrariesTest`` class tests removing the library classes
+	which cannot be reached from the mod.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.temp_dir = tempfile.mkdtemp(prefix='mcpackage-test-')
+		self.cache_dir = os.path.join(self.temp_dir, 'cache')
+		self.lib_file = os.path.join(self.temp_dir, 'lib.jar')
+		with zipfile.ZipFile(self.lib_file, 'w', zipfile.ZIP_DEFLATED) as zip_fh:
+			for name, desc in (('A', 'Lcom/lib/B;'), ('B', 'I'), ('C', 'I')):
+				builder = ClassBuilder()
+				zip_fh.writestr('com/lib/{}.class'.format(name), builder.build('com/lib/' + name, fields=[('value', desc, [])]))
+
+	def tearDown(self):
+		"""
+		Called after each test.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def shrink(self, keep):
+		"""
+		Determines the library classes to remove.
+
+		*keep* (``list`` of ``str``) contains the patterns of the classes to
+		always keep.
+
+		Returns the class entries to remove (``list`` of ``str``).
+		"""
+		keep_spec = pathspec.PathSpec.from_lines('gitignore', keep)
+		remove = shrink_libraries([(self.lib_file, 'digest')], ['com/lib/A'], keep_spec, self.cache_dir)
+		return sorted(remove[self.lib_file])
+
+	def test_01_reachable(self):
+		"""
+		Test only the classes reachable from the mod are kept.
+		"""
+		self.assertEqual(self.shrink([]), ['com/lib/C.class'])
+
+	def test_02_keep_negation(self):
+		"""
+		Test negating a keep pattern is not answered from the cache of the
+		positive pattern.
+		"""
+		self.assertEqual(self.shrink(['com/lib/*.class', 'com/lib/C.class']), [])
+		self.assertEqual(self.shrink(['com/lib/*.class', '!com/lib/C.class']), ['com/lib/C.class'])
+		self.assertEqual(self.shrink(['com/lib/*.class', 'com/lib/C.class']), [])
@@ -0,0 +1,75 @@
+# coding: utf-8
+"""
+This script tests that the commands remove their logging handlers when
+they finish.
+"""
+from __future__ import unicode_literals
+
+import io
+import logging
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from mcpackage.init import ManifestCommand
+from mcpackage.scale import ScaleCommand
+from mcpackage.synthetic import SyntheticCommand
+
+
+class LoggingTest(unittest.TestCase):
+	"""
+	The ``LoggingTest`` class tests that running commands within the same
+	process does not leave logging handlers behind.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.temp_dir = tempfile.mkdtemp(prefix='mcpackage-test-')
+		self.forge_dir = os.path.join(self.temp_dir, 'forge')
+		self.handlers = list(logging.getLogger().handlers)
+
+	def tearDown(self):
+		"""
+		Called after each test.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def test_01_synth(self):
+		"""
+		Test the "synth" command removes its handler.
+		"""
+		for i in range(2):
+			SyntheticCommand(mod_dir=os.path.join(self.temp_dir, 'mod{}'.format(i)), forge_dir=self.forge_dir, java=1).run()
+			self.assertEqual(logging.getLogger().handlers, self.handlers)
+
+	def test_02_scale(self):
+		"""
+		Test the "scale" command removes its handler.
+		"""
+		for i in range(2):
+			ScaleCommand(forge_dir=self.forge_dir, work_dir=os.path.join(self.temp_dir, 'work{}'.format(i)), java='1', python='0', assets='0', libraries='0').run()
+			self.assertEqual(logging.getLogger().handlers, self.handlers)
+
+	def test_03_manifest(self):
+		"""
+		Test the "init" command with a manifest removes its handler.
+		"""
+		manifest_file = os.path.join(self.temp_dir, 'manifest.yaml')
+		with io.open(manifest_file, 'w', encoding='UTF-8') as fh:
+			fh.write("mods:\n- {mod_name: Example, mod_namespace: example.mod, mod_dir: example}\n")
+		for i in range(2):
+			result = ManifestCommand(
+				manifest_file,
+				force=True,
+				mod_type='java',
+				config_file='mcpackage.yaml',
+				forge_dir=self.forge_dir,
+				build_dir='build',
+				library_dir='lib',
+				source_dir='src',
+			).run()
+			self.assertEqual(result, 0)
+			self.assertEqual(logging.getLogger().handlers, self.handlers)
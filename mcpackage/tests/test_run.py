@@ -0,0 +1,139 @@
+# coding: utf-8
+"""
+This script tests the run command with a stub Java launcher which prints
+representative FML log lines.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import os.path
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+import zipfile
+
+import mcpackage
+from mcpackage.run import LAUNCH_TIMES_FILE
+
+#: The stub Java launcher. Each log line is followed by a delay in units
+#: of the *STUB_DELAY* environment variable so that the phases take known
+#: times.
+STUB_LAUNCHER = """
+import os
+import sys
+import time
+
+delay = float(os.environ.get('STUB_DELAY', '0.1'))
+for line, units in [
+	("[INFO] [ForgeModLoader] Forge Mod Loader version 6.4.49.965 for Minecraft 1.6.4 loading", 0),
+	("[INFO] [ForgeModLoader] Searching mods for classes, identified 4 mods to load", 1),
+	("[FINE] [ForgeModLoader] Sending event FMLPreInitializationEvent to mod examplemod", 3),
+	("[FINE] [ForgeModLoader] Sending event FMLInitializationEvent to mod forge", 1),
+	("[FINE] [ForgeModLoader] Sending event FMLInitializationEvent to mod examplemod", 2),
+	("[FINE] [ForgeModLoader] Sending event FMLPostInitializationEvent to mod forge", 1),
+	("[INFO] [Minecraft-Server] Starting integrated minecraft server version 1.6.4", 1),
+	("[INFO] [Minecraft-Server] Done (1.23s)! For help, type \\"help\\" or \\"?\\"", 0),
+]:
+	sys.stdout.write(line + "\\n")
+	sys.stdout.flush()
+	time.sleep(units * delay)
+"""
+
+#: The number of seconds the results may be off by because of scheduling.
+TOLERANCE = 0.08
+
+
+class RunCommandTest(unittest.TestCase):
+	"""
+	The ``RunCommandTest`` class tests the ``RunCommand`` class.
+	"""
+
+	def setUp(self):
+		"""
+		Creates the mod with its built JAR, and the stub Java launcher.
+		"""
+		self.mod_dir = tempfile.mkdtemp()
+
+		java_exe = os.path.join(self.mod_dir, 'java')
+		with io.open(java_exe, mode='w', encoding='UTF-8') as fh:
+			fh.write("#!{}\n".format(sys.executable))
+			fh.write(STUB_LAUNCHER)
+		os.chmod(java_exe, os.stat(java_exe).st_mode | stat.S_IXUSR)
+
+		with io.open(os.path.join(self.mod_dir, 'mcpackage.yaml'), mode='w', encoding='UTF-8') as fh:
+			fh.write(json.dumps({
+				'name': 'example',
+				'run': {'java_exe': java_exe, 'classpath': []},
+			}))
+
+		os.makedirs(os.path.join(self.mod_dir, 'build'))
+		with zipfile.ZipFile(os.path.join(self.mod_dir, 'build', 'example.jar'), 'w') as jar_fh:
+			jar_fh.writestr('mcmod.info', json.dumps({'modlist': [{'modid': 'examplemod'}]}))
+
+	def tearDown(self):
+		"""
+		Removes the mod.
+		"""
+		shutil.rmtree(self.mod_dir)
+
+	def run_command(self, delay):
+		"""
+		Runs the run command.
+
+		*delay* (``float``) is the delay unit of the stub launcher.
+
+		Returns a ``tuple`` containing: the output (``str``), and the
+		recorded launch results (``dict``).
+		"""
+		env = dict(os.environ)
+		env['STUB_DELAY'] = str(delay)
+		env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+			os.path.dirname(os.path.dirname(os.path.abspath(mcpackage.__file__))),
+			env.get('PYTHONPATH'),
+		]))
+		proc = subprocess.Popen([sys.executable, '-m', 'mcpackage', 'run'], cwd=self.mod_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		output = proc.communicate()[0].decode('UTF-8')
+		self.assertEqual(proc.returncode, 0, output)
+		with io.open(os.path.join(self.mod_dir, 'build', 'log', LAUNCH_TIMES_FILE), mode='r', encoding='UTF-8') as fh:
+			results = json.loads(fh.readlines()[-1])
+		return output, results
+
+	def test_01_phases(self):
+		"""
+		Tests the loading phases, the share of the mod, and the recorded
+		results.
+		"""
+		output, results = self.run_command(0.1)
+		self.assertTrue(os.path.isfile(os.path.join(self.mod_dir, 'build', 'run', 'client', 'mods', 'example.jar')))
+		self.assertTrue(results['ready'])
+		self.assertEqual(results['side'], 'client')
+		self.assertEqual(sorted(results['phases']), ['construction', 'init', 'postinit', 'preinit', 'world'])
+		for phase, seconds in [
+			('construction', 0.1),
+			('preinit', 0.3),
+			('init', 0.3),
+			('postinit', 0.1),
+			('world', 0.1),
+		]:
+			self.assertAlmostEqual(results['phases'][phase], seconds, delta=TOLERANCE, msg=phase)
+		self.assertAlmostEqual(results['mod'], 0.5, delta=TOLERANCE)
+		self.assertAlmostEqual(sum(results['phases'].values()), 0.9, delta=TOLERANCE)
+		self.assertIn("Launch time of client:", output)
+		self.assertIn("in mod", output)
+		self.assertNotIn("regression", output)
+
+	def test_02_regression(self):
+		"""
+		Tests that a slower launch is reported as a regression.
+		"""
+		self.run_command(0.05)
+		output, results = self.run_command(0.1)
+		self.assertIn("Launch time regression: total time increased", output)
+		self.assertIn("Launch time regression: mod time increased", output)
+		with io.open(os.path.join(self.mod_dir, 'build', 'log', LAUNCH_TIMES_FILE), mode='r', encoding='UTF-8') as fh:
+			self.assertEqual(len(fh.readlines()), 2)
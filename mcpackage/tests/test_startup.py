@@ -0,0 +1,83 @@
+# coding: utf-8
+"""
+This script benchmarks the start-up time of the command-line interface.
+"""
+from __future__ import unicode_literals
+
+import os
+import os.path
+import subprocess
+import sys
+import time
+import unittest
+
+import mcpackage
+
+#: The number of seconds running ``mcpackage --version`` may take on top
+#: of starting the python interpreter.
+VERSION_BUDGET = 0.15
+
+#: The number of times to run each command. The fastest run is used to
+#: ignore noise from other processes.
+REPEAT = 5
+
+#: The modules which must only be imported when the command using them is
+#: run.
+# - NOTE: zipfile is not included because importlib.resources imports it.
+HEAVY_MODULES = ['mcpackage.build', 'pathspec', 'pkg_resources', 'yaml']
+
+
+class StartupTest(unittest.TestCase):
+	"""
+	The ``StartupTest`` class benchmarks the start-up time of the
+	command-line interface.
+	"""
+
+	def run_python(self, args):
+		"""
+		Runs python.
+
+		*args* (``list`` of ``str``) contains the arguments to python.
+
+		Returns a ``tuple`` containing: the fastest number of seconds python
+		took (``float``), and its output (``str``).
+		"""
+		env = dict(os.environ)
+		env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+			os.path.dirname(os.path.dirname(os.path.abspath(mcpackage.__file__))),
+			env.get('PYTHONPATH'),
+		]))
+		best, output = None, None
+		for _ in range(REPEAT):
+			start = time.time()
+			output = subprocess.check_output([sys.executable] + args, env=env, stderr=subprocess.STDOUT)
+			seconds = time.time() - start
+			if best is None or seconds < best:
+				best = seconds
+		return best, output.decode('UTF-8')
+
+	def test_01_version_budget(self):
+		"""
+		Tests that showing the version stays within its time budget.
+		"""
+		base, _ = self.run_python(['-c', 'pass'])
+		seconds, output = self.run_python(['-m', 'mcpackage', '--version'])
+		self.assertIn(mcpackage.__version__, output)
+		self.assertLess(seconds - base, VERSION_BUDGET, "--version took {:.3f}s over the interpreter start-up of {:.3f}s.".format(seconds - base, base))
+
+	def test_02_lazy_imports(self):
+		"""
+		Tests that the command modules and heavy dependencies are not
+		imported to parse the command-line.
+		"""
+		_, output = self.run_python(['-c', (
+			"import sys\n"
+			"from mcpackage import main\n"
+			"try:\n"
+			"	main.run(['mcpackage', '--help'])\n"
+			"except SystemExit:\n"
+			"	pass\n"
+			"print('\\nMODULES ' + ' '.join(sorted(sys.modules)))\n"
+		)])
+		modules = set(output.rsplit('MODULES ', 1)[1].split())
+		self.assertEqual([name for name in HEAVY_MODULES if name in modules], [])
@@ -0,0 +1,161 @@
+# coding: utf-8
+"""
+This script tests the utility functions.
+"""
+from __future__ import unicode_literals
+
+import copy
+import io
+import os
+import os.path
+import shutil
+import tempfile
+import time
+import unittest
+
+from mcpackage import util
+
+
+class SyncFilesTest(unittest.TestCase):
+	"""
+	The ``SyncFilesTest`` class tests synchronizing directories.
+	"""
+
+	def setUp(self):
+		"""
+		Called before each test.
+		"""
+		self.temp_dir = tempfile.mkdtemp(prefix='mcpackage-test-')
+		self.forge_dir = os.path.join(self.temp_dir, 'forge')
+		self.mod_dir = os.path.join(self.temp_dir, 'mod')
+		self.dest_dir = os.path.join(self.temp_dir, 'dest')
+
+	def tearDown(self):
+		"""
+		Called after each test.
+		"""
+		shutil.rmtree(self.temp_dir)
+
+	def read_file(self, path):
+		"""
+		Reads the file.
+
+		*path* (``str``) is the path of the file.
+
+		Returns the content of the file (``str``).
+		"""
+		with io.open(path, 'r', encoding='UTF-8') as fh:
+			return fh.read()
+
+	def write_file(self, path, text, mtime):
+		"""
+		Writes the file.
+
+		*path* (``str``) is the path of the file.
+
+		*text* (``str``) is the content of the file.
+
+		*mtime* (``float``) is the modified time of the file.
+		"""
+		try:
+			os.makedirs(os.path.dirname(path))
+		except OSError:
+			pass
+		with io.open(path, 'w', encoding='UTF-8') as fh:
+			fh.write(text)
+		os.utime(path, (mtime, mtime))
+
+	def test_01_shadow_linked(self):
+		"""
+		Test copying a mod file over a linked Forge file of the same path
+		does not modify the Forge file.
+		"""
+		mtime = time.time() - 60
+		forge_file = os.path.join(self.forge_dir, 'net', 'minecraft', 'Block.java')
+		self.write_file(forge_file, "forge", mtime)
+		self.write_file(os.path.join(self.forge_dir, 'net', 'minecraft', 'Item.java'), "item", mtime)
+		self.write_file(os.path.join(self.mod_dir, 'net', 'minecraft', 'Block.java'), "mod", mtime + 10)
+
+		files = [os.path.join('net', 'minecraft', name) for name in ('Block.java', 'Item.java')]
+		util.sync_files(self.forge_dir, self.dest_dir, link=True)
+		self.assertTrue(util.is_same_file(forge_file, os.path.join(self.dest_dir, files[0])))
+		counts = util.sync_files(self.mod_dir, self.dest_dir, files=files[:1], keep=files)
+
+		self.assertEqual(counts['copied'], 1)
+		self.assertEqual(self.read_file(os.path.join(self.dest_dir, files[0])), "mod")
+		self.assertEqual(self.read_file(forge_file), "forge")
+		self.assertEqual(sorted(os.listdir(os.path.join(self.dest_dir, 'net', 'minecraft'))), ['Block.java', 'Item.java'])
+
+
+class UpdateConfigTextTest(unittest.TestCase):
+	"""
+	The ``UpdateConfigTextTest`` class tests updating the YAML of a
+	configuration.
+	"""
+
+	#: The YAML of the example configuration.
+	TEXT = "\n".join([
+		"%YAML 1.1",
+		"---",
+		"# The ID of the mod.",
+		"id: example",
+		"# Settings for additional libraries.",
+		"library:",
+		"  # The library directory.",
+		"  dir: lib",
+		"  # The libraries to package.",
+		"  package:",
+		"    - '# Placeholder'",
+		"# Settings for the mod source.",
+		"source:",
+		"  # The source directory.",
+		"  dir: src",
+		"  extra: {}",
+		"",
+	])
+
+	def test_01_update(self):
+		"""
+		Test only the changed settings are rewritten, new settings are added
+		to their mapping, and the comments are kept.
+		"""
+		old = util.load_config(io.StringIO(self.TEXT))
+		new = copy.deepcopy(old)
+		new['library']['package'] = ['example-*.jar']
+		new['library']['relocate'] = True
+		new['source']['extra'] = {'files': ['/mcmod.info']}
+		new['history'] = {'enabled': False}
+
+		text = util.update_config_text(self.TEXT, old, new)
+		self.assertEqual(util.load_config(io.StringIO(text)), new)
+		self.assertEqual(text, "\n".join([
+			"%YAML 1.1",
+			"---",
+			"# The ID of the mod.",
+			"id: example",
+			"# Settings for additional libraries.",
+			"library:",
+			"  # The library directory.",
+			"  dir: lib",
+			"  # The libraries to package.",
+			"  package:",
+			"  - example-*.jar",
+			"  relocate: true",
+			"# Settings for the mod source.",
+			"source:",
+			"  # The source directory.",
+			"  dir: src",
+			"  extra:",
+			"    files:",
+			"    - /mcmod.info",
+			"history:",
+			"  enabled: false",
+			"",
+		]))
+
+	def test_02_unchanged(self):
+		"""
+		Test an unchanged configuration is not rewritten.
+		"""
+		old = util.load_config(io.StringIO(self.TEXT))
+		self.assertEqual(util.update_config_text(self.TEXT, old, copy.deepcopy(old)), self.TEXT)
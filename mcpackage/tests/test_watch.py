@@ -0,0 +1,108 @@
+# coding: utf-8
+"""
+This script tests the file system watchers.
+"""
+from __future__ import unicode_literals
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from mcpackage import watch
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "inotify is only available on Linux.")
+class InotifyWatcherTest(unittest.TestCase):
+	"""
+	The ``InotifyWatcherTest`` class tests the ``InotifyWatcher`` class.
+	"""
+
+	def setUp(self):
+		"""
+		Creates the watched directory.
+		"""
+		self.temp_dir = tempfile.mkdtemp()
+		os.makedirs(os.path.join(self.temp_dir, 'a', 'b'))
+		with open(os.path.join(self.temp_dir, 'a', 'b', 'Mod.java'), 'w') as fh:
+			fh.write("class Mod {}\n")
+		self.watcher = watch.InotifyWatcher([self.temp_dir], delay=0.1)
+
+	def tearDown(self):
+		"""
+		Removes the watched directory.
+		"""
+		self.watcher.close()
+		shutil.rmtree(self.temp_dir)
+
+	def change(self, func, *args):
+		"""
+		Changes the watched directory after the watcher starts waiting.
+
+		*func* (``callable``) changes the directory.
+
+		*args* is the arguments to send to *func*.
+
+		Returns the changed paths (``set`` of ``str``).
+		"""
+		def run():
+			time.sleep(0.1)
+			func(*args)
+		thread = threading.Thread(target=run)
+		thread.start()
+		try:
+			return self.watcher.wait()
+		finally:
+			thread.join()
+
+	def test_01_file(self):
+		"""
+		Tests that a changed file is reported.
+		"""
+		path = os.path.join(self.temp_dir, 'a', 'b', 'Mod.java')
+		changed = self.change(os.utime, path, None)
+		self.assertEqual(changed, {path})
+
+	def test_02_move_dir(self):
+		"""
+		Tests that moving a directory requires a rescan, and that its files
+		are watched at their new location.
+		"""
+		changed = self.change(os.rename, os.path.join(self.temp_dir, 'a'), os.path.join(self.temp_dir, 'c'))
+		self.assertEqual(changed, {watch.RESCAN})
+		self.assertEqual(sorted(self.watcher.watches.values()), [
+			self.temp_dir,
+			os.path.join(self.temp_dir, 'c'),
+			os.path.join(self.temp_dir, 'c', 'b'),
+		])
+
+		path = os.path.join(self.temp_dir, 'c', 'b', 'Mod.java')
+		changed = self.change(os.utime, path, None)
+		self.assertEqual(changed, {path})
+
+	def test_03_delete_dir(self):
+		"""
+		Tests that deleting a directory requires a rescan.
+		"""
+		changed = self.change(shutil.rmtree, os.path.join(self.temp_dir, 'a'))
+		self.assertIn(watch.RESCAN, changed)
+		self.assertEqual(list(self.watcher.watches.values()), [self.temp_dir])
+
+	def test_04_overflow(self):
+		"""
+		Tests that lost events require a rescan.
+		"""
+		event = self.watcher.EVENT.pack(-1, self.watcher.IN_Q_OVERFLOW, 0, 0)
+		changed = set()
+		read = os.read
+		os.read = lambda fd, size: event
+		try:
+			self.watcher.read(changed)
+		finally:
+			os.read = read
+		self.assertEqual(changed, {watch.RESCAN})
+		self.assertEqual(len(self.watcher.watches), 3)
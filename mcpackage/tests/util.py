@@ -0,0 +1,162 @@
+# coding: utf-8
+"""
+This module provides utility functions for the tests.
+"""
+from __future__ import unicode_literals
+
+import struct
+
+
+class ClassBuilder(object):
+	"""
+	The ``ClassBuilder`` class is used to assemble class files for tests
+	without a Java compiler.
+	"""
+
+	def __init__(self):
+		"""
+		Initializes the ``ClassBuilder`` instance.
+		"""
+
+		self.constants = []
+		"""
+		*constants* (``list`` of ``bytes``) contains the encoded constant
+		pool entries. Long and double entries are followed by ``None`` for
+		the unusable entry after them.
+		"""
+
+		self.indices = {}
+		"""
+		*indices* (``dict``) maps each encoded constant pool entry
+		(``bytes``) to its index (``int``).
+		"""
+
+	def add(self, entry, wide=False):
+		"""
+		Adds the constant pool entry.
+
+		*entry* (``bytes``) is the encoded entry.
+
+		*wide* (``bool``) is whether the entry takes two entries (long and
+		double). Default is ``False``.
+
+		Returns the index of the entry (``int``).
+		"""
+		index = self.indices.get(entry)
+		if index is None:
+			index = self.indices[entry] = len(self.constants) + 1
+			self.constants.append(entry)
+			if wide:
+				self.constants.append(None)
+		return index
+
+	def attribute(self, name, body):
+		"""
+		Encodes an attribute.
+
+		*name* (``str``) is the name of the attribute.
+
+		*body* (``bytes``) is the content of the attribute.
+
+		Returns the encoded attribute (``bytes``).
+		"""
+		return struct.pack('>HI', self.utf8(name), len(body)) + body
+
+	def build(self, name, super_name='java/lang/Object', fields=(), methods=(), attributes=()):
+		"""
+		Assembles the class file.
+
+		*name* (``str``) is the internal name of the class.
+
+		*super_name* (``str``) is the internal name of the super class.
+
+		*fields* and *methods* (``Iterable`` of ``tuple``) contain the name
+		(``str``), descriptor (``str``) and encoded attributes (``list`` of
+		``bytes``) of each member.
+
+		*attributes* (``Iterable`` of ``bytes``) contains the encoded
+		attributes of the class.
+
+		Returns the class file (``bytes``).
+		"""
+		body = struct.pack('>HHHH', 0x0021, self.class_(name), self.class_(super_name), 0)
+		for members in (fields, methods):
+			body += struct.pack('>H', len(members))
+			for member_name, member_desc, member_attrs in members:
+				body += struct.pack('>HHHH', 0x0001, self.utf8(member_name), self.utf8(member_desc), len(member_attrs))
+				body += b''.join(member_attrs)
+		body += struct.pack('>H', len(attributes)) + b''.join(attributes)
+
+		pool = b''.join(entry for entry in self.constants if entry is not None)
+		return struct.pack('>IHHH', 0xCAFEBABE, 0, 52, len(self.constants) + 1) + pool + body
+
+	def class_(self, name):
+		"""
+		Adds a class constant.
+
+		*name* (``str``) is the internal name of the class.
+
+		Returns the index of the constant (``int``).
+		"""
+		return self.add(struct.pack('>BH', 7, self.utf8(name)))
+
+	def code(self, local_vars=(), local_types=()):
+		"""
+		Encodes a *Code* attribute which only returns.
+
+		*local_vars* (``Iterable`` of ``tuple``) contains the name and
+		descriptor (``str``) of each local variable.
+
+		*local_types* (``Iterable`` of ``tuple``) contains the name and
+		signature (``str``) of each generic local variable.
+
+		Returns the encoded attribute (``bytes``).
+		"""
+		attrs = []
+		for table_name, table in (('LocalVariableTable', local_vars), ('LocalVariableTypeTable', local_types)):
+			if table:
+				rows = b''.join(struct.pack('>HHHHH', 0, 1, self.utf8(var_name), self.utf8(var_desc), i) for i, (var_name, var_desc) in enumerate(table))
+				attrs.append(self.attribute(table_name, struct.pack('>H', len(table)) + rows))
+		body = struct.pack('>HHI', 1, len(local_vars) + 1, 1) + b'\xb1' + struct.pack('>HH', 0, len(attrs)) + b''.join(attrs)
+		return self.attribute('Code', body)
+
+	def double(self, value):
+		"""
+		Adds a double constant.
+
+		*value* (``float``) is the value.
+
+		Returns the index of the constant (``int``).
+		"""
+		return self.add(struct.pack('>Bd', 6, value), wide=True)
+
+	def long(self, value):
+		"""
+		Adds a long constant.
+
+		*value* (``int``) is the value.
+
+		Returns the index of the constant (``int``).
+		"""
+		return self.add(struct.pack('>Bq', 5, value), wide=True)
+
+	def string(self, value):
+		"""
+		Adds a string constant.
+
+		*value* (``str``) is the value.
+
+		Returns the index of the constant (``int``).
+		"""
+		return self.add(struct.pack('>BH', 8, self.utf8(value)))
+
+	def utf8(self, value):
+		"""
+		Adds a UTF-8 constant.
+
+		*value* (``str``) is the value.
+
+		Returns the index of the constant (``int``).
+		"""
+		value = value.encode('UTF-8')
+		return self.add(struct.pack('>BH', 1, len(value)) + value)
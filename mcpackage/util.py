@@ -6,16 +6,56 @@ from __future__ import unicode_literals
 
 import errno
 import functools
+import hashlib
 import itertools
 import io
 import os
 import os.path
 import platform
+import re
 import shutil
 import textwrap
 
 import yaml
 import yaml.scanner
+try:
+	from yaml import CSafeLoader as SafeLoader
+except ImportError:
+	from yaml import SafeLoader
+
+def copy_file(src, dest):
+	"""
+	Copies the source file to the destination file replacing it if it
+	exists. The destination file is replaced instead of being written to so
+	that a file it is hard linked to (see ``link_file()``) is never
+	modified.
+
+	*src* (``str``) is the path of the file to copy.
+
+	*dest* (``str``) is the path to copy it to.
+	"""
+	temp_file = dest + '.mcpackage-copy'
+	if os.path.lexists(temp_file):
+		os.remove(temp_file)
+	shutil.copy2(src, temp_file)
+	replace_file(temp_file, dest)
+
+def file_digest(path, algorithm='sha1'):
+	"""
+	Calculates the digest of the file.
+
+	*path* (``str``) is the path of the file.
+
+	*algorithm* (``str``) is the name of the hash algorithm to use.
+	Default is `'sha1'`.
+
+	Returns the hexadecimal digest (``str``).
+	"""
+	digest = hashlib.new(algorithm)
+	with open(path, 'rb') as fh:
+		for block in iter(lambda: fh.read(1048576), b''):
+			digest.update(block)
+	return digest.hexdigest()
 
 def find_exe(exe, path=None):
 	"""
@@ -101,9 +141,49 @@ def get_system():
 			system = 'Darwin'
 	return system
 
+def is_same_file(path1, path2):
+	"""
+	Determines whether both paths refer to the same file (e.g., hard
+	links).
+
+	*path1* (``str``) is the path of the first file.
+
+	*path2* (``str``) is the path of the second file.
+
+	Returns whether they are the same file (``bool``).
+	"""
+	try:
+		return os.path.samefile(path1, path2)
+	except (AttributeError, OSError):
+		# samefile() is not available on Windows with Python 2.
+		return False
+
+def link_file(src, dest):
+	"""
+	Hard links the source file to the destination file replacing it if it
+	exists. The file is copied instead if it cannot be linked (e.g., it is
+	on a different file system). The destination file is replaced instead
+	of being written to so that a file it is already linked to is never
+	modified.
+
+	*src* (``str``) is the path of the file to link.
+
+	*dest* (``str``) is the path to link it to.
+	"""
+	temp_file = dest + '.mcpackage-link'
+	if os.path.lexists(temp_file):
+		os.remove(temp_file)
+	try:
+		os.link(src, temp_file)
+	except (AttributeError, OSError):
+		# - NOTE: Python 2 on Windows does not have os.link().
+		shutil.copy2(src, temp_file)
+	replace_file(temp_file, dest)
+
 def load_config(file): # pylint: disable=W0622
 	"""
-	Loads the configuration.
+	Loads the configuration. The libyaml based loader is used when it is
+	available.
 
 	*file* is either the ``file`` to read, or hte path (``str``) of the
 	file to read.
@@ -117,7 +197,15 @@ def load_config(file): # pylint: disable=W0622
 		fh = io.open(file, mode='r', encoding='UTF-8')
 		close = True
 	try:
-		config = yaml.safe_load(fh)
+		try:
+			config = yaml.load(fh, Loader=SafeLoader)
+		except yaml.YAMLError:
+			if SafeLoader is yaml.SafeLoader:
+				raise
+			# The errors from libyaml are less descriptive, so parse the file
+			# again using the pure python loader to report the error.
+			fh.seek(0, os.SEEK_SET)
+			config = yaml.load(fh, Loader=yaml.SafeLoader)
 	except yaml.scanner.ScannerError as e:
 		context = (e.context or '').lower()
 		problem = (e.problem or '').lower()
@@ -170,6 +258,23 @@ def merge_config(base, update):
 			merge[key] = update_value
 	return merge
 
+def replace_file(src, dest):
+	"""
+	Renames the source file to the destination file replacing it if it
+	exists. This is atomic except on Windows with Python 2.
+
+	*src* (``str``) is the path of the file to rename.
+
+	*dest* (``str``) is the path to rename it to.
+	"""
+	replace = getattr(os, 'replace', None)
+	if replace is not None:
+		replace(src, dest)
+	else:
+		if get_system() == 'Windows' and os.path.exists(dest):
+			os.remove(dest)
+		os.rename(src, dest)
+
 def set_nested_value(data, keys, value):
 	"""
 	Sets the nested value.
@@ -197,7 +302,7 @@ def short_path(path, root):
 	"""
 	return os.path.join(os.path.basename(root), os.path.relpath(path, root))
 
-def sync_files(src, dest, files=None, keep=None):
+def sync_files(src, dest, files=None, keep=None, link=False):
 	"""
 	Synchronizes the files from the source directory to the destination
 	directory.
@@ -213,9 +318,17 @@ def sync_files(src, dest, files=None, keep=None):
 	*keep* (``Iterable`` of ``str``) optionally contains the relative
 	paths to files to keep (or ignore) in the destination directory.
 	Default is ``None`` to keep no destination files.
+
+	*link* (``bool``) is whether the files should be hard linked (see
+	``link_file()``) instead of copied (see ``copy_file()``). Linked files must not be modified in the
+	destination directory. Default is ``False``.
+
+	Returns the counts (``dict``) of the files `'copied'` (``int``),
+	`'unchanged'` (``int``) and `'removed'` (``int``).
 	"""
 	src_dir = os.path.abspath(src)
 	dest_dir = os.path.abspath(dest)
+	sync_file = link_file if link else copy_file
 
 	keep_dirs = set() # Relative directory paths to keep.
 	keep_files = set()
@@ -282,6 +395,7 @@ def sync_files(src, dest, files=None, keep=None):
 
 	# Traverse destination directory, update modified files, and delete
 	# unneeded files.
+	counts = {'copied': 0, 'unchanged': 0, 'removed': 0}
 	for parent, dirs, files in os.walk(dest_dir):
 		# Make parent path relative to destination directory.
 		parent = os.path.relpath(parent, dest_dir)
@@ -303,12 +417,16 @@ def sync_files(src, dest, files=None, keep=None):
 				if os.path.getmtime(dest_full) < src_files[file_path]:
 					# Source file has been modified, copy it.
 					src_full = os.path.join(src_dir, file_path)
-					shutil.copy2(src_full, dest_full)
+					sync_file(src_full, dest_full)
+					counts['copied'] += 1
+				else:
+					counts['unchanged'] += 1
 				# Record that this file was handled.
 				del src_files[file_path]
 			elif file_path not in keep_files:
 				# Delete unneeded file.
 				os.remove(dest_full)
+				counts['removed'] += 1
 
 	# Copy remaining files which were not handled.
 	for file_path in src_files:
@@ -323,4 +441,80 @@ def sync_files(src, dest, files=None, keep=None):
 				raise
 
 		# Copy source file to destination.
-		shutil.copy2(src_full, dest_full)
+		sync_file(src_full, dest_full)
+		counts['copied'] += 1
+
+	return counts
+
+def update_config_text(text, old, new):
+	"""
+	Updates the YAML of a configuration without losing its comments. Only
+	the settings which changed are rewritten in place, and new settings are
+	appended to the end of their mapping.
+
+	*text* (``str``) is the YAML of the configuration.
+
+	*old* (``dict``) is the configuration loaded from *text*.
+
+	*new* (``dict``) is the updated configuration (e.g., from
+	``merge_config()``).
+
+	Returns the updated YAML (``str``).
+	"""
+	lines = text.splitlines(True)
+	if lines and not lines[-1].endswith('\n'):
+		lines[-1] += '\n'
+
+	def get_indent(line):
+		# Returns the indent of the line, or None for blank and comment lines.
+		content = line.lstrip(' ')
+		if not content.strip() or content.startswith('#'):
+			return None
+		return len(line) - len(content)
+
+	def find_value(start, end, indent, key):
+		# Returns the line of the key and the end of its value, or None.
+		key_regex = re.compile(r'^ {{{}}}(?:{}|\'{}\'|"{}")\s*:(?:\s|$)'.format(indent, *[re.escape(key)] * 3))
+		for key_line in range(start, end):
+			if key_regex.match(lines[key_line]):
+				break
+		else:
+			return None
+		value_end = key_line + 1
+		for i in range(key_line + 1, end):
+			line_indent = get_indent(lines[i])
+			if line_indent is None:
+				continue
+			if line_indent < indent or (line_indent == indent and not lines[i].lstrip(' ').startswith('- ')):
+				break
+			value_end = i + 1
+		return key_line, value_end
+
+	def update(start, end, indent, old, new):
+		# Updates the mapping within the lines, and returns its new end.
+		for key, value in new.items():
+			old_value = old.get(key) if isinstance(old, dict) else None
+			if isinstance(old, dict) and key in old and old_value == value:
+				continue
+			found = find_value(start, end, indent, key)
+			if found is not None and isinstance(old_value, dict) and isinstance(value, dict) and found[1] > found[0] + 1:
+				# Update the nested block mapping.
+				key_line, value_end = found
+				child_indents = [get_indent(line) for line in lines[key_line + 1:value_end]]
+				child_indent = next((i for i in child_indents if i is not None), indent + 2)
+				new_end = update(key_line + 1, value_end, child_indent, old_value, value)
+				end += new_end - value_end
+				continue
+
+			dumped = yaml.safe_dump({key: value}, default_flow_style=False, allow_unicode=True, encoding=None)
+			value_lines = [' ' * indent + line for line in dumped.splitlines(True)]
+			# - NOTE: A new key is appended after the last value of its
+			#   mapping, before the comments of the next key.
+			key_line, value_end = found if found is not None else (end, end)
+			lines[key_line:value_end] = value_lines
+			end += len(value_lines) - (value_end - key_line)
+		return end
+
+	update(0, len(lines), 0, old, new)
+	return "".join(lines)
+
@@ -0,0 +1,309 @@
+# coding: utf-8
+"""
+This module contains the file system watchers used to rebuild a mod
+when its files change.
+"""
+from __future__ import unicode_literals
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import os.path
+import select
+import struct
+import sys
+import time
+
+#: The default number of seconds to wait for a burst of changes to end
+#: before reporting them.
+DEFAULT_DELAY = 0.3
+
+#: The default number of seconds between scans when polling.
+DEFAULT_INTERVAL = 1.0
+
+#: Reported among the changed paths when the changes could not be
+#: determined (e.g., events were lost, or a directory was moved or
+#: deleted), and every file must be considered changed.
+RESCAN = '*'
+
+def create_watcher(paths, delay=None):
+	"""
+	Creates the best available watcher for the system. inotify is used on
+	Linux, and polling is used everywhere else.
+
+	*paths* (``Iterable`` of ``str``) contains the directories to watch.
+
+	*delay* (``float``) is the number of seconds to wait for a burst of
+	changes to end. Default is ``None`` for ``DEFAULT_DELAY``.
+
+	Returns the watcher (``PollingWatcher`` or ``InotifyWatcher``).
+	"""
+	if sys.platform.startswith('linux'):
+		try:
+			return InotifyWatcher(paths, delay=delay)
+		except (AttributeError, OSError):
+			# Either libc does not support inotify or we cannot create any more
+			# inotify instances.
+			pass
+	return PollingWatcher(paths, delay=delay)
+
+
+class PollingWatcher(object):
+	"""
+	The ``PollingWatcher`` class detects changed files by periodically
+	comparing the modified times and sizes of every file.
+	"""
+
+	def __init__(self, paths, delay=None, interval=None):
+		"""
+		Initializes the ``PollingWatcher`` instance.
+
+		*paths* (``Iterable`` of ``str``) contains the directories to watch.
+
+		*delay* (``float``) is the number of seconds to wait for a burst of
+		changes to end. Default is ``None`` for ``DEFAULT_DELAY``.
+
+		*interval* (``float``) is the number of seconds between scans.
+		Default is ``None`` for ``DEFAULT_INTERVAL``.
+		"""
+
+		self.delay = delay if delay is not None else DEFAULT_DELAY
+		"""
+		*delay* (``float``) is the number of seconds to wait for a burst of
+		changes to end.
+		"""
+
+		self.interval = interval if interval is not None else DEFAULT_INTERVAL
+		"""
+		*interval* (``float``) is the number of seconds between scans.
+		"""
+
+		self.paths = [os.path.abspath(path) for path in paths if os.path.isdir(path)]
+		"""
+		*paths* (``list`` of ``str``) contains the directories being
+		watched.
+		"""
+
+		self.snapshot = self.scan()
+		"""
+		*snapshot* (``dict``) maps each file path (``str``) to its modified
+		time and size (``tuple``).
+		"""
+
+	def close(self):
+		"""
+		Stops watching.
+		"""
+		pass
+
+	def scan(self):
+		"""
+		Scans the watched directories.
+
+		Returns the snapshot (``dict``) which maps each file path (``str``) to
+		its modified time and size (``tuple``).
+		"""
+		snapshot = {}
+		for root in self.paths:
+			for parent, _, files in os.walk(root, followlinks=True):
+				for file_name in files:
+					path = os.path.join(parent, file_name)
+					try:
+						stat = os.stat(path)
+					except OSError as e:
+						if e.errno != errno.ENOENT:
+							raise
+						continue
+					snapshot[path] = (stat.st_mtime, stat.st_size)
+		return snapshot
+
+	def wait(self):
+		"""
+		Waits for files to change.
+
+		Returns the changed file paths (``set`` of ``str``).
+		"""
+		changed = set()
+		while True:
+			time.sleep(self.delay if changed else self.interval)
+			snapshot = self.scan()
+			diff = set(path for path, stat in snapshot.items() if self.snapshot.get(path) != stat)
+			diff.update(path for path in self.snapshot if path not in snapshot)
+			self.snapshot = snapshot
+			if diff:
+				changed.update(diff)
+			elif changed:
+				return changed
+
+
+class InotifyWatcher(object):
+	"""
+	The ``InotifyWatcher`` class detects changed files using Linux inotify.
+	"""
+
+	#: inotify event masks from "sys/inotify.h".
+	IN_MODIFY = 0x00000002
+	IN_ATTRIB = 0x00000004
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_FROM = 0x00000040
+	IN_MOVED_TO = 0x00000080
+	IN_CREATE = 0x00000100
+	IN_DELETE = 0x00000200
+	IN_DELETE_SELF = 0x00000400
+	IN_Q_OVERFLOW = 0x00004000
+	IN_IGNORED = 0x00008000
+	IN_ISDIR = 0x40000000
+
+	#: The events to watch for.
+	MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+	#: The header of each event: watch descriptor, mask, cookie, and name
+	#: length.
+	EVENT = struct.Struct(str('iIII'))
+
+	def __init__(self, paths, delay=None):
+		"""
+		Initializes the ``InotifyWatcher`` instance.
+
+		*paths* (``Iterable`` of ``str``) contains the directories to watch.
+
+		*delay* (``float``) is the number of seconds to wait for a burst of
+		changes to end. Default is ``None`` for ``DEFAULT_DELAY``.
+		"""
+
+		self.delay = delay if delay is not None else DEFAULT_DELAY
+		"""
+		*delay* (``float``) is the number of seconds to wait for a burst of
+		changes to end.
+		"""
+
+		self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		"""
+		*libc* (``ctypes.CDLL``) is the C library providing inotify.
+		"""
+
+		self.fd = self.libc.inotify_init()
+		"""
+		*fd* (``int``) is the inotify file descriptor.
+		"""
+		if self.fd < 0:
+			code = ctypes.get_errno()
+			raise OSError(code, os.strerror(code))
+
+		self.paths = [os.path.abspath(path) for path in paths if os.path.isdir(path)]
+		"""
+		*paths* (``list`` of ``str``) contains the directories being
+		watched.
+		"""
+
+		self.watches = {}
+		"""
+		*watches* (``dict``) maps each watch descriptor (``int``) to its
+		directory (``str``).
+		"""
+
+		try:
+			for path in self.paths:
+				self.add_tree(path)
+		except:
+			self.close()
+			raise
+
+	def add_tree(self, root):
+		"""
+		Watches the directory and all of its subdirectories.
+
+		*root* (``str``) is the directory to watch.
+
+		Returns the files found under the directory (``list`` of ``str``).
+		"""
+		files = []
+		for parent, _, file_names in os.walk(root, followlinks=True):
+			wd = self.libc.inotify_add_watch(self.fd, os.fsencode(parent) if hasattr(os, 'fsencode') else parent.encode(sys.getfilesystemencoding()), self.MASK)
+			if wd < 0:
+				code = ctypes.get_errno()
+				if code == errno.ENOENT:
+					continue
+				raise OSError(code, os.strerror(code), parent)
+			self.watches[wd] = parent
+			files.extend(os.path.join(parent, file_name) for file_name in file_names)
+		return files
+
+	def close(self):
+		"""
+		Stops watching.
+		"""
+		if self.fd >= 0:
+			os.close(self.fd)
+			self.fd = -1
+
+	def read(self, changed):
+		"""
+		Reads the pending events.
+
+		*changed* (``set`` of ``str``) is updated with the changed file
+		paths, and ``RESCAN`` when the changed files cannot be determined.
+		"""
+		data = os.read(self.fd, 65536)
+		offset = 0
+		rescan = False
+		while offset < len(data):
+			wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+			offset += self.EVENT.size
+			name = data[offset:offset + length].rstrip(b'\0').decode(sys.getfilesystemencoding())
+			offset += length
+
+			if mask & self.IN_Q_OVERFLOW:
+				# Events were lost.
+				rescan = True
+				continue
+
+			parent = self.watches.get(wd)
+			if parent is None:
+				continue
+			if mask & self.IN_IGNORED:
+				del self.watches[wd]
+				continue
+
+			if mask & (self.IN_ISDIR | self.IN_DELETE_SELF):
+				# - NOTE: The files of a directory which was moved or deleted are
+				#   not reported, and the watched paths below a moved directory
+				#   are out of date.
+				rescan = True
+			else:
+				changed.add(os.path.join(parent, name) if name else parent)
+
+		if rescan:
+			self.rescan()
+			changed.add(RESCAN)
+
+	def rescan(self):
+		"""
+		Watches the directories again from scratch, and stops watching the
+		directories which were moved out of or deleted from the watched
+		directories.
+		"""
+		old_wds = set(self.watches)
+		self.watches = {}
+		for path in self.paths:
+			if os.path.isdir(path):
+				self.add_tree(path)
+		for wd in old_wds.difference(self.watches):
+			# - NOTE: This fails harmlessly for the watches which were already
+			#   removed because their directory was deleted.
+			self.libc.inotify_rm_watch(self.fd, wd)
+
+	def wait(self):
+		"""
+		Waits for files to change.
+
+		Returns the changed file paths (``set`` of ``str``).
+		"""
+		changed = set()
+		while True:
+			ready, _, _ = select.select([self.fd], [], [], self.delay if changed else None)
+			if ready:
+				self.read(changed)
+			elif changed:
+				return changed
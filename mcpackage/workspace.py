@@ -0,0 +1,220 @@
+# coding: utf-8
+"""
+This script builds the Minecraft Mods of a workspace concurrently.
+"""
+from __future__ import print_function, unicode_literals
+
+import copy
+import multiprocessing
+import os
+import os.path
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
+from . import __name__ as MCPACKAGE, util
+
+#: The default workspace configuration.
+DEFAULT_WORKSPACE = {
+	# The mcpackage configuration files of the mods to build. These are
+	# relative to the workspace configuration file, and each mod is built in
+	# the directory of its configuration file.
+	'mods': [],
+	# The maximum number of mods to build concurrently. If this is null,
+	# the number of CPUs is used.
+	'jobs': None,
+	# Whether the MCP source and compiled classes should be hard linked
+	# into the build directory of each mod instead of copied (see
+	# *forge.link*). This way the Forge and MCP preparation is shared by
+	# every mod built against the same Forge directory.
+	'link': True,
+}
+
+def command(**args):
+	"""
+	Builds the Minecraft Mods of the workspace.
+
+	`**args` is the keyword arguments to send to ``WorkspaceCommand()``.
+
+	Returns the exit code (``int``).
+	"""
+	return WorkspaceCommand(**args).run()
+
+
+class WorkspaceCommand(object):
+	"""
+	The ``WorkspaceCommand`` class is used to build the Minecraft Mods of a
+	workspace concurrently.
+
+	Each mod is built by its own mcpackage process in the directory of its
+	configuration so that its paths, logging and checkpoints are kept
+	separate, and the output of each build is prefixed with its name.
+	"""
+
+	def __init__(self, workspace_file, force=None, jobs=None, verbose=None, **_):
+		"""
+		Initializes the ``WorkspaceCommand`` instance.
+
+		*workspace_file* (``str``) is the workspace configuration file to
+		use.
+
+		*force* (``bool``) is whether every stage of each build should be run
+		instead of resuming from its checkpoints. Default is ``None`` for
+		``False``.
+
+		*jobs* (``int``) is the maximum number of mods to build concurrently.
+		Default is ``None`` to use *jobs* from the workspace configuration.
+
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed. Default is ``None`` for `0`.
+		"""
+
+		self.config = None
+		"""
+		*config* (``dict``) is the loaded workspace configuration.
+		"""
+
+		self.force = force or False
+		"""
+		*force* (``bool``) is whether every stage of each build should be
+		run.
+		"""
+
+		self.jobs = jobs
+		"""
+		*jobs* (``int``) is the maximum number of mods to build concurrently.
+		"""
+
+		self.output_lock = threading.Lock()
+		"""
+		*output_lock* (``threading.Lock``) is used to print whole lines of
+		output from the concurrent builds.
+		"""
+
+		self.verbose = verbose or 0
+		"""
+		*verbose* (``int``) is the level of verbose debugging information to
+		be printed.
+		"""
+
+		self.workspace_file = workspace_file
+		"""
+		*workspace_file* (``str``) is the workspace configuration file to
+		use.
+		"""
+
+	def build_mod(self, config_file):
+		"""
+		Builds the mod.
+
+		*config_file* (``str``) is the absolute path of the mcpackage
+		configuration file of the mod.
+
+		Returns a ``tuple`` containing: the configuration file (``str``), the
+		exit code (``int``), and the number of seconds the build took
+		(``float``).
+		"""
+		mod_dir, config_name = os.path.split(config_file)
+		label = os.path.relpath(mod_dir, os.path.dirname(os.path.abspath(self.workspace_file)))
+		command = [sys.executable, '-m', MCPACKAGE, 'build', '--config-file', config_name]
+		if self.force:
+			command.append('--force')
+		if self.config['link']:
+			command.append('--link')
+		if self.verbose:
+			command.append('-' + 'v' * self.verbose)
+
+		start = time.time()
+		try:
+			proc = subprocess.Popen(command, close_fds=True, cwd=mod_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+			try:
+				for line in iter(proc.stdout.readline, b''):
+					self.print_line(label, line.decode('UTF-8', 'replace').rstrip())
+			finally:
+				proc.stdout.close()
+				result = proc.wait()
+		except:
+			self.print_line(label, traceback.format_exc().rstrip())
+			result = 1
+		return config_file, result, time.time() - start
+
+	def init_config(self):
+		"""
+		Loads the workspace configuration.
+		"""
+		if self.verbose >= 1:
+			print("Load {!r}.".format(self.workspace_file))
+		config = util.load_config(self.workspace_file) or {}
+		self.config = util.merge_config(copy.deepcopy(DEFAULT_WORKSPACE), config)
+
+		# Resolve the configuration files of the mods.
+		workspace_dir = os.path.dirname(os.path.abspath(self.workspace_file))
+		mods = []
+		for config_file in self.config['mods']:
+			config_file = os.path.join(workspace_dir, os.path.expanduser(os.path.expandvars(config_file)))
+			if os.path.isdir(config_file):
+				config_file = os.path.join(config_file, 'mcpackage.yaml')
+			assert os.path.isfile(config_file), "Mod configuration {!r} does not exist.".format(config_file)
+			mods.append(config_file)
+		self.config['mods'] = mods
+
+		if not self.jobs:
+			self.jobs = self.config['jobs'] or multiprocessing.cpu_count()
+
+	def print_line(self, label, line):
+		"""
+		Prints the line of output from the build of a mod.
+
+		*label* (``str``) is the label of the mod.
+
+		*line* (``str``) is the line of output.
+		"""
+		with self.output_lock:
+			for part in line.split("\n"):
+				print("[{}] {}".format(label, part))
+			sys.stdout.flush()
+
+	def run(self):
+		"""
+		Runs the "workspace" command.
+
+		Returns the exit code (``int``).
+		"""
+		# Load config.
+		try:
+			self.init_config()
+		except:
+			traceback.print_exc(file=sys.stderr)
+			print("Failed to load workspace configuration.", file=sys.stderr)
+			return 1
+
+		mods = self.config['mods']
+		if not mods:
+			print("No mods in workspace {!r}.".format(self.workspace_file), file=sys.stderr)
+			return 1
+
+		# Build mods concurrently.
+		jobs = max(1, min(self.jobs, len(mods)))
+		if self.verbose >= 1:
+			print("Build {} mod(s) with {} job(s).".format(len(mods), jobs))
+		start = time.time()
+		pool = ThreadPool(jobs)
+		try:
+			results = pool.map(self.build_mod, mods, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+		elapsed = time.time() - start
+
+		# Print summary.
+		workspace_dir = os.path.dirname(os.path.abspath(self.workspace_file))
+		failed = 0
+		for config_file, result, seconds in results:
+			if result:
+				failed += 1
+			print("{:>8.3f}s  {:<6} {}".format(seconds, "failed" if result else "ok", os.path.relpath(config_file, workspace_dir)))
+		print("Built {} of {} mod(s) in {:.3f}s.".format(len(results) - failed, len(results), elapsed))
+		return 1 if failed else 0